@@ -0,0 +1,527 @@
+"""
+Admin maintenance CLI for Firestore story data.
+
+Scans the stories collection in parallel, page by page, and writes through
+BulkWriter, so migrations over large collections run in minutes instead of
+streaming and updating one document at a time.
+
+Commands:
+    owners              Story counts per userId
+    transfer-owner      Move every story from one userId to another
+    backfill-metadata   Fill in missing/stale word counts and content hashes
+    cleanup-orphans     Delete bible items / revisions whose story no longer exists
+    repair-stats        Recompute every user's stats document (user_stats.py)
+
+Common options:
+    --dry-run           Report what would change without writing
+    --workers N         Parallel partitions scanned at once
+    --page-size N       Documents read per query page
+    --rate-limit N      Max writes per second across all workers
+    --checkpoint FILE   Record progress so an interrupted run resumes (ignored with --dry-run)
+    --restart           Ignore an existing checkpoint
+
+Examples:
+    python admin_cli.py owners
+    python admin_cli.py transfer-owner --from guest --to <uid> --dry-run
+    python admin_cli.py backfill-metadata --workers 32 --checkpoint backfill.json
+
+Document IDs are split into key ranges by their first character, and each
+range is paged with a document-ID cursor, so partitions are stable across
+runs and a checkpoint records one cursor per range. A page's writes are
+flushed before its cursor is saved; re-running after a crash repeats at most
+one page per range, and every command is idempotent.
+
+Running servers keep a story cache (story_cache.py). Its snapshot listeners
+(on by default) push writes made here into it; with STORY_CACHE_LISTENERS=false
+they are seen once STORY_CACHE_MAX_AGE_SECONDS has passed.
+"""
+
+import argparse
+import json
+import os
+import string
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+DEFAULT_WORKERS = 16
+DEFAULT_PAGE_SIZE = 500
+# Key ranges per worker; more, smaller ranges keep workers busy when IDs are unevenly spread
+PARTITIONS_PER_WORKER = 4
+PROGRESS_INTERVAL_SECONDS = 5
+CHECKPOINT_INTERVAL_SECONDS = 2
+# Attempts per write before BulkWriter gives up on it
+MAX_WRITE_ATTEMPTS = 5
+
+# Characters of Firestore auto-generated IDs, in key order
+ID_ALPHABET = ''.join(sorted(string.digits + string.ascii_letters))
+
+# (name, lower bound inclusive, upper bound exclusive); None means unbounded
+Partition = Tuple[str, Optional[str], Optional[str]]
+
+
+def partition_bounds(count: int) -> List[Partition]:
+    """
+    Split the document-ID key space into contiguous ranges.
+
+    Boundaries fall on first characters of auto-generated IDs; the first and
+    last ranges are open-ended so custom IDs outside the alphabet are covered.
+
+    Args:
+        count: Number of ranges wanted (capped at the alphabet size)
+
+    Returns:
+        List of (name, lower, upper) ranges in key order
+    """
+    count = max(1, min(count, len(ID_ALPHABET)))
+    cuts = [ID_ALPHABET[len(ID_ALPHABET) * i // count] for i in range(1, count)]
+    lowers = [None] + cuts
+    uppers = cuts + [None]
+    return [(f"{i:03d}", lo, hi) for i, (lo, hi) in enumerate(zip(lowers, uppers))]
+
+
+class Stats:
+    """Thread-safe counters shared by workers and BulkWriter callbacks"""
+
+    def __init__(self, initial: Optional[Dict[str, int]] = None):
+        self._counts = Counter(initial or {})
+        self._lock = threading.Lock()
+
+    def add(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[key] += amount
+
+    def merge(self, counts: Dict[str, int]) -> None:
+        with self._lock:
+            self._counts.update(counts)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+class Checkpoint:
+    """
+    Per-partition cursors persisted to a JSON file.
+
+    The file is replaced atomically, so a crash mid-write leaves the previous
+    checkpoint intact. Without a path, progress is only kept in memory.
+    """
+
+    def __init__(self, path: Optional[str], key: str, restart: bool = False):
+        self.path = path
+        self.key = key
+        self.partitions: Dict[str, Dict[str, Any]] = {}
+        self.stats: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+
+        if path and os.path.exists(path) and not restart:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('key') != key:
+                raise SystemExit(
+                    f"Checkpoint {path} belongs to '{saved.get('key')}', not '{key}'. "
+                    f"Use --restart or a different --checkpoint file."
+                )
+            self.partitions = saved.get('partitions', {})
+            self.stats = saved.get('stats', {})
+
+    def cursor(self, name: str) -> Optional[str]:
+        with self._lock:
+            return self.partitions.get(name, {}).get('cursor')
+
+    def is_done(self, name: str) -> bool:
+        with self._lock:
+            return self.partitions.get(name, {}).get('done', False)
+
+    def advance(self, name: str, cursor: Optional[str], stats: Stats, done: bool = False) -> None:
+        """Record that everything in a partition up to cursor has been processed"""
+        with self._lock:
+            state = self.partitions.setdefault(name, {})
+            if cursor is not None:
+                state['cursor'] = cursor
+            state['done'] = done
+            self.stats = stats.snapshot()
+        self.save(force=done)
+
+    def save(self, force: bool = False) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_save < CHECKPOINT_INTERVAL_SECONDS:
+                return
+            self._last_save = now
+            payload = json.dumps({'key': self.key, 'partitions': self.partitions, 'stats': self.stats}, indent=2)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+
+
+def open_checkpoint(args, key: str) -> Checkpoint:
+    """
+    The run's checkpoint. Dry runs write nothing, so they neither resume from
+    nor record into a checkpoint file (a real run must not skip what a dry
+    run only counted).
+    """
+    if args.dry_run:
+        if args.checkpoint:
+            print(f"ℹ️  --checkpoint {args.checkpoint} ignored for a dry run")
+        return Checkpoint(None, key)
+    return Checkpoint(args.checkpoint, key, args.restart)
+
+
+class Progress:
+    """Prints a progress line at most every PROGRESS_INTERVAL_SECONDS"""
+
+    def __init__(self, stats: Stats, label: str):
+        self.stats = stats
+        self.label = label
+        self.started = time.monotonic()
+        self._last = self.started
+        self._lock = threading.Lock()
+
+    def tick(self, force: bool = False) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last < PROGRESS_INTERVAL_SECONDS:
+                return
+            self._last = now
+        counts = self.stats.snapshot()
+        elapsed = max(now - self.started, 1e-6)
+        summary = ', '.join(f"{k}={v}" for k, v in sorted(counts.items()) if ':' not in k)
+        print(f"⏱️  {self.label}: {summary or 'starting'} "
+              f"({counts.get('scanned', 0) / elapsed:.0f} docs/s, {elapsed:.0f}s)", flush=True)
+
+
+# --- Firestore plumbing ---
+
+def _connect():
+    from firebase_auth import initialize_firebase
+    from firestore_backend import get_db
+    initialize_firebase()
+    return get_db()
+
+
+def _make_bulk_writer(db, args, stats: Stats):
+    """BulkWriter sharing the global rate limit with the other workers"""
+    from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+
+    options = BulkWriterOptions()
+    if args.rate_limit:
+        per_worker = max(1, args.rate_limit // args.workers)
+        options = BulkWriterOptions(initial_ops_per_second=per_worker, max_ops_per_second=per_worker)
+    writer = db.bulk_writer(options=options)
+
+    def on_result(reference, result, bulk_writer):
+        stats.add('written')
+
+    def on_error(error, bulk_writer) -> bool:
+        if error.attempts < MAX_WRITE_ATTEMPTS:
+            return True
+        stats.add('failed')
+        print(f"❌ Write to {error.reference.path} failed after {error.attempts} attempts: {error.message}")
+        return False
+
+    writer.on_write_result(on_result)
+    writer.on_write_error(on_error)
+    return writer
+
+
+def _scan_partition(db, args, partition: Partition, base_query: Callable, process_page: Callable,
+                    checkpoint: Checkpoint, stats: Stats, progress: Progress) -> None:
+    """Page through one key range, processing and checkpointing each page"""
+    from google.cloud.firestore_v1.field_path import FieldPath
+    from firestore_backend import STORIES_COLLECTION
+
+    name, lower, upper = partition
+    if checkpoint.is_done(name):
+        return
+    collection = db.collection(STORIES_COLLECTION)
+    document_id = FieldPath.document_id()
+    writer = None if args.dry_run else _make_bulk_writer(db, args, stats)
+
+    cursor = checkpoint.cursor(name)
+    while True:
+        query = base_query(collection)
+        if cursor is not None:
+            query = query.where(document_id, '>', collection.document(cursor))
+        elif lower is not None:
+            query = query.where(document_id, '>=', collection.document(lower))
+        if upper is not None:
+            query = query.where(document_id, '<', collection.document(upper))
+        page = list(query.order_by(document_id).limit(args.page_size).stream())
+        if not page:
+            break
+
+        process_page(page, writer, stats)
+        stats.add('scanned', len(page))
+        if writer is not None:
+            writer.flush()
+        cursor = page[-1].id
+        checkpoint.advance(name, cursor, stats)
+        progress.tick()
+        if len(page) < args.page_size:
+            break
+
+    if writer is not None:
+        writer.close()
+    checkpoint.advance(name, cursor, stats, done=True)
+
+
+def run_scan(args, key: str, base_query: Callable, process_page: Callable) -> Dict[str, int]:
+    """
+    Run process_page over every story matched by base_query, in parallel key ranges.
+
+    Args:
+        args: Parsed command line arguments
+        key: Identifies the job in the checkpoint file
+        base_query: Builds the query from the stories collection (filters, field selection)
+        process_page: Called as process_page(snapshots, bulk_writer, stats); bulk_writer is None in dry runs
+
+    Returns:
+        Final counters
+    """
+    db = _connect()
+    checkpoint = open_checkpoint(args, key)
+    stats = Stats(checkpoint.stats)
+    progress = Progress(stats, key)
+    partitions = partition_bounds(args.workers * PARTITIONS_PER_WORKER)
+
+    print(f"🚀 {key}: {len(partitions)} partitions, {args.workers} workers"
+          f"{' (dry run)' if args.dry_run else ''}")
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            pool.submit(_scan_partition, db, args, partition, base_query, process_page, checkpoint, stats, progress)
+            for partition in partitions
+        ]
+        for future in as_completed(futures):
+            future.result()
+
+    checkpoint.save(force=True)
+    progress.tick(force=True)
+    return stats.snapshot()
+
+
+# --- Commands ---
+
+def cmd_owners(args) -> None:
+    def process_page(page, writer, stats: Stats) -> None:
+        stats.merge(Counter(f"owner:{doc.get('userId') or 'MISSING'}" for doc in page))
+
+    counts = run_scan(args, 'owners', lambda stories: stories.select(['userId']), process_page)
+    owners = sorted(((k[len('owner:'):], v) for k, v in counts.items() if k.startswith('owner:')),
+                    key=lambda pair: -pair[1])
+    print(f"\n{'userId':<40}{'stories':>10}")
+    for user_id, count in owners:
+        print(f"{user_id:<40}{count:>10}")
+    print(f"\n📚 {counts.get('scanned', 0)} stories, {len(owners)} owners")
+
+
+def cmd_transfer_owner(args) -> None:
+    if not args.to_user or args.from_user == args.to_user:
+        raise SystemExit("--to must be set and differ from --from")
+
+    def process_page(page, writer, stats: Stats) -> None:
+        for doc in page:
+            if writer is not None:
+                writer.update(doc.reference, {'userId': args.to_user})
+        stats.add('matched', len(page))
+
+    counts = run_scan(
+        args,
+        f"transfer-owner:{args.from_user}->{args.to_user}",
+        lambda stories: stories.where('userId', '==', args.from_user).select(['userId']),
+        process_page
+    )
+    verb = 'would move' if args.dry_run else 'moved'
+    print(f"✅ {verb} {counts.get('matched', 0)} stories from '{args.from_user}' to '{args.to_user}'"
+          f" ({counts.get('failed', 0)} failed)")
+    if not args.dry_run and counts.get('matched'):
+        # Both users' totals changed; drop their stats so they are rebuilt on next read
+        from firestore_backend import get_db, USER_STATS_COLLECTION
+        for user_id in (args.from_user, args.to_user):
+            get_db().collection(USER_STATS_COLLECTION).document(user_id).delete()
+
+
+def cmd_backfill_metadata(args) -> None:
+    from story_metadata import backfill_story_metadata
+
+    def process_page(page, writer, stats: Stats) -> None:
+        for doc in page:
+            data = doc.to_dict() or {}
+            if data.get('deleted'):
+                continue
+            update = backfill_story_metadata(data)
+            if not update:
+                continue
+            stats.add('changed')
+            if writer is not None:
+                writer.update(doc.reference, update)
+
+    counts = run_scan(args, 'backfill-metadata', lambda stories: stories, process_page)
+    verb = 'would update' if args.dry_run else 'updated'
+    print(f"✅ {verb} metadata on {counts.get('changed', 0)} of {counts.get('scanned', 0)} stories"
+          f" ({counts.get('failed', 0)} failed)")
+    if counts.get('changed'):
+        print("ℹ️  Word counts changed; run 'repair-stats' to refresh users' library totals")
+
+
+def cmd_repair_stats(args) -> None:
+    """
+    Recompute every user's stats document from scratch.
+
+    Per-user totals are accumulated in the counters (so they are saved with
+    the checkpoint) and written once the whole collection has been scanned.
+    Stats of users who no longer have any stories are reset to zero.
+    """
+    from firestore_backend import get_db, USER_STATS_COLLECTION
+    from user_stats import story_contribution, compute_user_stats, apply_delta
+
+    def process_page(page, writer, stats: Stats) -> None:
+        totals: Counter = Counter()
+        for doc in page:
+            data = doc.to_dict() or {}
+            user_id = data.get('userId')
+            if not user_id:
+                continue
+            for key, value in story_contribution(data).items():
+                totals[f"user:{user_id}\t{key}"] += value
+        stats.merge(totals)
+
+    counts = run_scan(
+        args,
+        'repair-stats',
+        lambda stories: stories.select(['userId', 'status', 'genre', 'metadata', 'deleted']),
+        process_page
+    )
+
+    per_user: Dict[str, Dict[str, int]] = {}
+    for key, value in counts.items():
+        if key.startswith('user:'):
+            user_id, field = key[len('user:'):].split('\t', 1)
+            per_user.setdefault(user_id, {})[field] = value
+    stats_collection = get_db().collection(USER_STATS_COLLECTION)
+    stale_users = [ref.id for ref in stats_collection.list_documents() if ref.id not in per_user]
+
+    if args.dry_run:
+        print(f"✅ would rewrite stats for {len(per_user)} users and reset {len(stale_users)}")
+        return
+    writer = _make_bulk_writer(get_db(), args, Stats())
+    for user_id, totals in per_user.items():
+        rebuilt = compute_user_stats([])
+        writer.set(stats_collection.document(user_id), {**apply_delta(rebuilt, totals), 'rebuiltAt': rebuilt['rebuiltAt']})
+    for user_id in stale_users:
+        writer.set(stats_collection.document(user_id), compute_user_stats([]))
+    writer.close()
+    print(f"✅ rewrote stats for {len(per_user)} users, reset {len(stale_users)}")
+
+
+def cmd_cleanup_orphans(args) -> None:
+    """
+    Delete subcollections (bible items, revisions) left under story IDs whose
+    story document no longer exists.
+
+    Firestore can only enumerate such missing parents by listing document
+    references, which is a single ordered stream, so listing is sequential
+    while existence checks and recursive deletes run in parallel per page.
+    The checkpoint cursor only advances past pages that have all finished.
+    """
+    from firestore_backend import STORIES_COLLECTION
+
+    db = _connect()
+    key = 'cleanup-orphans'
+    checkpoint = open_checkpoint(args, key)
+    stats = Stats(checkpoint.stats)
+    progress = Progress(stats, key)
+    resume_after = checkpoint.cursor('all')
+
+    def process_page(refs) -> None:
+        snapshots = db.get_all(refs, field_paths=['userId'])
+        orphans = [snapshot.reference for snapshot in snapshots if not snapshot.exists]
+        stats.add('scanned', len(refs))
+        stats.add('orphans', len(orphans))
+        if args.dry_run or not orphans:
+            return
+        writer = _make_bulk_writer(db, args, stats)
+        for ref in orphans:
+            db.recursive_delete(ref, bulk_writer=writer)
+        writer.close()
+
+    print(f"🚀 {key}: {args.workers} workers{' (dry run)' if args.dry_run else ''}")
+    pending: deque = deque()
+
+    def settle(max_pending: int) -> None:
+        # Advance the cursor over the leading run of finished pages, waiting
+        # on the oldest page while more than max_pending are in flight
+        while pending and (len(pending) > max_pending or pending[0][1].done()):
+            last_id, future = pending.popleft()
+            future.result()
+            checkpoint.advance('all', last_id, stats)
+            progress.tick()
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        page: List[Any] = []
+        for ref in db.collection(STORIES_COLLECTION).list_documents(page_size=args.page_size):
+            if resume_after is not None and ref.id <= resume_after:
+                continue
+            page.append(ref)
+            if len(page) >= args.page_size:
+                pending.append((page[-1].id, pool.submit(process_page, page)))
+                page = []
+                settle(max_pending=args.workers * 2)
+        if page:
+            pending.append((page[-1].id, pool.submit(process_page, page)))
+        settle(max_pending=0)
+
+    checkpoint.advance('all', None, stats, done=True)
+    progress.tick(force=True)
+    counts = stats.snapshot()
+    if args.dry_run:
+        print(f"✅ would delete {counts.get('orphans', 0)} orphaned stories' subcollections")
+    else:
+        print(f"✅ deleted {counts.get('written', 0)} documents under {counts.get('orphans', 0)} orphaned stories"
+              f" ({counts.get('failed', 0)} failed)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Storynexis Firestore maintenance")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--dry-run', action='store_true', help="report changes without writing")
+    common.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="parallel partitions")
+    common.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help="documents per query page")
+    common.add_argument('--rate-limit', type=int, default=0, help="max writes per second (0 = BulkWriter default ramp-up)")
+    common.add_argument('--checkpoint', help="progress file for resuming interrupted runs (not used by --dry-run)")
+    common.add_argument('--restart', action='store_true', help="ignore an existing checkpoint")
+
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('owners', parents=[common], help="story counts per userId").set_defaults(handler=cmd_owners)
+
+    transfer = commands.add_parser('transfer-owner', parents=[common], help="move stories to another userId")
+    transfer.add_argument('--from', dest='from_user', required=True, help="current userId (e.g. 'guest')")
+    transfer.add_argument('--to', dest='to_user', required=True, help="new owner's Firebase UID")
+    transfer.set_defaults(handler=cmd_transfer_owner)
+
+    commands.add_parser('backfill-metadata', parents=[common],
+                        help="fill in missing/stale word counts and content hashes").set_defaults(handler=cmd_backfill_metadata)
+    commands.add_parser('cleanup-orphans', parents=[common],
+                        help="delete subcollections of deleted stories").set_defaults(handler=cmd_cleanup_orphans)
+    commands.add_parser('repair-stats', parents=[common],
+                        help="recompute users' library stats").set_defaults(handler=cmd_repair_stats)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    if args.workers < 1 or args.page_size < 1:
+        raise SystemExit("--workers and --page-size must be positive")
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,210 @@
+"""
+Structured, non-blocking logging for the backend.
+
+Request paths used to print() synchronously: formatting whole manuscripts or
+model outputs on the event loop and blocking it on stdout. Modules now log
+through the standard `logging` module:
+
+    log = logging.getLogger(__name__)
+    log.info("📝 Updating story %s", story_id, extra=fields(userId=user_id, chars=len(content)))
+
+- Lazy: messages use %-style arguments, which are only formatted when the
+  record passes its logger's level and sampling.
+- Off the hot path: the calling thread only puts the record on a bounded
+  queue (LOG_QUEUE_SIZE); a listener thread formats and writes it. When the
+  queue is full the record is dropped and counted rather than blocking.
+- Truncated: the message and every structured field are cut to
+  LOG_MAX_FIELD_CHARS characters when formatted.
+- Configurable per module: LOG_LEVEL sets the default; LOG_LEVELS overrides
+  it per logger ("firestore_service=DEBUG,main=WARNING"); LOG_SAMPLING keeps
+  only a fraction of a logger's records below WARNING ("main=0.1").
+- LOG_FORMAT=json writes one JSON object per line (time, level, logger,
+  message and the structured fields); the default is text, one line per
+  record with fields appended as key=value.
+
+Since formatting happens on the listener thread, arguments should not be
+mutated after the call (pass ids, lengths and strings, not live objects).
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import Any, Dict, Optional
+
+from fast_response import dumps
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Per-logger levels, e.g. "firestore_service=DEBUG,main=WARNING"
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+# Fraction of a logger's DEBUG/INFO records kept, e.g. "main=0.1,story_cache=0.5"
+LOG_SAMPLING = os.getenv('LOG_SAMPLING', '')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_MAX_FIELD_CHARS = int(os.getenv('LOG_MAX_FIELD_CHARS', '300'))
+# Records waiting for the writer thread before new ones are dropped
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def fields(**values: Any) -> Dict[str, Any]:
+    """`extra=` for structured fields: log.info("...", extra=fields(storyId=story_id))"""
+    return values
+
+
+def truncate(value: Any, limit: int = LOG_MAX_FIELD_CHARS) -> str:
+    text = value if isinstance(value, str) else str(value)
+    if limit and len(text) > limit:
+        return f"{text[:limit]}… [{len(text) - limit} more chars]"
+    return text
+
+
+def _parse_pairs(spec: str) -> Dict[str, str]:
+    pairs = {}
+    for item in spec.split(','):
+        name, sep, value = item.partition('=')
+        if sep and name.strip():
+            pairs[name.strip()] = value.strip()
+    return pairs
+
+
+def _record_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    """`time level logger: message key=value ...`, each part truncated"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = truncate(record.message)
+        line = super().formatMessage(record)
+        extra = _record_fields(record)
+        if extra:
+            line += ' ' + ' '.join(f"{key}={truncate(value)}" for key, value in extra.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': truncate(record.getMessage()),
+        }
+        for key, value in _record_fields(record).items():
+            entry[key] = value if isinstance(value, (int, float, bool)) or value is None else truncate(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = truncate(record.exc_text, LOG_MAX_FIELD_CHARS * 10)
+        return dumps(entry).decode('utf-8')
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps `rate` of the records below WARNING (warnings and errors always pass)"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread and drops
+    records instead of blocking once `max_size` are waiting
+
+    Uses queue.SimpleQueue (implemented in C, a lock-free put) bounded by its
+    size, rather than a bounded queue.Queue, whose put() takes two
+    Python-level locks per record.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int = LOG_QUEUE_SIZE):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Tracebacks reference live frames, so render them before handing off
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+        else:
+            self.queue.put_nowait(record)
+
+
+_handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging() -> None:
+    """
+    Route all logging through the background writer (idempotent)
+
+    Called once at startup, before the application's modules start logging.
+    """
+    global _handler, _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+
+    # Neither format uses the caller's file/line or process, so skip looking them up per record
+    logging._srcfile = None
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    log_queue = queue.SimpleQueue()
+    _handler = NonBlockingQueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, output)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+
+    for name, level in _parse_pairs(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+    for name, rate in _parse_pairs(LOG_SAMPLING).items():
+        # Filters only apply to records logged on that exact logger
+        logging.getLogger(name).addFilter(SamplingFilter(float(rate)))
+
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Write out queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> Dict[str, Any]:
+    """Queue depth and dropped records (reported by /health)"""
+    if _handler is None:
+        return {'configured': False}
+    return {
+        'configured': True,
+        'format': LOG_FORMAT,
+        'level': LOG_LEVEL,
+        'queued': _handler.queue.qsize(),
+        'dropped': _handler.dropped,
+    }
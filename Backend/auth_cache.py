@@ -0,0 +1,252 @@
+"""
+Cache of verified Firebase ID tokens.
+
+The frontend sends the same ID token on every request for up to an hour,
+and verifying it (certificate lookup + RSA signature check) costs
+milliseconds. Verified claims are kept in an LRU keyed by a SHA-256 of the
+token until shortly before the token's 'exp', so repeat requests cost a hash
+and a dict lookup.
+
+Revocation (AUTH_CHECK_REVOKED):
+- 'off' (default): a cached token stays valid until it expires, like a
+  plain verify_id_token() call
+- 'interval': revocation / disabled-account status is re-checked with the
+  Auth backend at most every AUTH_REVOCATION_INTERVAL_SECONDS per token
+- 'always': re-checked on every request (signature checks are still cached)
+
+Google's token signing certificates are re-fetched on a daemon thread when
+their Cache-Control lifetime runs out (SigningKeyRefresher), so the request
+that first sees expired certificates doesn't pay for the download.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from firebase_admin import auth
+
+log = logging.getLogger(__name__)
+
+# Verified tokens kept in memory. 0 disables the cache.
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '10000'))
+# Cached claims are dropped this long before the token expires
+AUTH_CACHE_EXPIRY_MARGIN_SECONDS = int(os.getenv('AUTH_CACHE_EXPIRY_MARGIN_SECONDS', '30'))
+# 'off', 'interval' or 'always'
+AUTH_CHECK_REVOKED = os.getenv('AUTH_CHECK_REVOKED', 'off').lower()
+AUTH_REVOCATION_INTERVAL_SECONDS = int(os.getenv('AUTH_REVOCATION_INTERVAL_SECONDS', '300'))
+# Refresh Google's signing certificates in the background
+AUTH_KEY_REFRESH = os.getenv('AUTH_KEY_REFRESH', 'true').lower() == 'true'
+
+# Certificates used to sign Firebase ID tokens
+ID_TOKEN_CERT_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+# Refresh schedule bounds when the response carries no usable Cache-Control
+_MIN_REFRESH_SECONDS = 60
+_DEFAULT_REFRESH_SECONDS = 3600
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class TokenRevokedError(Exception):
+    """The token was revoked or its account disabled after it was issued"""
+
+
+class _Entry:
+    __slots__ = ('claims', 'expires_at', 'checked_at')
+
+    def __init__(self, claims: Dict[str, Any], expires_at: float, checked_at: float):
+        self.claims = claims
+        self.expires_at = expires_at
+        self.checked_at = checked_at
+
+
+class TokenVerificationCache:
+    """
+    LRU of verified token claims with per-entry expiry.
+
+    Args:
+        max_entries: Number of tokens kept; least recently used are evicted
+        expiry_margin: Seconds before 'exp' at which an entry stops being used
+        check_revoked: 'off', 'interval' or 'always'
+        revocation_interval: Seconds between revocation checks in 'interval' mode
+    """
+
+    def __init__(
+        self,
+        max_entries: int = AUTH_CACHE_MAX_ENTRIES,
+        expiry_margin: int = AUTH_CACHE_EXPIRY_MARGIN_SECONDS,
+        check_revoked: str = AUTH_CHECK_REVOKED,
+        revocation_interval: int = AUTH_REVOCATION_INTERVAL_SECONDS
+    ):
+        if check_revoked not in ('off', 'interval', 'always'):
+            raise ValueError(f"Unknown AUTH_CHECK_REVOKED '{check_revoked}' (expected 'off', 'interval' or 'always')")
+        self.max_entries = max_entries
+        self.expiry_margin = expiry_margin
+        self.check_revoked = check_revoked
+        self.revocation_interval = revocation_interval
+        self._entries: "OrderedDict[bytes, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'revocationChecks': 0, 'revoked': 0}
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Decoded claims of a valid ID token.
+
+        Raises the same firebase_admin.auth errors as auth.verify_id_token on
+        a cache miss, and TokenRevokedError when a revocation check fails.
+        """
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+            else:
+                if entry is not None:
+                    del self._entries[key]
+                entry = None
+                self._counters['misses'] += 1
+
+        if entry is not None:
+            if self._revocation_due(entry, now):
+                self._check_revoked(key, entry.claims)
+                entry.checked_at = now
+            return entry.claims
+
+        check_revoked = self.check_revoked != 'off'
+        if check_revoked:
+            with self._lock:
+                self._counters['revocationChecks'] += 1
+        claims = auth.verify_id_token(token, check_revoked=check_revoked)
+        self._store(key, claims, now)
+        return claims
+
+    def invalidate_user(self, uid: str) -> int:
+        """Drop every cached token of a user (e.g. after revoking their sessions)"""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry.claims.get('uid') == uid]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                **self._counters,
+                'entries': len(self._entries),
+                'hitRate': round(self._counters['hits'] / lookups, 4) if lookups else 0.0,
+                'checkRevoked': self.check_revoked,
+            }
+
+    def _store(self, key: bytes, claims: Dict[str, Any], now: float) -> None:
+        if self.max_entries <= 0:
+            return
+        expires_at = float(claims.get('exp', 0)) - self.expiry_margin
+        if expires_at <= now:
+            return
+        with self._lock:
+            self._entries[key] = _Entry(claims, expires_at, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def _revocation_due(self, entry: _Entry, now: float) -> bool:
+        if self.check_revoked == 'always':
+            return True
+        return self.check_revoked == 'interval' and now - entry.checked_at >= self.revocation_interval
+
+    def _check_revoked(self, key: bytes, claims: Dict[str, Any]) -> None:
+        """Same checks as verify_id_token(check_revoked=True), without re-verifying the signature"""
+        with self._lock:
+            self._counters['revocationChecks'] += 1
+        user = auth.get_user(claims['uid'])
+        valid_after = (user.tokens_valid_after_timestamp or 0) / 1000
+        if user.disabled or claims.get('iat', 0) < valid_after:
+            with self._lock:
+                self._entries.pop(key, None)
+                self._counters['revoked'] += 1
+            raise TokenRevokedError('disabled' if user.disabled else 'revoked')
+
+
+class SigningKeyRefresher:
+    """
+    Re-fetches Google's ID token signing certificates when their
+    Cache-Control max-age runs out.
+
+    firebase_admin caches the certificates in an HTTP cache honouring the
+    same headers; fetching through its session keeps that cache warm.
+    """
+
+    def __init__(self, cert_url: str = ID_TOKEN_CERT_URL):
+        self.cert_url = cert_url
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refreshes = 0
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        """Start the refresh thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="auth-key-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                delay = self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                log.warning("⚠️ Failed to refresh auth signing keys: %s", e)
+                delay = _MIN_REFRESH_SECONDS
+            self._stop.wait(delay)
+
+    def refresh(self) -> float:
+        """Fetch the certificates; returns seconds until they go stale"""
+        session = _firebase_cert_session()
+        response = session.get(self.cert_url, timeout=10)
+        response.raise_for_status()
+        self.refreshes += 1
+        return _freshness_seconds(response.headers)
+
+
+def _firebase_cert_session():
+    """The HTTP session firebase_admin verifies tokens with (falls back to a plain session)"""
+    try:
+        client = auth._get_client(None)
+        return client._token_verifier.request.session
+    except Exception:
+        import requests
+        return requests.Session()
+
+
+def _freshness_seconds(headers) -> float:
+    """Remaining lifetime of a response from its Cache-Control max-age and Age headers"""
+    match = _MAX_AGE.search(headers.get('Cache-Control', ''))
+    if not match:
+        return _DEFAULT_REFRESH_SECONDS
+    remaining = int(match.group(1)) - int(headers.get('Age', 0) or 0)
+    # Refetch just after expiry so the HTTP cache actually goes to the network
+    return max(remaining + 1, _MIN_REFRESH_SECONDS)
+
+
+# Process-wide caches
+token_cache = TokenVerificationCache()
+signing_key_refresher = SigningKeyRefresher()
@@ -0,0 +1,233 @@
+"""
+Write-behind buffer for editor autosaves.
+
+The editor autosaves the full story every few seconds while the user types.
+Instead of turning every autosave into a Firestore write, this module keeps
+the latest pending state per story in memory and persists it once per
+coalescing window.
+
+Durability guarantees:
+- An explicit (non-autosave) save is merged with the pending state and
+  written immediately in a single write.
+- Pending state is flushed when its window expires, measured from the first
+  buffered autosave, so a continuously typing user is persisted at least once
+  per window.
+- Graceful shutdown (FastAPI lifespan exit) flushes every pending story.
+- A hard crash (SIGKILL, power loss) can lose at most one window of autosaves.
+  The frontend's sessionStorage backup covers that gap on the client.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Optional, Dict, Any
+
+from fastapi import HTTPException
+
+from firestore_service import get_story, update_story
+
+log = logging.getLogger(__name__)
+
+# Coalescing window in seconds. 0 disables write-behind (every save is written).
+AUTOSAVE_COALESCE_SECONDS = float(os.getenv('AUTOSAVE_COALESCE_SECONDS', '0'))
+
+# Fields accepted by update_story that can be coalesced
+STORY_FIELDS = ('title', 'genre', 'content', 'chapters', 'settings', 'status')
+
+
+def _payload_size(fields: Dict[str, Any]) -> int:
+    """Approximate the wire size of a save payload in bytes"""
+    return len(json.dumps(fields, default=str).encode('utf-8'))
+
+
+class _PendingSave:
+    """Latest buffered state for a single story"""
+
+    def __init__(self, user_id: str, base_story: Dict[str, Any]):
+        self.user_id = user_id
+        self.base_story = base_story
+        self.fields: Dict[str, Any] = {}
+        self.saves = 0
+        self.bytes_buffered = 0
+        self.timer: Optional[asyncio.Task] = None
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces autosaves per story and persists only the latest state.
+
+    Args:
+        window_seconds: How long a story's autosaves are buffered before
+            being written. 0 disables buffering.
+    """
+
+    def __init__(self, window_seconds: float = AUTOSAVE_COALESCE_SECONDS):
+        self.window_seconds = window_seconds
+        self._pending: Dict[str, _PendingSave] = {}
+        self._lock = asyncio.Lock()
+        self._stats = {
+            'saves_received': 0,
+            'writes_issued': 0,
+            'bytes_received': 0,
+            'bytes_written': 0,
+            'flush_errors': 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0
+
+    async def submit(self, story_id: str, user_id: str, **fields) -> Dict[str, Any]:
+        """
+        Buffer an autosave for a story.
+
+        The first autosave in a window verifies ownership with a single read;
+        later autosaves in the same window only update memory.
+
+        Returns:
+            The story as it will look once the pending state is persisted
+        """
+        fields = {k: v for k, v in fields.items() if k in STORY_FIELDS and v is not None}
+        size = _payload_size(fields)
+
+        base_story = None
+        while True:
+            # Lookup/creation and the field update share one critical section,
+            # so a concurrent flush can never pop the entry between them.
+            async with self._lock:
+                entry = self._pending.get(story_id)
+                if entry is None or entry.user_id != user_id:
+                    if base_story is None:
+                        entry = None
+                    else:
+                        entry = _PendingSave(user_id, base_story)
+                        self._pending[story_id] = entry
+                        entry.timer = asyncio.create_task(self._flush_after_window(story_id, entry))
+
+                if entry is not None:
+                    # Chapters and legacy content are mutually exclusive in update_story
+                    if 'chapters' in fields:
+                        entry.fields.pop('content', None)
+                    elif 'content' in fields:
+                        entry.fields.pop('chapters', None)
+                    entry.fields.update(fields)
+                    entry.saves += 1
+                    entry.bytes_buffered += size
+                    self._stats['saves_received'] += 1
+                    self._stats['bytes_received'] += size
+
+                    return {**entry.base_story, **entry.fields, 'id': story_id}
+
+            # Raises 404/403 exactly like a direct save would
+            base_story = await get_story(story_id, user_id)
+
+    async def flush(self, story_id: str, user_id: Optional[str] = None, **overrides) -> Optional[Dict[str, Any]]:
+        """
+        Persist the pending state for a story now.
+
+        Fields passed as overrides (an explicit save) are merged on top of the
+        pending autosave so both land in a single write.
+
+        With a user_id, state buffered by another user is left alone, so a
+        request from someone who does not own the story cannot trigger a
+        write before its ownership check. Only internal callers (window
+        expiry, shutdown) flush without one.
+
+        Returns:
+            The updated story, or None if nothing was pending for this user
+        """
+        async with self._lock:
+            entry = self._pending.get(story_id)
+            if entry is None or (user_id is not None and entry.user_id != user_id):
+                return None
+            del self._pending[story_id]
+        if entry.timer is not None and entry.timer is not asyncio.current_task():
+            entry.timer.cancel()
+
+        overrides = {k: v for k, v in overrides.items() if k in STORY_FIELDS and v is not None}
+        if overrides and user_id == entry.user_id:
+            if 'chapters' in overrides:
+                entry.fields.pop('content', None)
+            elif 'content' in overrides:
+                entry.fields.pop('chapters', None)
+            entry.fields.update(overrides)
+            return await self._write(story_id, entry)
+
+        await self._write(story_id, entry)
+        return None
+
+    async def flush_all(self) -> int:
+        """Persist every pending story (used on graceful shutdown). Returns stories flushed."""
+        async with self._lock:
+            story_ids = list(self._pending.keys())
+        for story_id in story_ids:
+            try:
+                await self.flush(story_id)
+            except Exception as e:
+                log.error("❌ Autosave flush failed for story %s during shutdown: %s", story_id, e)
+        return len(story_ids)
+
+    async def discard(self, story_id: str) -> None:
+        """Drop pending state without writing it (e.g. the story was deleted)"""
+        async with self._lock:
+            entry = self._pending.pop(story_id, None)
+        if entry is not None and entry.timer is not None:
+            entry.timer.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters describing how much write volume was coalesced away"""
+        writes = self._stats['writes_issued']
+        saves = self._stats['saves_received']
+        return {
+            **self._stats,
+            'enabled': self.enabled,
+            'window_seconds': self.window_seconds,
+            'pending_stories': len(self._pending),
+            'bytes_saved': max(self._stats['bytes_received'] - self._stats['bytes_written'], 0),
+            'coalescing_ratio': round(saves / writes, 2) if writes else 0.0,
+        }
+
+    async def _flush_after_window(self, story_id: str, entry: _PendingSave) -> None:
+        try:
+            await asyncio.sleep(self.window_seconds)
+            async with self._lock:
+                if self._pending.get(story_id) is not entry:
+                    return
+            await self.flush(story_id)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            log.error("❌ Autosave flush failed for story %s: %s", story_id, e)
+
+    async def _write(self, story_id: str, entry: _PendingSave) -> Dict[str, Any]:
+        try:
+            result = await update_story(story_id=story_id, user_id=entry.user_id, **entry.fields)
+        except HTTPException as e:
+            self._stats['flush_errors'] += 1
+            if e.status_code < 500:
+                # Story deleted or ownership changed - the state can never be written
+                raise
+            await self._rebuffer(story_id, entry)
+            raise
+        except Exception:
+            self._stats['flush_errors'] += 1
+            await self._rebuffer(story_id, entry)
+            raise
+        written = _payload_size(entry.fields)
+        self._stats['writes_issued'] += 1
+        self._stats['bytes_written'] += written
+        log.debug("💾 Autosave flushed story %s: %s save(s) coalesced, %s bytes saved",
+                  story_id, entry.saves, max(entry.bytes_buffered - written, 0))
+        return result
+
+    async def _rebuffer(self, story_id: str, entry: _PendingSave) -> None:
+        """Keep failed state buffered for the next window unless newer state arrived"""
+        async with self._lock:
+            if story_id not in self._pending:
+                entry.timer = asyncio.create_task(self._flush_after_window(story_id, entry))
+                self._pending[story_id] = entry
+
+
+# Process-wide buffer shared by the story save endpoints
+autosave_buffer = WriteBehindBuffer()
@@ -0,0 +1,107 @@
+"""
+Benchmark quality-guided best-of-N against exhaustive generation.
+
+Needs the model (Qwen2.5-1.5B-Instruct by default; pass a local path or hub
+name as the first argument). For each prompt, N candidates at the
+variations' temperatures are decoded:
+- exhaustive: one model.generate per candidate, as /generate/variations does
+- batched: best_of_generate with pruning disabled (shared prefill, one batch)
+- best-of: best_of_generate as /generate/best-of runs it
+
+and the best `keep` are scored (stripped, not cleaned). Reports the mean
+quality of the returned candidates, tokens decoded, seconds, and seconds per
+unit of mean quality (lower is better).
+
+Usage:
+    python benchmark_best_of.py [model] [--candidates 6] [--keep 3] [--tokens 200]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+import best_of
+from quality_control import score_batch
+
+PROMPTS = [
+    "The lighthouse keeper found a second set of footprints in the snow.",
+    "Nobody in the village remembered building the bridge, yet there it stood.",
+    "The letter arrived forty years late, still sealed, addressed to my grandmother.",
+    "At the end of the market street, the clockmaker's shop was open at midnight.",
+]
+
+
+def encode(tokenizer, story: str, device):
+    messages = [
+        {"role": "system", "content": "You are a creative storyteller. Continue the story."},
+        {"role": "user", "content": story},
+    ]
+    text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    return tokenizer(text, return_tensors="pt").to(device)
+
+
+def exhaustive(model, tokenizer, inputs, temperatures, max_new_tokens, keep):
+    texts, decoded = [], 0
+    for temperature in temperatures:
+        outputs = model.generate(
+            inputs.input_ids, attention_mask=inputs.attention_mask, max_new_tokens=max_new_tokens,
+            temperature=temperature, top_p=0.9, do_sample=True, repetition_penalty=1.12,
+            pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id, use_cache=True,
+        )
+        generated = outputs[0][inputs.input_ids.shape[1]:]
+        decoded += len(generated)
+        texts.append(tokenizer.decode(generated, skip_special_tokens=True))
+    scores = sorted((scores['overall'] for scores in score_batch([text.strip() for text in texts])), reverse=True)
+    return scores[:keep], decoded
+
+
+def searched(model, tokenizer, inputs, temperatures, max_new_tokens, keep):
+    best, stats = best_of.best_of_generate(model, tokenizer, inputs.input_ids, temperatures, max_new_tokens, keep)
+    texts = [tokenizer.decode(candidate.tokens, skip_special_tokens=True).strip() for candidate in best]
+    return [scores['overall'] for scores in score_batch(texts)], stats['tokensDecoded']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model', nargs='?', default="Qwen/Qwen2.5-1.5B-Instruct")
+    parser.add_argument('--candidates', type=int, default=6)
+    parser.add_argument('--keep', type=int, default=3)
+    parser.add_argument('--tokens', type=int, default=200)
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    tokenizer = AutoTokenizer.from_pretrained(args.model, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(
+        args.model, torch_dtype=torch.float16 if device.type == "cuda" else torch.float32, trust_remote_code=True
+    ).to(device).eval()
+    temperatures = [min(0.8 + (i % 3) * 0.15, 1.0) for i in range(args.candidates)]
+    margin = best_of.BEST_OF_PRUNE_MARGIN
+
+    def batched(*run):
+        best_of.BEST_OF_PRUNE_MARGIN = float('inf')
+        try:
+            return searched(*run)
+        finally:
+            best_of.BEST_OF_PRUNE_MARGIN = margin
+
+    print(f"{args.candidates} candidates, best {args.keep}, max_new_tokens={args.tokens}, {device}")
+    print(f"{'mode':<12}{'quality':>9}{'tokens':>9}{'seconds':>9}{'s/quality':>11}")
+    for label, run in (("exhaustive", exhaustive), ("batched", batched), ("best-of", searched)):
+        qualities, tokens, seconds = [], 0, 0.0
+        for seed, prompt in enumerate(PROMPTS):
+            torch.manual_seed(seed)
+            inputs = encode(tokenizer, prompt, device)
+            start = time.perf_counter()
+            with torch.no_grad():
+                scores, decoded = run(model, tokenizer, inputs, temperatures, args.tokens, args.keep)
+            seconds += time.perf_counter() - start
+            qualities += scores
+            tokens += decoded
+        quality = sum(qualities) / len(qualities)
+        print(f"{label:<12}{quality:>9.3f}{tokens:>9}{seconds:>9.1f}{seconds / quality:>11.1f}")
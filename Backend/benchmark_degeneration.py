@@ -0,0 +1,101 @@
+"""
+Benchmark online degeneration detection.
+
+Feeds token sequences through DegenerationDetector the way
+DegenerationMonitor does during decoding (one token per step) and reports:
+- false positives on fluent text: every module docstring in this directory
+  (English prose), tokenized into words and punctuation
+- detection delay on loops: a fluent 80-token prefix followed by a loop of
+  period 1-40 tokens, plus loops with one token varied per repeat (periods
+  of 4 or more); delay is counted from the start of the loop, and tokens
+  saved against max_new_tokens=300 ('-': not caught)
+- cost per decoding step
+
+The model's tokens are subwords (~1.3 per English word), so real periods
+are a little longer than these word-level ones.
+
+Usage:
+    python benchmark_degeneration.py
+"""
+
+import ast
+import glob
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from degeneration import DegenerationDetector
+
+MAX_NEW_TOKENS = 300
+PREFIX_TOKENS = 80
+PERIODS = (1, 2, 3, 5, 8, 12, 16, 20, 30, 40)
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def docstring_corpus() -> list:
+    texts = []
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))):
+        with open(path, encoding='utf-8') as source:
+            docstring = ast.get_docstring(ast.parse(source.read()))
+        if docstring:
+            texts.append(docstring)
+    return texts
+
+
+def token_ids(texts: list) -> list:
+    vocabulary = {}
+    return [[vocabulary.setdefault(word.lower(), len(vocabulary)) for word in _TOKEN.findall(text)] for text in texts]
+
+
+def first_flag(tokens: list):
+    """(tokens consumed, reason) at the first flag, or (None, None)"""
+    detector = DegenerationDetector()
+    for index, token in enumerate(tokens):
+        reason = detector.update(token)
+        if reason is not None:
+            return index + 1, reason
+    return None, None
+
+
+if __name__ == "__main__":
+    fluent = [tokens for tokens in token_ids(docstring_corpus()) if len(tokens) >= 64]
+    flagged = [(len(tokens), *first_flag(tokens)) for tokens in fluent]
+    false_positives = [item for item in flagged if item[1] is not None]
+    total_tokens = sum(len(tokens) for tokens in fluent)
+    print(f"Fluent text: {len(fluent)} docstrings, {total_tokens} tokens, "
+          f"{len(false_positives)} flagged")
+    for length, at, reason in false_positives:
+        print(f"  flagged after {at} of {length} tokens ({reason})")
+
+    prose = [token for tokens in fluent for token in tokens]
+    prefix = prose[:PREFIX_TOKENS]
+    print(f"\nLoops after a {PREFIX_TOKENS}-token prefix, max_new_tokens={MAX_NEW_TOKENS}")
+    print(f"{'period':>8}{'exact: delay':>14}{'saved':>8}{'varied: delay':>15}{'saved':>8}")
+    for period in PERIODS:
+        cycle = prose[1000:1000 + period]
+        row = []
+        for varied in (False, True):
+            tokens = list(prefix)
+            repeat = 0
+            while len(tokens) < MAX_NEW_TOKENS:
+                unit = list(cycle)
+                if varied and period >= 4:
+                    # One token differs in every repeat (e.g. "the first door", "the second door")
+                    unit[period // 2] = 100000 + repeat
+                tokens.extend(unit)
+                repeat += 1
+            tokens = tokens[:MAX_NEW_TOKENS]
+            at, _ = first_flag(tokens)
+            row.append(('-', '-') if at is None else (str(at - PREFIX_TOKENS), str(MAX_NEW_TOKENS - at)))
+        print(f"{period:>8}{row[0][0]:>14}{row[0][1]:>8}{row[1][0]:>15}{row[1][1]:>8}")
+
+    # Thresholds that never trigger, so every step does the full update and check
+    detector = DegenerationDetector(max_repeat=2.0, min_diversity=-1.0)
+    start = time.perf_counter()
+    for token in prose * 5:
+        detector.update(token)
+    per_step = (time.perf_counter() - start) / (len(prose) * 5) * 1e6
+    print(f"\nCost per decoding step: {per_step:.2f} µs")
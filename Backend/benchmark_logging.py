@@ -0,0 +1,62 @@
+"""
+Benchmark request-path logging.
+
+Measures the CPU time the calling thread (the event loop, in the server)
+spends per log line - thread CPU time, so waiting for the GIL while the
+writer thread runs is not counted - for:
+- print() of an f-string, as the endpoints used to do (stdout sent to
+  /dev/null, so this is the best case for print - a terminal or a pipe
+  to a log collector is slower)
+- logging through app_logging: a record that is filtered out by level
+  (DEBUG with LOG_LEVEL=INFO), and one that is enqueued for the writer thread
+- a 200 KB payload (a manuscript or raw model output), both ways
+
+Usage:
+    python benchmark_logging.py
+"""
+
+import contextlib
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app_logging
+from app_logging import configure_logging, fields, logging_stats, shutdown_logging
+
+ITERATIONS = 20000
+PAYLOAD = "The lantern flickered, and she reached for the door. " * 4000
+
+
+def per_call(fn, iterations=ITERATIONS):
+    start = time.thread_time()
+    for i in range(iterations):
+        fn(i)
+    return (time.thread_time() - start) / iterations * 1e6
+
+
+if __name__ == "__main__":
+    devnull = open(os.devnull, 'w')
+    with contextlib.redirect_stdout(devnull):
+        print_small = per_call(lambda i: print(f"📝 Updating story story-{i} for user reader@example.com (UID: u{i})"))
+        print_payload = per_call(lambda i: print(f"DEBUG: Raw AI Bible response: {PAYLOAD}"), 2000)
+
+    # The writer thread resolves sys.stdout when configured, so point it at /dev/null too
+    real_stdout, sys.stdout = sys.stdout, devnull
+    configure_logging()
+    log = logging.getLogger('benchmark')
+    log_filtered = per_call(lambda i: log.debug("📝 Updating story %s for user %s", f"story-{i}", "reader@example.com"))
+    log_enqueued = per_call(lambda i: log.info("📝 Updating story %s", f"story-{i}", extra=fields(userId=f"u{i}")))
+    log_payload = per_call(lambda i: log.info("Raw AI Bible response: %s", PAYLOAD), 2000)
+    stats = logging_stats()
+    shutdown_logging()
+    sys.stdout = real_stdout
+
+    print(f"Calling-thread CPU per log line (µs), level {app_logging.LOG_LEVEL}\n")
+    print(f"{'':<34}{'print()':>10}{'logging':>10}")
+    print(f"{'one-line message':<34}{print_small:>10.2f}{log_enqueued:>10.2f}")
+    print(f"{'below level (DEBUG)':<34}{print_small:>10.2f}{log_filtered:>10.2f}")
+    print(f"{'200 KB payload':<34}{print_payload:>10.2f}{log_payload:>10.2f}")
+    print(f"\nDropped by the bounded queue: {stats['dropped']}")
@@ -0,0 +1,88 @@
+"""
+Benchmark story metadata maintenance on save.
+
+Compares recounting every chapter (the previous behaviour) with the
+incremental path in story_metadata.process_chapter_updates on a 200-chapter
+story where a single chapter was edited, and checks both give the same totals.
+
+Usage:
+    python benchmark_metadata.py
+"""
+
+import copy
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from story_metadata import (
+    calculate_word_count,
+    aggregate_story_metadata_from_chapters,
+    process_chapter_updates
+)
+
+CHAPTERS = 200
+PARAGRAPHS_PER_CHAPTER = 40
+ROUNDS = 50
+
+
+def make_chapters() -> list:
+    paragraph = "<p>The lighthouse keeper watched the storm roll in over the <em>black</em> water.</p>"
+    return [
+        {
+            'id': str(i),
+            'title': f'Chapter {i + 1}',
+            'content': paragraph * PARAGRAPHS_PER_CHAPTER,
+            'order': i,
+        }
+        for i in range(CHAPTERS)
+    ]
+
+
+def full_recount(chapters: list) -> dict:
+    """Previous behaviour: recount every chapter, then sum"""
+    for chapter in chapters:
+        content = chapter.get('content', '')
+        chapter['metadata'] = {
+            **(chapter.get('metadata') or {}),
+            'wordCount': calculate_word_count(content),
+            'characterCount': len(content),
+        }
+    return aggregate_story_metadata_from_chapters(chapters)
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    stored_chapters, stored_metadata = process_chapter_updates(make_chapters(), [])
+
+    full_samples, incremental_samples = [], []
+    for round_number in range(ROUNDS):
+        # Client sends the whole story back with one chapter edited
+        incoming = copy.deepcopy(stored_chapters)
+        edited = incoming[round_number % CHAPTERS]
+        edited['content'] += f"<p>Edit number {round_number}.</p>"
+
+        full_copy = copy.deepcopy(incoming)
+        full_samples.append(timed(full_recount, full_copy))
+        incremental_samples.append(timed(process_chapter_updates, incoming, stored_chapters, stored_metadata))
+
+        expected = aggregate_story_metadata_from_chapters(full_copy)
+        stored_chapters, stored_metadata = process_chapter_updates(
+            copy.deepcopy(incoming), stored_chapters, stored_metadata
+        )
+        assert stored_metadata['wordCount'] == expected['wordCount'], (stored_metadata, expected)
+        assert stored_metadata['characterCount'] == expected['characterCount']
+
+    full_ms = statistics.median(full_samples)
+    incremental_ms = statistics.median(incremental_samples)
+    print(f"{CHAPTERS} chapters, 1 edited per save (median of {ROUNDS} saves)")
+    print(f"  full recount:  {full_ms:8.2f} ms")
+    print(f"  incremental:   {incremental_ms:8.2f} ms  ({full_ms / incremental_ms:.1f}x faster)")
+    print(f"  totals match:  {stored_metadata['wordCount']} words, {stored_metadata['characterCount']} characters")
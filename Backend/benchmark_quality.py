@@ -0,0 +1,158 @@
+"""
+Benchmark quality scoring.
+
+Compares quality_control.calculate_quality_score and score_batch with the
+previous implementation (kept below as `legacy_quality_score`), which
+tokenized each text four times and built every trigram as a joined string.
+First checks that both produce identical scores on every text of the corpus
+(story-like passages of 30-900 words, degenerate loops, non-ASCII text and
+edge cases), then times:
+- one text at a time, for short (~60 words), medium (~250) and long (~900) passages
+- a batch of 3 variations, scored one by one vs with score_batch
+
+Usage:
+    python benchmark_quality.py
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from quality_control import calculate_quality_score, score_batch
+
+ITERATIONS = 2000
+REPEATS = 5
+SENTENCES = [
+    "The lantern flickered as she reached for the door.",
+    "Outside, the rain had turned the courtyard into a mirror of broken light!",
+    "Who had left the gate open?",
+    "He waited.",
+    "Somewhere beyond the hills a bell began to toll, slow and uneven, as if the ringer had forgotten the rhythm.",
+    "Mara counted the steps under her breath: eleven, twelve, thirteen...",
+    "Nothing moved in the hall except the dust, drifting through a thin bar of moonlight.",
+    "“You shouldn’t be here,” whispered a voice from the stairwell.",
+    "The letter was dated 1887, the ink faded to the colour of weak tea.",
+    "She folded it twice and slipped it into her coat.",
+]
+
+
+def legacy_quality_score(text: str) -> dict:
+    """The scoring functions as they were before the single-pass rewrite"""
+    def detect_repetition(text):
+        words = text.lower().split()
+        if len(words) < 10:
+            return 1.0
+        phrases = []
+        for i in range(len(words) - 2):
+            phrase = ' '.join(words[i:i+3])
+            phrases.append(phrase)
+        unique_phrases = len(set(phrases))
+        total_phrases = len(phrases)
+        return unique_phrases / total_phrases if total_phrases > 0 else 1.0
+
+    def calculate_coherence(text):
+        words = [w.lower() for w in re.findall(r'\b\w+\b', text)]
+        if len(words) < 10:
+            return 1.0
+        ttr = len(set(words)) / len(words)
+        return min(ttr / 0.5, 1.0)
+
+    def check_length_quality(text):
+        word_count = len(text.split())
+        if word_count < 20:
+            return word_count / 20
+        elif word_count > 500:
+            return max(0.5, 1.0 - (word_count - 500) / 500)
+        else:
+            return 1.0
+
+    def sentence_variety(text):
+        sentences = re.split(r'[.!?]+', text)
+        sentences = [s.strip() for s in sentences if s.strip()]
+        if len(sentences) < 2:
+            return 0.5
+        lengths = [len(s.split()) for s in sentences]
+        avg_length = sum(lengths) / len(lengths)
+        variance = sum((l - avg_length) ** 2 for l in lengths) / len(lengths)
+        return min(variance / 10, 1.0)
+
+    scores = {
+        'repetition': detect_repetition(text),
+        'coherence': calculate_coherence(text),
+        'length': check_length_quality(text),
+        'variety': sentence_variety(text),
+    }
+    scores['overall'] = (
+        scores['repetition'] * 0.3 +
+        scores['coherence'] * 0.3 +
+        scores['length'] * 0.2 +
+        scores['variety'] * 0.2
+    )
+    return scores
+
+
+def passage(words: int, rng: random.Random) -> str:
+    parts, count = [], 0
+    while count < words:
+        sentence = rng.choice(SENTENCES)
+        parts.append(sentence)
+        count += len(sentence.split())
+    return ' '.join(parts)
+
+
+def corpus(rng: random.Random) -> list:
+    texts = [passage(words, rng) for words in (30, 60, 120, 250, 500, 900) for _ in range(20)]
+    texts += [
+        "", "   ", "One.", "Short text without an ending", "!!! ... ???",
+        "and then the door opened and then " * 40,  # a decoding loop
+        "She said, \"No.\" " * 60,
+        "İstanbul'da İlkay ile buluştuk. Çok güzel bir gündü! Ya sonra?" * 5,
+        "Straße. STRASSE! ǅemal and ǈudmila met in Ωmega-town... Δelta? ß " * 8,
+        "word\tword\nword word word. " * 30,
+        "x_y 3.14 is-not a_word! 42nd street; don't stop? " * 12,
+    ]
+    return texts
+
+
+def best_of(fn, iterations: int, repeats: int = REPEATS) -> float:
+    """Fastest of `repeats` runs of `iterations` calls, in µs per call"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / iterations * 1e6
+
+
+def per_text(fn, texts) -> float:
+    return best_of(lambda: [fn(text) for text in texts], ITERATIONS // 5) / len(texts)
+
+
+if __name__ == "__main__":
+    rng = random.Random(7)
+    texts = corpus(rng)
+    mismatches = [text for text in texts if calculate_quality_score(text) != legacy_quality_score(text)]
+    batch_ok = score_batch(texts) == [legacy_quality_score(text) for text in texts]
+    print(f"Parity: {len(texts) - len(mismatches)}/{len(texts)} texts identical, batch {'identical' if batch_ok else 'DIFFERS'}")
+    for text in mismatches[:3]:
+        print(f"  differs: {text[:60]!r}")
+
+    print(f"\n{'µs per text':<28}{'legacy':>10}{'current':>10}{'speedup':>10}")
+    for label, words in (("short (~60 words)", 60), ("medium (~250 words)", 250), ("long (~900 words)", 900)):
+        sample = [passage(words, rng) for _ in range(5)]
+        legacy = per_text(legacy_quality_score, sample)
+        current = per_text(calculate_quality_score, sample)
+        print(f"{label:<28}{legacy:>10.1f}{current:>10.1f}{legacy / current:>9.1f}x")
+
+    variations = [passage(200, rng) for _ in range(3)]
+    legacy = best_of(lambda: [legacy_quality_score(text) for text in variations], ITERATIONS // 5)
+    batch = best_of(lambda: score_batch(variations), ITERATIONS // 5)
+    print(f"{'3 variations (batch)':<28}{legacy:>10.1f}{batch:>10.1f}{legacy / batch:>9.1f}x")
+
+    if mismatches or not batch_ok:
+        sys.exit(1)
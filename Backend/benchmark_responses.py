@@ -0,0 +1,138 @@
+"""
+Benchmark story response serialization.
+
+Builds a 100k-word, 40-chapter story and compares:
+- the old path: response_model validation + jsonable_encoder + stdlib json
+  (what FastAPI does for a dict returned with response_model=StoryResponse)
+- json_response's path: orjson on the trusted dict
+and the size/time of each content encoding the server can produce.
+
+Usage:
+    python benchmark_responses.py
+"""
+
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fast_response import dumps, compress, available_encodings, story_payload
+
+CHAPTERS = 40
+WORDS = 100_000
+RUNS = 20
+
+# Pseudo-words with a prose-like length distribution, so compression ratios are realistic
+SYLLABLES = ['ka', 'lo', 'ren', 'dis', 'ta', 'mor', 'vi', 'sen', 'ul', 'bra', 'the', 'an', 'od', 'wy', 'qua', 'ish']
+
+
+def make_story() -> dict:
+    rng = random.Random(42)
+    vocabulary = [''.join(rng.choices(SYLLABLES, k=rng.randint(1, 4))) for _ in range(5000)]
+    words_per_chapter = WORDS // CHAPTERS
+    chapters = []
+    for number in range(CHAPTERS):
+        paragraphs = []
+        words = 0
+        while words < words_per_chapter:
+            sentences = []
+            for _ in range(rng.randint(3, 7)):
+                sentence = rng.choices(vocabulary, k=rng.randint(6, 20))
+                sentences.append(' '.join(sentence).capitalize() + '.')
+                words += len(sentence)
+            paragraphs.append(f"<p>{' '.join(sentences)}</p>")
+        content = ''.join(paragraphs)
+        now = datetime.utcnow().isoformat()
+        chapters.append({
+            'id': f"chapter-{number}",
+            'title': f"Chapter {number + 1}",
+            'content': content,
+            'order': number,
+            'status': 'draft',
+            'metadata': {'wordCount': words, 'characterCount': len(content), 'contentHash': f"{number:032x}",
+                         'createdAt': now, 'updatedAt': now},
+        })
+    return {
+        'id': 'benchmark-story',
+        'userId': 'benchmark-user',
+        'title': 'Benchmark Story',
+        'genre': 'Mystery',
+        'content': chapters[0]['content'],
+        'chapters': chapters,
+        'metadata': {'wordCount': WORDS, 'characterCount': sum(len(c['content']) for c in chapters),
+                     'chapterCount': CHAPTERS, 'createdAt': now, 'updatedAt': now, 'lastEditedAt': now},
+        'settings': {},
+        'status': 'draft',
+    }
+
+
+def model_path():
+    """Serializer equivalent to FastAPI's response_model handling, if pydantic/fastapi are installed"""
+    try:
+        from typing import Optional, List, Dict, Any
+        from pydantic import BaseModel
+        from fastapi.encoders import jsonable_encoder
+    except ImportError:
+        return None
+
+    class StoryResponse(BaseModel):
+        id: str
+        userId: str
+        title: str
+        genre: str
+        content: Optional[str] = ""
+        chapters: Optional[List[Dict[str, Any]]] = []
+        metadata: Dict[str, Any]
+        settings: Dict[str, Any]
+        status: str
+
+    def serialize(story: dict) -> bytes:
+        validated = StoryResponse.model_validate(story)
+        content = jsonable_encoder(validated)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode('utf-8')
+
+    return serialize
+
+
+def stdlib_path(story: dict) -> bytes:
+    return json.dumps(story, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+
+def measure(fn, *args):
+    samples = []
+    result = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+if __name__ == "__main__":
+    story = make_story()
+    print(f"Story: {WORDS} words, {CHAPTERS} chapters\n")
+    print(f"{'serializer':<38}{'median ms':>12}{'bytes':>12}")
+
+    serializers = [('stdlib json (no validation)', stdlib_path)]
+    validated = model_path()
+    if validated is not None:
+        serializers.insert(0, ('response_model + jsonable_encoder + json', validated))
+    else:
+        print("(pydantic/fastapi not installed - skipping the response_model path)")
+    serializers.append(('json_response (orjson)', lambda s: dumps(story_payload(s))))
+
+    body = b''
+    for name, fn in serializers:
+        elapsed, body = measure(fn, story)
+        print(f"{name:<38}{elapsed:>12.2f}{len(body):>12,}")
+
+    print(f"\n{'encoding':<38}{'median ms':>12}{'bytes':>12}{'ratio':>8}")
+    print(f"{'identity':<38}{0:>12.2f}{len(body):>12,}{1:>8.1f}")
+    for encoding in available_encodings():
+        elapsed, compressed = measure(compress, body, encoding)
+        print(f"{encoding:<38}{elapsed:>12.2f}{len(compressed):>12,}{len(body) / len(compressed):>8.1f}")
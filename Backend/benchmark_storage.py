@@ -0,0 +1,92 @@
+"""
+Benchmark storage backend operations.
+
+Runs the same story/bible workload against a StorageBackend and prints
+per-operation latency percentiles, so Firestore and SQLite can be compared.
+
+Usage:
+    python benchmark_storage.py             # SQLite in a temp directory
+    python benchmark_storage.py firestore   # needs Firebase credentials
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+STORIES = 50
+READS_PER_STORY = 20
+ITEMS_PER_STORY = 20
+
+
+def make_story(i: int) -> dict:
+    content = "<p>" + ("The lighthouse keeper watched the storm roll in. " * 400) + "</p>"
+    return {
+        'userId': 'benchmark-user',
+        'title': f'Benchmark Story {i}',
+        'genre': 'Mystery',
+        'content': content,
+        'chapters': [],
+        'metadata': {'wordCount': 3200, 'updatedAt': f'2026-01-01T00:00:{i:02d}'},
+        'settings': {},
+        'status': 'draft',
+    }
+
+
+def timed(samples: dict, name: str, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    samples.setdefault(name, []).append((time.perf_counter() - start) * 1_000_000)
+    return result
+
+
+def report(backend_name: str, samples: dict) -> None:
+    print(f"\n{backend_name} backend (microseconds)")
+    print(f"{'operation':<22}{'count':>8}{'p50':>12}{'p95':>12}{'max':>12}")
+    for name, values in samples.items():
+        values = sorted(values)
+        p95 = values[min(int(len(values) * 0.95), len(values) - 1)]
+        print(f"{name:<22}{len(values):>8}{statistics.median(values):>12.1f}{p95:>12.1f}{values[-1]:>12.1f}")
+
+
+def run(backend) -> dict:
+    samples: dict = {}
+    story_ids = []
+    for i in range(STORIES):
+        story_id = backend.new_story_id()
+        timed(samples, 'create_story', backend.create_story, story_id, make_story(i))
+        story_ids.append(story_id)
+
+    for story_id in story_ids:
+        for _ in range(READS_PER_STORY):
+            timed(samples, 'get_story', backend.get_story, story_id)
+        timed(samples, 'update_story', backend.update_story, story_id, {'title': 'Renamed'})
+        items = [{'name': f'Entity {n}', 'category': 'Character', 'description': 'x'} for n in range(ITEMS_PER_STORY)]
+        timed(samples, 'write_bible_items', backend.write_bible_items, story_id, items, [])
+        timed(samples, 'list_bible_items', backend.list_bible_items, story_id)
+
+    for _ in range(READS_PER_STORY):
+        timed(samples, 'list_stories', backend.list_stories, 'benchmark-user', None, 20, 0)
+
+    # Clean up
+    for story_id in story_ids:
+        while backend.delete_story_children(story_id, 500):
+            pass
+        backend.delete_story_document(story_id)
+    return samples
+
+
+if __name__ == "__main__":
+    backend_name = sys.argv[1] if len(sys.argv) > 1 else 'sqlite'
+    if backend_name == 'firestore':
+        from firebase_auth import initialize_firebase
+        from firestore_backend import FirestoreBackend
+        initialize_firebase()
+        report('firestore', run(FirestoreBackend()))
+    else:
+        from sqlite_backend import SQLiteBackend
+        with tempfile.TemporaryDirectory() as tmp:
+            report('sqlite', run(SQLiteBackend(os.path.join(tmp, 'benchmark.db'))))
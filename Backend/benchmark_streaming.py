@@ -0,0 +1,103 @@
+"""
+Benchmark SSE framing for streamed generations.
+
+Replays a 2,000-fragment generation from a blocking iterator (like
+TextIteratorStreamer) at a fixed token rate and writes every event to a
+socket, comparing:
+- the old path: the streamer iterated on the event loop, one json.dumps'd
+  event per fragment
+- StreamFramer: fragments buffered on a thread and coalesced over
+  STREAM_FRAME_WINDOW_MS / STREAM_FRAME_MAX_BYTES
+
+Reported: events and bytes per generation, and CPU time per token on the
+event loop thread (the one serving every other request) and in total
+(process time, all threads - includes the simulated decoder's pacing).
+
+Usage:
+    python benchmark_streaming.py
+"""
+
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from stream_framing import StreamFramer
+
+FRAGMENTS = 2000
+# Tokens per second: a fast GPU, and a burst (e.g. a cached continuation replayed)
+RATES = (60, 400)
+
+
+def make_fragments():
+    rng = random.Random(7)
+    words = ['the', ' lantern', ' flick', 'ered', ',', ' and', ' she', ' rea', 'ched', ' for', ' the', ' door', '.',
+             '\n\n', ' "', 'Who', "'s", ' there', '?"', ' é', 'té']
+    return [rng.choice(words) for _ in range(FRAGMENTS)]
+
+
+def paced(fragments, rate):
+    """Blocking iterator yielding fragments at `rate` per second"""
+    interval = 1 / rate
+    start = time.perf_counter()
+    for i, fragment in enumerate(fragments):
+        delay = start + i * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield fragment
+
+
+def drain(sock):
+    while sock.recv(65536):
+        pass
+
+
+async def old_events(fragments, rate):
+    for text_chunk in paced(fragments, rate):
+        yield f"data: {json.dumps({'type': 'chunk', 'text': text_chunk})}\n\n".encode('utf-8')
+        await asyncio.sleep(0)
+
+
+async def framed_events(fragments, rate):
+    framer = StreamFramer(heartbeat_seconds=0)
+    async for event in framer.sse(paced(fragments, rate)):
+        yield event
+
+
+async def run(events):
+    loop = asyncio.get_running_loop()
+    writer, reader = socket.socketpair()
+    writer.setblocking(False)
+    drainer = threading.Thread(target=drain, args=(reader,), daemon=True)
+    drainer.start()
+    count = 0
+    size = 0
+    loop_cpu = time.thread_time()
+    cpu = time.process_time()
+    async for event in events:
+        await loop.sock_sendall(writer, event)
+        count += 1
+        size += len(event)
+    loop_cpu = time.thread_time() - loop_cpu
+    cpu = time.process_time() - cpu
+    writer.close()
+    drainer.join()
+    reader.close()
+    return count, size, loop_cpu, cpu
+
+
+if __name__ == "__main__":
+    fragments = make_fragments()
+    print(f"{FRAGMENTS} fragments per generation\n")
+    print(f"{'path':<24}{'tokens/s':>10}{'events':>10}{'bytes':>10}{'loop µs/token':>15}{'total µs/token':>16}")
+    for rate in RATES:
+        for name, events in (('event per fragment', old_events), ('StreamFramer', framed_events)):
+            count, size, loop_cpu, cpu = asyncio.run(run(events(fragments, rate)))
+            print(f"{name:<24}{rate:>10}{count:>10,}{size:>10,}"
+                  f"{loop_cpu / FRAGMENTS * 1e6:>15.1f}{cpu / FRAGMENTS * 1e6:>16.1f}")
@@ -0,0 +1,198 @@
+"""
+Benchmark text post-processing.
+
+Compares text_processing.clean_and_complete_text, truncate_context and
+sentence_lengths with the previous implementations (kept below as
+`legacy_*`). First checks parity on a corpus of generated-text shapes
+(complete and cut-off passages, leaked meta-commentary, dialogue, quotes,
+ellipses, non-ASCII, edge cases):
+- cleaning and sentence lengths must be identical
+- truncation must be identical, except that it may now also start after a
+  ! or ? or a closing quote, which the legacy split on '. ' missed; there it
+  must start right after the window's first sentence boundary
+then times each on short generations and on a long story.
+
+Usage:
+    python benchmark_text.py
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from text_processing import clean_and_complete_text, sentence_boundaries, sentence_lengths, truncate_context
+
+ITERATIONS = 2000
+REPEATS = 5
+SENTENCES = [
+    "The lantern flickered as she reached for the door.",
+    "Outside, the rain had turned the courtyard into a mirror of broken light!",
+    "Who had left the gate open?",
+    "He waited.",
+    "“You shouldn’t be here,” whispered a voice from the stairwell.",
+    "\"Run,\" she said. \"Now!\"",
+    "Mara counted the steps under her breath: eleven, twelve, thirteen...",
+    "Mr. Hale paid 3.50 for the map, e.g. the old one.",
+    "'Is anyone there?' he called.",
+    "Somewhere beyond the hills a bell began to toll, slow and uneven, as if the ringer had forgotten the rhythm",
+    "Nothing moved in the hall except the dust, drifting through a thin bar of moonlight and settling on the piano",
+    "Çok güzel bir gündü!",
+]
+LEAKS = [
+    "Here's the continuation: ", "Let me continue the story:\n", "The story continues: ", "I'll write more:  ",
+    "", "", "",
+]
+TAILS = [
+    "\n[Note: this continues the scene]", "\n(Word count: 120)", "\n---\nEnd of part one", " --- notes", "", "", "",
+]
+
+
+def legacy_clean_and_complete_text(text):
+    if not text:
+        return text
+    unwanted_patterns = [
+        r'^(Here\'s|Here is|I\'ll|Let me|Continuing|The story continues).*?:\s*',
+        r'\n\s*\[.*?\]\s*$',
+        r'\n\s*\(.*?\)\s*$',
+        r'---+.*$',
+    ]
+    for pattern in unwanted_patterns:
+        text = re.sub(pattern, '', text, flags=re.IGNORECASE | re.DOTALL)
+    text = text.strip()
+    if text and text[-1] in '.!?"\'':
+        return text
+    sentence_endings = []
+    for match in re.finditer(r'[.!?]["\']?\s', text):
+        sentence_endings.append(match.end() - 1)
+    for match in re.finditer(r'[.!?]["\']?$', text):
+        sentence_endings.append(match.end())
+    if sentence_endings:
+        last_end = max(sentence_endings)
+        text = text[:last_end].strip()
+    else:
+        if len(text) > 20 and text[-1] not in '.!?,"\'':
+            last_comma = text.rfind(',')
+            last_and = text.rfind(' and ')
+            last_but = text.rfind(' but ')
+            break_point = max(last_comma, last_and, last_but)
+            if break_point > len(text) * 0.5:
+                text = text[:break_point].rstrip(',').strip() + '.'
+            else:
+                text = text + '.'
+    return text
+
+
+def legacy_truncate_context(content: str, max_tokens: int = 1000) -> str:
+    max_words = int(max_tokens * 0.75)
+    words = content.split()
+    if len(words) <= max_words:
+        return content
+    truncated_words = words[-max_words:]
+    truncated_text = ' '.join(truncated_words)
+    sentences = truncated_text.split('. ')
+    if len(sentences) > 1:
+        return '. '.join(sentences[1:])
+    return truncated_text
+
+
+def legacy_sentence_lengths(text: str) -> list:
+    sentences = re.split(r'[.!?]+', text)
+    return [len(s.split()) for s in sentences if s.strip()]
+
+
+def passage(words: int, rng: random.Random) -> str:
+    parts, count = [], 0
+    while count < words:
+        sentence = rng.choice(SENTENCES)
+        parts.append(sentence)
+        count += len(sentence.split())
+    text = rng.choice([' ', '\n', '  ', '\n\n']).join(parts)
+    if rng.random() < 0.5:
+        # Cut mid-sentence, as max_new_tokens does
+        text = text[:rng.randrange(1, len(text) + 1)]
+    return text
+
+
+def generation(words: int, rng: random.Random) -> str:
+    return rng.choice(LEAKS) + passage(words, rng) + rng.choice(TAILS)
+
+
+def corpus(rng: random.Random) -> list:
+    texts = [generation(words, rng) for words in (3, 10, 40, 100, 200, 400) for _ in range(100)]
+    texts += [
+        "", "   ", ".", "Hi", "One.", "!!! ... ???", "\"Quoted\"", "no ending at all here but long enough",
+        "Short, but with a comma and then more words that trail off",
+        "and then the door opened and then " * 40,
+        "Here is: ", "Continuing: he ran.", "Ends with quote.'\" ", "He said 'no.' Then left",
+        "İstanbul'da İlkay ile buluştuk. Çok güzel bir gündü! Ya sonra",
+        "x y. z w? tail",
+    ]
+    return texts
+
+
+def truncation_matches(text: str, max_tokens: int) -> bool:
+    legacy, current = legacy_truncate_context(text, max_tokens), truncate_context(text, max_tokens)
+    if current == legacy:
+        return True
+    # Started at an earlier ! ? or quote boundary, where the legacy result (if it skipped anything) follows
+    window = ' '.join(text.split()[-int(max_tokens * 0.75):])
+    boundaries = [end for end in sentence_boundaries(window) if end < len(window)]
+    expected = window[boundaries[0] + 1:] if boundaries else window
+    return current == expected and (legacy == window or current.endswith(legacy))
+
+
+def best_of(fn, iterations: int, repeats: int = REPEATS) -> float:
+    """Fastest of `repeats` runs of `iterations` calls, in µs per call"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / iterations * 1e6
+
+
+def per_text(fn, texts, iterations: int = ITERATIONS) -> float:
+    return best_of(lambda: [fn(text) for text in texts], max(iterations // len(texts), 1)) / len(texts)
+
+
+if __name__ == "__main__":
+    rng = random.Random(11)
+    texts = corpus(rng)
+    cleaned = [text for text in texts if clean_and_complete_text(text) != legacy_clean_and_complete_text(text)]
+    lengths = [text for text in texts if sentence_lengths(text) != legacy_sentence_lengths(text)]
+    stories = [passage(words, rng) for words in (500, 1000, 3000, 8000) for _ in range(10)] + texts
+    truncations = [(text, tokens) for text in stories for tokens in (20, 100, 1000, 3000)]
+    moved = [(text, tokens) for text, tokens in truncations
+             if truncate_context(text, tokens) != legacy_truncate_context(text, tokens)]
+    broken = [(text, tokens) for text, tokens in moved if not truncation_matches(text, tokens)]
+    print(f"Parity: cleaning {len(texts) - len(cleaned)}/{len(texts)} identical, "
+          f"sentence lengths {len(texts) - len(lengths)}/{len(texts)} identical")
+    print(f"        truncation {len(truncations) - len(moved)}/{len(truncations)} identical, "
+          f"{len(moved) - len(broken)} start at an earlier ! ? or quote boundary, {len(broken)} wrong")
+    for text in (cleaned + lengths)[:3] + [text for text, _ in broken[:3]]:
+        print(f"  differs: {text[:60]!r}")
+
+    print(f"\n{'µs per call':<32}{'legacy':>10}{'current':>10}{'speedup':>10}")
+    short = [generation(words, rng) for words in (40, 100, 200) for _ in range(10)]
+    rows = [
+        ("clean (40-200 word outputs)", legacy_clean_and_complete_text, clean_and_complete_text, short),
+        ("sentence lengths", legacy_sentence_lengths, sentence_lengths, short),
+    ]
+    for label, legacy_fn, current_fn, sample in rows:
+        legacy = per_text(legacy_fn, sample)
+        current = per_text(getattr(current_fn, '__wrapped__', current_fn), sample)
+        print(f"{label:<32}{legacy:>10.1f}{current:>10.1f}{legacy / current:>9.1f}x")
+    for words, tokens in ((2000, 1000), (8000, 3000)):
+        story = [passage(words, rng) for _ in range(3)]
+        legacy = per_text(lambda text: legacy_truncate_context(text, tokens), story, ITERATIONS // 10)
+        current = per_text(lambda text: truncate_context(text, tokens), story, ITERATIONS // 10)
+        label = f"truncate ({words} words, {tokens} tok)"
+        print(f"{label:<32}{legacy:>10.1f}{current:>10.1f}{legacy / current:>9.1f}x")
+
+    if cleaned or lengths or broken:
+        sys.exit(1)
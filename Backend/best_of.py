@@ -0,0 +1,213 @@
+"""
+Quality-guided best-of-N generation.
+
+/generate/variations decodes each variation to completion, one after the
+other, and ranks them afterwards. best_of_generate() decodes N candidates
+as one batch and spends less on the ones that are clearly losing:
+
+- The prompt is prefilled once and its KV cache shared by all candidates
+  (DynamicCache.batch_repeat_interleave) instead of N prefills.
+- Every BEST_OF_CHECK_TOKENS tokens (from BEST_OF_MIN_TOKENS on) the partial
+  texts are scored with quality_control.score_batch, and running candidates
+  scoring more than BEST_OF_PRUNE_MARGIN below the best are pruned, worst
+  first, while more than `keep` candidates remain.
+- Candidates that end (EOS), degenerate (degeneration.DegenerationDetector)
+  or are pruned leave the batch - their rows are dropped from the cache
+  (batch_select_indices) - so later steps only compute the survivors.
+
+Sampling matches model.generate with do_sample: repetition penalty,
+per-candidate temperature, then top-p. A plain decoding loop is used
+because model.generate keeps stopped sequences in the batch as padding.
+"""
+
+import logging
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import torch
+from transformers import DynamicCache, RepetitionPenaltyLogitsProcessor, TopPLogitsWarper
+
+from degeneration import DEGENERATION_STOPS, DEGENERATION_TOKENS_SAVED, DegenerationDetector
+from quality_control import score_batch
+from tracing import span
+
+log = logging.getLogger(__name__)
+
+# Candidates one request may ask for
+BEST_OF_MAX_CANDIDATES = int(os.getenv('BEST_OF_MAX_CANDIDATES', '8'))
+# Tokens between quality checkpoints, and before the first one
+BEST_OF_CHECK_TOKENS = int(os.getenv('BEST_OF_CHECK_TOKENS', '24'))
+BEST_OF_MIN_TOKENS = int(os.getenv('BEST_OF_MIN_TOKENS', '48'))
+# How far below the best overall score a running candidate is pruned
+BEST_OF_PRUNE_MARGIN = float(os.getenv('BEST_OF_PRUNE_MARGIN', '0.1'))
+
+
+class Candidate:
+    """
+    One sampled continuation
+
+    state is 'running', 'finished' (EOS or max_new_tokens), 'degenerate'
+    (stopped by the degeneration detector) or 'pruned'.
+    """
+
+    __slots__ = ('index', 'temperature', 'tokens', 'state', 'score', 'pruned_at')
+
+    def __init__(self, index: int, temperature: float):
+        self.index = index
+        self.temperature = temperature
+        self.tokens: List[int] = []
+        self.state = 'running'
+        self.score: Optional[float] = None
+        self.pruned_at: Optional[int] = None
+
+
+def _checkpoint(candidates: List[Candidate], tokenizer, keep: int, step: int) -> None:
+    """Score running and newly ended candidates; prune clearly inferior running ones"""
+    pending = [c for c in candidates if c.state in ('running', 'finished') and (c.state == 'running' or c.score is None)]
+    if pending:
+        texts = tokenizer.batch_decode([c.tokens for c in pending], skip_special_tokens=True)
+        for candidate, scores in zip(pending, score_batch(texts)):
+            candidate.score = scores['overall']
+
+    contenders = [c for c in candidates if c.state in ('running', 'finished')]
+    best = max((c.score for c in contenders if c.score is not None), default=None)
+    if best is None:
+        return
+    remaining = len(contenders)
+    for candidate in sorted((c for c in contenders if c.state == 'running'), key=lambda c: c.score):
+        if remaining <= keep or candidate.score >= best - BEST_OF_PRUNE_MARGIN:
+            break
+        candidate.state = 'pruned'
+        candidate.pruned_at = step
+        remaining -= 1
+
+
+@torch.no_grad()
+def best_of_generate(
+    model,
+    tokenizer,
+    input_ids: torch.Tensor,
+    temperatures: Sequence[float],
+    max_new_tokens: int,
+    keep: int,
+    top_p: float = 0.9,
+    repetition_penalty: float = 1.12,
+    endpoint: str = 'best_of',
+    probe=None,
+    cancel: Optional[threading.Event] = None
+) -> Tuple[List[Candidate], Dict[str, Any]]:
+    """
+    Sample len(temperatures) candidates for one prompt and return the best `keep`
+
+    Args:
+        input_ids: The prompt, shape (1, prompt length)
+        temperatures: Sampling temperature per candidate
+        keep: Candidates to return (never pruned below this many)
+        endpoint: Metric label for degeneration stops
+        probe: GenerationProbe timing the run (called once per decoding step)
+        cancel: Stops decoding at the next step once set (e.g. client disconnected)
+
+    Returns:
+        (the best `keep` candidates, best first by their last partial score -
+        re-rank after cleaning, search statistics)
+    """
+    started = time.perf_counter()
+    candidates = [Candidate(index, temperature) for index, temperature in enumerate(temperatures)]
+    detectors = [DegenerationDetector() for _ in candidates]
+    eos_token_id = tokenizer.eos_token_id
+    penalty = RepetitionPenaltyLogitsProcessor(repetition_penalty)
+    nucleus = TopPLogitsWarper(top_p)
+    count = len(candidates)
+
+    with span('model.best_of', candidates=count, keep=keep) as current:
+        # Prefill once, then give every candidate its own copy of the prompt's cache
+        cache = DynamicCache()
+        logits = model(input_ids=input_ids, past_key_values=cache, use_cache=True).logits[:, -1, :]
+        cache.batch_repeat_interleave(count)
+        logits = logits.repeat(count, 1)
+        sequences = input_ids.repeat(count, 1)
+        temps = torch.tensor(temperatures, device=input_ids.device, dtype=torch.float32).unsqueeze(1)
+        rows = list(range(count))  # candidate index of each batch row
+        decoded = 0
+
+        cancelled = False
+        for step in range(1, max_new_tokens + 1):
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            scores = penalty(sequences, logits.float())
+            scores = nucleus(sequences, scores / temps)
+            next_tokens = torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1)
+            sequences = torch.cat([sequences, next_tokens], dim=-1)
+            if probe is not None:
+                probe(sequences, None)
+
+            for row, token in enumerate(next_tokens[:, 0].tolist()):
+                candidate = candidates[rows[row]]
+                decoded += 1
+                if token == eos_token_id:
+                    candidate.state = 'finished'
+                    continue
+                candidate.tokens.append(token)
+                reason = detectors[candidate.index].update(token)
+                if reason is not None:
+                    candidate.state = 'degenerate'
+                    DEGENERATION_STOPS.inc(endpoint=endpoint, reason=reason)
+                    DEGENERATION_TOKENS_SAVED.inc(max_new_tokens - step, endpoint=endpoint)
+
+            if step == max_new_tokens:
+                break
+            if step >= BEST_OF_MIN_TOKENS and (step - BEST_OF_MIN_TOKENS) % BEST_OF_CHECK_TOKENS == 0:
+                _checkpoint(candidates, tokenizer, keep, step)
+
+            survivors = [row for row, index in enumerate(rows) if candidates[index].state == 'running']
+            if not survivors:
+                break
+            if len(survivors) < len(rows):
+                selected = torch.tensor(survivors, device=input_ids.device)
+                cache.batch_select_indices(selected)
+                sequences = sequences[selected]
+                temps = temps[selected]
+                next_tokens = next_tokens[selected]
+                rows = [rows[row] for row in survivors]
+            logits = model(input_ids=next_tokens, past_key_values=cache, use_cache=True).logits[:, -1, :]
+
+        for candidate in candidates:
+            if candidate.state == 'running':
+                candidate.state = 'finished'
+        if probe is not None:
+            # The probe counts steps; a batched step decodes one token per running candidate
+            probe.tokens = decoded
+
+        # Final scores, then the best `keep`, preferring candidates that did not degenerate
+        ranked = [c for c in candidates if c.state != 'pruned']
+        texts = tokenizer.batch_decode([c.tokens for c in ranked], skip_special_tokens=True)
+        for candidate, scores in zip(ranked, score_batch(texts)):
+            candidate.score = scores['overall']
+        ranked.sort(key=lambda c: (c.state != 'degenerate', c.score), reverse=True)
+
+        # An exhaustive run decodes every candidate to its end; for stopped ones that is at most max_new_tokens
+        exhaustive = sum(
+            max_new_tokens if c.state in ('pruned', 'degenerate') else len(c.tokens) + (len(c.tokens) < max_new_tokens)
+            for c in candidates
+        )
+        stats = {
+            'candidates': count,
+            'returned': min(keep, len(ranked)),
+            'pruned': sum(c.state == 'pruned' for c in candidates),
+            'degenerate': sum(c.state == 'degenerate' for c in candidates),
+            'prunedAt': sorted(c.pruned_at for c in candidates if c.pruned_at is not None),
+            'tokensDecoded': decoded,
+            'tokensExhaustive': exhaustive,
+            'tokensSaved': max(exhaustive - decoded, 0),
+            'prefillsSaved': count - 1,
+            'cancelled': cancelled,
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+        current.set(**{key: value for key, value in stats.items() if key != 'prunedAt'})
+
+    log.info("🏁 Best-of-%s: pruned %s, %s degenerate, %s of ~%s tokens decoded",
+             count, stats['pruned'], stats['degenerate'], decoded, exhaustive)
+    return ranked[:keep], stats
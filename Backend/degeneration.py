@@ -0,0 +1,193 @@
+"""
+Online degeneration detection.
+
+quality_control's repetition score only sees a generation after it has
+finished: a model stuck in a loop ("and then the door opened and then the
+door opened ...") decodes all max_new_tokens first. DegenerationMonitor is a
+StoppingCriteria that watches the newest token id of every sequence while
+decoding and stops a sequence as soon as its recent output has degenerated:
+
+- repetition: the share of token n-grams (DEGENERATION_NGRAM) in the last
+  DEGENERATION_WINDOW tokens that already occurred in that window reaches
+  DEGENERATION_MAX_REPEAT. N-grams are tracked as rolling polynomial hashes,
+  so each step costs a few integer operations and dict updates.
+- low diversity: the window's type-token ratio (distinct tokens / tokens)
+  falls to DEGENERATION_MIN_DIVERSITY.
+
+Nothing is checked before DEGENERATION_MIN_TOKENS tokens. Fluent prose
+repeats almost no 4-gram within 64 tokens; a loop of period p (up to about
+half the window) is caught some 35 + p tokens after it starts
+(benchmark_degeneration.py).
+
+The Story Bible run is not monitored: its JSON output repeats keys by design.
+
+Stops are counted per endpoint with the tokens they saved (max_new_tokens
+minus tokens generated - an upper bound, as the model might have ended
+earlier on its own) in /metrics.
+"""
+
+import logging
+import os
+from collections import deque
+from typing import Dict, List, Optional
+
+from transformers import StoppingCriteria
+
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+DEGENERATION_STOP = os.getenv('DEGENERATION_STOP', 'true').lower() == 'true'
+DEGENERATION_NGRAM = int(os.getenv('DEGENERATION_NGRAM', '4'))
+DEGENERATION_WINDOW = int(os.getenv('DEGENERATION_WINDOW', '64'))
+DEGENERATION_MIN_TOKENS = int(os.getenv('DEGENERATION_MIN_TOKENS', '32'))
+# Share of the window's n-grams that are repeats
+DEGENERATION_MAX_REPEAT = float(os.getenv('DEGENERATION_MAX_REPEAT', '0.5'))
+# Distinct tokens / tokens in the window
+DEGENERATION_MIN_DIVERSITY = float(os.getenv('DEGENERATION_MIN_DIVERSITY', '0.25'))
+
+_HASH_BASE = 1_000_003
+_HASH_MOD = (1 << 61) - 1
+
+DEGENERATION_STOPS = metrics.counter(
+    'generation_degeneration_stops_total', 'Generations stopped early as degenerate',
+    ('endpoint', 'reason')
+)
+DEGENERATION_TOKENS_SAVED = metrics.counter(
+    'generation_degeneration_tokens_saved_total',
+    'Tokens not decoded because of degeneration stops (max_new_tokens minus tokens generated)',
+    ('endpoint',)
+)
+
+
+class DegenerationDetector:
+    """
+    Incremental repetition / diversity check of one token sequence
+
+    Args:
+        ngram: N-gram length for repetition
+        window: Tokens the statistics cover
+        min_tokens: Tokens before anything is flagged
+        max_repeat: Repeated n-gram share that flags repetition
+        min_diversity: Type-token ratio that flags low diversity
+    """
+
+    def __init__(
+        self,
+        ngram: int = DEGENERATION_NGRAM,
+        window: int = DEGENERATION_WINDOW,
+        min_tokens: int = DEGENERATION_MIN_TOKENS,
+        max_repeat: float = DEGENERATION_MAX_REPEAT,
+        min_diversity: float = DEGENERATION_MIN_DIVERSITY
+    ):
+        self.ngram = ngram
+        self.window = window
+        self.min_tokens = max(min_tokens, ngram)
+        self.max_repeat = max_repeat
+        self.min_diversity = min_diversity
+        self.tokens = 0
+        self.reason: Optional[str] = None
+        self._recent = deque()  # last `window` tokens
+        self._token_counts: Dict[int, int] = {}
+        self._hashes = deque()  # hashes of the n-grams ending in the window
+        self._hash_counts: Dict[int, int] = {}
+        self._hash = 0
+        self._leading = pow(_HASH_BASE, ngram - 1, _HASH_MOD)
+
+    def update(self, token: int) -> Optional[str]:
+        """Add the next token; returns 'repetition' or 'low_diversity' once degenerate"""
+        if self.reason is not None:
+            return self.reason
+        recent = self._recent
+        # Roll the hash of the last `ngram` tokens
+        if len(recent) >= self.ngram:
+            self._hash = (self._hash - recent[-self.ngram] * self._leading) % _HASH_MOD
+        self._hash = (self._hash * _HASH_BASE + token) % _HASH_MOD
+
+        recent.append(token)
+        counts = self._token_counts
+        counts[token] = counts.get(token, 0) + 1
+        if len(recent) > self.window:
+            dropped = recent.popleft()
+            if counts[dropped] == 1:
+                del counts[dropped]
+            else:
+                counts[dropped] -= 1
+
+        self.tokens += 1
+        if self.tokens >= self.ngram:
+            hashes, hash_counts = self._hashes, self._hash_counts
+            hashes.append(self._hash)
+            hash_counts[self._hash] = hash_counts.get(self._hash, 0) + 1
+            if len(hashes) > self.window - self.ngram + 1:
+                dropped = hashes.popleft()
+                if hash_counts[dropped] == 1:
+                    del hash_counts[dropped]
+                else:
+                    hash_counts[dropped] -= 1
+
+        if self.tokens < self.min_tokens:
+            return None
+        if 1 - len(self._hash_counts) / len(self._hashes) >= self.max_repeat:
+            self.reason = 'repetition'
+        elif len(counts) / len(recent) <= self.min_diversity:
+            self.reason = 'low_diversity'
+        return self.reason
+
+
+class DegenerationMonitor(StoppingCriteria):
+    """
+    Stops sequences whose output degenerates (one DegenerationDetector per sequence)
+
+    Args:
+        endpoint: Metric label (generation_labels()['endpoint'])
+        max_new_tokens: The run's limit, to count the tokens a stop saved
+        eos_token_id: Sequences that emitted it are finished; in a batch they
+            keep receiving padding, which must not look like a loop
+    """
+
+    def __init__(self, endpoint: str, max_new_tokens: int, eos_token_id: Optional[int] = None):
+        self.endpoint = endpoint
+        self.max_new_tokens = max_new_tokens
+        self.eos_token_id = eos_token_id
+        self.detectors: List[DegenerationDetector] = []
+        self._finished = set()
+
+    @property
+    def stopped(self) -> List[Optional[str]]:
+        """Stop reason per sequence (None while healthy)"""
+        return [detector.reason for detector in self.detectors]
+
+    def __call__(self, input_ids, scores, **kwargs):
+        newest = input_ids[:, -1].tolist()
+        if not self.detectors:
+            self.detectors = [DegenerationDetector() for _ in newest]
+        flags = []
+        for row, (detector, token) in enumerate(zip(self.detectors, newest)):
+            if row in self._finished or token == self.eos_token_id:
+                self._finished.add(row)
+                flags.append(False)
+                continue
+            already = detector.reason is not None
+            reason = detector.update(token)
+            if reason is not None and not already:
+                self._record(detector)
+            flags.append(reason is not None)
+        if len(flags) == 1:
+            return flags[0]
+        return input_ids.new_tensor(flags).bool()
+
+    def _record(self, detector: DegenerationDetector) -> None:
+        saved = max(self.max_new_tokens - detector.tokens, 0)
+        DEGENERATION_STOPS.inc(endpoint=self.endpoint, reason=detector.reason)
+        DEGENERATION_TOKENS_SAVED.inc(saved, endpoint=self.endpoint)
+        log.info("🔁 Stopped a degenerate %s generation after %s tokens (%s, ~%s tokens saved)",
+                 self.endpoint, detector.tokens, detector.reason, saved)
+
+
+def degeneration_criteria(labels: Dict[str, str], max_new_tokens: int,
+                          eos_token_id: Optional[int] = None) -> List[StoppingCriteria]:
+    """[DegenerationMonitor] for a run's stopping_criteria, or [] with DEGENERATION_STOP off"""
+    if not DEGENERATION_STOP:
+        return []
+    return [DegenerationMonitor(labels['endpoint'], max_new_tokens, eos_token_id)]
@@ -0,0 +1,205 @@
+"""
+Fast JSON responses for large story payloads.
+
+Story endpoints return documents that were built (and already checked) by
+firestore_service.py, so re-validating them against a response_model and
+encoding them with jsonable_encoder + stdlib json is wasted work that grows
+with manuscript size. json_response() serializes the dict directly with
+orjson (falling back to json when it isn't installed) and returns a ready
+Response, which FastAPI sends without touching the response_model.
+
+Bodies larger than RESPONSE_COMPRESSION_MIN_BYTES are compressed with the
+best encoding the client accepts: zstd, then brotli, then gzip. zstd and
+brotli are used only when the zstandard / brotli packages are installed.
+
+`python benchmark_responses.py` compares serialization time and bytes on
+the wire for a 100k-word story.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, date
+from typing import Optional, Dict, Any, List, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from http_cache import weak_etag
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Smaller bodies are sent uncompressed (compression wouldn't save a packet)
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', '1400'))
+# Levels favour speed: these run on every story read
+GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', '3'))
+BROTLI_QUALITY = int(os.getenv('RESPONSE_BROTLI_QUALITY', '4'))
+ZSTD_LEVEL = int(os.getenv('RESPONSE_ZSTD_LEVEL', '3'))
+# Bodies at least this large are compressed on a worker thread instead of the event loop
+RESPONSE_COMPRESSION_THREAD_BYTES = 64 * 1024
+
+# Fields of StoryResponse, with the defaults the model applied
+STORY_RESPONSE_DEFAULTS = {
+    'id': None,
+    'userId': None,
+    'title': None,
+    'genre': None,
+    'content': '',
+    'chapters': [],
+    'metadata': {},
+    'settings': {},
+    'status': None,
+}
+
+
+def _default(value: Any) -> Any:
+    """Encode types JSON doesn't know the way FastAPI's encoder does"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
+
+
+def dumps(data: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def available_encodings() -> List[str]:
+    """Content encodings this server can produce, best first"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick a content encoding from an Accept-Encoding header
+
+    Args:
+        accept_encoding: Header value, e.g. 'gzip, deflate, br;q=0.9'
+
+    Returns:
+        'zstd', 'br', 'gzip' or None for identity
+    """
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    best: Optional[Tuple[float, int, str]] = None
+    wildcard = accepted.get('*', 0.0)
+    for rank, encoding in enumerate(available_encodings()):
+        quality = accepted.get(encoding, wildcard)
+        if quality <= 0:
+            continue
+        # Highest q wins; ties go to the better compressor
+        candidate = (quality, -rank, encoding)
+        if best is None or candidate > best:
+            best = candidate
+    return best[2] if best else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+async def encode_body(body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """
+    Compress a response body if it is large enough and the client accepts it
+
+    Returns:
+        (body, content encoding or None)
+    """
+    if len(body) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return body, None
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is None:
+        return body, None
+    if len(body) >= RESPONSE_COMPRESSION_THREAD_BYTES:
+        return await asyncio.to_thread(compress, body, encoding), encoding
+    return compress(body, encoding), encoding
+
+
+async def json_response(
+    request: Request,
+    data: Any,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Serialized, optionally compressed JSON response for trusted data
+
+    Args:
+        request: Incoming request (for Accept-Encoding)
+        data: Dicts/lists built by the service layer; not validated again
+        status_code: HTTP status
+        headers: Extra response headers
+
+    Returns:
+        Response with the encoded body
+    """
+    body, encoding = await encode_body(dumps(data), request.headers.get('accept-encoding'))
+    response_headers = {'Vary': 'Accept-Encoding', **(headers or {})}
+    if encoding:
+        response_headers['Content-Encoding'] = encoding
+        if 'ETag' in response_headers:
+            response_headers['ETag'] = weak_etag(response_headers['ETag'])
+    return Response(content=body, status_code=status_code, media_type='application/json', headers=response_headers)
+
+
+def story_payload(story: Dict[str, Any]) -> Dict[str, Any]:
+    """A story document projected onto StoryResponse's fields"""
+    return {
+        field: story[field] if story.get(field) is not None else default
+        for field, default in STORY_RESPONSE_DEFAULTS.items()
+    }
+
+
+def story_list_payload(story: Dict[str, Any]) -> Dict[str, Any]:
+    """A story summary projected onto StoryListResponse's fields"""
+    return {field: story.get(field) for field in ('id', 'userId', 'title', 'genre', 'metadata', 'settings', 'status')}
+
+
+def bible_item_payload(item: Dict[str, Any]) -> Dict[str, Any]:
+    """A bible item projected onto BibleItemResponse's fields"""
+    return {
+        field: item.get(field)
+        for field in ('id', 'name', 'category', 'description', 'attributes', 'imageUrl', 'createdAt', 'updatedAt')
+    }
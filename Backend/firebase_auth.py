@@ -1,10 +1,16 @@
+import logging
 import firebase_admin
 from firebase_admin import credentials, auth
 from fastapi import HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import Optional
+from typing import Optional, Tuple
 import os
 
+from auth_cache import token_cache, TokenRevokedError
+from tracing import span
+
+log = logging.getLogger(__name__)
+
 # Dev mode - set to True to allow unauthenticated requests for testing
 DEV_MODE = os.getenv('DEV_MODE', 'true').lower() == 'true'
 
@@ -19,12 +25,12 @@ def initialize_firebase():
         if os.path.exists(cred_path):
             cred = credentials.Certificate(cred_path)
             firebase_admin.initialize_app(cred)
-            print("Firebase Admin SDK initialized successfully")
+            log.info("Firebase Admin SDK initialized successfully")
         else:
-            print(f"Warning: Firebase credentials file not found at {cred_path}")
-            print("Authentication will not work until credentials are provided")
+            log.warning("Warning: Firebase credentials file not found at %s", cred_path)
+            log.info("Authentication will not work until credentials are provided")
     except Exception as e:
-        print(f"Error initializing Firebase Admin SDK: {e}")
+        log.error("Error initializing Firebase Admin SDK: %s", e)
 
 security = HTTPBearer(auto_error=not DEV_MODE)  # Don't auto-error in dev mode
 
@@ -46,22 +52,29 @@ async def verify_firebase_token(credentials: Optional[HTTPAuthorizationCredentia
     
     try:
         token = credentials.credentials
-        decoded_token = auth.verify_id_token(token)
+        # Claims of tokens seen before come from the verification cache (auth_cache.py)
+        with span('auth.verify_token'):
+            decoded_token = token_cache.verify(token)
         return decoded_token
-    except auth.InvalidIdTokenError:
+    except (TokenRevokedError, auth.RevokedIdTokenError, auth.UserDisabledError):
         raise HTTPException(
             status_code=401,
-            detail="Invalid authentication token"
+            detail="Authentication token has been revoked"
         )
     except auth.ExpiredIdTokenError:
         raise HTTPException(
             status_code=401,
             detail="Authentication token has expired"
         )
+    except auth.InvalidIdTokenError:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid authentication token"
+        )
     except Exception as e:
         # In dev mode, allow through even if Firebase isn't configured
         if DEV_MODE:
-            print(f"Auth warning (dev mode): {e}")
+            log.warning("Auth warning (dev mode): %s", e)
             return None
         raise HTTPException(
             status_code=401,
@@ -89,3 +102,17 @@ async def get_current_user(token_data: Optional[dict] = Security(verify_firebase
         "name": token_data.get("name"),
         "email_verified": token_data.get("email_verified", False)
     }
+
+async def authenticate_token(token: Optional[str]) -> Tuple[dict, Optional[float]]:
+    """
+    Authenticate a bare ID token (e.g. sent over a WebSocket) the same way as
+    the Authorization header
+    
+    Returns:
+        (user info as from get_current_user, token expiry as a Unix timestamp
+        or None for dev mode guests)
+    """
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token) if token else None
+    token_data = await verify_firebase_token(credentials)
+    user = await get_current_user(token_data)
+    return user, float(token_data['exp']) if token_data and token_data.get('exp') else None
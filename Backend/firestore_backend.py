@@ -0,0 +1,315 @@
+"""
+Firestore implementation of the storage backend.
+
+Stories live in the 'stories' collection; bible items and revisions live in
+each story's 'bible_items' and 'revisions' subcollections, and the bible
+version token in the story's 'meta/bible' document. Per-user stats
+documents live in 'user_stats', keyed by user ID.
+"""
+
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Callable
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+
+from storage_backend import (
+    StorageBackend, StoredDocument, RevisionExists, StoryVersionConflict, StatsDelta, STORY_LIST_FIELDS
+)
+from user_stats import nest_delta
+
+# Constants
+STORIES_COLLECTION = 'stories'
+BIBLE_ITEMS_COLLECTION = 'bible_items'
+REVISIONS_COLLECTION = 'revisions'
+STORY_META_COLLECTION = 'meta'
+BIBLE_VERSION_DOCUMENT = 'bible'
+USER_STATS_COLLECTION = 'user_stats'
+
+# Revision fields other than the payload
+REVISION_META_FIELDS = ['number', 'kind', 'base', 'depth', 'createdAt', 'updatedAt',
+                        'label', 'wordCount', 'size', 'changedChapters']
+
+# Firestore rejects documents larger than 1 MiB
+FIRESTORE_DOCUMENT_MAX_BYTES = 1024 * 1024
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_BATCH_LIMIT = 500
+
+# Lazy-load Firestore client to ensure Firebase is initialized first
+_db = None
+
+def get_db():
+    """Get Firestore client instance (lazy initialization)."""
+    global _db
+    if _db is None:
+        _db = firestore.client()
+    return _db
+
+
+class FirestoreBackend(StorageBackend):
+    """Stores stories in Cloud Firestore via firebase_admin"""
+
+    name = 'firestore'
+    max_story_bytes = FIRESTORE_DOCUMENT_MAX_BYTES
+
+    def _stories(self):
+        return get_db().collection(STORIES_COLLECTION)
+
+    def _bible_items(self, story_id: str):
+        return self._stories().document(story_id).collection(BIBLE_ITEMS_COLLECTION)
+
+    def _bible_version(self, story_id: str):
+        return self._stories().document(story_id).collection(STORY_META_COLLECTION).document(BIBLE_VERSION_DOCUMENT)
+
+    def _revisions(self, story_id: str):
+        return self._stories().document(story_id).collection(REVISIONS_COLLECTION)
+
+    @staticmethod
+    def _revision_id(number: int) -> str:
+        # Zero-padded so document IDs sort like numbers
+        return f"{number:010d}"
+
+    # Stories
+
+    def new_story_id(self) -> str:
+        return self._stories().document().id
+
+    def get_story(self, story_id: str) -> Optional[StoredDocument]:
+        doc = self._stories().document(story_id).get()
+        if not doc.exists:
+            return None
+        return StoredDocument(doc.id, doc.to_dict(), doc.update_time)
+
+    def _write_story(
+        self,
+        story_id: str,
+        method: str,
+        data: Dict[str, Any],
+        stats: Optional[StatsDelta],
+        expected_version: Any = None
+    ) -> Any:
+        """set() or update() a story, batched with the owner's stats increments if there are any"""
+        doc_ref = self._stories().document(story_id)
+        kwargs = {}
+        if expected_version is not None:
+            kwargs['option'] = get_db().write_option(last_update_time=expected_version)
+        try:
+            if not stats or not stats.increments:
+                write_result = getattr(doc_ref, method)(data, **kwargs)
+                return getattr(write_result, 'update_time', None)
+            batch = get_db().batch()
+            getattr(batch, method)(doc_ref, data, **kwargs)
+            batch.set(
+                get_db().collection(USER_STATS_COLLECTION).document(stats.user_id),
+                {**nest_delta(stats.increments, firestore.Increment), 'updatedAt': datetime.utcnow().isoformat()},
+                merge=True
+            )
+            write_results = batch.commit()
+            return getattr(write_results[0], 'update_time', None)
+        except FailedPrecondition as e:
+            raise StoryVersionConflict(str(e))
+
+    def create_story(self, story_id: str, data: Dict[str, Any], stats: Optional[StatsDelta] = None) -> Any:
+        return self._write_story(story_id, 'set', data, stats)
+
+    def update_story(
+        self,
+        story_id: str,
+        fields: Dict[str, Any],
+        stats: Optional[StatsDelta] = None,
+        expected_version: Any = None
+    ) -> Any:
+        return self._write_story(story_id, 'update', fields, stats, expected_version)
+
+    def get_story_fields(self, story_id: str, fields: List[str]) -> Optional[Dict[str, Any]]:
+        doc = self._stories().document(story_id).get(field_paths=fields)
+        return doc.to_dict() if doc.exists else None
+
+    def append_story_chapters(
+        self,
+        story_id: str,
+        chapters: List[Dict[str, Any]],
+        fields: Dict[str, Any],
+        stats: Optional[StatsDelta] = None
+    ) -> Any:
+        return self.update_story(story_id, {**fields, 'chapters': firestore.ArrayUnion(chapters)}, stats)
+
+    def list_stories(
+        self,
+        user_id: str,
+        status: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> List[StoredDocument]:
+        # Build query - only filter by userId (no order_by to avoid composite index)
+        query = self._stories().where('userId', '==', user_id)
+
+        # Filter by status if provided
+        if status:
+            query = query.where('status', '==', status)
+
+        # Project away content and chapters so listings don't download manuscripts
+        query = query.select(list(STORY_LIST_FIELDS) + ['deleted'])
+
+        stories = []
+        for doc in query.stream():
+            data = doc.to_dict()
+            if data.pop('deleted', False):
+                continue
+            stories.append(StoredDocument(doc.id, data, doc.update_time))
+
+        # Sort by updatedAt in Python (most recent first)
+        stories.sort(
+            key=lambda s: (s.data.get('metadata') or {}).get('updatedAt', ''),
+            reverse=True
+        )
+
+        # Apply pagination after sorting
+        return stories[offset:offset + limit]
+
+    def list_deleted_story_ids(self) -> List[str]:
+        query = self._stories().where('deleted', '==', True)
+        return [doc.id for doc in query.stream()]
+
+    def delete_story_children(self, story_id: str, limit: int) -> int:
+        limit = min(limit, FIRESTORE_BATCH_LIMIT)
+        doc_refs = []
+        self._collect_descendants(self._stories().document(story_id), limit, doc_refs)
+        if not doc_refs:
+            return 0
+        batch = get_db().batch()
+        for doc_ref in doc_refs:
+            batch.delete(doc_ref)
+        batch.commit()
+        return len(doc_refs)
+
+    def _collect_descendants(self, doc_ref, limit: int, out: list) -> None:
+        """Collect up to `limit` nested documents, deepest first"""
+        for collection_ref in doc_ref.collections():
+            for doc in collection_ref.limit(limit - len(out)).stream():
+                self._collect_descendants(doc.reference, limit, out)
+                if len(out) >= limit:
+                    return
+                out.append(doc.reference)
+            if len(out) >= limit:
+                return
+
+    def delete_story_document(self, story_id: str) -> None:
+        self._stories().document(story_id).delete()
+
+    def watch_story(
+        self,
+        story_id: str,
+        on_change: Callable[[Optional[Dict[str, Any]], Any], None]
+    ) -> Optional[Callable[[], None]]:
+        def on_snapshot(doc_snapshots, changes, read_time):
+            for snapshot in doc_snapshots:
+                if snapshot.exists:
+                    on_change(snapshot.to_dict(), snapshot.update_time)
+                else:
+                    on_change(None, None)
+
+        watch = self._stories().document(story_id).on_snapshot(on_snapshot)
+        return watch.unsubscribe
+
+    # User stats
+
+    def get_user_stats(self, user_id: str) -> Optional[Dict[str, Any]]:
+        doc = get_db().collection(USER_STATS_COLLECTION).document(user_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def set_user_stats(self, user_id: str, stats: Dict[str, Any]) -> None:
+        get_db().collection(USER_STATS_COLLECTION).document(user_id).set(stats)
+
+    # Bible items
+
+    def list_bible_items(self, story_id: str, category: Optional[str] = None) -> List[StoredDocument]:
+        collection_ref = self._bible_items(story_id)
+
+        if category:
+            docs = collection_ref.where('category', '==', category).stream()
+        else:
+            docs = collection_ref.stream()
+
+        return [StoredDocument(doc.id, doc.to_dict(), doc.update_time) for doc in docs]
+
+    def get_bible_item(self, story_id: str, item_id: str) -> Optional[Dict[str, Any]]:
+        doc = self._bible_items(story_id).document(item_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def write_bible_items(
+        self,
+        story_id: str,
+        add_items: List[Dict[str, Any]],
+        delete_item_ids: List[str]
+    ) -> List[str]:
+        collection_ref = self._bible_items(story_id)
+
+        operations = []
+        for item_id in delete_item_ids:
+            operations.append(('delete', collection_ref.document(item_id), None))
+
+        new_ids = []
+        for item in add_items:
+            doc_ref = collection_ref.document()
+            operations.append(('set', doc_ref, item))
+            new_ids.append(doc_ref.id)
+
+        for start in range(0, len(operations), FIRESTORE_BATCH_LIMIT):
+            batch = get_db().batch()
+            for op, doc_ref, data in operations[start:start + FIRESTORE_BATCH_LIMIT]:
+                if op == 'delete':
+                    batch.delete(doc_ref)
+                else:
+                    batch.set(doc_ref, data)
+            batch.commit()
+
+        return new_ids
+
+    def update_bible_item(self, story_id: str, item_id: str, fields: Dict[str, Any]) -> None:
+        self._bible_items(story_id).document(item_id).update(fields)
+
+    def delete_bible_item(self, story_id: str, item_id: str) -> None:
+        self._bible_items(story_id).document(item_id).delete()
+
+    def get_bible_version(self, story_id: str) -> Optional[str]:
+        doc = self._bible_version(story_id).get()
+        return doc.to_dict().get('version') if doc.exists else None
+
+    def set_bible_version(self, story_id: str, version: str) -> None:
+        self._bible_version(story_id).set({'version': version})
+
+    # Revisions
+
+    def list_revisions(self, story_id: str) -> List[StoredDocument]:
+        query = self._revisions(story_id).select(REVISION_META_FIELDS).order_by('number')
+        return [StoredDocument(doc.id, doc.to_dict(), doc.update_time) for doc in query.stream()]
+
+    def get_revisions(self, story_id: str, numbers: List[int]) -> List[StoredDocument]:
+        collection_ref = self._revisions(story_id)
+        doc_refs = [collection_ref.document(self._revision_id(number)) for number in numbers]
+        docs = [doc for doc in get_db().get_all(doc_refs) if doc.exists]
+        docs.sort(key=lambda doc: doc.id)
+        return [StoredDocument(doc.id, doc.to_dict(), doc.update_time) for doc in docs]
+
+    def create_revision(self, story_id: str, revision: Dict[str, Any]) -> None:
+        doc_ref = self._revisions(story_id).document(self._revision_id(revision['number']))
+        try:
+            doc_ref.create(revision)
+        except AlreadyExists as e:
+            raise RevisionExists(str(e))
+
+    def write_revisions(self, story_id: str, put: List[Dict[str, Any]], delete_numbers: List[int]) -> None:
+        collection_ref = self._revisions(story_id)
+        # Rewrites go first so a partial failure never leaves a dangling delta chain
+        operations = [('set', revision['number'], revision) for revision in put]
+        operations += [('delete', number, None) for number in delete_numbers]
+        for start in range(0, len(operations), FIRESTORE_BATCH_LIMIT):
+            batch = get_db().batch()
+            for op, number, data in operations[start:start + FIRESTORE_BATCH_LIMIT]:
+                doc_ref = collection_ref.document(self._revision_id(number))
+                if op == 'delete':
+                    batch.delete(doc_ref)
+                else:
+                    batch.set(doc_ref, data)
+            batch.commit()
@@ -2,100 +2,178 @@
 Firestore service module for story management.
 Handles all database operations for stories including CRUD operations,
 authorization checks, and metadata management.
+
+Storage goes through the configured StorageBackend (Firestore by default,
+SQLite for self-hosted deployments - see storage_backend.py).
 """
 
-from typing import Optional, Dict, Any, List
+import logging
+from typing import Optional, Dict, Any, List, Iterable, Tuple
 from datetime import datetime
-from firebase_admin import firestore
-from google.cloud.firestore_v1.base_query import FieldFilter
+import asyncio
+import uuid
+from functools import partial
 from fastapi import HTTPException
-import re
 
-# Constants
-STORIES_COLLECTION = 'stories'
+from story_cache import story_cache
+from storage_backend import get_storage, StatsDelta, StoryVersionConflict
+from search_index import search_index
+from story_history import revision_history, state_to_story
+from story_metadata import (
+    create_story_metadata,
+    update_story_metadata,
+    process_chapter_updates,
+    calculate_chapter_metadata
+)
+from story_import import IMPORT_BATCH_BYTES, IMPORT_MAX_BYTES, IMPORT_DOCUMENT_FILL
+from user_stats import stats_delta, compute_user_stats, stats_response
+from http_cache import make_etag, version_token, check_if_match
+from metrics import timed_storage
 
-# Lazy-load Firestore client to ensure Firebase is initialized first
-_db = None
+log = logging.getLogger(__name__)
 
-def get_db():
-    """Get Firestore client instance (lazy initialization)."""
-    global _db
-    if _db is None:
-        _db = firestore.client()
-    return _db
 
+def _record_revision(story_id: str, story: Dict[str, Any]) -> None:
+    """Add the saved text to the story's revision history (never fails the save)"""
+    try:
+        revision_history.record(story_id, story)
+    except Exception as e:
+        log.warning("⚠️ Failed to record revision for story %s: %s", story_id, e)
 
-def calculate_word_count(text: str) -> int:
-    """Calculate word count from text (strips HTML tags first)"""
-    if not text:
-        return 0
-    # Strip HTML tags before counting
-    clean = re.sub(r'<[^>]+>', ' ', text)
-    words = re.findall(r'\b\w+\b', clean)
-    return len(words)
 
+def read_story_document(story_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Read a story document through the in-process story cache
+    
+    Returns:
+        Document fields (shared with the cache - copy before mutating
+        nested values), or None if the document does not exist
+    """
+    data, _ = read_story_with_version(story_id)
+    return data
 
-def create_story_metadata(content: str) -> Dict[str, Any]:
-    """Create metadata for a story"""
-    now = datetime.utcnow().isoformat()
-    return {
-        'wordCount': calculate_word_count(content),
-        'characterCount': len(content) if content else 0,
-        'createdAt': now,
-        'updatedAt': now,
-        'lastEditedAt': now
-    }
 
+def read_story_with_version(story_id: str) -> Tuple[Optional[Dict[str, Any]], Any]:
+    """
+    Like read_story_document, also returning the storage version of the document
+    
+    Returns:
+        (document fields or None, version or None)
+    """
+    cached = story_cache.get_with_version(story_id)
+    if cached is not None:
+        return cached
+    
+    storage = get_storage()
+    read_token = story_cache.begin_read()
+    stored = storage.get_story(story_id)
+    if stored is None:
+        return None, None
+    
+    story_cache.put(story_id, stored.data, version=stored.version, read_token=read_token,
+                    subscribe=partial(storage.watch_story, story_id))
+    return stored.data, stored.version
 
-def update_story_metadata(existing_metadata: Dict[str, Any], content: str) -> Dict[str, Any]:
-    """Update metadata for an existing story"""
-    now = datetime.utcnow().isoformat()
-    return {
-        **existing_metadata,
-        'wordCount': calculate_word_count(content),
-        'characterCount': len(content) if content else 0,
-        'updatedAt': now,
-        'lastEditedAt': now
-    }
 
+# Attempts for a story write whose stats delta was computed from a copy that
+# turned out to be stale (another worker, instance or admin_cli.py wrote first)
+STATS_WRITE_ATTEMPTS = 3
 
-def calculate_chapter_metadata(content: str) -> Dict[str, Any]:
-    """Calculate metadata for a single chapter"""
-    now = datetime.utcnow().isoformat()
-    return {
-        'wordCount': calculate_word_count(content),
-        'characterCount': len(content) if content else 0,
-        'createdAt': now,
-        'updatedAt': now
-    }
+
+def _library_change(user_id: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> StatsDelta:
+    """
+    Stats increments for a story write, also bumping the owner's libraryVersion
+    so story list ETags change even when no total does (e.g. a retitle)
+    """
+    return StatsDelta(user_id, {**stats_delta(before, after), 'libraryVersion': 1})
 
 
-def aggregate_story_metadata_from_chapters(chapters: List[Dict[str, Any]], existing_metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    """Aggregate metadata from all chapters"""
-    if not chapters:
-        return existing_metadata or create_story_metadata("")
-    
-    total_words = sum(ch.get('metadata', {}).get('wordCount', 0) for ch in chapters)
-    total_chars = sum(ch.get('metadata', {}).get('characterCount', 0) for ch in chapters)
+# ETags (see http_cache.py)
+
+def story_etag(story_id: str, version: Any) -> str:
+    return make_etag('story', story_id, version_token(version))
+
+
+def current_story_etag(story_id: str) -> Optional[str]:
+    """ETag of the cached copy of a story, without reading storage (None if not cached)"""
+    cached = story_cache.get_with_version(story_id)
+    return story_etag(story_id, cached[1]) if cached is not None else None
+
+
+def bible_etag(story_id: str, bible_version: Optional[str]) -> str:
+    return make_etag('items', story_id, bible_version or '')
+
+
+def _check_story_precondition(story_id: str, if_match: Optional[str], version: Any) -> None:
+    """Raise 412 unless If-Match names the story's current version"""
+    try:
+        check_if_match(if_match, story_etag(story_id, version))
+    except HTTPException:
+        # Our copy may be the stale one; make the client's refetch hit storage
+        story_cache.invalidate(story_id)
+        raise
+
+
+@timed_storage
+async def get_library_etag(user_id: str) -> Optional[str]:
+    """
+    ETag for a user's story lists, from their stats document (one small read)
     
-    # Get earliest createdAt and latest updatedAt
-    created_dates = [ch.get('metadata', {}).get('createdAt', '') for ch in chapters if ch.get('metadata', {}).get('createdAt')]
-    updated_dates = [ch.get('metadata', {}).get('updatedAt', '') for ch in chapters if ch.get('metadata', {}).get('updatedAt')]
+    Every story write increments the stats document's libraryVersion in the
+    same atomic write, so the ETag changes whenever any list could.
     
-    now = datetime.utcnow().isoformat()
-    created_at = min(created_dates) if created_dates else (existing_metadata or {}).get('createdAt', now)
-    updated_at = max(updated_dates) if updated_dates else now
+    Returns:
+        ETag, or None if the user has no stats document yet
+    """
+    try:
+        stats = get_storage().get_user_stats(user_id)
+        if stats is None:
+            return None
+        return make_etag('stories', user_id, stats.get('libraryVersion', 0), stats.get('updatedAt'))
+    except Exception as e:
+        log.warning("⚠️ Failed to compute story list ETag for user %s: %s", user_id, e)
+        return None
+
+
+@timed_storage
+async def get_bible_etag(story_id: str, user_id: str) -> str:
+    """
+    ETag for a story's bible items, from the story's bible version token
     
-    return {
-        'wordCount': total_words,
-        'characterCount': total_chars,
-        'chapterCount': len(chapters),
-        'createdAt': created_at,
-        'updatedAt': updated_at,
-        'lastEditedAt': now
-    }
+    Ownership comes from the cached story when there is one, otherwise from
+    a projected read of two fields (never the manuscript). The token lives
+    in its own small document, so bible writes leave the story ETag alone.
+    """
+    try:
+        story_data = story_cache.get(story_id)
+        if story_data is None:
+            story_data = get_storage().get_story_fields(story_id, ['userId', 'deleted'])
+        
+        if story_data is None or story_data.get('deleted'):
+            raise HTTPException(status_code=404, detail="Story not found")
+        if story_data.get('userId') != user_id:
+            raise HTTPException(status_code=403, detail="Not authorized to view this story")
+        
+        return bible_etag(story_id, get_storage().get_bible_version(story_id))
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("Error getting bible ETag: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to get bible items: {str(e)}")
+
+
+def _check_bible_precondition(story_id: str, if_match: Optional[str]) -> None:
+    """Raise 412 unless If-Match names the current bible ETag (checked before the write, not atomically)"""
+    if if_match:
+        check_if_match(if_match, bible_etag(story_id, get_storage().get_bible_version(story_id)))
 
 
+def _touch_bible_version(story_id: str) -> None:
+    """Give the story's bible a new version token after its items changed"""
+    get_storage().set_bible_version(story_id, uuid.uuid4().hex)
+
+
+@timed_storage
 async def create_story(
     user_id: str,
     title: str,
@@ -123,22 +201,8 @@ async def create_story(
     try:
         # Process chapters if provided
         if chapters and len(chapters) > 0:
-            # Ensure each chapter has metadata
-            processed_chapters = []
-            for ch in chapters:
-                if isinstance(ch, dict):
-                    chapter_dict = ch
-                else:
-                    chapter_dict = ch.dict() if hasattr(ch, 'dict') else dict(ch)
-                
-                # Calculate metadata if not provided
-                if 'metadata' not in chapter_dict or not chapter_dict['metadata']:
-                    chapter_dict['metadata'] = calculate_chapter_metadata(chapter_dict.get('content', ''))
-                
-                processed_chapters.append(chapter_dict)
-            
-            # Aggregate metadata from chapters
-            metadata = aggregate_story_metadata_from_chapters(processed_chapters)
+            # Count every chapter and store its content hash for later saves
+            processed_chapters, metadata = process_chapter_updates(chapters, [])
             
             # Sync content field with first chapter for backward compatibility
             content = processed_chapters[0].get('content', '') if processed_chapters else ''
@@ -166,30 +230,243 @@ async def create_story(
                 'status': status
             }
         
-        # Add to Firestore
-        print(f"DEBUG: Attempting to create story documentation in '{STORIES_COLLECTION}'...")
-        db = get_db()
-        doc_ref = db.collection(STORIES_COLLECTION).document()
+        # Add to storage
+        storage = get_storage()
+        story_id = storage.new_story_id()
+        log.debug("Attempting to create story document in %s...", storage.name)
         
         # Explicitly check for content length to catch empty saves
         content_len = len(story_data.get('content', ''))
-        print(f"DEBUG: Creating doc {doc_ref.id} for user {user_id}. Content length: {content_len}")
+        log.debug("Creating doc %s for user %s. Content length: %s", story_id, user_id, content_len)
         
-        doc_ref.set(story_data)
-        print(f"✅ Success: Story document {doc_ref.id} created in Firestore.")
+        version = storage.create_story(story_id, story_data, _library_change(user_id, None, story_data))
+        story_cache.put(story_id, story_data, version=version, subscribe=partial(storage.watch_story, story_id))
+        log.info("✅ Success: Story document %s created in %s.", story_id, storage.name)
+        search_index.index_story(user_id, story_id, story_data)
+        _record_revision(story_id, story_data)
         
         # Return story with ID
         return {
-            'id': doc_ref.id,
+            'id': story_id,
             **story_data
         }
     except Exception as e:
-        print(f"❌ Error creating story: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ Error creating story: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to create story: {str(e)}")
 
 
+def _import_story_sections(
+    user_id: str,
+    title: str,
+    genre: str,
+    sections: Iterable[Tuple[str, str]],
+    batch_bytes: int
+) -> Dict[str, Any]:
+    """Write imported chapters in batches; only the pending batch is kept in memory"""
+    storage = get_storage()
+    max_bytes = import_max_bytes()
+    if storage.max_story_bytes is not None:
+        # The whole story fits one document anyway: write it once, after its
+        # size is known, so an oversized manuscript never leaves a partial story
+        batch_bytes = max_bytes + 1
+    story_id = None
+    batch: List[Dict[str, Any]] = []
+    pending_bytes = 0
+    total_bytes = 0
+    chapter_count = 0
+    total_words = 0
+    total_chars = 0
+    now = datetime.utcnow().isoformat()
+    # What the story counted in the owner's stats as of the last write
+    counted: Optional[Dict[str, Any]] = None
+    
+    def story_metadata() -> Dict[str, Any]:
+        return {
+            'wordCount': total_words,
+            'characterCount': total_chars,
+            'chapterCount': chapter_count,
+            'createdAt': now,
+            'updatedAt': now,
+            'lastEditedAt': now
+        }
+    
+    def write_batch() -> None:
+        nonlocal story_id, batch, pending_bytes, counted
+        summary = {'genre': genre, 'status': 'draft', 'metadata': story_metadata()}
+        stats = _library_change(user_id, counted, summary)
+        if story_id is None:
+            story_id = storage.new_story_id()
+            storage.create_story(story_id, {
+                'userId': user_id,
+                'title': title,
+                'genre': genre,
+                'content': batch[0]['content'],
+                'chapters': batch,
+                'metadata': story_metadata(),
+                'settings': {},
+                'status': 'draft'
+            }, stats)
+        else:
+            storage.append_story_chapters(story_id, batch, {'metadata': summary['metadata']}, stats)
+        counted = summary
+        batch = []
+        pending_bytes = 0
+    
+    try:
+        for chapter_title, html in sections:
+            # Same shape as the Chapter model, with metadata computed on the fly
+            chapter = {
+                'id': uuid.uuid4().hex,
+                'title': chapter_title,
+                'content': html,
+                'order': chapter_count,
+                'status': 'draft',
+                'metadata': calculate_chapter_metadata(html)
+            }
+            chapter_count += 1
+            total_words += chapter['metadata']['wordCount']
+            total_chars += chapter['metadata']['characterCount']
+            batch.append(chapter)
+            pending_bytes += len(html)
+            total_bytes += len(html.encode('utf-8')) + len(chapter_title.encode('utf-8'))
+            if storage.max_story_bytes is not None and total_bytes > max_bytes:
+                raise HTTPException(status_code=413, detail=manuscript_too_large_detail(max_bytes))
+            if pending_bytes >= batch_bytes:
+                write_batch()
+        if batch:
+            write_batch()
+    except Exception:
+        if story_id is not None:
+            # Leave no half-imported story behind; the reaper's sweep removes it
+            storage.update_story(
+                story_id,
+                {'deleted': True, 'deletedAt': datetime.utcnow().isoformat()},
+                _library_change(user_id, counted, None)
+            )
+        raise
+    
+    if story_id is None:
+        raise HTTPException(status_code=400, detail="The file contains no text to import")
+    
+    return {
+        'id': story_id,
+        'userId': user_id,
+        'title': title,
+        'genre': genre,
+        'metadata': story_metadata(),
+        'settings': {},
+        'status': 'draft'
+    }
+
+
+def import_max_bytes() -> int:
+    """Largest manuscript (upload, and imported text) the storage backend can hold as one story"""
+    limit = get_storage().max_story_bytes
+    if limit is None:
+        return IMPORT_MAX_BYTES
+    return min(IMPORT_MAX_BYTES, int(limit * IMPORT_DOCUMENT_FILL))
+
+
+def manuscript_too_large_detail(max_bytes: int) -> str:
+    if max_bytes >= 1024 * 1024:
+        return f"Manuscript is larger than {max_bytes // (1024 * 1024)} MB"
+    return f"Manuscript is larger than {max_bytes // 1024} KB"
+
+
+@timed_storage
+async def import_story(
+    user_id: str,
+    title: str,
+    genre: str,
+    sections: Iterable[Tuple[str, str]],
+    batch_bytes: int = IMPORT_BATCH_BYTES
+) -> Dict[str, Any]:
+    """
+    Create a story from an imported manuscript
+    
+    Args:
+        user_id: Firebase user UID (owner)
+        title: Story title
+        genre: Story genre
+        sections: (chapter title, chapter HTML) pairs, e.g. from story_import.py
+        batch_bytes: Chapter content written per storage round trip
+    
+    Returns:
+        Story summary (without content)
+    """
+    try:
+        # Parsing and batched writes run off the event loop
+        summary = await asyncio.to_thread(_import_story_sections, user_id, title, genre, sections, batch_bytes)
+        log.info("✅ Imported story %s: %s chapters, %s words", summary['id'], summary['metadata']['chapterCount'], summary['metadata']['wordCount'])
+        
+        story_data = read_story_document(summary['id'])
+        if story_data is not None:
+            search_index.index_story(user_id, summary['id'], story_data)
+            _record_revision(summary['id'], story_data)
+        return summary
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # Unreadable or unsupported manuscript
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        log.error("❌ Error importing story: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to import story: {str(e)}")
+
+
+def _story_update_fields(
+    story_data: Dict[str, Any],
+    title: Optional[str],
+    genre: Optional[str],
+    content: Optional[str],
+    chapters: Optional[List[Dict[str, Any]]],
+    settings: Optional[Dict[str, Any]],
+    status: Optional[str]
+) -> Dict[str, Any]:
+    """Top-level fields an update_story call writes, given the stored story"""
+    update_data = {}
+    if title is not None:
+        update_data['title'] = title
+    if genre is not None:
+        update_data['genre'] = genre
+    
+    # Handle chapters update
+    if chapters is not None:
+        # Recount only chapters whose content changed; totals are updated by deltas
+        processed_chapters, update_data['metadata'] = process_chapter_updates(
+            chapters,
+            story_data.get('chapters'),
+            story_data.get('metadata', {})
+        )
+        
+        update_data['chapters'] = processed_chapters
+        
+        # Sync content field with first chapter for backward compatibility
+        if processed_chapters:
+            update_data['content'] = processed_chapters[0].get('content', '')
+    elif content is not None:
+        # Legacy mode: update content field
+        update_data['content'] = content
+        # Update metadata when content changes
+        update_data['metadata'] = update_story_metadata(
+            story_data.get('metadata', {}),
+            content
+        )
+    
+    if settings is not None:
+        update_data['settings'] = settings
+    if status is not None:
+        update_data['status'] = status
+    
+    # Always update the lastEditedAt timestamp
+    if 'metadata' not in update_data:
+        metadata = {**story_data.get('metadata', {})}
+        metadata['lastEditedAt'] = datetime.utcnow().isoformat()
+        update_data['metadata'] = metadata
+    return update_data
+
+
+@timed_storage
 async def update_story(
     story_id: str,
     user_id: str,
@@ -198,7 +475,8 @@ async def update_story(
     content: Optional[str] = None,
     chapters: Optional[List[Dict[str, Any]]] = None,
     settings: Optional[Dict[str, Any]] = None,
-    status: Optional[str] = None
+    status: Optional[str] = None,
+    if_match: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Update an existing story
@@ -212,106 +490,80 @@ async def update_story(
         chapters: Updated chapters (new format)
         settings: Updated settings
         status: Updated status
+        if_match: If-Match header; the update fails with 412 unless it names
+            the story's current ETag
     
     Returns:
         Updated story document
     """
     try:
-        doc_ref = get_db().collection(STORIES_COLLECTION).document(story_id)
-        doc = doc_ref.get()
-        
-        if not doc.exists:
-            raise HTTPException(status_code=404, detail="Story not found")
-        
-        story_data = doc.to_dict()
-        
-        # Check authorization
-        if story_data.get('userId') != user_id:
-            raise HTTPException(status_code=403, detail="Not authorized to update this story")
-        
-        # Build update data
-        update_data = {}
-        if title is not None:
-            update_data['title'] = title
-        if genre is not None:
-            update_data['genre'] = genre
-        
-        # Handle chapters update
-        if chapters is not None:
-            # Process chapters
-            processed_chapters = []
-            for ch in chapters:
-                if isinstance(ch, dict):
-                    chapter_dict = ch
-                else:
-                    chapter_dict = ch.dict() if hasattr(ch, 'dict') else dict(ch)
-                
-                # Calculate/update metadata
-                if 'metadata' not in chapter_dict or not chapter_dict['metadata']:
-                    chapter_dict['metadata'] = calculate_chapter_metadata(chapter_dict.get('content', ''))
-                else:
-                    # Update existing metadata
-                    now = datetime.utcnow().isoformat()
-                    chapter_dict['metadata']['updatedAt'] = now
-                    chapter_dict['metadata']['wordCount'] = calculate_word_count(chapter_dict.get('content', ''))
-                    chapter_dict['metadata']['characterCount'] = len(chapter_dict.get('content', ''))
-                
-                processed_chapters.append(chapter_dict)
+        storage = get_storage()
+        for attempt in range(STATS_WRITE_ATTEMPTS):
+            # Retries read storage, not the cache: the cached copy was stale
+            story_data, current_version = read_story_with_version(story_id)
             
-            update_data['chapters'] = processed_chapters
+            if story_data is None:
+                raise HTTPException(status_code=404, detail="Story not found")
             
-            # Aggregate metadata from chapters
-            update_data['metadata'] = aggregate_story_metadata_from_chapters(
-                processed_chapters,
-                story_data.get('metadata', {})
-            )
+            # Stories pending cascade deletion are already gone for the API
+            if story_data.get('deleted'):
+                raise HTTPException(status_code=404, detail="Story not found")
             
-            # Sync content field with first chapter for backward compatibility
-            if processed_chapters:
-                update_data['content'] = processed_chapters[0].get('content', '')
-        elif content is not None:
-            # Legacy mode: update content field
-            update_data['content'] = content
-            # Update metadata when content changes
-            update_data['metadata'] = update_story_metadata(
-                story_data.get('metadata', {}),
-                content
-            )
-        
-        if settings is not None:
-            update_data['settings'] = settings
-        if status is not None:
-            update_data['status'] = status
-        
-        # Always update the lastEditedAt timestamp
-        if 'metadata' not in update_data:
-            metadata = story_data.get('metadata', {})
-            metadata['lastEditedAt'] = datetime.utcnow().isoformat()
-            update_data['metadata'] = metadata
-        
-        # Update in Firestore
-        print(f"DEBUG: Attempting to update story {story_id}...")
-        print(f"DEBUG: Update fields: {list(update_data.keys())}")
-        
-        if 'content' in update_data:
-            print(f"DEBUG: New content length: {len(update_data['content'])}")
+            # Check authorization
+            if story_data.get('userId') != user_id:
+                raise HTTPException(status_code=403, detail="Not authorized to update this story")
+            
+            # Conditional update: checked here, and again by storage at write time
+            if if_match:
+                _check_story_precondition(story_id, if_match, current_version)
             
-        doc_ref.update(update_data)
-        print(f"✅ Success: Story document {story_id} updated in Firestore.")
+            update_data = _story_update_fields(story_data, title, genre, content, chapters, settings, status)
+            
+            # Update in Firestore
+            log.debug("Attempting to update story %s...", story_id)
+            log.debug("Update fields: %s", list(update_data.keys()))
+            
+            if 'content' in update_data:
+                log.debug("New content length: %s", len(update_data['content']))
+            
+            # The stats delta is relative to story_data, so the write only
+            # applies if the story is still at the version that was read
+            stats = _library_change(user_id, story_data, {**story_data, **update_data})
+            try:
+                version = storage.update_story(story_id, update_data, stats, expected_version=current_version)
+                break
+            except StoryVersionConflict:
+                story_cache.invalidate(story_id)
+                if if_match:
+                    raise HTTPException(status_code=412, detail="Story has changed since it was read")
+            except Exception:
+                # The write may or may not have applied - don't trust the cached copy
+                story_cache.invalidate(story_id)
+                raise
+        else:
+            raise HTTPException(status_code=409, detail="Story is being changed concurrently, please retry")
+        log.debug("✅ Success: Story document %s updated in %s.", story_id, storage.name)
+        
+        # All updated fields are top-level, so merging reproduces the stored
+        # document without a second read
+        updated_story = {**story_data, **update_data}
+        story_cache.put(story_id, updated_story, version=version, subscribe=partial(storage.watch_story, story_id))
+        search_index.index_story(user_id, story_id, updated_story)
+        _record_revision(story_id, updated_story)
         
         # Return updated story
-        updated_doc = doc_ref.get()
         return {
             'id': story_id,
-            **updated_doc.to_dict()
+            **updated_story
         }
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating story: {e}")
+        log.error("Error updating story: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to update story: {str(e)}")
 
 
+@timed_storage
 async def get_story(story_id: str, user_id: str) -> Dict[str, Any]:
     """
     Get a single story by ID
@@ -323,30 +575,44 @@ async def get_story(story_id: str, user_id: str) -> Dict[str, Any]:
     Returns:
         Story document
     """
+    story, _ = await get_story_with_etag(story_id, user_id)
+    return story
+
+
+@timed_storage
+async def get_story_with_etag(story_id: str, user_id: str) -> Tuple[Dict[str, Any], str]:
+    """
+    Get a single story by ID together with its ETag (from the same read)
+    
+    Returns:
+        (story document, ETag)
+    """
     try:
-        doc_ref = get_db().collection(STORIES_COLLECTION).document(story_id)
-        doc = doc_ref.get()
+        story_data, version = read_story_with_version(story_id)
         
-        if not doc.exists:
+        if story_data is None:
             raise HTTPException(status_code=404, detail="Story not found")
         
-        story_data = doc.to_dict()
+        # Stories pending cascade deletion are already gone for the API
+        if story_data.get('deleted'):
+            raise HTTPException(status_code=404, detail="Story not found")
         
         # Check authorization
         if story_data.get('userId') != user_id:
             raise HTTPException(status_code=403, detail="Not authorized to view this story")
         
         return {
-            'id': doc.id,
+            'id': story_id,
             **story_data
-        }
+        }, story_etag(story_id, version)
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error getting story: {e}")
+        log.error("Error getting story: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to get story: {str(e)}")
 
 
+@timed_storage
 async def list_user_stories(
     user_id: str,
     limit: int = 20,
@@ -366,20 +632,14 @@ async def list_user_stories(
         List of story documents (without full content for performance)
     """
     try:
-        # Build query - only filter by userId (no order_by to avoid composite index)
-        query = get_db().collection(STORIES_COLLECTION).where('userId', '==', user_id)
-        
-        # Filter by status if provided
-        if status:
-            query = query.where('status', '==', status)
-        
-        # Execute query - get all matching documents
-        docs = query.stream()
+        # Storage returns the page sorted by updatedAt (most recent first),
+        # skipping stories pending deletion
+        docs = get_storage().list_stories(user_id, status=status, limit=limit, offset=offset)
         
         # Build result list (exclude full content for performance)
         stories = []
         for doc in docs:
-            data = doc.to_dict()
+            data = doc.data
             stories.append({
                 'id': doc.id,
                 'userId': data.get('userId'),
@@ -391,49 +651,66 @@ async def list_user_stories(
                 # Exclude 'content' for list view
             })
         
-        # Sort by updatedAt in Python (most recent first)
-        stories.sort(
-            key=lambda x: x.get('metadata', {}).get('updatedAt', ''),
-            reverse=True
-        )
-        
-        # Apply pagination after sorting
-        start = offset
-        end = offset + limit
-        stories = stories[start:end]
-        
         return stories
     except Exception as e:
-        print(f"Error listing stories: {e}")
+        log.error("Error listing stories: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to list stories: {str(e)}")
 
 
-async def delete_story(story_id: str, user_id: str) -> Dict[str, str]:
+@timed_storage
+async def delete_story(story_id: str, user_id: str, if_match: Optional[str] = None) -> Dict[str, str]:
     """
     Delete a story
     
+    Only marks the story as deleted, so latency is constant regardless of
+    how many bible items it has. The story document and its subcollections
+    are removed afterwards by the background reaper (story_reaper.py).
+    
     Args:
         story_id: Story document ID
         user_id: Firebase user UID (for authorization)
+        if_match: If-Match header; the delete fails with 412 unless it names
+            the story's current ETag
     
     Returns:
         Success message
     """
     try:
-        doc_ref = get_db().collection(STORIES_COLLECTION).document(story_id)
-        doc = doc_ref.get()
-        
-        if not doc.exists:
-            raise HTTPException(status_code=404, detail="Story not found")
-        
-        story_data = doc.to_dict()
-        
-        # Check authorization
-        if story_data.get('userId') != user_id:
-            raise HTTPException(status_code=403, detail="Not authorized to delete this story")
-        
-        # Delete the document
-        doc_ref.delete()
+        for attempt in range(STATS_WRITE_ATTEMPTS):
+            # Retries read storage, not the cache: the cached copy was stale
+            story_data, current_version = read_story_with_version(story_id)
+            
+            if story_data is None:
+                raise HTTPException(status_code=404, detail="Story not found")
+            
+            # Stories pending cascade deletion are already gone for the API
+            if story_data.get('deleted'):
+                raise HTTPException(status_code=404, detail="Story not found")
+            
+            # Check authorization
+            if story_data.get('userId') != user_id:
+                raise HTTPException(status_code=403, detail="Not authorized to delete this story")
+            
+            if if_match:
+                _check_story_precondition(story_id, if_match, current_version)
+            
+            # Mark for cascade deletion by the background reaper; conditional,
+            # since the stats delta is relative to story_data
+            try:
+                get_storage().update_story(story_id, {
+                    'deleted': True,
+                    'deletedAt': datetime.utcnow().isoformat()
+                }, _library_change(user_id, story_data, None), expected_version=current_version)
+                break
+            except StoryVersionConflict:
+                if if_match:
+                    raise HTTPException(status_code=412, detail="Story has changed since it was read")
+            finally:
+                story_cache.invalidate(story_id)
+        else:
+            raise HTTPException(status_code=409, detail="Story is being changed concurrently, please retry")
+        search_index.remove_story(user_id, story_id)
+        revision_history.forget(story_id)
         
         return {
             'message': 'Story deleted successfully',
@@ -442,40 +719,100 @@ async def delete_story(story_id: str, user_id: str) -> Dict[str, str]:
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting story: {e}")
+        log.error("Error deleting story: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to delete story: {str(e)}")
 
 
 # Bible (Story Items) Management
 
-async def add_bible_item(story_id: str, item_data: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+@timed_storage
+async def add_bible_item(
+    story_id: str,
+    item_data: Dict[str, Any],
+    user_id: str,
+    if_match: Optional[str] = None
+) -> Dict[str, Any]:
     """Add a new item to the story bible"""
     try:
         # Verify story ownership
         await get_story(story_id, user_id)
-        
-        # Add item to subcollection
-        collection_ref = get_db().collection(STORIES_COLLECTION).document(story_id).collection('bible_items')
-        doc_ref = collection_ref.document()
+        _check_bible_precondition(story_id, if_match)
         
         # Add timestamps
         now = datetime.utcnow().isoformat()
         item_data['createdAt'] = now
         item_data['updatedAt'] = now
         
-        doc_ref.set(item_data)
+        # Add item to subcollection
+        (item_id,) = get_storage().write_bible_items(story_id, [item_data], [])
+        _touch_bible_version(story_id)
+        search_index.index_bible_item(user_id, story_id, item_id, item_data)
         
         return {
-            'id': doc_ref.id,
+            'id': item_id,
             **item_data
         }
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error adding bible item: {e}")
+        log.error("Error adding bible item: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to add bible item: {str(e)}")
 
 
+def normalize_item_name(name: str) -> str:
+    """Normalize a bible item name for duplicate detection"""
+    return ' '.join((name or '').split()).casefold()
+
+
+@timed_storage
+async def bulk_update_bible_items(
+    story_id: str,
+    user_id: str,
+    add_items: Optional[List[Dict[str, Any]]] = None,
+    delete_item_ids: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Add and delete many bible items with a single ownership check
+    
+    All mutations are applied in bulk by the storage backend (WriteBatch
+    commits chunked at Firestore's per-batch limit, or one SQLite
+    transaction), so syncing dozens of items costs one or two round trips
+    instead of one read and one write per item.
+    
+    Args:
+        story_id: Story document ID
+        user_id: Firebase user UID (for authorization)
+        add_items: Item payloads to create
+        delete_item_ids: IDs of existing items to delete
+    
+    Returns:
+        Created items with their new IDs
+    """
+    try:
+        # Verify story ownership once for the whole batch
+        await get_story(story_id, user_id)
+        
+        now = datetime.utcnow().isoformat()
+        items = [{**item_data, 'createdAt': now, 'updatedAt': now} for item_data in add_items or []]
+        
+        new_ids = get_storage().write_bible_items(story_id, items, list(delete_item_ids or []))
+        _touch_bible_version(story_id)
+        created_items = [{'id': item_id, **item} for item_id, item in zip(new_ids, items)]
+        
+        for item_id in delete_item_ids or []:
+            search_index.remove_bible_item(user_id, story_id, item_id)
+        for item_id, item in zip(new_ids, items):
+            search_index.index_bible_item(user_id, story_id, item_id, item)
+        
+        return created_items
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("Error bulk updating bible items: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to update bible items: {str(e)}")
+
+
+@timed_storage
 async def get_bible_items(story_id: str, user_id: str, category: Optional[str] = None) -> List[Dict[str, Any]]:
     """Get all bible items for a story"""
     try:
@@ -483,43 +820,42 @@ async def get_bible_items(story_id: str, user_id: str, category: Optional[str] =
         await get_story(story_id, user_id)
         
         # Query subcollection
-        collection_ref = get_db().collection(STORIES_COLLECTION).document(story_id).collection('bible_items')
-        
-        if category:
-            query = collection_ref.where('category', '==', category)
-            docs = query.stream()
-        else:
-            docs = collection_ref.stream()
+        docs = get_storage().list_bible_items(story_id, category)
             
         items = []
         for doc in docs:
-            data = doc.to_dict()
             items.append({
                 'id': doc.id,
-                **data
+                **doc.data
             })
             
         return items
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error getting bible items: {e}")
+        log.error("Error getting bible items: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to get bible items: {str(e)}")
 
 
-async def update_bible_item(story_id: str, item_id: str, item_data: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+@timed_storage
+async def update_bible_item(
+    story_id: str,
+    item_id: str,
+    item_data: Dict[str, Any],
+    user_id: str,
+    if_match: Optional[str] = None
+) -> Dict[str, Any]:
     """Update a bible item"""
     try:
         # Verify story ownership
         await get_story(story_id, user_id)
+        _check_bible_precondition(story_id, if_match)
         
-        doc_ref = get_db().collection(STORIES_COLLECTION).document(story_id).collection('bible_items').document(item_id)
-        doc = doc_ref.get()
+        storage = get_storage()
+        current_data = storage.get_bible_item(story_id, item_id)
         
-        if not doc.exists:
+        if current_data is None:
             raise HTTPException(status_code=404, detail="Item not found")
-            
-        current_data = doc.to_dict()
         
         # Update fields
         update_data = {**item_data}
@@ -529,7 +865,9 @@ async def update_bible_item(story_id: str, item_id: str, item_data: Dict[str, An
         if 'createdAt' in update_data:
             del update_data['createdAt']
         
-        doc_ref.update(update_data)
+        storage.update_bible_item(story_id, item_id, update_data)
+        _touch_bible_version(story_id)
+        search_index.index_bible_item(user_id, story_id, item_id, {**current_data, **update_data})
         
         # Merge for return
         return {
@@ -540,23 +878,31 @@ async def update_bible_item(story_id: str, item_id: str, item_data: Dict[str, An
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating bible item: {e}")
+        log.error("Error updating bible item: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to update bible item: {str(e)}")
 
 
-async def delete_bible_item(story_id: str, item_id: str, user_id: str) -> Dict[str, str]:
+@timed_storage
+async def delete_bible_item(
+    story_id: str,
+    item_id: str,
+    user_id: str,
+    if_match: Optional[str] = None
+) -> Dict[str, str]:
     """Delete a bible item"""
     try:
         # Verify story ownership
         await get_story(story_id, user_id)
+        _check_bible_precondition(story_id, if_match)
         
-        doc_ref = get_db().collection(STORIES_COLLECTION).document(story_id).collection('bible_items').document(item_id)
-        doc = doc_ref.get()
+        storage = get_storage()
         
-        if not doc.exists:
+        if storage.get_bible_item(story_id, item_id) is None:
             raise HTTPException(status_code=404, detail="Item not found")
             
-        doc_ref.delete()
+        storage.delete_bible_item(story_id, item_id)
+        _touch_bible_version(story_id)
+        search_index.remove_bible_item(user_id, story_id, item_id)
         
         return {
             'message': 'Item deleted successfully',
@@ -565,5 +911,187 @@ async def delete_bible_item(story_id: str, item_id: str, user_id: str) -> Dict[s
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting bible item: {e}")
+        log.error("Error deleting bible item: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to delete bible item: {str(e)}")
+
+
+# User stats
+
+def rebuild_user_stats(user_id: str) -> Dict[str, Any]:
+    """
+    Recompute a user's stats document from their stories and store it
+    
+    Args:
+        user_id: Firebase user UID
+    
+    Returns:
+        The rebuilt stats document
+    """
+    storage = get_storage()
+    stories = storage.list_stories(user_id, limit=1_000_000, offset=0)
+    stats = compute_user_stats(doc.data for doc in stories)
+    storage.set_user_stats(user_id, stats)
+    log.info("📊 Rebuilt stats for user %s: %s stories, %s words", user_id, stats['storyCount'], stats['wordCount'])
+    return stats
+
+
+@timed_storage
+async def get_user_stats(user_id: str, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Library totals for the dashboard (one document read)
+    
+    Args:
+        user_id: Firebase user UID
+        refresh: Recompute from the user's stories instead of trusting the stored totals
+    
+    Returns:
+        Story, word, character and chapter counts plus story counts per status and genre
+    """
+    try:
+        stats = None if refresh else get_storage().get_user_stats(user_id)
+        if stats is None or not stats.get('rebuiltAt'):
+            # No stats yet, or only increments on top of stories that predate stats tracking
+            stats = await asyncio.to_thread(rebuild_user_stats, user_id)
+        return stats_response(stats)
+    except Exception as e:
+        log.error("Error getting user stats: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to get user stats: {str(e)}")
+
+
+# Search
+
+@timed_storage
+async def search_stories(
+    user_id: str,
+    query: str,
+    limit: int = 20,
+    story_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Full-text search over a user's stories, chapters and bible items
+    
+    Args:
+        user_id: Firebase user UID
+        query: Search text (the last term also matches as a prefix)
+        limit: Maximum number of hits
+        story_id: Restrict hits to a single story
+    
+    Returns:
+        Hits ranked by BM25 score, best first
+    """
+    try:
+        if story_id:
+            # Verify story ownership
+            await get_story(story_id, user_id)
+        # A first search builds the user's index from storage; keep it off the event loop
+        return await asyncio.to_thread(search_index.search, user_id, query, limit=limit, story_id=story_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("Error searching stories: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to search stories: {str(e)}")
+
+
+@timed_storage
+async def list_story_revisions(story_id: str, user_id: str, chapter_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    List a story's revisions, newest first
+    
+    Args:
+        story_id: Story document ID
+        user_id: Firebase user UID (for authorization)
+        chapter_id: Only revisions that changed this chapter
+    
+    Returns:
+        Revision metadata (number, createdAt, updatedAt, label, wordCount, changedChapters, ...)
+    """
+    # Verify story ownership
+    await get_story(story_id, user_id)
+    try:
+        return revision_history.list_revisions(story_id, chapter_id=chapter_id)
+    except Exception as e:
+        log.error("Error listing revisions: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to list revisions: {str(e)}")
+
+
+@timed_storage
+async def get_story_revision(
+    story_id: str,
+    number: int,
+    user_id: str,
+    chapter_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Reconstruct a story (or a single chapter) as it was at a revision
+    
+    Args:
+        story_id: Story document ID
+        number: Revision number
+        user_id: Firebase user UID (for authorization)
+        chapter_id: Return only this chapter
+    
+    Returns:
+        Revision metadata plus title and content/chapters
+    """
+    # Verify story ownership
+    await get_story(story_id, user_id)
+    try:
+        revision = revision_history.reconstruct(story_id, number)
+    except Exception as e:
+        log.error("Error reconstructing revision: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to load revision: {str(e)}")
+    
+    if revision is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    
+    meta, state = revision
+    story = state_to_story(state)
+    if chapter_id is not None:
+        chapter = next((ch for ch in story.get('chapters', []) if str(ch.get('id')) == chapter_id), None)
+        if chapter is None:
+            raise HTTPException(status_code=404, detail="Chapter not found in this revision")
+        return {**meta, 'chapter': chapter}
+    return {**meta, **story}
+
+
+@timed_storage
+async def create_story_checkpoint(story_id: str, user_id: str, label: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Record the story's current text as a new (optionally labelled) revision
+    
+    Args:
+        story_id: Story document ID
+        user_id: Firebase user UID (for authorization)
+        label: Checkpoint name; labelled revisions are kept by compaction
+    
+    Returns:
+        Metadata of the new revision
+    """
+    story = await get_story(story_id, user_id)
+    try:
+        return revision_history.record(story_id, story, label=label, force=True)
+    except Exception as e:
+        log.error("Error creating checkpoint: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to create checkpoint: {str(e)}")
+
+
+@timed_storage
+async def restore_story_revision(story_id: str, number: int, user_id: str) -> Dict[str, Any]:
+    """
+    Restore a story's title and text to a revision
+    
+    The restore is saved as a normal update, so it becomes the newest
+    revision and can itself be undone.
+    
+    Args:
+        story_id: Story document ID
+        number: Revision number to restore
+        user_id: Firebase user UID (for authorization)
+    
+    Returns:
+        Updated story document
+    """
+    revision = await get_story_revision(story_id, number, user_id)
+    if 'chapters' in revision:
+        return await update_story(story_id, user_id, title=revision['title'], chapters=revision['chapters'])
+    return await update_story(story_id, user_id, title=revision['title'], content=revision['content'])
@@ -0,0 +1,306 @@
+"""
+Resumable generation streams.
+
+A streamed generation no longer lives and dies with its HTTP response.
+POST /generate/stream registers the generation under a random id and decodes
+into a ResumableGeneration, a bounded buffer of the text frames produced so
+far; the response is just one subscriber reading that buffer. Every chunk
+event carries an SSE `id:` line holding the stream offset (characters of
+generated text) after that chunk. A client whose connection drops reconnects
+with GET /generate/stream/{id} and `Last-Event-ID: <offset>` and gets the
+missed text as one chunk, then the live stream.
+
+While nobody is reading, decoding keeps going for GENERATION_RESUME_GRACE_SECONDS;
+if no client has come back by then the generation is cancelled (CancelOnEvent)
+and dropped. Finished generations are kept for the same grace period so a
+client that lost the connection just before 'done' can still fetch it.
+
+Bounds:
+- each buffer keeps the last GENERATION_RESUME_BUFFER_CHARS characters; a
+  resume from an offset that has been trimmed is refused (410) and the client
+  has to regenerate
+- at most GENERATION_RESUME_MAX_STREAMS generations are registered; beyond
+  that the oldest finished (then the oldest unattended) ones are evicted
+
+Buffers are per process: with several workers, resumes must reach the worker
+that started the generation (sticky sessions on the X-Generation-Id header).
+"""
+
+import asyncio
+import logging
+import os
+import secrets
+import threading
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional
+
+from stream_framing import STREAM_HEARTBEAT_SECONDS, SSE_HEARTBEAT, StreamFramer, sse_chunk, sse_event
+
+log = logging.getLogger(__name__)
+
+# How long an unattended generation keeps decoding (and a finished one stays resumable)
+GENERATION_RESUME_GRACE_SECONDS = float(os.getenv('GENERATION_RESUME_GRACE_SECONDS', '30'))
+# Generated text kept per generation for replay
+GENERATION_RESUME_BUFFER_CHARS = int(os.getenv('GENERATION_RESUME_BUFFER_CHARS', '32768'))
+# Generations registered at once (running, unattended or recently finished)
+GENERATION_RESUME_MAX_STREAMS = int(os.getenv('GENERATION_RESUME_MAX_STREAMS', '64'))
+
+
+class ResumeUnavailable(Exception):
+    """The generation is unknown or expired, or the requested offset is no longer buffered"""
+
+
+class ResumableGeneration:
+    """
+    Buffered output of one generation, readable by any number of subscribers.
+
+    Args:
+        generation_id: Registry key, sent to the client
+        cancel: Event stopping model.generate (see CancelOnEvent)
+        on_finished: Called once the final event has been recorded
+        grace_seconds: How long decoding continues without a subscriber
+    """
+
+    def __init__(
+        self,
+        generation_id: str,
+        cancel: threading.Event,
+        on_finished: Callable[[str], None],
+        grace_seconds: float = GENERATION_RESUME_GRACE_SECONDS
+    ):
+        self.id = generation_id
+        self.cancel = cancel
+        self.grace_seconds = grace_seconds
+        self.frames = deque()  # (end offset, text)
+        self.base = 0  # offset of the first buffered character
+        self.offset = 0  # characters generated so far
+        self.buffered = 0
+        self.final: Optional[bytes] = None  # the 'done' / 'error' event
+        self.subscribers = 0
+        self.resumes = 0
+        self.cancelled = False
+        self._changed = asyncio.Event()
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+        self._on_finished = on_finished
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.final is not None
+
+    def start(self, streamer: Iterable[str], finish: Callable[[str], Dict[str, Any]]) -> None:
+        """Start decoding into the buffer (runs until done, failed or abandoned)"""
+        self._task = asyncio.create_task(self._produce(streamer, finish))
+
+    async def _produce(self, streamer: Iterable[str], finish: Callable[[str], Dict[str, Any]]) -> None:
+        # Subscribers send their own heartbeats, so the framer only coalesces
+        framer = StreamFramer(heartbeat_seconds=0)
+        fragments = []
+
+        def collect():
+            for text_chunk in streamer:
+                fragments.append(text_chunk)
+                yield text_chunk
+
+        try:
+            async for frame in framer.frames(collect()):
+                self._append(frame)
+            if self.cancelled:
+                final = sse_event({'type': 'error', 'message': 'Generation was cancelled'})
+            else:
+                final = sse_event({'type': 'done', **finish(''.join(fragments)), 'stream': framer.stats.as_dict()})
+        except Exception as e:
+            log.error("❌ Streaming error: %s", e)
+            final = sse_event({'type': 'error', 'message': str(e)})
+        finally:
+            self.cancel.set()
+            self._clear_abandon_timer()
+        self.final = final
+        self._notify()
+        self._on_finished(self.id)
+
+    def _append(self, text: str) -> None:
+        self.offset += len(text)
+        self.frames.append((self.offset, text))
+        self.buffered += len(text)
+        # Trim the oldest frames, always keeping the newest one
+        while self.buffered > GENERATION_RESUME_BUFFER_CHARS and len(self.frames) > 1:
+            end, dropped = self.frames.popleft()
+            self.buffered -= len(dropped)
+            self.base = end
+        self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _text_since(self, position: int) -> str:
+        """Buffered text from `position` to the current offset"""
+        parts = []
+        for end, text in reversed(self.frames):
+            if end <= position:
+                break
+            start = end - len(text)
+            parts.append(text[position - start:] if start < position else text)
+        return ''.join(reversed(parts))
+
+    def check_offset(self, position: int) -> None:
+        """Raises ResumeUnavailable unless `position` can be resumed from"""
+        if position < self.base or position > self.offset:
+            raise ResumeUnavailable(
+                f"Offset {position} is not buffered (available: {self.base}-{self.offset})"
+            )
+
+    async def events(self, position: int = 0) -> AsyncIterator[bytes]:
+        """
+        SSE events from `position` to the end of the generation
+
+        Missed text is sent as one chunk, then frames as they are produced;
+        each chunk's event id is the offset after it. Heartbeats are sent
+        after STREAM_HEARTBEAT_SECONDS without output.
+        """
+        self.check_offset(position)
+        self._attach()
+        try:
+            while True:
+                changed = self._changed
+                if position < self.offset:
+                    if position < self.base:
+                        # This reader fell behind the buffer (a very slow connection)
+                        yield sse_event({'type': 'error', 'message': 'Stream fell behind the resume buffer'})
+                        return
+                    text = self._text_since(position)
+                    position = self.offset
+                    yield sse_chunk(text, position)
+                elif self.final is not None:
+                    yield self.final
+                    return
+                else:
+                    try:
+                        await asyncio.wait_for(changed.wait(), STREAM_HEARTBEAT_SECONDS or None)
+                    except asyncio.TimeoutError:
+                        yield SSE_HEARTBEAT
+        finally:
+            self._detach()
+
+    def _attach(self) -> None:
+        self.subscribers += 1
+        self._clear_abandon_timer()
+
+    def _detach(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.finished:
+            log.info("📴 Generation %s lost its client; decoding on for %gs", self.id, self.grace_seconds)
+            self._abandon_timer = asyncio.get_running_loop().call_later(
+                self.grace_seconds, self.abandon
+            )
+
+    def _clear_abandon_timer(self) -> None:
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+
+    def abandon(self) -> None:
+        """Stop decoding (no client came back, or the client cancelled)"""
+        self._abandon_timer = None
+        if not self.finished:
+            log.info("⏹️ Cancelling generation %s", self.id)
+            self.cancelled = True
+            self.cancel.set()
+
+
+class GenerationRegistry:
+    """
+    Resumable generations by id (module singleton below).
+
+    Args:
+        grace_seconds: How long unattended generations keep decoding and finished ones stay resumable
+        max_streams: Registered generations before the oldest are evicted
+    """
+
+    def __init__(
+        self,
+        grace_seconds: float = GENERATION_RESUME_GRACE_SECONDS,
+        max_streams: int = GENERATION_RESUME_MAX_STREAMS
+    ):
+        self.grace_seconds = grace_seconds
+        self.max_streams = max_streams
+        self._generations: "OrderedDict[str, ResumableGeneration]" = OrderedDict()
+        self._counters = {'started': 0, 'resumed': 0, 'cancelled': 0, 'evicted': 0}
+
+    def start(
+        self,
+        streamer: Iterable[str],
+        cancel: threading.Event,
+        finish: Callable[[str], Dict[str, Any]]
+    ) -> ResumableGeneration:
+        """
+        Register a generation and start buffering its output
+
+        Args:
+            streamer: Text fragments (a TextIteratorStreamer)
+            cancel: The event passed to start_generation
+            finish: Builds the 'done' payload from the raw generated text
+        """
+        self._evict()
+        generation = ResumableGeneration(secrets.token_urlsafe(16), cancel, self._finished, self.grace_seconds)
+        self._generations[generation.id] = generation
+        self._counters['started'] += 1
+        generation.start(streamer, finish)
+        return generation
+
+    def resume(self, generation_id: str, position: int) -> ResumableGeneration:
+        """
+        Look up a generation to resume from `position`
+
+        Raises:
+            ResumeUnavailable: Unknown or expired id, or offset not buffered
+        """
+        generation = self._generations.get(generation_id)
+        if generation is None:
+            raise ResumeUnavailable("Generation not found or expired")
+        generation.check_offset(position)
+        generation.resumes += 1
+        self._counters['resumed'] += 1
+        return generation
+
+    def cancel(self, generation_id: str) -> bool:
+        """Stop a generation at the client's request; False if unknown"""
+        generation = self._generations.get(generation_id)
+        if generation is None:
+            return False
+        generation.abandon()
+        return True
+
+    def _finished(self, generation_id: str) -> None:
+        generation = self._generations.get(generation_id)
+        if generation is not None and generation.cancelled:
+            self._counters['cancelled'] += 1
+        asyncio.get_running_loop().call_later(self.grace_seconds, self._generations.pop, generation_id, None)
+
+    def _evict(self) -> None:
+        """Make room for one more generation"""
+        while len(self._generations) >= self.max_streams:
+            victim = next((g for g in self._generations.values() if g.finished), None)
+            if victim is None:
+                victim = next((g for g in self._generations.values() if g.subscribers == 0), None)
+            if victim is None:
+                # Every generation has a live client; they are bounded by model capacity
+                return
+            victim.abandon()
+            del self._generations[victim.id]
+            self._counters['evicted'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        generations = list(self._generations.values())
+        return {
+            **self._counters,
+            'registered': len(generations),
+            'running': sum(not g.finished for g in generations),
+            'unattended': sum(g.subscribers == 0 and not g.finished for g in generations),
+            'bufferedChars': sum(g.buffered for g in generations),
+            'graceSeconds': self.grace_seconds,
+        }
+
+
+resumable_generations = GenerationRegistry()
@@ -0,0 +1,378 @@
+"""
+WebSocket channel multiplexing generation streams.
+
+An editor session opens one WebSocket to /generate/ws, authenticates once,
+and runs any number of continuations, variations and rewrites over it
+instead of one HTTP POST per generation. Each stream has a client-chosen id;
+chunks from concurrent streams are interleaved on the socket.
+
+Cancellation is explicit: a 'cancel' message sets the stream's cancel event,
+which CancelOnEvent checks between decoding steps, so model.generate stops
+within one token instead of running to max_new_tokens after the client has
+gone. Streams wait for one of WS_GENERATION_SLOTS model slots (shared by all
+channels and /generate/best-of) in priority order; 'priority' messages reorder waiting streams.
+
+Protocol - JSON text messages, except binary chunks:
+
+client -> server
+    {"type": "auth", "token": "<Firebase ID token>", "binary": false}
+        First message (within WS_AUTH_TIMEOUT_SECONDS); send again with a
+        fresh token before the current one expires
+    {"type": "start", "id": 1, "kind": "continue" | "variations" | "rewrite",
+     "params": {...}, "priority": 0}
+        params are the body of /generate/stream, /generate/variations or /rewrite
+    {"type": "cancel", "id": 1}
+    {"type": "priority", "id": 1, "priority": 5}
+    {"type": "ping"}
+
+server -> client
+    {"type": "ready", "uid": "...", "expiresAt": 1700000000}
+    {"type": "queued", "id": 1}            waiting for a model slot
+    {"type": "started", "id": 1}
+    {"type": "chunk", "id": 1, "variant": 0, "text": "..."}
+        or, with "binary": true, a binary message: 4-byte big-endian stream
+        id, 1-byte variant, UTF-8 text
+    {"type": "done", "id": 1, ...result, "stream": {...frame stats}}
+    {"type": "cancelled", "id": 1}
+    {"type": "error", "id": 1 | null, "message": "..."}
+    {"type": "pong"}
+
+Chunks are coalesced per stream with StreamFramer (stream_framing.py).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from itertools import count
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from transformers import StoppingCriteria
+
+from fast_response import dumps
+from stream_framing import StreamFramer
+from tracing import start_trace
+
+log = logging.getLogger(__name__)
+
+# Concurrent model runs started over WebSocket channels (all connections) and /generate/best-of
+WS_GENERATION_SLOTS = int(os.getenv('WS_GENERATION_SLOTS', '2'))
+# Streams one connection may have running or queued
+WS_MAX_STREAMS_PER_CONNECTION = int(os.getenv('WS_MAX_STREAMS_PER_CONNECTION', '8'))
+WS_AUTH_TIMEOUT_SECONDS = float(os.getenv('WS_AUTH_TIMEOUT_SECONDS', '10'))
+
+_CHUNK_HEADER = struct.Struct('>IB')
+_MAX_STREAM_ID = 2 ** 32 - 1
+
+# WebSocket close codes
+CLOSE_POLICY_VIOLATION = 1008
+
+
+class CancelOnEvent(StoppingCriteria):
+    """Stops model.generate at the next decoding step once the event is set"""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.event.is_set()
+
+
+class GenerationJob(NamedTuple):
+    """
+    What a stream runs: one model run per variant, then a finishing step
+
+    runs: Generation settings per run (passed to start)
+    start: Starts a run and returns its text fragments (a blocking iterator),
+        stopping early when the event is set
+    finish: Turns the raw text of every run into the 'done' payload
+        (called on a worker thread)
+    """
+    runs: List[Dict[str, Any]]
+    start: Callable[[Dict[str, Any], threading.Event], Iterable[str]]
+    finish: Callable[[List[str]], Dict[str, Any]]
+
+
+class StreamTicket:
+    """A stream's place in the scheduler and its cancel signal"""
+
+    __slots__ = ('priority', 'seq', 'future', 'cancel')
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.future: Optional[asyncio.Future] = None
+        self.cancel = threading.Event()
+
+
+class GenerationScheduler:
+    """
+    Priority-ordered model slots for channel streams.
+
+    Waiting streams are admitted highest priority first, then in arrival
+    order; a running stream keeps its slot until it finishes or is cancelled.
+    """
+
+    def __init__(self, slots: int = WS_GENERATION_SLOTS):
+        self.slots = max(slots, 1)
+        self._running = 0
+        self._waiting: List[StreamTicket] = []
+        self._seq = count()
+
+    def ticket(self, priority: int = 0) -> StreamTicket:
+        return StreamTicket(priority, next(self._seq))
+
+    def must_wait(self) -> bool:
+        return self._running >= self.slots or bool(self._waiting)
+
+    async def acquire(self, ticket: StreamTicket) -> None:
+        if not self.must_wait():
+            self._running += 1
+            return
+        ticket.future = asyncio.get_running_loop().create_future()
+        self._waiting.append(ticket)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+            elif ticket.future.done() and not ticket.future.cancelled():
+                # The slot was handed over just as we were cancelled
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Hand the slot to the best waiting stream, or free it"""
+        while self._waiting:
+            ticket = max(self._waiting, key=lambda t: (t.priority, -t.seq))
+            self._waiting.remove(ticket)
+            if not ticket.future.done():
+                ticket.future.set_result(None)
+                return
+        self._running -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {'slots': self.slots, 'running': self._running, 'waiting': len(self._waiting)}
+
+
+class GenerationChannel:
+    """
+    One WebSocket connection carrying many generation streams.
+
+    Args:
+        websocket: The accepted-to-be connection
+        authenticate: Async callable (token) -> (user, token expiry or None);
+            raises HTTPException when the token is rejected
+        jobs: kind -> builder (params, user) -> GenerationJob; builders
+            raise ValueError (or pydantic's ValidationError) for bad params
+        allowed_origins: Browser origins allowed to connect
+        scheduler: Shared model slots
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        authenticate: Callable[[Optional[str]], Awaitable[Tuple[Dict[str, Any], Optional[float]]]],
+        jobs: Dict[str, Callable[[Dict[str, Any], Dict[str, Any]], GenerationJob]],
+        allowed_origins: List[str],
+        scheduler: Optional[GenerationScheduler] = None
+    ):
+        self.websocket = websocket
+        self.authenticate = authenticate
+        self.jobs = jobs
+        self.allowed_origins = allowed_origins
+        self.scheduler = scheduler or generation_scheduler
+        self.user: Optional[Dict[str, Any]] = None
+        self.expires_at: Optional[float] = None
+        self.binary = False
+        self._streams: Dict[int, Tuple[asyncio.Task, StreamTicket]] = {}
+        self._send_lock = asyncio.Lock()
+        self._closed = False
+
+    async def serve(self) -> None:
+        """Run the connection until the client disconnects"""
+        origin = self.websocket.headers.get('origin')
+        if origin and origin not in self.allowed_origins:
+            await self.websocket.close(code=CLOSE_POLICY_VIOLATION)
+            return
+        await self.websocket.accept()
+        try:
+            try:
+                first = await asyncio.wait_for(self._receive(), WS_AUTH_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                await self.websocket.close(code=CLOSE_POLICY_VIOLATION, reason="Authentication timed out")
+                return
+            if first.get('type') != 'auth' or not await self._authenticate(first):
+                await self.websocket.close(code=CLOSE_POLICY_VIOLATION, reason="Not authenticated")
+                return
+            while True:
+                await self._dispatch(await self._receive())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._closed = True
+            for task, ticket in list(self._streams.values()):
+                ticket.cancel.set()
+                task.cancel()
+
+    async def _receive(self) -> Dict[str, Any]:
+        while True:
+            text = await self.websocket.receive_text()
+            try:
+                message = json.loads(text)
+            except ValueError:
+                await self._send_error(None, "Messages must be JSON")
+                continue
+            if isinstance(message, dict):
+                return message
+            await self._send_error(None, "Messages must be JSON objects")
+
+    async def _authenticate(self, message: Dict[str, Any]) -> bool:
+        try:
+            self.user, self.expires_at = await self.authenticate(message.get('token'))
+        except HTTPException as e:
+            await self._send_error(None, e.detail)
+            return False
+        self.binary = bool(message.get('binary', self.binary))
+        await self._send_json({'type': 'ready', 'uid': self.user['uid'], 'expiresAt': self.expires_at})
+        return True
+
+    async def _dispatch(self, message: Dict[str, Any]) -> None:
+        kind = message.get('type')
+        if kind == 'ping':
+            await self._send_json({'type': 'pong'})
+        elif kind == 'auth':
+            await self._authenticate(message)
+        elif kind == 'start':
+            await self._start(message)
+        elif kind == 'cancel':
+            self._cancel(message.get('id'))
+        elif kind == 'priority':
+            self._reprioritize(message.get('id'), message.get('priority'))
+        else:
+            await self._send_error(message.get('id'), f"Unknown message type '{kind}'")
+
+    async def _start(self, message: Dict[str, Any]) -> None:
+        stream_id = message.get('id')
+        if not isinstance(stream_id, int) or isinstance(stream_id, bool) or not 0 <= stream_id <= _MAX_STREAM_ID:
+            await self._send_error(None, "Stream id must be an integer between 0 and 2^32-1")
+            return
+        if stream_id in self._streams:
+            await self._send_error(stream_id, "Stream id is already in use")
+            return
+        if len(self._streams) >= WS_MAX_STREAMS_PER_CONNECTION:
+            await self._send_error(stream_id, f"At most {WS_MAX_STREAMS_PER_CONNECTION} streams per connection")
+            return
+        if self.expires_at is not None and self.expires_at <= time.time():
+            await self._send_error(stream_id, "Authentication token has expired")
+            return
+        builder = self.jobs.get(message.get('kind'))
+        if builder is None:
+            await self._send_error(stream_id, f"Unknown stream kind '{message.get('kind')}'")
+            return
+        try:
+            job = builder(message.get('params') or {}, self.user)
+        except ValueError as e:
+            await self._send_error(stream_id, str(e))
+            return
+
+        ticket = self.scheduler.ticket(_priority(message.get('priority')))
+        task = asyncio.create_task(self._run(stream_id, message['kind'], job, ticket))
+        self._streams[stream_id] = (task, ticket)
+
+    def _cancel(self, stream_id: Any) -> None:
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            return
+        task, ticket = stream
+        ticket.cancel.set()
+        if ticket.future is not None and not ticket.future.done():
+            # Still queued - nothing is running yet
+            task.cancel()
+
+    def _reprioritize(self, stream_id: Any, priority: Any) -> None:
+        stream = self._streams.get(stream_id)
+        if stream is not None:
+            stream[1].priority = _priority(priority)
+
+    async def _run(self, stream_id: int, kind: str, job: GenerationJob, ticket: StreamTicket) -> None:
+        # Each stream is sampled and traced like an HTTP request (tracing.py)
+        with start_trace(f"WS {kind}", kind=kind):
+            await self._stream(stream_id, job, ticket)
+
+    async def _stream(self, stream_id: int, job: GenerationJob, ticket: StreamTicket) -> None:
+        try:
+            if self.scheduler.must_wait():
+                await self._send_json({'type': 'queued', 'id': stream_id})
+            await self.scheduler.acquire(ticket)
+            try:
+                await self._send_json({'type': 'started', 'id': stream_id})
+                framer = StreamFramer(heartbeat_seconds=0)
+                texts = []
+                for variant, run in enumerate(job.runs):
+                    parts = []
+
+                    def fragments(run=run, parts=parts):
+                        for fragment in job.start(run, ticket.cancel):
+                            parts.append(fragment)
+                            yield fragment
+
+                    async for frame in framer.frames(fragments()):
+                        await self._send_chunk(stream_id, variant, frame)
+                    if ticket.cancel.is_set():
+                        break
+                    texts.append(''.join(parts))
+            finally:
+                self.scheduler.release()
+
+            if ticket.cancel.is_set():
+                await self._send_json({'type': 'cancelled', 'id': stream_id})
+                return
+            result = await asyncio.to_thread(job.finish, texts)
+            await self._send_json({**result, 'type': 'done', 'id': stream_id, 'stream': framer.stats.as_dict()})
+        except asyncio.CancelledError:
+            ticket.cancel.set()
+            if self._closed:
+                raise
+            # Cancelled by the client while queued
+            await self._send_json({'type': 'cancelled', 'id': stream_id})
+        except WebSocketDisconnect:
+            ticket.cancel.set()
+        except Exception as e:
+            ticket.cancel.set()
+            log.error("❌ Generation stream %s failed: %s", stream_id, e)
+            await self._send_error(stream_id, str(e))
+        finally:
+            self._streams.pop(stream_id, None)
+
+    async def _send_chunk(self, stream_id: int, variant: int, text: str) -> None:
+        if self.binary:
+            async with self._send_lock:
+                await self.websocket.send_bytes(_CHUNK_HEADER.pack(stream_id, variant) + text.encode('utf-8'))
+        else:
+            await self._send_json({'type': 'chunk', 'id': stream_id, 'variant': variant, 'text': text})
+
+    async def _send_json(self, message: Dict[str, Any]) -> None:
+        async with self._send_lock:
+            await self.websocket.send_text(dumps(message).decode('utf-8'))
+
+    async def _send_error(self, stream_id: Optional[int], message: str) -> None:
+        try:
+            await self._send_json({'type': 'error', 'id': stream_id, 'message': message})
+        except Exception:
+            pass
+
+
+def _priority(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+# Model slots shared by every channel
+generation_scheduler = GenerationScheduler()
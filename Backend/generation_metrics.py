@@ -0,0 +1,152 @@
+"""
+Inference metrics.
+
+GenerationProbe is a StoppingCriteria that never stops anything: transformers
+calls it once per decoding step (after each new token), which is enough to
+split a model.generate call into prefill (start to the first new token -
+the model's time to first token) and decode (first to last token) and to
+count output tokens, without touching the model code. It records into the
+histograms and counters below when the run ends, and - in a traced request -
+adds model.generate, model.prefill and model.decode spans under the span
+that was current when the probe was created (tracing.py).
+
+Every generation metric is labelled by endpoint (generate, stream,
+variations, rewrite, bible, and ws_continue / ws_variations / ws_rewrite for
+WebSocket streams), tone and length. Tone and length come from the client,
+so values outside the ones main.py knows (tone_instructions, length_map /
+VARIATION_LENGTHS) are recorded as 'other' to keep label cardinality bounded.
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+from transformers import StoppingCriteria
+
+from metrics import metrics
+from tracing import current_span, record_span
+
+GENERATION_LABELS = ('endpoint', 'tone', 'length')
+# Label values accepted as-is (keys of main.py's tone_instructions and length maps)
+TONE_LABELS = frozenset({'Dark', 'Humorous', 'Romantic', 'Mysterious', 'Action', 'Dramatic', 'Any Genre'})
+LENGTH_LABELS = frozenset({'Short', 'Medium', 'Long'})
+
+# Seconds: prefill of a short prompt on GPU to a long CPU decode
+GENERATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 120, 200)
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+GENERATIONS = metrics.counter(
+    'generations_total', 'Model runs by outcome (completed, cancelled, error)', GENERATION_LABELS + ('outcome',)
+)
+PREFILL_SECONDS = metrics.histogram(
+    'generation_prefill_seconds', 'model.generate start to first new token (time to first token)',
+    GENERATION_LABELS, buckets=GENERATION_BUCKETS
+)
+DECODE_SECONDS = metrics.histogram(
+    'generation_decode_seconds', 'First to last new token', GENERATION_LABELS, buckets=GENERATION_BUCKETS
+)
+DECODE_RATE = metrics.histogram(
+    'generation_decode_tokens_per_second', 'Output tokens per second of decode time',
+    GENERATION_LABELS, buckets=TOKEN_RATE_BUCKETS
+)
+INPUT_TOKENS = metrics.counter('generation_input_tokens_total', 'Prompt tokens processed', GENERATION_LABELS)
+OUTPUT_TOKENS = metrics.counter('generation_output_tokens_total', 'Tokens generated', GENERATION_LABELS)
+QUALITY_SCORE = metrics.histogram(
+    'generation_quality_score', 'quality_control.calculate_quality_score per dimension',
+    GENERATION_LABELS + ('dimension',), buckets=SCORE_BUCKETS
+)
+
+
+def generation_labels(endpoint: str, tone: Optional[str] = None, length: Optional[str] = None) -> Dict[str, str]:
+    return {'endpoint': endpoint, 'tone': _bounded(tone, TONE_LABELS), 'length': _bounded(length, LENGTH_LABELS)}
+
+
+def _bounded(value: Optional[str], known: frozenset) -> str:
+    if not value:
+        return 'none'
+    return value if value in known else 'other'
+
+
+class GenerationProbe(StoppingCriteria):
+    """
+    Times one model.generate call (add it to stopping_criteria after any
+    cancelling criteria; it never stops generation itself)
+
+    Args:
+        labels: From generation_labels()
+        prompt_tokens: Length of the prompt's input_ids
+        cancel: The run's cancel event; a run that ends while it is set counts as cancelled
+    """
+
+    def __init__(self, labels: Dict[str, str], prompt_tokens: int, cancel: Optional[threading.Event] = None):
+        self.labels = labels
+        self.prompt_tokens = prompt_tokens
+        self.cancel = cancel
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.last_token: Optional[float] = None
+        self.tokens = 0
+        self.cancelled = False
+        self._recorded = False
+        # The request's span; the run itself happens on another thread
+        self.span = current_span()
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+        self.last_token = now
+        self.tokens += 1
+        # Seen at the last step of a run stopped by CancelOnEvent
+        self.cancelled = self.cancel is not None and self.cancel.is_set()
+        return False
+
+    def __enter__(self) -> "GenerationProbe":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.record('error' if exc_type is not None else None)
+
+    def run(self, generate, **kwargs):
+        """Call generate(**kwargs) and record the run (a Thread target for streamed runs)"""
+        with self:
+            return generate(**kwargs)
+
+    def record(self, outcome: Optional[str] = None) -> None:
+        """Record the run once (outcome defaults to completed or cancelled)"""
+        if self._recorded:
+            return
+        self._recorded = True
+        outcome = outcome or ('cancelled' if self.cancelled else 'completed')
+        GENERATIONS.inc(outcome=outcome, **self.labels)
+        INPUT_TOKENS.inc(self.prompt_tokens, **self.labels)
+        self._trace(outcome)
+        if self.first_token is None:
+            return
+        OUTPUT_TOKENS.inc(self.tokens, **self.labels)
+        PREFILL_SECONDS.observe(self.first_token - self.started, **self.labels)
+        decode = self.last_token - self.first_token
+        DECODE_SECONDS.observe(decode, **self.labels)
+        if self.tokens > 1 and decode > 0:
+            DECODE_RATE.observe((self.tokens - 1) / decode, **self.labels)
+
+    def _trace(self, outcome: str) -> None:
+        if not self.span.sampled:
+            return
+        run = record_span(
+            'model.generate', self.span, self.started, time.perf_counter(),
+            endpoint=self.labels['endpoint'], promptTokens=self.prompt_tokens,
+            outputTokens=self.tokens, outcome=outcome
+        )
+        if self.first_token is not None:
+            record_span('model.prefill', run, self.started, self.first_token)
+            record_span('model.decode', run, self.first_token, self.last_token, tokens=self.tokens)
+
+
+def observe_quality(scores: Dict[str, float], labels: Dict[str, str]) -> Dict[str, float]:
+    """Record a quality_control score dict; returns it unchanged"""
+    for dimension, value in scores.items():
+        QUALITY_SCORE.observe(value, dimension=dimension, **labels)
+    return scores
@@ -0,0 +1,94 @@
+"""
+ETag helpers for conditional requests.
+
+ETags are derived from storage versions rather than response bodies, so
+deciding whether a client's copy is current never needs the payload:
+- a story: its document version (Firestore update_time / SQLite row version)
+- a user's story list: the version and update time of their stats document,
+  which every story write touches in the same atomic write (user_stats.py)
+- a story's bible items: the story's bible version token, kept outside the
+  story document and replaced on every bible write
+
+GET endpoints answer a matching If-None-Match with 304 before serializing
+anything. Writes accept If-Match and fail with 412 when the resource has
+changed since the client read it.
+"""
+
+import hashlib
+from typing import Any, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+# Clients may keep responses but must revalidate them (cheaply, via ETag) before use
+CACHE_CONTROL = 'private, no-cache'
+
+
+def version_token(version: Any) -> str:
+    """Stable string for a storage version (Firestore timestamps keep nanoseconds)"""
+    rfc3339 = getattr(version, 'rfc3339', None)
+    return rfc3339() if callable(rfc3339) else str(version)
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag from the parts identifying a resource version"""
+    digest = hashlib.blake2b('\x1f'.join(str(part) for part in parts).encode('utf-8'), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+
+def weak_etag(etag: str) -> str:
+    """Weak form of an ETag, sent with content-coded bodies (the bytes differ per encoding)"""
+    return etag if etag.startswith('W/') else f'W/{etag}'
+
+
+def etag_matches(header: Optional[str], etag: Optional[str], weak: bool = False) -> bool:
+    """
+    Whether an If-Match / If-None-Match header value names the current ETag
+
+    Args:
+        header: Comma-separated entity tags or '*'
+        etag: Current ETag (None if the resource has none)
+        weak: Ignore W/ prefixes
+    """
+    if not header or etag is None:
+        return False
+    tags = [tag.strip() for tag in header.split(',') if tag.strip()]
+    if '*' in tags:
+        return True
+    if weak:
+        tags = [tag.removeprefix('W/') for tag in tags]
+    return etag in tags
+
+
+def if_none_match(request: Request, etag: Optional[str]) -> bool:
+    """True if the client's cached copy is current"""
+    return etag_matches(request.headers.get('if-none-match'), etag, weak=True)
+
+
+def check_if_match(if_match: Optional[str], etag: Optional[str]) -> None:
+    """
+    Enforce an If-Match precondition
+
+    ETags name storage versions, not body bytes, so a W/ tag the client got
+    with a compressed response identifies the same version and is accepted.
+
+    Args:
+        if_match: The request's If-Match header (None if absent)
+        etag: Current ETag of the resource
+
+    Raises:
+        HTTPException 412 if the header is present and names no current version
+    """
+    if if_match and not etag_matches(if_match, etag, weak=True):
+        raise HTTPException(status_code=412, detail="Resource has changed since it was read", headers=etag_headers(etag))
+
+
+def etag_headers(etag: Optional[str]) -> dict:
+    if etag is None:
+        return {}
+    return {'ETag': etag, 'Cache-Control': CACHE_CONTROL}
+
+
+def not_modified(etag: str) -> Response:
+    """Empty 304 response for a client whose copy is current"""
+    return Response(status_code=304, headers=etag_headers(etag))
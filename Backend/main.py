@@ -1,20 +1,33 @@
-from fastapi import FastAPI, HTTPException, Depends, Query, Request
+import logging
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, UploadFile, File, Form, Header, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
-from transformers import AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer
+from transformers import AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer, StoppingCriteriaList
 import torch
 from typing import Optional, List, Dict, Any, AsyncGenerator
 from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
-from firebase_auth import initialize_firebase, get_current_user
+
+# Load environment variables from .env file before any local module import:
+# storage_backend, autosave_buffer, auth_cache, tracing and others read their
+# settings from the environment when they are imported.
+load_dotenv()
+
+from firebase_auth import initialize_firebase, get_current_user, authenticate_token
+from auth_cache import token_cache, signing_key_refresher, AUTH_KEY_REFRESH
 import re
 import json
+import secrets
 import asyncio
+import threading
 from threading import Thread
 from firestore_service import (
     create_story,
+    import_story,
+    import_max_bytes,
+    manuscript_too_large_detail,
     update_story,
     get_story,
     list_user_stories,
@@ -22,64 +35,45 @@ from firestore_service import (
     add_bible_item,
     get_bible_items,
     update_bible_item,
-    delete_bible_item
+    delete_bible_item,
+    bulk_update_bible_items,
+    normalize_item_name,
+    search_stories,
+    list_story_revisions,
+    get_story_revision,
+    create_story_checkpoint,
+    restore_story_revision,
+    get_user_stats,
+    get_story_with_etag,
+    get_library_etag,
+    get_bible_etag,
+    current_story_etag
 )
-
-# Load environment variables from .env file
-load_dotenv()
-
-def clean_and_complete_text(text):
-    """Clean generated text and ensure it ends with complete sentences."""
-    if not text:
-        return text
-    
-    # Remove any meta-commentary or instructions that leaked through
-    unwanted_patterns = [
-        r'^(Here\'s|Here is|I\'ll|Let me|Continuing|The story continues).*?:\s*',
-        r'\n\s*\[.*?\]\s*$',
-        r'\n\s*\(.*?\)\s*$',
-        r'---+.*$',
-    ]
-    for pattern in unwanted_patterns:
-        text = re.sub(pattern, '', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    text = text.strip()
-    
-    # Check if text ends with proper punctuation
-    if text and text[-1] in '.!?"\'':
-        return text
-    
-    # Find the last complete sentence
-    # Look for sentence endings: . ! ? followed by space or end, or closing quote
-    sentence_endings = []
-    for match in re.finditer(r'[.!?]["\']?\s', text):
-        sentence_endings.append(match.end() - 1)
-    
-    # Also check for endings at the very end
-    for match in re.finditer(r'[.!?]["\']?$', text):
-        sentence_endings.append(match.end())
-    
-    if sentence_endings:
-        # Get the last complete sentence ending
-        last_end = max(sentence_endings)
-        text = text[:last_end].strip()
-    else:
-        # No sentence ending found - add a period if it looks like a sentence
-        if len(text) > 20 and text[-1] not in '.!?,"\'':
-            # Try to find a natural break point
-            last_comma = text.rfind(',')
-            last_and = text.rfind(' and ')
-            last_but = text.rfind(' but ')
-            
-            break_point = max(last_comma, last_and, last_but)
-            if break_point > len(text) * 0.5:  # Only use if in latter half
-                text = text[:break_point].rstrip(',').strip() + '.'
-            else:
-                text = text + '.'
-    
-    return text
-
-
+from autosave_buffer import autosave_buffer
+from story_reaper import story_reaper
+from story_history import revision_history
+from story_cache import story_cache
+from fast_response import json_response, story_payload, story_list_payload, bible_item_payload
+from http_cache import if_none_match, not_modified, etag_headers
+from stream_framing import sse_event, framing_stats
+from generation_buffer import ResumableGeneration, ResumeUnavailable, resumable_generations
+from generation_metrics import GenerationProbe, generation_labels, observe_quality
+from degeneration import degeneration_criteria
+from text_processing import clean_and_complete_text, truncate_context
+from best_of import BEST_OF_MAX_CANDIDATES, best_of_generate
+from metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from generation_channel import GenerationChannel, GenerationJob, CancelOnEvent, generation_scheduler
+from story_export import StoryExport, parse_range
+from story_import import iter_manuscript_sections, IMPORT_EXTENSIONS, IMPORT_MAX_BYTES
+
+log = logging.getLogger(__name__)
+
+from app_logging import configure_logging, shutdown_logging, logging_stats, fields
+configure_logging()
+from tracing import TracingMiddleware, configure_tracing, shutdown_tracing, tracing_stats, span, traced, bind
+configure_tracing()
+
+@traced('prompt.build')
 def build_qwen_prompt(content: str, tone: str, genre: str = None) -> str:
     """
     Build optimized prompt for Qwen 2.5 model
@@ -120,31 +114,6 @@ Continue the story naturally from where it left off. Write in the same style and
     return prompt
 
 
-def truncate_context(content: str, max_tokens: int = 1000) -> str:
-    """
-    Truncate content to fit context window while preserving story coherence
-    Keeps the most recent context
-    """
-    # Simple word-based truncation (approximate)
-    # Qwen tokenizer roughly: 1 token ≈ 0.75 words
-    max_words = int(max_tokens * 0.75)
-    
-    words = content.split()
-    if len(words) <= max_words:
-        return content
-    
-    # Keep last N words (most recent context)
-    truncated_words = words[-max_words:]
-    truncated_text = ' '.join(truncated_words)
-    
-    # Try to start at a sentence boundary for better coherence
-    sentences = truncated_text.split('. ')
-    if len(sentences) > 1:
-        # Skip first partial sentence
-        return '. '.join(sentences[1:])
-    
-    return truncated_text
-
 # Model configuration
 MODEL_PATH = r"D:\Story\Model\Qwen2.5-1.5B-Instruct"
 MODEL_NAME = "Qwen/Qwen2.5-1.5B-Instruct"
@@ -159,17 +128,23 @@ async def lifespan(app: FastAPI):
     
     # Initialize Firebase
     initialize_firebase()
+    if AUTH_KEY_REFRESH:
+        signing_key_refresher.start()
+    
+    # Start cascade deletion of stories and resume any interrupted deletions
+    story_reaper.start()
+    story_reaper.sweep_pending()
     
     try:
-        print(f"Loading model from {MODEL_PATH}...")
+        log.info("Loading model from %s...", MODEL_PATH)
         
         # Check for GPU
         device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"Using device: {device}")
+        log.info("Using device: %s", device)
         
         if torch.cuda.is_available():
-            print(f"GPU: {torch.cuda.get_device_name(0)}")
-            print(f"GPU Memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB")
+            log.info("GPU: %s", torch.cuda.get_device_name(0))
+            log.info("GPU Memory: %.2f GB", torch.cuda.get_device_properties(0).total_memory / 1024**3)
         
         tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH, trust_remote_code=True)
         
@@ -193,22 +168,30 @@ async def lifespan(app: FastAPI):
             tokenizer.pad_token = tokenizer.eos_token
         
         model.eval()
-        print(f"Model loaded successfully on {device}")
+        log.info("Model loaded successfully on %s", device)
         
         # Attach to app state
         app.state.model = model
         app.state.tokenizer = tokenizer
         
     except Exception as e:
-        print(f"Error loading model: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error loading model: %s", e)
         raise
     
     yield
     
     # Shutdown
-    print("Shutting down...")
+    log.info("Shutting down...")
+    flushed = await autosave_buffer.flush_all()
+    if flushed:
+        log.info("💾 Flushed %s pending autosave(s)", flushed)
+    folded = revision_history.flush_all()
+    if folded:
+        log.info("💾 Wrote %s folded revision(s)", folded)
+    story_reaper.stop()
+    signing_key_refresher.stop()
+    shutdown_tracing()
+    shutdown_logging()
 
 app = FastAPI(title="Fiction Story Generator API", lifespan=lifespan)
 
@@ -219,7 +202,7 @@ allowed_origins_str = os.getenv(
 )
 allowed_origins = [origin.strip() for origin in allowed_origins_str.split(',')]
 
-print(f"🌐 CORS enabled for origins: {allowed_origins}")
+log.info("🌐 CORS enabled for origins: %s", allowed_origins)
 
 app.add_middleware(
     CORSMiddleware,
@@ -227,7 +210,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Generation-Id", "X-Trace-Id"],
 )
+# Root span of sampled requests (tracing.py); outermost, so it covers CORS handling too
+app.add_middleware(TracingMiddleware)
 
 class GenerateRequest(BaseModel):
     prompt: str
@@ -249,6 +235,7 @@ class GeneratedOption(BaseModel):
 class ChapterMetadata(BaseModel):
     wordCount: int = 0
     characterCount: int = 0
+    contentHash: Optional[str] = None
     createdAt: str
     updatedAt: str
 
@@ -287,6 +274,9 @@ class StoryResponse(BaseModel):
     settings: Dict[str, Any]
     status: str
 
+class CheckpointCreate(BaseModel):
+    label: Optional[str] = None
+
 class StoryListResponse(BaseModel):
     id: str
     userId: str
@@ -296,6 +286,15 @@ class StoryListResponse(BaseModel):
     settings: Dict[str, Any]
     status: str
 
+class UserStatsResponse(BaseModel):
+    storyCount: int
+    wordCount: int
+    characterCount: int
+    chapterCount: int
+    byStatus: Dict[str, int]
+    byGenre: Dict[str, int]
+    updatedAt: Optional[str] = None
+
 # Bible Item Models
 class BibleItemCreate(BaseModel):
     name: str
@@ -335,14 +334,61 @@ async def health_check():
         "status": "healthy",
         "model": "Qwen/Qwen2.5-1.5B-Instruct",
         "model_loaded": model is not None,
-        "device": "cuda" if torch.cuda.is_available() else "cpu"
+        "device": "cuda" if torch.cuda.is_available() else "cpu",
+        "autosave": autosave_buffer.stats(),
+        "reaper": story_reaper.progress(),
+        "storyCache": story_cache.stats(),
+        "authCache": token_cache.stats(),
+        "streaming": framing_stats(),
+        "generationSlots": generation_scheduler.stats(),
+        "resumableGenerations": resumable_generations.stats(),
+        "logging": logging_stats(),
+        "tracing": tracing_stats()
     }
 
+# Capacity, read at scrape time
+metrics.gauge('generation_slots', 'Model slots for WebSocket streams',
+              callback=lambda: generation_scheduler.stats()['slots'])
+metrics.gauge('generation_slots_in_use', 'WebSocket streams holding a model slot',
+              callback=lambda: generation_scheduler.stats()['running'])
+metrics.gauge('generation_queue_depth', 'WebSocket streams waiting for a model slot',
+              callback=lambda: generation_scheduler.stats()['waiting'])
+metrics.gauge('resumable_generations', 'Registered SSE generations by state', ('state',),
+              callback=lambda: {
+                  ('running',): resumable_generations.stats()['running'],
+                  ('unattended',): resumable_generations.stats()['unattended'],
+              })
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+
+@app.get("/metrics")
+async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    """
+    Prometheus metrics (metrics.py, generation_metrics.py)
+    
+    Requires `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is set.
+    """
+    if METRICS_TOKEN and not secrets.compare_digest(authorization or '', f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/user/me")
 async def get_user_info(current_user: dict = Depends(get_current_user)):
     """Get current authenticated user information"""
     return current_user
 
+@app.get("/user/me/stats", response_model=UserStatsResponse)
+async def get_user_library_stats(
+    refresh: bool = Query(False),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Library totals for the dashboard, read from the user's stats document
+    (kept up to date by every story save). refresh=true recomputes them.
+    """
+    return await get_user_stats(current_user['uid'], refresh=refresh)
+
 @app.post("/generate", response_model=List[GeneratedOption])
 async def generate_continuation(
     request: Request,
@@ -353,7 +399,7 @@ async def generate_continuation(
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
-        print(f"\n🎬 User {current_user['email']} generating {request_body.count} continuation(s) with {request_body.tone} tone, {request_body.length} length")
+        log.info("🎬 User %s generating %s continuation(s) with %s tone, %s length", current_user['email'], request_body.count, request_body.tone, request_body.length)
         
         # Adjust max_length based on length parameter (optimized for speed)
         length_map = {
@@ -368,7 +414,7 @@ async def generate_continuation(
         # Cap at 2000 tokens to avoid memory issues
         max_new_tokens = min(max_new_tokens, 2000)
         
-        print(f"  Using max_new_tokens: {max_new_tokens}")
+        log.debug("Using max_new_tokens: %s", max_new_tokens)
         
         # Adjust temperature based on tone
         tone_temp_map = {
@@ -384,14 +430,15 @@ async def generate_continuation(
         temperature = tone_temp_map.get(request_body.tone, 0.68)
         
         results = []
+        labels = generation_labels('generate', request_body.tone, request_body.length)
         
         for i in range(request_body.count):
             # Check for client disconnect before starting next generation
             if await request.is_disconnected():
-                print("⚠️ Client disconnected between generations. Stopping.")
+                log.warning("⚠️ Client disconnected between generations. Stopping.")
                 break
 
-            print(f"  Generating option {i+1}/{request_body.count}...")
+            log.debug("Generating option %s/%s...", i+1, request_body.count)
             
             tone_keywords = {
                 "Dark": "dark and atmospheric",
@@ -418,13 +465,14 @@ Rules:
                 {"role": "user", "content": f"Continue this story with a complete, coherent passage:\n\n{request_body.prompt[-2000:]}"}
             ]
             
-            text = tokenizer.apply_chat_template(
-                messages,
-                tokenize=False,
-                add_generation_prompt=True
-            )
+            with span('prompt.build'):
+                text = tokenizer.apply_chat_template(
+                    messages,
+                    tokenize=False,
+                    add_generation_prompt=True
+                )
             
-            inputs = tokenizer(text, return_tensors="pt").to(device)
+            inputs = encode_prompt(tokenizer, text, device)
             
             # Use Streamer to allow for cancellation
             streamer = TextIteratorStreamer(
@@ -447,9 +495,17 @@ Rules:
                 use_cache=True,
                 streamer=streamer  # Add streamer
             )
+            # Stop decoding when the client goes away; the probe times the run (generation_metrics.py)
+            cancel = threading.Event()
+            probe = GenerationProbe(labels, inputs.input_ids.shape[-1], cancel)
+            generation_kwargs['stopping_criteria'] = StoppingCriteriaList(
+                [CancelOnEvent(cancel)]
+                + degeneration_criteria(labels, max_new_tokens, tokenizer.eos_token_id)
+                + [probe]
+            )
 
-            # Run generation in a separate thread
-            thread = Thread(target=model.generate, kwargs=generation_kwargs)
+            # Run generation in a separate thread (bound to this request's trace)
+            thread = Thread(target=bind(probe.run), args=(model.generate,), kwargs=generation_kwargs)
             thread.start()
             
             generated_text = ""
@@ -459,7 +515,8 @@ Rules:
             for new_text in streamer:
                 # Check for disconnection
                 if await request.is_disconnected():
-                    print(f"🛑 Client disconnected during generation of option {i+1}. Aborting...")
+                    log.info("🛑 Client disconnected during generation of option %s. Aborting...", i+1)
+                    cancel.set()
                     is_aborted = True
                     break 
                 
@@ -474,7 +531,7 @@ Rules:
             continuation = generated_text.strip()
             continuation = clean_and_complete_text(continuation)
             
-            print(f"  ✓ Generated {len(continuation)} characters")
+            log.debug("✓ Generated %s characters", len(continuation))
             
             results.append({
                 "id": f"gen-{i}-{hash(continuation) % 10000}",
@@ -484,94 +541,94 @@ Rules:
             })
         
         if not results and await request.is_disconnected():
-             print("❌ Request completely aborted.")
+             log.info("🛑 Request completely aborted.")
              # Raise exception or just return empty list? 
              # FastAPI might have already noticed the disconnect and won't send response.
              return []
 
-        print(f"✅ Successfully generated {len(results)} continuation(s)\n")
+        log.info("✅ Successfully generated %s continuation(s)", len(results),
+                 extra=fields(userId=current_user['uid'], tone=request_body.tone, length=request_body.length))
         return results
     
     except Exception as e:
-        print(f"❌ Generation error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ Generation error: %s", e)
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
 
 
+def encode_prompt(tokenizer, text: str, device) -> Any:
+    """Tokenize a prompt onto the model's device (the 'tokenize' span of a trace)"""
+    with span('tokenize') as current:
+        inputs = tokenizer(text, return_tensors="pt").to(device)
+        current.set(promptTokens=inputs.input_ids.shape[-1])
+    return inputs
+
+
 # Streaming Text Generation
-async def generate_text_stream(
-    prompt: str,
-    tone: str,
-    length: str,
-    max_length: int,
-    temperature: float,
-    top_p: float,
-    model,
-    tokenizer
-) -> AsyncGenerator[str, None]:
-    """Generate text and yield chunks in real-time via Server-Sent Events"""
-    try:
-        # Prepare the full prompt using the optimized Qwen template
-        full_prompt = build_qwen_prompt(prompt, tone)
-        
-        # Tokenize input
-        inputs = tokenizer(full_prompt, return_tensors="pt").to(model.device)
-        
-        # Create text streamer
-        streamer = TextIteratorStreamer(
-            tokenizer,
-            skip_prompt=True,
-            skip_special_tokens=True
-        )
-        
-        # Prepare generation kwargs
-        generation_kwargs = {
-            "input_ids": inputs.input_ids,
-            "attention_mask": inputs.attention_mask,
-            "max_new_tokens": max_length,
-            "temperature": temperature,
-            "top_p": top_p,
-            "do_sample": True,
-            "pad_token_id": tokenizer.pad_token_id or tokenizer.eos_token_id,
-            "eos_token_id": tokenizer.eos_token_id,
-            "repetition_penalty": 1.12,
-            "use_cache": True,
-            "streamer": streamer
-        }
-        
-        # Start generation in background thread
-        thread = Thread(target=model.generate, kwargs=generation_kwargs)
-        thread.start()
-        
-        # Send start event
-        yield f"data: {json.dumps({'type': 'start'})}\n\n"
-        
-        # Yield chunks as they're generated
-        full_text = ""
-        for text_chunk in streamer:
-            full_text += text_chunk
-            yield f"data: {json.dumps({'type': 'chunk', 'text': text_chunk})}\n\n"
-            await asyncio.sleep(0)  # Allow other tasks to run
-        
-        # Clean up the generated text
-        cleaned_text = clean_and_complete_text(full_text)
-        
-        # Calculate quality score
-        from quality_control import calculate_quality_score
-        quality_scores = calculate_quality_score(cleaned_text, prompt)
-        
-        # Send completion event with final cleaned text and quality metrics
-        completion_data = {
-            'type': 'done',
-            'fullText': cleaned_text,
-            'quality': quality_scores
-        }
-        yield f"data: {json.dumps(completion_data)}\n\n"
-        
-    except Exception as e:
-        print(f"❌ Streaming error: {e}")
-        yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+def start_generation(model, tokenizer, run: Dict[str, Any], cancel: Optional[threading.Event] = None) -> TextIteratorStreamer:
+    """
+    Start model.generate on a background thread and return its text streamer
+    
+    Args:
+        run: 'prompt' (full chat-template text), 'max_new_tokens', 'temperature',
+            'top_p' and optionally 'repetition_penalty' and metric 'labels'
+            (generation_labels(); defaults to the SSE endpoint)
+        cancel: Stops decoding at the next token once set
+    """
+    inputs = encode_prompt(tokenizer, run['prompt'], model.device)
+    streamer = TextIteratorStreamer(
+        tokenizer,
+        skip_prompt=True,
+        skip_special_tokens=True
+    )
+    generation_kwargs = {
+        "input_ids": inputs.input_ids,
+        "attention_mask": inputs.attention_mask,
+        "max_new_tokens": run['max_new_tokens'],
+        "temperature": run['temperature'],
+        "top_p": run['top_p'],
+        "do_sample": True,
+        "pad_token_id": tokenizer.pad_token_id or tokenizer.eos_token_id,
+        "eos_token_id": tokenizer.eos_token_id,
+        "repetition_penalty": run.get('repetition_penalty', 1.12),
+        "use_cache": True,
+        "streamer": streamer
+    }
+    labels = run.get('labels') or generation_labels('stream')
+    probe = GenerationProbe(labels, inputs.input_ids.shape[-1], cancel)
+    criteria = [CancelOnEvent(cancel)] if cancel is not None else []
+    # Loops end early instead of decoding to max_new_tokens (degeneration.py)
+    criteria += degeneration_criteria(labels, run['max_new_tokens'], tokenizer.eos_token_id)
+    generation_kwargs["stopping_criteria"] = StoppingCriteriaList(criteria + [probe])
+    
+    thread = Thread(target=bind(probe.run), args=(model.generate,), kwargs=generation_kwargs)
+    thread.start()
+    return streamer
+
+
+def stream_target_length(request: "GenerateRequest") -> int:
+    """max_new_tokens for a streamed continuation"""
+    length_map = {
+        "Short": 150,
+        "Medium": 300,
+        "Long": 600
+    }
+    # Use request.max_length if provided and valid, otherwise use logic based on length enum
+    return request.max_length if request.max_length > 50 else length_map.get(request.length, 300)
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Disable nginx buffering
+    "Connection": "keep-alive"
+}
+
+
+async def generation_events(generation: ResumableGeneration, position: int = 0) -> AsyncGenerator[bytes, None]:
+    """A resumable generation as Server-Sent Events, from `position` on"""
+    # Send start event
+    yield sse_event({'type': 'start', 'generationId': generation.id, 'offset': position})
+    async for event in generation.events(position):
+        yield event
 
 
 @app.post("/generate/stream")
@@ -581,53 +638,126 @@ async def generate_stream(request: GenerateRequest):
     
     This endpoint provides a better user experience by showing text as it's generated
     instead of waiting for the entire generation to complete.
+    
+    The generation is resumable (generation_buffer.py): its id is sent in the
+    X-Generation-Id header and the start event, and each chunk's event id is
+    its stream offset, so a dropped client can continue with
+    GET /generate/stream/{id} instead of regenerating.
     """
     try:
-        print(f"\n🌊 Starting streaming generation...")
-        print(f"  Prompt length: {len(request.prompt)} chars")
-        print(f"  Tone: {request.tone}, Length: {request.length}")
-        print(f"  Tone: {request.tone}, Length: {request.length}")
+        log.info("🌊 Starting streaming generation...")
+        log.debug("Prompt length: %s chars", len(request.prompt))
+        log.debug("Tone: %s, Length: %s", request.tone, request.length)
         
         # Adjust max_length based on length parameter
-        length_map = {
-            "Short": 150,
-            "Medium": 300,
-            "Long": 600
+        target_length = stream_target_length(request)
+        
+        log.debug("Target tokens: %s", target_length)
+        
+        # Prepare the full prompt using the optimized Qwen template
+        run = {
+            'prompt': build_qwen_prompt(request.prompt, request.tone),
+            'max_new_tokens': target_length,
+            'temperature': request.temperature,
+            'top_p': request.top_p,
+            'labels': generation_labels('stream', request.tone, request.length)
         }
-        # Use request.max_length if provided and valid, otherwise use logic based on length enum
-        target_length = request.max_length if request.max_length > 50 else length_map.get(request.length, 300)
+        # Set when the client cancels or doesn't come back, so the model stops decoding
+        cancel = threading.Event()
+        streamer = start_generation(app.state.model, app.state.tokenizer, run, cancel)
         
-        print(f"  Target tokens: {target_length}")
+        def finish(raw_text: str) -> Dict[str, Any]:
+            # Clean up the generated text and calculate quality score
+            from quality_control import calculate_quality_score
+            cleaned_text = clean_and_complete_text(raw_text)
+            quality = observe_quality(calculate_quality_score(cleaned_text, request.prompt), run['labels'])
+            return {'fullText': cleaned_text, 'quality': quality}
         
-        # Get model and tokenizer from app state
-        model = app.state.model
-        tokenizer = app.state.tokenizer
+        generation = resumable_generations.start(streamer, cancel, finish)
         
         return StreamingResponse(
-            generate_text_stream(
-                prompt=request.prompt,
-                tone=request.tone,
-                length=request.length,
-                max_length=target_length,
-                temperature=request.temperature,
-                top_p=request.top_p,
-                model=model,
-                tokenizer=tokenizer
-            ),
+            generation_events(generation),
             media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "X-Accel-Buffering": "no",  # Disable nginx buffering
-                "Connection": "keep-alive"
-            }
+            headers={**SSE_HEADERS, "X-Generation-Id": generation.id}
         )
     except Exception as e:
-        print(f"❌ Stream endpoint error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ Stream endpoint error: %s", e)
         raise HTTPException(status_code=500, detail=f"Streaming failed: {str(e)}")
 
 
+@app.get("/generate/stream/{generation_id}")
+async def resume_generate_stream(
+    generation_id: str,
+    offset: Optional[int] = Query(None, ge=0),
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Resume a streamed generation after a dropped connection
+    
+    Args:
+        generation_id: From X-Generation-Id / the start event
+        offset: Characters already received; defaults to the Last-Event-ID header
+    
+    Returns:
+        The missed text as one chunk event, then the live stream.
+        410 if the generation has expired or the offset is no longer buffered.
+    """
+    if offset is None:
+        try:
+            offset = int(last_event_id) if last_event_id else 0
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID must be a stream offset")
+    
+    try:
+        generation = resumable_generations.resume(generation_id, offset)
+    except ResumeUnavailable as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    
+    log.info("🔁 Resuming generation %s from offset %s", generation_id, offset)
+    return StreamingResponse(
+        generation_events(generation, offset),
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Generation-Id": generation.id}
+    )
+
+
+@app.delete("/generate/stream/{generation_id}")
+async def cancel_generate_stream(generation_id: str):
+    """Stop a streamed generation (the client gave up on it; it is not resumable afterwards)"""
+    if not resumable_generations.cancel(generation_id):
+        raise HTTPException(status_code=404, detail="Generation not found or expired")
+    return {"message": "Generation cancelled", "generationId": generation_id}
+
+
+VARIATION_LENGTHS = {"Short": 100, "Medium": 200, "Long": 400}
+
+
+def variation_temperature(base: float, index: int) -> float:
+    """Each variation samples a little hotter than the last, capped at 1.0"""
+    return min(base + index * 0.15, 1.0)
+
+
+def build_variations(raw_texts: List[str], temperatures: List[float], prompt: str, labels: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    Clean and score generated variations in one batch, best first
+    (scores are recorded under the metric labels)
+    """
+    from quality_control import score_batch
+    cleaned = [clean_and_complete_text(text.strip()) for text in raw_texts]
+    variations = [
+        {
+            "id": f"var-{index}",
+            "text": text,
+            "temperature": temperature,
+            "quality": observe_quality(quality, labels),
+            "wordCount": len(text.split())
+        }
+        for index, (text, temperature, quality) in enumerate(zip(cleaned, temperatures, score_batch(cleaned, prompt)))
+    ]
+    variations.sort(key=lambda x: x['quality']['overall'], reverse=True)
+    return variations
+
+
 @app.post("/generate/variations")
 async def generate_variations(request: GenerateRequest):
     """
@@ -637,29 +767,29 @@ async def generate_variations(request: GenerateRequest):
     try:
         variations_count = min(request.count, 3)  # Max 3 variations
         
-        print(f"\n🎲 Generating {variations_count} variations...")
-        print(f"  Prompt length: {len(request.prompt)} chars")
-        print(f"  Tone: {request.tone}, Length: {request.length}")
+        log.info("🎲 Generating %s variations...", variations_count)
+        log.debug("Prompt length: %s chars", len(request.prompt))
+        log.debug("Tone: %s, Length: %s", request.tone, request.length)
         
         # Adjust max_length
-        length_map = {"Short": 100, "Medium": 200, "Long": 400}
-        max_new_tokens = length_map.get(request.length, 200)
+        max_new_tokens = VARIATION_LENGTHS.get(request.length, 200)
         
         # Use optimized prompt
         full_prompt = build_qwen_prompt(request.prompt, request.tone)
-        inputs = tokenizer(full_prompt, return_tensors="pt").to(device)
+        inputs = encode_prompt(tokenizer, full_prompt, device)
+        labels = generation_labels('variations', request.tone, request.length)
         
-        variations = []
-        from quality_control import calculate_quality_score
+        texts = []
+        temperatures = []
         
         for i in range(variations_count):
-            print(f"  Generating variation {i+1}/{variations_count}...")
+            log.debug("Generating variation %s/%s...", i+1, variations_count)
             
             # Vary temperature for diversity
-            temp = request.temperature + (i * 0.15)
-            temp = min(temp, 1.0)  # Cap at 1.0
+            temp = variation_temperature(request.temperature, i)
             
-            with torch.no_grad():
+            probe = GenerationProbe(labels, inputs.input_ids.shape[-1])
+            with torch.no_grad(), probe:
                 outputs = model.generate(
                     inputs.input_ids,
                     attention_mask=inputs.attention_mask,
@@ -671,35 +801,101 @@ async def generate_variations(request: GenerateRequest):
                     eos_token_id=tokenizer.eos_token_id,
                     repetition_penalty=1.12,
                     use_cache=True,
+                    stopping_criteria=StoppingCriteriaList(
+                        degeneration_criteria(labels, max_new_tokens, tokenizer.eos_token_id) + [probe]
+                    ),
                 )
             
             generated_ids = outputs[0][inputs.input_ids.shape[1]:]
-            text = tokenizer.decode(generated_ids, skip_special_tokens=True).strip()
-            cleaned = clean_and_complete_text(text)
-            
-            # Calculate quality
-            quality_scores = calculate_quality_score(cleaned, request.prompt)
-            
-            variations.append({
-                "id": f"var-{i}",
-                "text": cleaned,
-                "temperature": temp,
-                "quality": quality_scores,
-                "wordCount": len(cleaned.split())
-            })
+            text = tokenizer.decode(generated_ids, skip_special_tokens=True)
+            texts.append(text)
+            temperatures.append(temp)
         
-        # Sort by quality (best first)
-        variations.sort(key=lambda x: x['quality']['overall'], reverse=True)
+        # Scored together, sorted by quality (best first)
+        variations = build_variations(texts, temperatures, request.prompt, labels)
         
-        print(f"✅ Generated {len(variations)} variations")
-        print(f"   Quality scores: {[round(v['quality']['overall'], 2) for v in variations]}")
+        log.info("✅ Generated %s variations", len(variations),
+                 extra=fields(tone=request.tone, length=request.length,
+                              scores=[round(v['quality']['overall'], 2) for v in variations]))
         
         return {"variations": variations}
         
     except Exception as e:
-        print(f"❌ Variation generation error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ Variation generation error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class BestOfRequest(GenerateRequest):
+    candidates: int = 6
+
+
+async def cancel_on_disconnect(http_request: Request, cancel: threading.Event, interval: float = 0.25) -> None:
+    """Set `cancel` once the client goes away (run as a task alongside a blocking generation)"""
+    while not cancel.is_set():
+        if await http_request.is_disconnected():
+            cancel.set()
+            return
+        await asyncio.sleep(interval)
+
+
+@app.post("/generate/best-of")
+async def generate_best_of(request: BestOfRequest, http_request: Request):
+    """
+    Quality-guided variations: samples `candidates` continuations as one batch,
+    prunes those whose partial text scores clearly worse (best_of.py) and
+    returns the best `count` (max 3) with the search's compute statistics
+
+    The batch takes a model slot from generation_scheduler (it can be several
+    sequences wide) and stops decoding if the client disconnects.
+    """
+    if model is None or tokenizer is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    try:
+        candidates = max(1, min(request.candidates, BEST_OF_MAX_CANDIDATES))
+        keep = max(1, min(request.count, 3, candidates))
+        max_new_tokens = VARIATION_LENGTHS.get(request.length, 200)
+        # The variations' temperature ladder, cycled over the candidates
+        temperatures = [variation_temperature(request.temperature, i % 3) for i in range(candidates)]
+
+        log.info("🎲 Best-of-%s for %s variations...", candidates, keep)
+        inputs = encode_prompt(tokenizer, build_qwen_prompt(request.prompt, request.tone), device)
+        labels = generation_labels('best_of', request.tone, request.length)
+        probe = GenerationProbe(labels, inputs.input_ids.shape[-1])
+
+        ticket = generation_scheduler.ticket()
+
+        def search():
+            with probe:
+                return best_of_generate(
+                    model, tokenizer, inputs.input_ids, temperatures, max_new_tokens, keep,
+                    top_p=request.top_p, endpoint=labels['endpoint'], probe=probe, cancel=ticket.cancel
+                )
+
+        await generation_scheduler.acquire(ticket)
+        watcher = asyncio.create_task(cancel_on_disconnect(http_request, ticket.cancel))
+        try:
+            best, stats = await asyncio.to_thread(search)
+        finally:
+            watcher.cancel()
+            generation_scheduler.release()
+
+        if stats['cancelled']:
+            log.info("🛑 Client disconnected during best-of generation. Aborted.")
+            return {"variations": [], "search": stats}
+        variations = build_variations(
+            [tokenizer.decode(candidate.tokens, skip_special_tokens=True) for candidate in best],
+            [candidate.temperature for candidate in best], request.prompt, labels
+        )
+
+        log.info("✅ Generated %s variations from %s candidates", len(variations), candidates,
+                 extra=fields(tone=request.tone, length=request.length, pruned=stats['pruned'],
+                              tokens_saved=stats['tokensSaved'],
+                              scores=[round(v['quality']['overall'], 2) for v in variations]))
+
+        return {"variations": variations, "search": stats}
+
+    except Exception as e:
+        log.exception("❌ Best-of generation error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 class RewriteRequest(BaseModel):
@@ -708,6 +904,26 @@ class RewriteRequest(BaseModel):
     context: Optional[str] = None
     tone: Optional[str] = None
 
+@traced('prompt.build')
+def build_rewrite_prompt(request: RewriteRequest) -> str:
+    """Chat-template prompt for a rewrite"""
+    system_msg = "You are an expert editor and creative writer. Rewrite the provided text according to the user's instruction. Maintain the original meaning and context unless asked to change it."
+    
+    user_content = f"Instruction: {request.instruction}\n\nOriginal Text:\n{request.text}"
+    if request.context:
+        user_content += f"\n\nContext:\n{request.context}"
+        
+    messages = [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": user_content}
+    ]
+    
+    return tokenizer.apply_chat_template(
+        messages,
+        tokenize=False,
+        add_generation_prompt=True
+    )
+
 @app.post("/rewrite")
 async def rewrite_text(request: RewriteRequest):
     """
@@ -718,31 +934,18 @@ async def rewrite_text(request: RewriteRequest):
         raise HTTPException(status_code=503, detail="Model not loaded")
         
     try:
-        print(f"\n✍️ Rewriting text...")
-        print(f"  Instruction: {request.instruction}")
-        print(f"  Text length: {len(request.text)} chars")
+        log.info("✍️ Rewriting text...")
+        log.debug("Instruction: %s", request.instruction)
+        log.debug("Text length: %s chars", len(request.text))
         
         # Build prompt for rewriting
-        system_msg = "You are an expert editor and creative writer. Rewrite the provided text according to the user's instruction. Maintain the original meaning and context unless asked to change it."
-        
-        user_content = f"Instruction: {request.instruction}\n\nOriginal Text:\n{request.text}"
-        if request.context:
-            user_content += f"\n\nContext:\n{request.context}"
-            
-        messages = [
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": user_content}
-        ]
-        
-        text = tokenizer.apply_chat_template(
-            messages,
-            tokenize=False,
-            add_generation_prompt=True
-        )
+        text = build_rewrite_prompt(request)
         
-        inputs = tokenizer(text, return_tensors="pt").to(device)
+        inputs = encode_prompt(tokenizer, text, device)
+        labels = generation_labels('rewrite', request.tone)
+        probe = GenerationProbe(labels, inputs.input_ids.shape[-1])
         
-        with torch.no_grad():
+        with torch.no_grad(), probe:
             outputs = model.generate(
                 inputs.input_ids,
                 attention_mask=inputs.attention_mask,
@@ -752,52 +955,144 @@ async def rewrite_text(request: RewriteRequest):
                 do_sample=True,
                 pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
                 eos_token_id=tokenizer.eos_token_id,
-                repetition_penalty=1.1
+                repetition_penalty=1.1,
+                stopping_criteria=StoppingCriteriaList(
+                    degeneration_criteria(labels, 400, tokenizer.eos_token_id) + [probe]
+                )
             )
             
         generated_ids = outputs[0][inputs.input_ids.shape[1]:]
         rewritten_text = tokenizer.decode(generated_ids, skip_special_tokens=True).strip()
         rewritten_text = clean_and_complete_text(rewritten_text)
         
-        print(f"✅ Rewrite complete ({len(rewritten_text)} chars)")
+        log.info("✅ Rewrite complete (%s chars)", len(rewritten_text), extra=fields(inputChars=len(request.text)))
         
         return {"rewritten": rewritten_text}
         
     except Exception as e:
-        print(f"❌ Rewrite error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ Rewrite error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# WebSocket generation channel (generation_channel.py)
+
+def _run_generation(run: Dict[str, Any], cancel: threading.Event) -> TextIteratorStreamer:
+    if model is None or tokenizer is None:
+        raise RuntimeError("Model not loaded")
+    return start_generation(model, tokenizer, run, cancel)
+
+
+def continuation_job(params: Dict[str, Any], user: dict) -> GenerationJob:
+    """A streamed continuation, same as POST /generate/stream"""
+    request = GenerateRequest(**params)
+    run = {
+        'prompt': build_qwen_prompt(request.prompt, request.tone),
+        'max_new_tokens': stream_target_length(request),
+        'temperature': request.temperature,
+        'top_p': request.top_p,
+        'labels': generation_labels('ws_continue', request.tone, request.length)
+    }
+    
+    def finish(texts: List[str]) -> Dict[str, Any]:
+        from quality_control import calculate_quality_score
+        cleaned_text = clean_and_complete_text(texts[0])
+        quality = observe_quality(calculate_quality_score(cleaned_text, request.prompt), run['labels'])
+        return {'fullText': cleaned_text, 'quality': quality}
+    
+    return GenerationJob([run], _run_generation, finish)
+
+
+def variations_job(params: Dict[str, Any], user: dict) -> GenerationJob:
+    """Up to 3 variations streamed one after another, same as POST /generate/variations"""
+    request = GenerateRequest(**params)
+    prompt = build_qwen_prompt(request.prompt, request.tone)
+    labels = generation_labels('ws_variations', request.tone, request.length)
+    runs = [
+        {
+            'prompt': prompt,
+            'max_new_tokens': VARIATION_LENGTHS.get(request.length, 200),
+            'temperature': variation_temperature(request.temperature, i),
+            'top_p': request.top_p,
+            'labels': labels
+        }
+        for i in range(min(request.count, 3))
+    ]
+    
+    def finish(texts: List[str]) -> Dict[str, Any]:
+        temperatures = [run['temperature'] for run in runs]
+        return {'variations': build_variations(texts, temperatures, request.prompt, labels)}
+    
+    return GenerationJob(runs, _run_generation, finish)
+
+
+def rewrite_job(params: Dict[str, Any], user: dict) -> GenerationJob:
+    """A streamed rewrite, same as POST /rewrite"""
+    if tokenizer is None:
+        raise ValueError("Model not loaded")
+    request = RewriteRequest(**params)
+    run = {
+        'prompt': build_rewrite_prompt(request),
+        'max_new_tokens': 400,
+        'temperature': 0.7,
+        'top_p': 0.9,
+        'repetition_penalty': 1.1,
+        'labels': generation_labels('ws_rewrite', request.tone)
+    }
+    
+    def finish(texts: List[str]) -> Dict[str, Any]:
+        return {'rewritten': clean_and_complete_text(texts[0].strip())}
+    
+    return GenerationJob([run], _run_generation, finish)
+
+
+GENERATION_JOBS = {
+    'continue': continuation_job,
+    'variations': variations_job,
+    'rewrite': rewrite_job,
+}
+
+
+@app.websocket("/generate/ws")
+async def generation_socket(websocket: WebSocket):
+    """
+    Multiplexed generation streams over one authenticated WebSocket
+    (continuations, variations and rewrites, with per-stream cancel and priority)
+    """
+    await GenerationChannel(websocket, authenticate_token, GENERATION_JOBS, allowed_origins).serve()
+
+
 # Story Management Endpoints
 
 @app.post("/stories", response_model=StoryResponse)
 async def create_or_update_story(
+    request: Request,
     story_data: StoryCreate,
     story_id: Optional[str] = None,
+    autosave: bool = Query(False),
+    if_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Create a new story or update existing one
     If story_id is provided in query params, updates that story
     Otherwise creates a new story
+    Updates flagged with autosave=true are coalesced by the write-behind buffer
+    when AUTOSAVE_COALESCE_SECONDS is set
+    Updates with an If-Match header are written straight through and fail with
+    412 if the story changed since that ETag was served
+    The saved story is returned through json_response (no response_model re-validation)
     """
     try:
         user_id = current_user['uid']
-        print(f"DEBUG: Saving story for user {user_id}. Data: {story_data}")
+        log.debug("Saving story for user %s: '%s', %s chapters", user_id, story_data.title, len(story_data.chapters or []))
         
         # Convert chapters from Pydantic models to dicts
         chapters_data = None
         if story_data.chapters:
-            chapters_data = [ch.dict() if hasattr(ch, 'dict') else ch for ch in story_data.chapters]
+            chapters_data = [ch.model_dump() for ch in story_data.chapters]
         
         if story_id:
-            # Update existing story
-            print(f"📝 Updating story {story_id} for user {current_user['email']} (UID: {user_id})")
-            updated_story = await update_story(
-                story_id=story_id,
-                user_id=user_id,
+            update_fields = dict(
                 title=story_data.title,
                 genre=story_data.genre,
                 content=story_data.content,
@@ -805,10 +1100,35 @@ async def create_or_update_story(
                 settings=story_data.settings,
                 status=story_data.status
             )
-            return updated_story
+            
+            if if_match:
+                # Conditional save: write pending autosaves first, then check the precondition
+                await autosave_buffer.flush(story_id, user_id)
+            elif autosave_buffer.enabled:
+                if autosave:
+                    # Coalesce with other autosaves in the current window
+                    pending_story = await autosave_buffer.submit(story_id, user_id, **update_fields)
+                    return await json_response(request, story_payload(pending_story))
+                
+                # Explicit save: merge any pending autosave into this write
+                flushed_story = await autosave_buffer.flush(story_id, user_id, **update_fields)
+                if flushed_story is not None:
+                    return await json_response(request, story_payload(flushed_story))
+            
+            # Update existing story
+            log.debug("📝 Updating story %s for user %s (UID: %s)", story_id, current_user['email'], user_id)
+            updated_story = await update_story(
+                story_id=story_id,
+                user_id=user_id,
+                if_match=if_match,
+                **update_fields
+            )
+            return await json_response(
+                request, story_payload(updated_story), headers=etag_headers(current_story_etag(story_id))
+            )
         else:
             # Create new story
-            print(f"📖 Creating new story for user {current_user['email']} (UID: {user_id})")
+            log.info("📖 Creating new story for user %s (UID: %s)", current_user['email'], user_id)
             new_story = await create_story(
                 user_id=user_id,
                 title=story_data.title,
@@ -818,19 +1138,60 @@ async def create_or_update_story(
                 settings=story_data.settings,
                 status=story_data.status
             )
-            print(f"✅ Story created with ID: {new_story['id']}, userId: {new_story['userId']}")
-            return new_story
+            log.info("✅ Story created with ID: %s, userId: %s", new_story['id'], new_story['userId'])
+            return await json_response(
+                request, story_payload(new_story), headers=etag_headers(current_story_etag(new_story['id']))
+            )
     except HTTPException as he:
-        print(f"⚠ HTTP error in create_or_update_story: {he.detail}")
+        log.warning("⚠ HTTP error in create_or_update_story: %s", he.detail)
         raise he
     except Exception as e:
-        print(f"❌ CRITICAL Error in create_or_update_story: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ CRITICAL Error in create_or_update_story: %s", e)
         raise HTTPException(status_code=500, detail=f"Backend save failed: {str(e)}")
 
+@app.post("/stories/import", response_model=StoryListResponse)
+async def import_manuscript(
+    file: UploadFile = File(...),
+    title: Optional[str] = Form(None),
+    genre: str = Form("General"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Import a .txt, .md or .docx manuscript as a new story
+    The upload is parsed in a single streaming pass, split into chapters on
+    headings, and written to storage in batches
+    """
+    try:
+        user_id = current_user['uid']
+        filename = file.filename or ''
+        if not filename.lower().endswith(IMPORT_EXTENSIONS):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported file type. Upload one of: {', '.join(IMPORT_EXTENSIONS)}"
+            )
+        # Firestore caps a story at one 1 MiB document. Text uploads over the
+        # limit are rejected before parsing; .docx files (zipped, often with
+        # images) are checked against the extracted text before anything is written
+        max_bytes = import_max_bytes()
+        upload_limit = IMPORT_MAX_BYTES if filename.lower().endswith('.docx') else max_bytes
+        if file.size is not None and file.size > upload_limit:
+            raise HTTPException(status_code=413, detail=manuscript_too_large_detail(upload_limit))
+        
+        log.info("📥 Importing %s (%s bytes) for user %s", filename, file.size, current_user['email'])
+        story_title = (title or os.path.splitext(os.path.basename(filename))[0]).strip() or "Imported Story"
+        sections = iter_manuscript_sections(filename, file.file)
+        return await import_story(user_id=user_id, title=story_title, genre=genre, sections=sections)
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("❌ Error importing manuscript: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await file.close()
+
 @app.get("/stories", response_model=List[StoryListResponse])
 async def get_user_stories(
+    request: Request,
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
     status: Optional[str] = Query(None),
@@ -839,10 +1200,16 @@ async def get_user_stories(
     """
     Get all stories for the current user
     Returns list of stories without full content for performance
+    Answers 304 when If-None-Match names the current library ETag
     """
     try:
         user_id = current_user['uid']
-        print(f"📚 Fetching stories for user {current_user['email']} (UID: {user_id})")
+        log.debug("📚 Fetching stories for user %s (UID: %s)", current_user['email'], user_id)
+        
+        # Taken before listing, so a write racing the list can only make the ETag older than the body
+        etag = await get_library_etag(user_id)
+        if if_none_match(request, etag):
+            return not_modified(etag)
         
         stories = await list_user_stories(
             user_id=user_id,
@@ -851,55 +1218,230 @@ async def get_user_stories(
             status=status
         )
         
-        print(f"✅ Found {len(stories)} stories for UID: {user_id}")
+        log.debug("✅ Found %s stories for UID: %s", len(stories), user_id)
         if len(stories) > 0:
-            print(f"   First story userId: {stories[0].get('userId', 'MISSING')}")
-        return stories
+            log.debug("First story userId: %s", stories[0].get('userId', 'MISSING'))
+        return await json_response(
+            request, [story_list_payload(story) for story in stories], headers=etag_headers(etag)
+        )
     except Exception as e:
-        print(f"❌ Error fetching stories: {e}")
+        log.error("❌ Error fetching stories: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/stories/{story_id}", response_model=StoryResponse)
 async def get_story_by_id(
+    request: Request,
     story_id: str,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Get a single story by ID with full content
     User must own the story
+    Answers 304 when If-None-Match names the current story ETag
     """
     try:
         user_id = current_user['uid']
-        print(f"📖 Fetching story {story_id} for user {current_user['email']}")
+        log.debug("📖 Fetching story %s for user %s", story_id, current_user['email'])
         
-        story = await get_story(story_id=story_id, user_id=user_id)
-        return story
+        # Make sure a reload sees autosaves that are still buffered
+        await autosave_buffer.flush(story_id, user_id)
+        
+        story, etag = await get_story_with_etag(story_id=story_id, user_id=user_id)
+        if if_none_match(request, etag):
+            return not_modified(etag)
+        return await json_response(request, story_payload(story), headers=etag_headers(etag))
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error fetching story: {e}")
+        log.error("❌ Error fetching story: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/stories/{story_id}")
 async def delete_story_by_id(
     story_id: str,
+    if_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Delete a story by ID
     User must own the story
+    With If-Match, fails with 412 if the story changed since that ETag was served
     """
     try:
         user_id = current_user['uid']
-        print(f"🗑️  Deleting story {story_id} for user {current_user['email']}")
-        
-        result = await delete_story(story_id=story_id, user_id=user_id)
-        print(f"✅ Story deleted successfully")
+        log.info("🗑️  Deleting story %s for user %s", story_id, current_user['email'])
+        
+        if if_match:
+            await autosave_buffer.flush(story_id, user_id)
+        result = await delete_story(story_id=story_id, user_id=user_id, if_match=if_match)
+        await autosave_buffer.discard(story_id)
+        story_reaper.enqueue(story_id)
+        log.info("✅ Story deleted successfully")
         return result
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error deleting story: {e}")
+        log.error("❌ Error deleting story: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/stories/{story_id}/revisions")
+async def get_story_revisions(
+    story_id: str,
+    chapter_id: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    List a story's revision history, newest first
+    With chapter_id, only revisions that changed that chapter are returned
+    """
+    try:
+        user_id = current_user['uid']
+        await autosave_buffer.flush(story_id, user_id)
+        return await list_story_revisions(story_id, user_id, chapter_id=chapter_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("❌ Error listing revisions: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/stories/{story_id}/revisions")
+async def create_revision_checkpoint(
+    story_id: str,
+    checkpoint: CheckpointCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Save the story's current text as a named checkpoint
+    """
+    try:
+        user_id = current_user['uid']
+        await autosave_buffer.flush(story_id, user_id)
+        return await create_story_checkpoint(story_id, user_id, label=checkpoint.label)
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("❌ Error creating checkpoint: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/stories/{story_id}/revisions/{number}")
+async def get_story_revision_by_number(
+    story_id: str,
+    number: int,
+    chapter_id: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the story (or one chapter) as it was at a revision
+    """
+    try:
+        user_id = current_user['uid']
+        return await get_story_revision(story_id, number, user_id, chapter_id=chapter_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("❌ Error fetching revision: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/stories/{story_id}/revisions/{number}/restore", response_model=StoryResponse)
+async def restore_story_to_revision(
+    request: Request,
+    story_id: str,
+    number: int,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Restore a story's title and text to a revision
+    The restore becomes the newest revision, so it can be undone the same way
+    """
+    try:
+        user_id = current_user['uid']
+        log.info("⏪ Restoring story %s to revision %s for user %s", story_id, number, current_user['email'])
+        await autosave_buffer.flush(story_id, user_id)
+        story = await restore_story_revision(story_id, number, user_id)
+        return await json_response(request, story_payload(story))
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("❌ Error restoring revision: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/stories/{story_id}/export")
+async def export_story(
+    story_id: str,
+    request: Request,
+    format: str = Query("md", pattern="^(md|txt|epub)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Download a story as Markdown, plain text or EPUB
+    The file is generated chapter by chapter while streaming; Range / If-Range
+    requests are supported so interrupted downloads can resume
+    """
+    try:
+        user_id = current_user['uid']
+        await autosave_buffer.flush(story_id, user_id)
+        story = await get_story(story_id=story_id, user_id=user_id)
+        
+        export = StoryExport(story_id, story, format, author=current_user.get('name'))
+        # Sizing pass (renders one chapter at a time) off the event loop
+        await asyncio.to_thread(export.plan)
+        
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": export.etag,
+            "Content-Disposition": f'attachment; filename="{export.filename}"',
+        }
+        
+        byte_range = None
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range == export.etag:
+            try:
+                byte_range = parse_range(request.headers.get("range"), export.size)
+            except ValueError:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{export.size}"})
+        
+        if byte_range is None:
+            headers["Content-Length"] = str(export.size)
+            return StreamingResponse(export.iter_bytes(), media_type=export.media_type, headers=headers)
+        
+        start, end = byte_range
+        log.info("📦 Resuming %s export of story %s at byte %s", format, story_id, start)
+        headers["Content-Range"] = f"bytes {start}-{end}/{export.size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            export.iter_bytes(start, end),
+            status_code=206,
+            media_type=export.media_type,
+            headers=headers
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("❌ Error exporting story: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/search")
+async def search_library(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    story_id: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Search the current user's library
+    Matches story titles, chapter text and Story Bible items, ranked by relevance
+    """
+    try:
+        user_id = current_user['uid']
+        hits = await search_stories(user_id, q, limit=limit, story_id=story_id)
+        return {"query": q, "results": hits}
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("❌ Error searching stories: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -930,7 +1472,7 @@ async def generate_bible_items(story_content: str, existing_items: List[Dict] =
     if not story_content:
         return []
         
-    print(f"🧠 Analyzing story content ({len(story_content)} chars) for Bible items...")
+    log.info("🧠 Analyzing story content (%s chars) for Bible items...", len(story_content))
     
     # Existing items context to avoid duplicates (simplified)
     existing_names = [item.get('name', '').lower() for item in existing_items]
@@ -967,9 +1509,10 @@ Output ONLY valid JSON.
 """
     
     try:
-        inputs = tokenizer(prompt, return_tensors="pt").to(device)
+        inputs = encode_prompt(tokenizer, prompt, device)
+        probe = GenerationProbe(generation_labels('bible'), inputs.input_ids.shape[-1])
         
-        with torch.no_grad():
+        with torch.no_grad(), probe:
             outputs = model.generate(
                 inputs.input_ids,
                 attention_mask=inputs.attention_mask,
@@ -977,12 +1520,13 @@ Output ONLY valid JSON.
                 temperature=0.3, # Low temp for structured output
                 do_sample=True,
                 pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
-                eos_token_id=tokenizer.eos_token_id
+                eos_token_id=tokenizer.eos_token_id,
+                stopping_criteria=StoppingCriteriaList([probe])
             )
             
         generated_ids = outputs[0][inputs.input_ids.shape[1]:]
         text = tokenizer.decode(generated_ids, skip_special_tokens=True).strip()
-        print(f"DEBUG: Raw AI Bible response: {text}")
+        log.debug("Raw AI Bible response: %s", text)
         
         # Parse JSON
         data = extract_json_from_text(text)
@@ -1002,17 +1546,17 @@ Output ONLY valid JSON.
                             item['category'] = cat
                             valid_items.append(item)
             
-            print(f"✅ Extracted {len(valid_items)} new Bible items. AI marked {len(obsolete_names)} as obsolete.")
+            log.info("✅ Extracted %s new Bible items. AI marked %s as obsolete.", len(valid_items), len(obsolete_names))
             return {
                 "items": valid_items,
                 "obsolete": obsolete_names if isinstance(obsolete_names, list) else []
             }
             
-        print("⚠️ Failed to parse valid JSON from model output")
+        log.warning("⚠️ Failed to parse valid JSON from model output")
         return {"items": [], "obsolete": []}
         
     except Exception as e:
-        print(f"❌ Error generating bible items: {e}")
+        log.error("❌ Error generating bible items: %s", e)
         return {"items": [], "obsolete": []}
 
 
@@ -1049,39 +1593,53 @@ async def generate_bible_endpoint(
         # 3. Generate items (returning new and obsolete)
         analysis_result = await generate_bible_items(content, existing_items)
         new_items_data = analysis_result.get('items', [])
-        obsolete_ai_names = [n.lower() for n in analysis_result.get('obsolete', [])]
+        obsolete_ai_names = {normalize_item_name(n) for n in analysis_result.get('obsolete', []) if isinstance(n, str)}
         
-        saved_items = []
+        # Index existing items by normalized name for O(1) duplicate checks
+        existing_by_name: Dict[str, List[Dict]] = {}
+        for item in existing_items:
+            existing_by_name.setdefault(normalize_item_name(item.get('name', '')), []).append(item)
         
-        # 4. Handle Deletions (Pruning) if in sync mode
+        # 4. Collect Deletions (Pruning) if in sync mode
+        delete_ids = []
         if sync:
-            print(f"🗑️ Sync mode enabled. Pruning {len(obsolete_ai_names)} potential obsolete items...")
-            for existing in existing_items:
-                # ONLY delete if:
-                # 1. AI says it's obsolete
-                # 2. It was auto-generated (to protect manual edits)
-                if (existing['name'].lower() in obsolete_ai_names and 
-                    existing.get('autoGenerated', False)):
-                    
-                    print(f"   Deleting obsolete item: {existing['name']}")
-                    await delete_bible_item(story_id, existing['id'], user_id)
-
-        # 5. Save New Items
+            log.info("🗑️ Sync mode enabled. Pruning %s potential obsolete items...", len(obsolete_ai_names))
+            for name_key in obsolete_ai_names:
+                for existing in existing_by_name.get(name_key, []):
+                    # ONLY delete if:
+                    # 1. AI says it's obsolete
+                    # 2. It was auto-generated (to protect manual edits)
+                    if existing.get('autoGenerated', False):
+                        log.debug("Deleting obsolete item: %s", existing['name'])
+                        delete_ids.append(existing['id'])
+        
+        # 5. Collect New Items, skipping duplicate names (case/whitespace-insensitive)
+        items_to_add = []
         for item_data in new_items_data:
-            # Check for duplicate names (case-insensitive)
-            if not any(existing['name'].lower() == item_data['name'].lower() for existing in existing_items):
-                 # Tag as auto-generated
-                 item_data['autoGenerated'] = True
-                 saved = await add_bible_item(story_id, item_data, user_id)
-                 saved_items.append(saved)
-                 existing_items.append(saved) # Add to local list check
+            name_key = normalize_item_name(item_data['name'])
+            if name_key in existing_by_name:
+                continue
+            # Tag as auto-generated
+            item_data['autoGenerated'] = True
+            items_to_add.append(item_data)
+            existing_by_name[name_key] = [item_data]  # Dedupe within this batch too
+        
+        # 6. Apply all adds and deletes in batched writes
+        saved_items = []
+        if items_to_add or delete_ids:
+            saved_items = await bulk_update_bible_items(
+                story_id,
+                user_id,
+                add_items=items_to_add,
+                delete_item_ids=delete_ids
+            )
         
         return saved_items
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error in generate bible endpoint: {e}")
+        log.error("❌ Error in generate bible endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1089,69 +1647,89 @@ async def generate_bible_endpoint(
 
 @app.post("/stories/{story_id}/items", response_model=BibleItemResponse)
 async def create_bible_item_endpoint(
+    request: Request,
     story_id: str,
     item: BibleItemCreate,
+    if_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
     """Create a new bible item"""
     try:
         user_id = current_user['uid']
-        return await add_bible_item(story_id, item.dict(), user_id)
+        created = await add_bible_item(story_id, item.model_dump(), user_id, if_match=if_match)
+        etag = await get_bible_etag(story_id, user_id)
+        return await json_response(request, bible_item_payload(created), headers=etag_headers(etag))
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error creating bible item: {e}")
+        log.error("❌ Error creating bible item: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/stories/{story_id}/items", response_model=List[BibleItemResponse])
 async def list_bible_items_endpoint(
+    request: Request,
     story_id: str,
     category: Optional[str] = Query(None),
     current_user: dict = Depends(get_current_user)
 ):
-    """List bible items for a story"""
+    """
+    List bible items for a story
+    Answers 304 when If-None-Match names the current items ETag
+    """
     try:
         user_id = current_user['uid']
-        return await get_bible_items(story_id, user_id, category)
+        etag = await get_bible_etag(story_id, user_id)
+        if if_none_match(request, etag):
+            return not_modified(etag)
+        items = await get_bible_items(story_id, user_id, category)
+        return await json_response(request, [bible_item_payload(item) for item in items], headers=etag_headers(etag))
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error listing bible items: {e}")
+        log.error("❌ Error listing bible items: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/stories/{story_id}/items/{item_id}", response_model=BibleItemResponse)
 async def update_bible_item_endpoint(
+    request: Request,
     story_id: str,
     item_id: str,
     item: BibleItemUpdate,
+    if_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
     """Update a bible item"""
     try:
         user_id = current_user['uid']
         # Filter out None values
-        item_data = {k: v for k, v in item.dict().items() if v is not None}
-        return await update_bible_item(story_id, item_id, item_data, user_id)
+        item_data = {k: v for k, v in item.model_dump().items() if v is not None}
+        updated = await update_bible_item(story_id, item_id, item_data, user_id, if_match=if_match)
+        etag = await get_bible_etag(story_id, user_id)
+        return await json_response(request, bible_item_payload(updated), headers=etag_headers(etag))
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error updating bible item: {e}")
+        log.error("❌ Error updating bible item: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/stories/{story_id}/items/{item_id}")
 async def delete_bible_item_endpoint(
+    request: Request,
     story_id: str,
     item_id: str,
+    if_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
     """Delete a bible item"""
     try:
         user_id = current_user['uid']
-        return await delete_bible_item(story_id, item_id, user_id)
+        result = await delete_bible_item(story_id, item_id, user_id, if_match=if_match)
+        etag = await get_bible_etag(story_id, user_id)
+        return await json_response(request, result, headers=etag_headers(etag))
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error deleting bible item: {e}")
+        log.error("❌ Error deleting bible item: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
@@ -0,0 +1,305 @@
+"""
+Prometheus metrics.
+
+A small in-process registry of counters, gauges and histograms rendered in
+the Prometheus text exposition format by GET /metrics. Metric updates take
+one lock and a dict lookup, so they can be called from the event loop and
+from generation threads alike; all formatting happens at scrape time.
+
+    requests = metrics.counter('widgets_total', 'Widgets made', ('kind',))
+    requests.inc(kind='blue')
+
+Metric names are prefixed with METRICS_NAMESPACE. Labels must be low
+cardinality (endpoint, tone, operation - never user or story ids).
+
+Generation metrics are defined in generation_metrics.py; storage metrics
+below, recorded by the `timed_storage` decorator on firestore_service's API
+(which also opens a storage.<operation> span in traced requests).
+"""
+
+import asyncio
+import bisect
+import functools
+import inspect
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from tracing import span
+
+METRICS_NAMESPACE = os.getenv('METRICS_NAMESPACE', 'storynexis')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds, from sub-millisecond cache hits to multi-second model runs
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Payload sizes, 100 B to 10 MB
+SIZE_BUCKETS = (100, 1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 10_000_000)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Metric:
+    """
+    Base for labelled metrics
+
+    Args:
+        name: Full metric name
+        documentation: HELP text
+        labelnames: Label names every sample must set
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Gauge(Metric):
+    """
+    Current value, either set directly or read at scrape time
+
+    Args:
+        callback: Returns the value (no labels) or {label values tuple: value}
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Any]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> Iterable[str]:
+        if self.callback is not None:
+            try:
+                current = self.callback()
+            except Exception:
+                return
+            values = current.items() if isinstance(current, dict) else [((), current)]
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        # Index of the first bucket holding the value (le is inclusive); cumulated at scrape time
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class MetricsRegistry:
+    """Metrics rendered by /metrics (module singleton `metrics` below)"""
+
+    def __init__(self, namespace: str = METRICS_NAMESPACE):
+        self.namespace = namespace
+        self._metrics: List[Metric] = []
+
+    def _register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def _name(self, name: str) -> str:
+        return f'{self.namespace}_{name}' if self.namespace else name
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self._name(name), documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              callback: Optional[Callable[[], Any]] = None) -> Gauge:
+        return self._register(Gauge(self._name(name), documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self._name(name), documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format"""
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+# Storage
+
+STORAGE_SECONDS = metrics.histogram(
+    'storage_operation_seconds',
+    'Latency of firestore_service operations (storage round trips, caches and bookkeeping)',
+    ('operation', 'outcome')
+)
+STORAGE_BYTES = metrics.histogram(
+    'storage_payload_bytes',
+    'Approximate payload per firestore_service operation: text characters written (in) or returned (out)',
+    ('operation', 'direction'),
+    buckets=SIZE_BUCKETS
+)
+
+
+def payload_size(value: Any) -> int:
+    """Characters of text in a payload (strings in nested dicts/lists/models), without serializing it"""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(payload_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(item) for item in value)
+    if hasattr(value, 'model_dump'):
+        return payload_size(value.model_dump())
+    return 0
+
+
+def _outcome(error: Optional[BaseException]) -> str:
+    if error is None:
+        return 'ok'
+    status = getattr(error, 'status_code', None)
+    return 'client_error' if status is not None and status < 500 else 'error'
+
+
+def timed_storage(fn: Callable) -> Callable:
+    """
+    Record latency and payload size of a firestore_service operation
+
+    The operation label is the function name. Written size counts the text
+    in the arguments other than ids and preconditions; returned size the
+    text in the result.
+    """
+    operation = fn.__name__
+    span_name = f'storage.{operation}'
+    skipped = {
+        name for name in inspect.signature(fn).parameters
+        if name.endswith('_id') or name == 'if_match'
+    }
+    skipped_positions = {
+        index for index, name in enumerate(inspect.signature(fn).parameters) if name in skipped
+    }
+
+    def record(started: float, args: tuple, kwargs: dict, result: Any, error: Optional[BaseException]) -> None:
+        STORAGE_SECONDS.observe(time.perf_counter() - started, operation=operation, outcome=_outcome(error))
+        written = (
+            sum(payload_size(arg) for index, arg in enumerate(args) if index not in skipped_positions)
+            + sum(payload_size(value) for name, value in kwargs.items() if name not in skipped)
+        )
+        if written:
+            STORAGE_BYTES.observe(written, operation=operation, direction='in')
+        if error is None:
+            returned = payload_size(result)
+            if returned:
+                STORAGE_BYTES.observe(returned, operation=operation, direction='out')
+
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            with span(span_name):
+                try:
+                    result = await fn(*args, **kwargs)
+                except BaseException as e:
+                    record(started, args, kwargs, None, e)
+                    raise
+            record(started, args, kwargs, result, None)
+            return result
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        with span(span_name):
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                record(started, args, kwargs, None, e)
+                raise
+        record(started, args, kwargs, result, None)
+        return result
+    return wrapper
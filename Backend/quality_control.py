@@ -2,16 +2,108 @@
 Quality Control Module for Story Generation
 
 Provides quality scoring and filtering for generated text.
+
+Every metric is computed from one TextFeatures analysis of the text: the
+lowercased whitespace tokens (repetition and length), the word-character
+runs (coherence) and the word count of each sentence (variety), each found
+by a single C-level split or regex pass. Repeated phrases are counted as a
+set of word-trigram tuples (hashed once, no joined strings). Scores are
+identical to scoring each metric separately, as the functions below still do.
+
+score_batch() scores several candidates (e.g. variations) at once.
 """
 
 import re
-from typing import Dict, Tuple
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from text_processing import sentence_lengths
+from tracing import span, traced
+
+_WORD = re.compile(r'\w+')  # same matches as \b\w+\b
+_ASCII_WORD = re.compile(rb'\w+')
+
+
+class TextFeatures(NamedTuple):
+    """Tokenizations shared by the quality metrics"""
+    words: List[str]  # lowercased whitespace-separated tokens
+    word_chars: List  # lowercased runs of word characters (bytes for ASCII text)
+    sentence_lengths: List[int]  # words per non-empty sentence
+
+
+def analyze(text: str) -> TextFeatures:
+    """Tokenize `text` once for all metrics"""
+    lowered = text.lower()
+    return TextFeatures(
+        words=lowered.split(),
+        word_chars=_word_chars(text, lowered),
+        sentence_lengths=sentence_lengths(text),
+    )
+
+
+def _word_chars(text: str, lowered: str) -> List:
+    if text.isascii():
+        # Byte patterns skip the Unicode category lookups
+        return _ASCII_WORD.findall(lowered.encode('ascii'))
+    if '\u0130' not in text:
+        # Lowercasing keeps every other character in or out of \w
+        return _WORD.findall(lowered)
+    # İ lowercases to i + a combining dot, which splits the word
+    return [word.lower() for word in _WORD.findall(text)]
+
+
+def _repetition(words: List[str]) -> float:
+    if len(words) < 10:
+        return 1.0
+    trigrams = len(words) - 2
+    return len(set(zip(words, words[1:], words[2:]))) / trigrams
+
+
+def _coherence(word_chars: List[str]) -> float:
+    if len(word_chars) < 10:
+        return 1.0
+    ttr = len(set(word_chars)) / len(word_chars)
+    return min(ttr / 0.5, 1.0)
+
+
+def _length_quality(word_count: int) -> float:
+    if word_count < 20:
+        return word_count / 20
+    elif word_count > 500:
+        return max(0.5, 1.0 - (word_count - 500) / 500)
+    else:
+        return 1.0
 
 
+def _variety(lengths: List[int]) -> float:
+    if len(lengths) < 2:
+        return 0.5
+    avg_length = sum(lengths) / len(lengths)
+    variance = sum((l - avg_length) ** 2 for l in lengths) / len(lengths)
+    return min(variance / 10, 1.0)
+
+
+def _score(features: TextFeatures) -> Dict[str, float]:
+    scores = {
+        'repetition': _repetition(features.words),
+        'coherence': _coherence(features.word_chars),
+        'length': _length_quality(len(features.words)),
+        'variety': _variety(features.sentence_lengths),
+    }
+    # Overall score (weighted average)
+    scores['overall'] = (
+        scores['repetition'] * 0.3 +
+        scores['coherence'] * 0.3 +
+        scores['length'] * 0.2 +
+        scores['variety'] * 0.2
+    )
+    return scores
+
+
+@traced('quality.score')
 def calculate_quality_score(text: str, original: str = "") -> Dict[str, float]:
     """
     Calculate quality metrics for generated text
-    
+
     Returns dict with scores for:
     - repetition: 0-1 (higher is better, less repetition)
     - coherence: 0-1 (higher is better, more diverse vocabulary)
@@ -19,29 +111,26 @@ def calculate_quality_score(text: str, original: str = "") -> Dict[str, float]:
     - variety: 0-1 (higher is better, varied sentence structure)
     - overall: 0-1 (weighted average)
     """
-    scores = {}
-    
-    # 1. Repetition detection
-    scores['repetition'] = detect_repetition(text)
-    
-    # 2. Coherence (vocabulary diversity)
-    scores['coherence'] = calculate_coherence(text)
-    
-    # 3. Length appropriateness
-    scores['length'] = check_length_quality(text)
-    
-    # 4. Sentence structure variety
-    scores['variety'] = sentence_variety(text)
-    
-    # Overall score (weighted average)
-    scores['overall'] = (
-        scores['repetition'] * 0.3 +
-        scores['coherence'] * 0.3 +
-        scores['length'] * 0.2 +
-        scores['variety'] * 0.2
-    )
-    
-    return scores
+    return _score(analyze(text))
+
+
+def score_batch(texts: Sequence[str], original: str = "") -> List[Dict[str, float]]:
+    """
+    calculate_quality_score for several candidates
+
+    Args:
+        texts: Candidate texts (duplicates are scored once)
+        original: Original prompt/context (optional)
+
+    Returns:
+        One score dict per text, in order
+    """
+    with span('quality.score', candidates=len(texts)):
+        scored: Dict[str, Dict[str, float]] = {}
+        for text in texts:
+            if text not in scored:
+                scored[text] = _score(analyze(text))
+        return [dict(scored[text]) for text in texts]
 
 
 def detect_repetition(text: str) -> float:
@@ -49,21 +138,7 @@ def detect_repetition(text: str) -> float:
     Detect repetitive patterns (0-1, higher is better)
     Checks for repeated 3-word phrases
     """
-    words = text.lower().split()
-    if len(words) < 10:
-        return 1.0
-    
-    # Check for repeated phrases (3+ words)
-    phrases = []
-    for i in range(len(words) - 2):
-        phrase = ' '.join(words[i:i+3])
-        phrases.append(phrase)
-    
-    unique_phrases = len(set(phrases))
-    total_phrases = len(phrases)
-    
-    diversity = unique_phrases / total_phrases if total_phrases > 0 else 1.0
-    return diversity
+    return _repetition(text.lower().split())
 
 
 def calculate_coherence(text: str) -> float:
@@ -71,19 +146,8 @@ def calculate_coherence(text: str) -> float:
     Calculate vocabulary diversity (0-1, higher is better)
     Uses type-token ratio
     """
-    words = [w.lower() for w in re.findall(r'\b\w+\b', text)]
-    if len(words) < 10:
-        return 1.0
-    
-    unique_words = len(set(words))
-    total_words = len(words)
-    
-    # Type-token ratio
-    ttr = unique_words / total_words
-    
-    # Normalize (typical TTR is 0.4-0.6 for good text)
-    normalized = min(ttr / 0.5, 1.0)
-    return normalized
+    # Normalized so a typical TTR of 0.4-0.6 for good text scores 0.8-1.0
+    return _coherence(_word_chars(text, text.lower()))
 
 
 def check_length_quality(text: str) -> float:
@@ -91,16 +155,7 @@ def check_length_quality(text: str) -> float:
     Check if length is appropriate (0-1, higher is better)
     Penalizes very short or excessively long outputs
     """
-    words = text.split()
-    word_count = len(words)
-    
-    # Penalize very short or very long outputs
-    if word_count < 20:
-        return word_count / 20
-    elif word_count > 500:
-        return max(0.5, 1.0 - (word_count - 500) / 500)
-    else:
-        return 1.0
+    return _length_quality(len(text.split()))
 
 
 def sentence_variety(text: str) -> float:
@@ -108,35 +163,23 @@ def sentence_variety(text: str) -> float:
     Check sentence structure variety (0-1, higher is better)
     Measures variance in sentence lengths
     """
-    sentences = re.split(r'[.!?]+', text)
-    sentences = [s.strip() for s in sentences if s.strip()]
-    
-    if len(sentences) < 2:
-        return 0.5
-    
-    # Check sentence length variety
-    lengths = [len(s.split()) for s in sentences]
-    avg_length = sum(lengths) / len(lengths)
-    variance = sum((l - avg_length) ** 2 for l in lengths) / len(lengths)
-    
-    # Normalize variance (good variety has variance > 10)
-    variety_score = min(variance / 10, 1.0)
-    return variety_score
+    # Good variety has variance > 10
+    return _variety(sentence_lengths(text))
 
 
 def filter_low_quality(text: str, original: str = "", threshold: float = 0.5) -> Tuple[bool, Dict]:
     """
     Filter out low-quality generations
-    
+
     Args:
         text: Generated text to evaluate
         original: Original prompt/context (optional)
         threshold: Minimum acceptable quality score (0-1)
-    
+
     Returns:
         (is_acceptable, scores)
     """
     scores = calculate_quality_score(text, original)
     is_acceptable = scores['overall'] >= threshold
-    
+
     return is_acceptable, scores
@@ -0,0 +1,367 @@
+"""
+Full-text search over a user's library.
+
+Keeps an in-memory inverted index per user covering story titles, chapter
+text (HTML stripped), legacy story content and story bible item names and
+descriptions. Queries are ranked with BM25; the last query term also matches
+as a prefix so search-as-you-type works.
+
+The index for a user is built from storage on their first search and is
+then maintained incrementally by the save paths in firestore_service.py.
+Saves that land while a build is running are recorded and re-read from
+storage before the built index is published, so none are lost.
+Unchanged fields are detected by hash and not re-tokenized. Indexes of users
+who have not searched recently are evicted (LRU).
+"""
+
+import hashlib
+import heapq
+import math
+import os
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict, Counter
+from typing import Optional, Dict, Any, List, Tuple
+
+from storage_backend import get_storage
+
+# Number of per-user indexes kept in memory
+SEARCH_INDEX_MAX_USERS = int(os.getenv('SEARCH_INDEX_MAX_USERS', '200'))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Prefix expansions considered for the last query term
+MAX_PREFIX_EXPANSIONS = 16
+# Shorter trailing terms only match exactly (a 1-2 letter prefix matches too much)
+MIN_PREFIX_LENGTH = 3
+# Field boosts applied to BM25 scores
+FIELD_BOOSTS = {'title': 3.0, 'bible': 1.5, 'chapter': 1.0, 'content': 1.0}
+
+PREVIEW_CHARS = 160
+
+_HTML_TAG = re.compile(r'<[^>]+>')
+_TOKEN = re.compile(r'\w+')
+_WHITESPACE = re.compile(r'\s+')
+
+# (story_id, kind, ref) - kind is 'title', 'content', 'chapter' or 'bible'
+DocKey = Tuple[str, str, str]
+
+
+def strip_html(text: str) -> str:
+    """Replace HTML tags with spaces and collapse whitespace"""
+    return _WHITESPACE.sub(' ', _HTML_TAG.sub(' ', text or '')).strip()
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens"""
+    return _TOKEN.findall(text.lower())
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class _UserIndex:
+    """Inverted index over one user's stories and bible items"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[DocKey, int]] = {}
+        self.doc_lengths: Dict[DocKey, int] = {}
+        self.doc_info: Dict[DocKey, Dict[str, Any]] = {}
+        self.doc_hashes: Dict[DocKey, str] = {}
+        self.story_docs: Dict[str, set] = {}
+        self.total_length = 0
+        self.vocabulary: List[str] = []  # Sorted, for prefix lookups
+        self._length_norms: Optional[Dict[DocKey, float]] = None
+
+    def upsert(self, key: DocKey, text: str, info: Dict[str, Any]) -> None:
+        fingerprint = _fingerprint(text)
+        if self.doc_hashes.get(key) == fingerprint:
+            info['_terms'] = self.doc_info[key].get('_terms', [])
+            self.doc_info[key] = info
+            return
+        self.remove(key)
+        self._length_norms = None
+
+        terms = Counter(tokenize(text))
+        if not terms:
+            return
+        for term, tf in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                insort(self.vocabulary, term)
+            postings[key] = tf
+        length = sum(terms.values())
+        self.doc_lengths[key] = length
+        self.total_length += length
+        self.doc_hashes[key] = fingerprint
+        self.doc_info[key] = info
+        self.story_docs.setdefault(key[0], set()).add(key)
+        # Term list is needed for removal
+        info['_terms'] = list(terms.keys())
+
+    def remove(self, key: DocKey) -> None:
+        info = self.doc_info.pop(key, None)
+        self.doc_hashes.pop(key, None)
+        length = self.doc_lengths.pop(key, None)
+        if length is not None:
+            self.total_length -= length
+            self._length_norms = None
+        if info is not None:
+            for term in info.get('_terms', []):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(key, None)
+                    if not postings:
+                        del self.postings[term]
+                        del self.vocabulary[bisect_left(self.vocabulary, term)]
+        docs = self.story_docs.get(key[0])
+        if docs is not None:
+            docs.discard(key)
+            if not docs:
+                del self.story_docs[key[0]]
+
+    def remove_story(self, story_id: str, kinds: Optional[Tuple[str, ...]] = None) -> None:
+        for key in list(self.story_docs.get(story_id, ())):
+            if kinds is None or key[1] in kinds:
+                self.remove(key)
+
+    def length_norms(self) -> Dict[DocKey, float]:
+        """BM25 length normalization term k1 * (1 - b + b * len / avglen) per document"""
+        if self._length_norms is None:
+            avg_length = self.total_length / len(self.doc_lengths)
+            self._length_norms = {
+                key: BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                for key, length in self.doc_lengths.items()
+            }
+        return self._length_norms
+
+    def expand_prefix(self, prefix: str) -> List[str]:
+        if len(prefix) < MIN_PREFIX_LENGTH:
+            return [prefix] if prefix in self.postings else []
+        vocabulary = self.vocabulary
+        start = bisect_left(vocabulary, prefix)
+        matches = []
+        for term in vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, query: str, limit: int, story_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        terms = tokenize(query)
+        if not terms or not self.doc_lengths:
+            return []
+
+        # Exact terms, plus prefix expansions of the last (possibly partial) term
+        weighted_terms: Dict[str, float] = {term: 1.0 for term in terms[:-1]}
+        for term in self.expand_prefix(terms[-1]):
+            weighted_terms[term] = max(weighted_terms.get(term, 0.0), 1.0 if term == terms[-1] else 0.8)
+
+        doc_count = len(self.doc_lengths)
+        length_norms = self.length_norms()
+        scores: Dict[DocKey, float] = {}
+        for term, weight in weighted_terms.items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            factor = weight * idf * (BM25_K1 + 1)
+            for key, tf in postings.items():
+                if story_id is not None and key[0] != story_id:
+                    continue
+                scores[key] = scores.get(key, 0.0) + factor * tf / (tf + length_norms[key])
+
+        ranked = heapq.nlargest(
+            limit,
+            ((score * FIELD_BOOSTS.get(key[1], 1.0), key) for key, score in scores.items()),
+            key=lambda pair: pair[0]
+        )
+
+        results = []
+        for score, key in ranked:
+            info = {k: v for k, v in self.doc_info[key].items() if not k.startswith('_')}
+            results.append({'storyId': key[0], 'kind': key[1], 'score': round(score, 4), **info})
+        return results
+
+
+class _PendingBuild:
+    """Placeholder for a user's index while it is being built from storage"""
+
+    def __init__(self):
+        self.changed: set = set()  # Story IDs saved/deleted during the build
+        self.done = threading.Event()
+        self.index: Optional[_UserIndex] = None
+
+
+class SearchIndex:
+    """
+    Per-user inverted indexes with LRU eviction.
+
+    Building a user's index reads their whole library, so search() blocks;
+    call it from a worker thread (asyncio.to_thread) on the request path.
+    """
+
+    def __init__(self, max_users: int = SEARCH_INDEX_MAX_USERS):
+        self.max_users = max_users
+        self._users: "OrderedDict[str, _UserIndex]" = OrderedDict()
+        self._building: Dict[str, _PendingBuild] = {}
+        self._lock = threading.RLock()
+
+    def _index_for_update(self, user_id: str, story_id: str) -> Optional[_UserIndex]:
+        """The user's published index, or None (noting the change if a build is running). Caller holds the lock."""
+        index = self._users.get(user_id)
+        if index is None:
+            build = self._building.get(user_id)
+            if build is not None:
+                build.changed.add(story_id)
+        return index
+
+    def index_story(self, user_id: str, story_id: str, story: Dict[str, Any]) -> None:
+        """Index (or re-index) a story's title, chapters and legacy content"""
+        with self._lock:
+            index = self._index_for_update(user_id, story_id)
+            if index is None:
+                return  # Built from storage on the user's first search
+            self._index_story(index, story_id, story)
+
+    def remove_story(self, user_id: str, story_id: str) -> None:
+        """Remove a story and its bible items from the index"""
+        with self._lock:
+            index = self._index_for_update(user_id, story_id)
+            if index is not None:
+                index.remove_story(story_id)
+
+    def index_bible_item(self, user_id: str, story_id: str, item_id: str, item: Dict[str, Any]) -> None:
+        """Index a bible item's name and description"""
+        with self._lock:
+            index = self._index_for_update(user_id, story_id)
+            if index is not None:
+                self._index_bible_item(index, story_id, item_id, item)
+
+    def remove_bible_item(self, user_id: str, story_id: str, item_id: str) -> None:
+        with self._lock:
+            index = self._index_for_update(user_id, story_id)
+            if index is not None:
+                index.remove((story_id, 'bible', item_id))
+
+    def search(self, user_id: str, query: str, limit: int = 20, story_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Rank the user's documents against a query with BM25 (blocks while the index is built)"""
+        while True:
+            with self._lock:
+                index = self._users.get(user_id)
+                if index is not None:
+                    self._users.move_to_end(user_id)
+                    return index.search(query, limit, story_id)
+                build = self._building.get(user_id)
+                owner = build is None
+                if owner:
+                    build = self._building[user_id] = _PendingBuild()
+
+            if owner:
+                self._run_build(user_id, build)
+            else:
+                # Another request is building it; wait, then search the published index
+                build.done.wait()
+
+    def _run_build(self, user_id: str, build: _PendingBuild) -> None:
+        """Build a user's index, catch up on saves made meanwhile, then publish it"""
+        try:
+            index = self._build(user_id)
+            while True:
+                with self._lock:
+                    changed, build.changed = build.changed, set()
+                    if not changed:
+                        self._users[user_id] = index
+                        self._users.move_to_end(user_id)
+                        while len(self._users) > self.max_users:
+                            self._users.popitem(last=False)
+                        build.index = index
+                        return
+                # The index is unpublished, so only this thread touches it
+                for changed_id in changed:
+                    self._reindex_from_storage(index, changed_id)
+        finally:
+            with self._lock:
+                if self._building.get(user_id) is build:
+                    del self._building[user_id]
+            build.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'documents': sum(len(index.doc_lengths) for index in self._users.values()),
+                'terms': sum(len(index.postings) for index in self._users.values()),
+            }
+
+    def _build(self, user_id: str) -> _UserIndex:
+        """Build a user's index from storage"""
+        storage = get_storage()
+        index = _UserIndex()
+        for summary in storage.list_stories(user_id, limit=1_000_000, offset=0):
+            stored = storage.get_story(summary.id)
+            if stored is None or stored.data.get('deleted'):
+                continue
+            self._index_story(index, summary.id, stored.data)
+            for item in storage.list_bible_items(summary.id):
+                self._index_bible_item(index, summary.id, item.id, item.data)
+        return index
+
+    def _reindex_from_storage(self, index: _UserIndex, story_id: str) -> None:
+        """Replace a story's documents with its current stored state"""
+        storage = get_storage()
+        index.remove_story(story_id)
+        stored = storage.get_story(story_id)
+        if stored is None or stored.data.get('deleted'):
+            return
+        self._index_story(index, story_id, stored.data)
+        for item in storage.list_bible_items(story_id):
+            self._index_bible_item(index, story_id, item.id, item.data)
+
+    def _index_story(self, index: _UserIndex, story_id: str, story: Dict[str, Any]) -> None:
+        story_title = story.get('title') or ''
+        index.upsert((story_id, 'title', ''), story_title, {'storyTitle': story_title, 'title': story_title})
+
+        chapters = story.get('chapters') or []
+        live_keys = {(story_id, 'title', '')}
+        if chapters:
+            for chapter in chapters:
+                chapter_id = str(chapter.get('id', chapter.get('order', '')))
+                text = strip_html(chapter.get('content', ''))
+                key = (story_id, 'chapter', chapter_id)
+                index.upsert(key, text, {
+                    'storyTitle': story_title,
+                    'chapterId': chapter_id,
+                    'title': chapter.get('title', ''),
+                    'preview': text[:PREVIEW_CHARS],
+                })
+                live_keys.add(key)
+        elif story.get('content'):
+            text = strip_html(story['content'])
+            key = (story_id, 'content', '')
+            index.upsert(key, text, {'storyTitle': story_title, 'title': story_title, 'preview': text[:PREVIEW_CHARS]})
+            live_keys.add(key)
+
+        # Drop chapters that were removed from the story
+        for key in list(index.story_docs.get(story_id, ())):
+            if key[1] in ('title', 'chapter', 'content') and key not in live_keys:
+                index.remove(key)
+
+    def _index_bible_item(self, index: _UserIndex, story_id: str, item_id: str, item: Dict[str, Any]) -> None:
+        name = item.get('name') or ''
+        description = item.get('description') or ''
+        index.upsert((story_id, 'bible', item_id), f"{name} {description}", {
+            'itemId': item_id,
+            'title': name,
+            'category': item.get('category'),
+            'preview': description[:PREVIEW_CHARS],
+        })
+
+
+# Process-wide search index
+search_index = SearchIndex()
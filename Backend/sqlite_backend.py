@@ -0,0 +1,416 @@
+"""
+SQLite implementation of the storage backend.
+
+Intended for single-node and self-hosted deployments that should not need a
+live Firebase project. The database runs in WAL mode so readers never block
+the writer, every query is a constant SQL string (compiled once per
+connection by sqlite3's statement cache), and connections are pooled across
+request threads.
+
+Story documents are stored as JSON alongside the columns needed for
+indexing (owner, status, update time, deleted flag) and a small JSON summary
+used for listings, so the dashboard never loads manuscripts.
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Iterator
+
+from storage_backend import (
+    StorageBackend, StoredDocument, RevisionExists, StoryVersionConflict, StatsDelta, STORY_LIST_FIELDS
+)
+from user_stats import apply_delta
+
+# Database file (created on first use)
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'storynexis.db')
+# Maximum pooled connections
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '8'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    id          TEXT PRIMARY KEY,
+    user_id     TEXT NOT NULL,
+    status      TEXT,
+    updated_at  TEXT NOT NULL DEFAULT '',
+    deleted     INTEGER NOT NULL DEFAULT 0,
+    version     INTEGER NOT NULL DEFAULT 1,
+    summary     TEXT NOT NULL,
+    data        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stories_user_updated
+    ON stories (user_id, deleted, updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_stories_user_status_updated
+    ON stories (user_id, status, deleted, updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_stories_deleted
+    ON stories (deleted) WHERE deleted = 1;
+
+CREATE TABLE IF NOT EXISTS bible_items (
+    story_id    TEXT NOT NULL,
+    id          TEXT NOT NULL,
+    category    TEXT,
+    data        TEXT NOT NULL,
+    PRIMARY KEY (story_id, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_bible_items_category
+    ON bible_items (story_id, category);
+
+CREATE TABLE IF NOT EXISTS bible_versions (
+    story_id    TEXT PRIMARY KEY,
+    version     TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS revisions (
+    story_id    TEXT NOT NULL,
+    number      INTEGER NOT NULL,
+    meta        TEXT NOT NULL,
+    payload     BLOB NOT NULL,
+    PRIMARY KEY (story_id, number)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id     TEXT PRIMARY KEY,
+    data        TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Statements (constant strings so each connection compiles them once)
+SQL_GET_STORY = "SELECT data, version FROM stories WHERE id = ?"
+# Picks the requested top-level keys (a JSON array parameter) inside SQLite
+SQL_GET_STORY_FIELDS = (
+    "SELECT (SELECT json_group_object(key, value) FROM json_each(data) "
+    "WHERE key IN (SELECT value FROM json_each(?))) FROM stories WHERE id = ?"
+)
+SQL_INSERT_STORY = (
+    "INSERT INTO stories (id, user_id, status, updated_at, deleted, version, summary, data) "
+    "VALUES (?, ?, ?, ?, ?, 1, ?, ?)"
+)
+SQL_UPDATE_STORY = (
+    "UPDATE stories SET user_id = ?, status = ?, updated_at = ?, deleted = ?, "
+    "version = version + 1, summary = ?, data = ? WHERE id = ? RETURNING version"
+)
+SQL_LIST_STORIES = (
+    "SELECT id, summary, version FROM stories "
+    "WHERE user_id = ? AND deleted = 0 ORDER BY updated_at DESC LIMIT ? OFFSET ?"
+)
+SQL_LIST_STORIES_BY_STATUS = (
+    "SELECT id, summary, version FROM stories "
+    "WHERE user_id = ? AND status = ? AND deleted = 0 ORDER BY updated_at DESC LIMIT ? OFFSET ?"
+)
+SQL_LIST_DELETED = "SELECT id FROM stories WHERE deleted = 1"
+SQL_DELETE_CHILDREN = (
+    "DELETE FROM bible_items WHERE story_id = ? AND id IN "
+    "(SELECT id FROM bible_items WHERE story_id = ? LIMIT ?)"
+)
+SQL_DELETE_REVISION_CHILDREN = (
+    "DELETE FROM revisions WHERE story_id = ? AND number IN "
+    "(SELECT number FROM revisions WHERE story_id = ? LIMIT ?)"
+)
+SQL_DELETE_STORY = "DELETE FROM stories WHERE id = ?"
+SQL_LIST_ITEMS = "SELECT id, data FROM bible_items WHERE story_id = ?"
+SQL_LIST_ITEMS_BY_CATEGORY = "SELECT id, data FROM bible_items WHERE story_id = ? AND category = ?"
+SQL_GET_ITEM = "SELECT data FROM bible_items WHERE story_id = ? AND id = ?"
+SQL_INSERT_ITEM = "INSERT INTO bible_items (story_id, id, category, data) VALUES (?, ?, ?, ?)"
+SQL_UPDATE_ITEM = "UPDATE bible_items SET category = ?, data = ? WHERE story_id = ? AND id = ?"
+SQL_DELETE_ITEM = "DELETE FROM bible_items WHERE story_id = ? AND id = ?"
+SQL_GET_BIBLE_VERSION = "SELECT version FROM bible_versions WHERE story_id = ?"
+SQL_PUT_BIBLE_VERSION = "INSERT OR REPLACE INTO bible_versions (story_id, version) VALUES (?, ?)"
+SQL_DELETE_BIBLE_VERSION = "DELETE FROM bible_versions WHERE story_id = ?"
+SQL_LIST_REVISIONS = "SELECT number, meta FROM revisions WHERE story_id = ? ORDER BY number"
+SQL_GET_REVISION = "SELECT meta, payload FROM revisions WHERE story_id = ? AND number = ?"
+SQL_INSERT_REVISION = "INSERT INTO revisions (story_id, number, meta, payload) VALUES (?, ?, ?, ?)"
+SQL_REPLACE_REVISION = "INSERT OR REPLACE INTO revisions (story_id, number, meta, payload) VALUES (?, ?, ?, ?)"
+SQL_DELETE_REVISION = "DELETE FROM revisions WHERE story_id = ? AND number = ?"
+SQL_GET_USER_STATS = "SELECT data FROM user_stats WHERE user_id = ?"
+SQL_PUT_USER_STATS = "INSERT OR REPLACE INTO user_stats (user_id, data) VALUES (?, ?)"
+
+
+def _dumps(data: Dict[str, Any]) -> str:
+    return json.dumps(data, separators=(',', ':'), default=str)
+
+
+def _story_columns(data: Dict[str, Any]) -> tuple:
+    """Indexed columns and listing summary derived from a story document"""
+    summary = {field: data.get(field) for field in STORY_LIST_FIELDS}
+    updated_at = (data.get('metadata') or {}).get('updatedAt', '') or ''
+    return (
+        data.get('userId', ''),
+        data.get('status'),
+        updated_at,
+        1 if data.get('deleted') else 0,
+        _dumps(summary),
+    )
+
+
+class _ConnectionPool:
+    """Thread-safe pool of SQLite connections to one database file"""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            isolation_level=None,  # Explicit transactions only
+            check_same_thread=False,
+            cached_statements=256,
+            timeout=10.0,
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA mmap_size = 268435456")
+        conn.execute("PRAGMA cache_size = -32000")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            conn = self._connect() if can_create else self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+
+class SQLiteBackend(StorageBackend):
+    """Stores stories in a local SQLite database"""
+
+    name = 'sqlite'
+
+    def __init__(self, path: str = SQLITE_PATH, pool_size: int = SQLITE_POOL_SIZE):
+        self._pool = _ConnectionPool(path, pool_size)
+        with self._pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction that takes the write lock up front"""
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    # Stories
+
+    def new_story_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def get_story(self, story_id: str) -> Optional[StoredDocument]:
+        with self._pool.connection() as conn:
+            row = conn.execute(SQL_GET_STORY, (story_id,)).fetchone()
+        if row is None:
+            return None
+        return StoredDocument(story_id, json.loads(row[0]), row[1])
+
+    def create_story(self, story_id: str, data: Dict[str, Any], stats: Optional[StatsDelta] = None) -> Any:
+        with self._transaction() as conn:
+            conn.execute(SQL_INSERT_STORY, (story_id, *_story_columns(data), _dumps(data)))
+            self._apply_stats(conn, stats)
+        return 1
+
+    def update_story(
+        self,
+        story_id: str,
+        fields: Dict[str, Any],
+        stats: Optional[StatsDelta] = None,
+        expected_version: Any = None
+    ) -> Any:
+        with self._transaction() as conn:
+            row = conn.execute(SQL_GET_STORY, (story_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"Story {story_id} does not exist")
+            if expected_version is not None and row[1] != expected_version:
+                raise StoryVersionConflict(f"Story {story_id} is at version {row[1]}, expected {expected_version}")
+            data = {**json.loads(row[0]), **fields}
+            (version,) = conn.execute(
+                SQL_UPDATE_STORY,
+                (*_story_columns(data), _dumps(data), story_id)
+            ).fetchone()
+            self._apply_stats(conn, stats)
+        return version
+
+    def get_story_fields(self, story_id: str, fields: List[str]) -> Optional[Dict[str, Any]]:
+        with self._pool.connection() as conn:
+            row = conn.execute(SQL_GET_STORY_FIELDS, (json.dumps(fields), story_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def append_story_chapters(
+        self,
+        story_id: str,
+        chapters: List[Dict[str, Any]],
+        fields: Dict[str, Any],
+        stats: Optional[StatsDelta] = None
+    ) -> Any:
+        with self._transaction() as conn:
+            row = conn.execute(SQL_GET_STORY, (story_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"Story {story_id} does not exist")
+            data = json.loads(row[0])
+            data.update(fields)
+            data['chapters'] = (data.get('chapters') or []) + chapters
+            (version,) = conn.execute(
+                SQL_UPDATE_STORY,
+                (*_story_columns(data), _dumps(data), story_id)
+            ).fetchone()
+            self._apply_stats(conn, stats)
+        return version
+
+    @staticmethod
+    def _apply_stats(conn: sqlite3.Connection, stats: Optional[StatsDelta]) -> None:
+        """Read-modify-write the owner's stats inside the caller's transaction"""
+        if not stats or not stats.increments:
+            return
+        row = conn.execute(SQL_GET_USER_STATS, (stats.user_id,)).fetchone()
+        current = json.loads(row[0]) if row else {}
+        conn.execute(SQL_PUT_USER_STATS, (stats.user_id, _dumps(apply_delta(current, stats.increments))))
+
+    def list_stories(
+        self,
+        user_id: str,
+        status: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> List[StoredDocument]:
+        with self._pool.connection() as conn:
+            if status:
+                rows = conn.execute(SQL_LIST_STORIES_BY_STATUS, (user_id, status, limit, offset)).fetchall()
+            else:
+                rows = conn.execute(SQL_LIST_STORIES, (user_id, limit, offset)).fetchall()
+        return [StoredDocument(row[0], json.loads(row[1]), row[2]) for row in rows]
+
+    def list_deleted_story_ids(self) -> List[str]:
+        with self._pool.connection() as conn:
+            return [row[0] for row in conn.execute(SQL_LIST_DELETED)]
+
+    def delete_story_children(self, story_id: str, limit: int) -> int:
+        with self._transaction() as conn:
+            deleted = conn.execute(SQL_DELETE_CHILDREN, (story_id, story_id, limit)).rowcount
+            if deleted < limit:
+                deleted += conn.execute(
+                    SQL_DELETE_REVISION_CHILDREN, (story_id, story_id, limit - deleted)
+                ).rowcount
+            if deleted < limit:
+                deleted += conn.execute(SQL_DELETE_BIBLE_VERSION, (story_id,)).rowcount
+            return deleted
+
+    def delete_story_document(self, story_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(SQL_DELETE_STORY, (story_id,))
+
+    # User stats
+
+    def get_user_stats(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._pool.connection() as conn:
+            row = conn.execute(SQL_GET_USER_STATS, (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_user_stats(self, user_id: str, stats: Dict[str, Any]) -> None:
+        with self._transaction() as conn:
+            conn.execute(SQL_PUT_USER_STATS, (user_id, _dumps(stats)))
+
+    # Bible items
+
+    def list_bible_items(self, story_id: str, category: Optional[str] = None) -> List[StoredDocument]:
+        with self._pool.connection() as conn:
+            if category:
+                rows = conn.execute(SQL_LIST_ITEMS_BY_CATEGORY, (story_id, category)).fetchall()
+            else:
+                rows = conn.execute(SQL_LIST_ITEMS, (story_id,)).fetchall()
+        return [StoredDocument(row[0], json.loads(row[1])) for row in rows]
+
+    def get_bible_item(self, story_id: str, item_id: str) -> Optional[Dict[str, Any]]:
+        with self._pool.connection() as conn:
+            row = conn.execute(SQL_GET_ITEM, (story_id, item_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def write_bible_items(
+        self,
+        story_id: str,
+        add_items: List[Dict[str, Any]],
+        delete_item_ids: List[str]
+    ) -> List[str]:
+        new_ids = [uuid.uuid4().hex for _ in add_items]
+        with self._transaction() as conn:
+            if delete_item_ids:
+                conn.executemany(SQL_DELETE_ITEM, [(story_id, item_id) for item_id in delete_item_ids])
+            if add_items:
+                conn.executemany(SQL_INSERT_ITEM, [
+                    (story_id, item_id, item.get('category'), _dumps(item))
+                    for item_id, item in zip(new_ids, add_items)
+                ])
+        return new_ids
+
+    def update_bible_item(self, story_id: str, item_id: str, fields: Dict[str, Any]) -> None:
+        with self._transaction() as conn:
+            row = conn.execute(SQL_GET_ITEM, (story_id, item_id)).fetchone()
+            if row is None:
+                raise KeyError(f"Bible item {item_id} does not exist")
+            data = {**json.loads(row[0]), **fields}
+            conn.execute(SQL_UPDATE_ITEM, (data.get('category'), _dumps(data), story_id, item_id))
+
+    def delete_bible_item(self, story_id: str, item_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(SQL_DELETE_ITEM, (story_id, item_id))
+
+    def get_bible_version(self, story_id: str) -> Optional[str]:
+        with self._pool.connection() as conn:
+            row = conn.execute(SQL_GET_BIBLE_VERSION, (story_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_bible_version(self, story_id: str, version: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(SQL_PUT_BIBLE_VERSION, (story_id, version))
+
+    # Revisions
+
+    @staticmethod
+    def _revision_row(story_id: str, revision: Dict[str, Any]) -> tuple:
+        meta = {key: value for key, value in revision.items() if key != 'payload'}
+        return (story_id, revision['number'], _dumps(meta), revision['payload'])
+
+    def list_revisions(self, story_id: str) -> List[StoredDocument]:
+        with self._pool.connection() as conn:
+            rows = conn.execute(SQL_LIST_REVISIONS, (story_id,)).fetchall()
+        return [StoredDocument(str(row[0]), json.loads(row[1])) for row in rows]
+
+    def get_revisions(self, story_id: str, numbers: List[int]) -> List[StoredDocument]:
+        revisions = []
+        with self._pool.connection() as conn:
+            for number in sorted(set(numbers)):
+                row = conn.execute(SQL_GET_REVISION, (story_id, number)).fetchone()
+                if row is not None:
+                    revisions.append(StoredDocument(str(number), {**json.loads(row[0]), 'payload': row[1]}))
+        return revisions
+
+    def create_revision(self, story_id: str, revision: Dict[str, Any]) -> None:
+        try:
+            with self._transaction() as conn:
+                conn.execute(SQL_INSERT_REVISION, self._revision_row(story_id, revision))
+        except sqlite3.IntegrityError as e:
+            raise RevisionExists(str(e))
+
+    def write_revisions(self, story_id: str, put: List[Dict[str, Any]], delete_numbers: List[int]) -> None:
+        with self._transaction() as conn:
+            if put:
+                conn.executemany(SQL_REPLACE_REVISION, [self._revision_row(story_id, r) for r in put])
+            if delete_numbers:
+                conn.executemany(SQL_DELETE_REVISION, [(story_id, number) for number in delete_numbers])
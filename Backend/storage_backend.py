@@ -0,0 +1,243 @@
+"""
+Storage backend interface for stories and story bible items.
+
+firestore_service.py holds the business logic (metadata, authorization,
+caching) and talks to storage only through a StorageBackend. Two
+implementations exist:
+- FirestoreBackend (firestore_backend.py): the hosted default
+- SQLiteBackend (sqlite_backend.py): single-node / self-hosted deployments
+
+The backend is chosen with the STORAGE_BACKEND environment variable.
+
+Each story's bible version token (the bible items ETag source) is kept in
+a small per-story document of its own and deleted with the story's other
+children.
+
+Story revisions (story_history.py) are stored per story, keyed by their
+sequence number; the 'payload' field holds compressed bytes.
+
+Story writes can carry a StatsDelta, which the backend applies to the
+owner's stats document (user_stats.py) atomically with the story write.
+"""
+
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Any, List, Callable, NamedTuple
+
+log = logging.getLogger(__name__)
+
+# 'firestore' (default) or 'sqlite'
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'firestore').lower()
+
+# Story fields returned by list_stories (everything except the manuscript)
+STORY_LIST_FIELDS = ('userId', 'title', 'genre', 'metadata', 'settings', 'status')
+
+
+class RevisionExists(Exception):
+    """A revision with the same number was already written for the story"""
+
+
+class StoryVersionConflict(Exception):
+    """The story changed since the version an update was conditioned on"""
+
+
+class StatsDelta(NamedTuple):
+    """Increments to a user's stats document, e.g. {'wordCount': 120, 'byStatus.draft': -1}"""
+    user_id: str
+    increments: Dict[str, int]
+
+
+class StoredDocument(NamedTuple):
+    """A document read from storage"""
+    id: str
+    data: Dict[str, Any]
+    version: Any = None  # Monotonic per document; compared only within one backend
+
+
+class StorageBackend(ABC):
+    """
+    Synchronous storage operations used by the story service.
+
+    Story documents are flat dicts (userId, title, genre, content, chapters,
+    metadata, settings, status, deleted, ...). Updates replace whole top-level
+    fields, matching Firestore's update() semantics.
+    """
+
+    name = 'abstract'
+    # Largest story document the backend can store, in bytes (None: no limit)
+    max_story_bytes: Optional[int] = None
+
+    # Stories
+
+    @abstractmethod
+    def new_story_id(self) -> str:
+        """Allocate an ID for a story that is about to be created"""
+
+    @abstractmethod
+    def get_story(self, story_id: str) -> Optional[StoredDocument]:
+        """Read a full story document, or None if it does not exist"""
+
+    @abstractmethod
+    def create_story(self, story_id: str, data: Dict[str, Any], stats: Optional[StatsDelta] = None) -> Any:
+        """Create a story document (and apply stats in the same write). Returns its version."""
+
+    @abstractmethod
+    def update_story(
+        self,
+        story_id: str,
+        fields: Dict[str, Any],
+        stats: Optional[StatsDelta] = None,
+        expected_version: Any = None
+    ) -> Any:
+        """
+        Replace top-level fields of a story (and apply stats in the same write).
+        With expected_version, the write only applies if the story is still at
+        that version; otherwise StoryVersionConflict is raised.
+        Returns the new version.
+        """
+
+    @abstractmethod
+    def get_story_fields(self, story_id: str, fields: List[str]) -> Optional[Dict[str, Any]]:
+        """Read only some top-level fields of a story (without downloading the manuscript)"""
+
+    @abstractmethod
+    def append_story_chapters(
+        self,
+        story_id: str,
+        chapters: List[Dict[str, Any]],
+        fields: Dict[str, Any],
+        stats: Optional[StatsDelta] = None
+    ) -> Any:
+        """
+        Append chapters to a story's chapter list (sending only the new
+        chapters where the backend allows) and replace other top-level fields.
+        Returns the new version.
+        """
+
+    @abstractmethod
+    def list_stories(
+        self,
+        user_id: str,
+        status: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> List[StoredDocument]:
+        """
+        List a user's stories that are not marked deleted, most recently
+        updated first. Documents only carry STORY_LIST_FIELDS.
+        """
+
+    @abstractmethod
+    def list_deleted_story_ids(self) -> List[str]:
+        """IDs of stories marked deleted that still exist in storage"""
+
+    @abstractmethod
+    def delete_story_children(self, story_id: str, limit: int) -> int:
+        """
+        Delete up to `limit` documents nested under a story (bible items,
+        revisions and any deeper subcollections). Returns how many were
+        deleted; 0 means nothing is left.
+        """
+
+    @abstractmethod
+    def delete_story_document(self, story_id: str) -> None:
+        """Delete the story document itself"""
+
+    def watch_story(
+        self,
+        story_id: str,
+        on_change: Callable[[Optional[Dict[str, Any]], Any], None]
+    ) -> Optional[Callable[[], None]]:
+        """
+        Call on_change(data, version) whenever the story changes outside this
+        process (data is None when it is deleted). Returns an unsubscribe
+        callable, or None if the backend has no change notifications.
+        """
+        return None
+
+    # User stats
+
+    @abstractmethod
+    def get_user_stats(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Read a user's stats document, or None if there is none"""
+
+    @abstractmethod
+    def set_user_stats(self, user_id: str, stats: Dict[str, Any]) -> None:
+        """Replace a user's stats document (used when rebuilding)"""
+
+    # Bible items
+
+    @abstractmethod
+    def list_bible_items(self, story_id: str, category: Optional[str] = None) -> List[StoredDocument]:
+        """List bible items of a story, optionally filtered by category"""
+
+    @abstractmethod
+    def get_bible_item(self, story_id: str, item_id: str) -> Optional[Dict[str, Any]]:
+        """Read a single bible item, or None if it does not exist"""
+
+    @abstractmethod
+    def write_bible_items(
+        self,
+        story_id: str,
+        add_items: List[Dict[str, Any]],
+        delete_item_ids: List[str]
+    ) -> List[str]:
+        """Create and delete bible items in as few round trips as possible. Returns new item IDs."""
+
+    @abstractmethod
+    def update_bible_item(self, story_id: str, item_id: str, fields: Dict[str, Any]) -> None:
+        """Replace top-level fields of a bible item"""
+
+    @abstractmethod
+    def delete_bible_item(self, story_id: str, item_id: str) -> None:
+        """Delete a single bible item"""
+
+    @abstractmethod
+    def get_bible_version(self, story_id: str) -> Optional[str]:
+        """Read the token identifying the current state of a story's bible items, or None if never set"""
+
+    @abstractmethod
+    def set_bible_version(self, story_id: str, version: str) -> None:
+        """
+        Replace a story's bible version token. It is stored apart from the
+        story document so bible writes do not change the story's version.
+        """
+
+
+    # Revisions
+
+    @abstractmethod
+    def list_revisions(self, story_id: str) -> List[StoredDocument]:
+        """Revision metadata (no payload) ordered by number, oldest first"""
+
+    @abstractmethod
+    def get_revisions(self, story_id: str, numbers: List[int]) -> List[StoredDocument]:
+        """Full revisions (with payload) for the given numbers, ordered by number"""
+
+    @abstractmethod
+    def create_revision(self, story_id: str, revision: Dict[str, Any]) -> None:
+        """Write a new revision. Raises RevisionExists if its number is taken."""
+
+    @abstractmethod
+    def write_revisions(self, story_id: str, put: List[Dict[str, Any]], delete_numbers: List[int]) -> None:
+        """Overwrite revisions and delete others in as few round trips as possible"""
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """Get the configured storage backend (lazy initialization)"""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == 'sqlite':
+            from sqlite_backend import SQLiteBackend
+            _storage = SQLiteBackend()
+        elif STORAGE_BACKEND == 'firestore':
+            from firestore_backend import FirestoreBackend
+            _storage = FirestoreBackend()
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}' (expected 'firestore' or 'sqlite')")
+        log.info("🗄️ Using %s storage backend", _storage.name)
+    return _storage
@@ -0,0 +1,273 @@
+"""
+In-process read-through cache of story documents.
+
+Hot stories are re-read from storage many times a minute while someone is
+writing (every save, every bible operation checks ownership). This cache keeps
+recently used story documents in an LRU bounded by approximate byte size.
+
+Consistency:
+- Our own writes go through put() with the write's update_time, or invalidate().
+- A change listener per cached story (Firestore snapshot listeners via
+  StorageBackend.watch_story, on by default) pushes remote changes (other
+  workers and instances, admin_cli.py, console edits) into the cache.
+- Entries without a listener (listeners disabled, or a backend without
+  change notifications such as SQLite) are only served for
+  STORY_CACHE_MAX_AGE_SECONDS, then re-read from storage.
+- Every entry carries a version (Firestore update_time or the SQLite row
+  version, see StorageBackend). A read can only
+  replace an entry with an equal or newer version, and a read that started
+  before an invalidation of the same story is discarded, so a stale read can
+  never win.
+
+Cached documents are shared: callers must copy before mutating nested values.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, Tuple
+
+log = logging.getLogger(__name__)
+
+# Byte budget for cached story documents. 0 disables caching.
+STORY_CACHE_MAX_BYTES = int(os.getenv('STORY_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# Attach a storage change listener (Firestore snapshot listener) to every cached story
+STORY_CACHE_LISTENERS = os.getenv('STORY_CACHE_LISTENERS', 'true').lower() == 'true'
+# Seconds an entry without a change listener is served before it is re-read. 0 = no limit.
+STORY_CACHE_MAX_AGE_SECONDS = float(os.getenv('STORY_CACHE_MAX_AGE_SECONDS', '5'))
+
+# Invalidation records kept for in-flight read checks
+_MAX_INVALIDATION_RECORDS = 10000
+
+
+def _estimate_size(data: Dict[str, Any]) -> int:
+    """Approximate memory footprint of a document in bytes"""
+    return len(json.dumps(data, default=str))
+
+
+class _CacheEntry:
+    __slots__ = ('data', 'version', 'size', 'unsubscribe', 'stored_at')
+
+    def __init__(self, data: Dict[str, Any], version: Any, size: int):
+        self.data = data
+        self.version = version
+        self.size = size
+        self.unsubscribe: Optional[Callable[[], None]] = None
+        self.stored_at = time.monotonic()
+
+
+class StoryCache:
+    """
+    Byte-bounded LRU cache of story documents with per-entry versioning.
+
+    Args:
+        max_bytes: Total byte budget; least recently used stories are evicted
+        listen: Attach snapshot listeners to keep entries fresh
+        max_age_seconds: How long entries without a listener are served
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = STORY_CACHE_MAX_BYTES,
+        listen: bool = STORY_CACHE_LISTENERS,
+        max_age_seconds: float = STORY_CACHE_MAX_AGE_SECONDS
+    ):
+        self.max_bytes = max_bytes
+        self.listen = listen
+        self.max_age = max_age_seconds
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._clock = 0
+        self._invalidated_at: "OrderedDict[str, int]" = OrderedDict()
+        self._invalidation_floor = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'stale_rejections': 0,
+            'expirations': 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, story_id: str) -> Optional[Dict[str, Any]]:
+        """Return the cached document, or None on a miss"""
+        cached = self.get_with_version(story_id)
+        return cached[0] if cached is not None else None
+
+    def get_with_version(self, story_id: str) -> Optional[Tuple[Dict[str, Any], Any]]:
+        """Return (document, storage version) from the cache, or None on a miss"""
+        if not self.enabled:
+            return None
+        unsubscribe = None
+        with self._lock:
+            entry = self._entries.get(story_id)
+            if entry is not None and self._expired(entry):
+                # No listener keeps it fresh; another writer may have changed it
+                unsubscribe = self._remove(story_id)
+                self._stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+            else:
+                self._entries.move_to_end(story_id)
+                self._stats['hits'] += 1
+        _detach(story_id, unsubscribe)
+        return (entry.data, entry.version) if entry is not None else None
+
+    def begin_read(self) -> int:
+        """Take a token before reading from storage; pass it to put()"""
+        with self._lock:
+            self._clock += 1
+            return self._clock
+
+    def put(self, story_id: str, data: Dict[str, Any], version: Any = None,
+            read_token: Optional[int] = None,
+            subscribe: Optional[Callable[[Callable], Optional[Callable[[], None]]]] = None) -> bool:
+        """
+        Store a document version.
+
+        Args:
+            story_id: Story document ID
+            data: Document fields (without 'id')
+            version: Storage version; older versions never replace newer ones
+            read_token: Token from begin_read() if the data came from a read
+            subscribe: Registers a change callback for this story and returns
+                an unsubscribe callable (e.g. StorageBackend.watch_story)
+
+        Returns:
+            True if the cache now holds this version
+        """
+        if not self.enabled:
+            return False
+        size = _estimate_size(data)
+        if size > self.max_bytes:
+            return False
+
+        evicted = []
+        try:
+            with self._lock:
+                return self._put(story_id, data, version, size, read_token, subscribe, evicted)
+        finally:
+            for evicted_id, unsubscribe in evicted:
+                _detach(evicted_id, unsubscribe)
+
+    def _put(self, story_id: str, data: Dict[str, Any], version: Any, size: int,
+             read_token: Optional[int], subscribe, evicted: list) -> bool:
+        """put() under the lock; evicted listeners are returned in `evicted` for detaching after it"""
+        if read_token is not None and self._is_stale_read(story_id, read_token):
+            self._stats['stale_rejections'] += 1
+            return False
+
+        entry = self._entries.get(story_id)
+        if entry is not None:
+            if entry.version is not None and version is not None and version < entry.version:
+                self._stats['stale_rejections'] += 1
+                return False
+            self._bytes -= entry.size
+            entry.data, entry.version, entry.size = data, version, size
+            entry.stored_at = time.monotonic()
+            self._entries.move_to_end(story_id)
+        else:
+            entry = _CacheEntry(data, version, size)
+            self._entries[story_id] = entry
+            if self.listen and subscribe is not None:
+                entry.unsubscribe = self._attach_listener(story_id, subscribe)
+        self._bytes += size
+
+        evicted.extend(self._evict())
+        return True
+
+    def invalidate(self, story_id: str) -> None:
+        """Drop a story and make in-flight reads of it stale"""
+        with self._lock:
+            self._clock += 1
+            self._invalidated_at[story_id] = self._clock
+            self._invalidated_at.move_to_end(story_id)
+            while len(self._invalidated_at) > _MAX_INVALIDATION_RECORDS:
+                _, forgotten = self._invalidated_at.popitem(last=False)
+                # Reads older than a forgotten invalidation are treated as stale
+                self._invalidation_floor = max(self._invalidation_floor, forgotten)
+            self._stats['invalidations'] += 1
+            unsubscribe = self._remove(story_id)
+        _detach(story_id, unsubscribe)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and memory usage"""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hit_ratio': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+                'listeners': sum(1 for e in self._entries.values() if e.unsubscribe is not None),
+            }
+
+    def _is_stale_read(self, story_id: str, read_token: int) -> bool:
+        if read_token <= self._invalidation_floor:
+            return True
+        return self._invalidated_at.get(story_id, 0) >= read_token
+
+    def _expired(self, entry: _CacheEntry) -> bool:
+        return (entry.unsubscribe is None and self.max_age > 0
+                and time.monotonic() - entry.stored_at > self.max_age)
+
+    def _evict(self) -> list:
+        """Evict least recently used stories; returns (story_id, unsubscribe) pairs to detach"""
+        evicted = []
+        while self._bytes > self.max_bytes and self._entries:
+            story_id = next(iter(self._entries))
+            evicted.append((story_id, self._remove(story_id)))
+            self._stats['evictions'] += 1
+        return evicted
+
+    def _remove(self, story_id: str) -> Optional[Callable[[], None]]:
+        """Drop an entry (caller holds the lock); returns its unsubscribe callable for _detach"""
+        entry = self._entries.pop(story_id, None)
+        if entry is None:
+            return None
+        self._bytes -= entry.size
+        return entry.unsubscribe
+
+    def _attach_listener(self, story_id: str, subscribe) -> Optional[Callable[[], None]]:
+        def on_change(data: Optional[Dict[str, Any]], version: Any) -> None:
+            if data is None or data.get('deleted'):
+                self.invalidate(story_id)
+                return
+            size = _estimate_size(data)
+            evicted = []
+            with self._lock:
+                if story_id in self._entries and size <= self.max_bytes:
+                    self._put(story_id, data, version, size, None, None, evicted)
+            for evicted_id, unsubscribe in evicted:
+                _detach(evicted_id, unsubscribe)
+
+        try:
+            return subscribe(on_change)
+        except Exception as e:
+            log.warning("⚠️ Failed to attach story cache listener for %s: %s", story_id, e)
+            return None
+
+
+def _detach(story_id: str, unsubscribe: Optional[Callable[[], None]]) -> None:
+    """Stop a removed entry's change listener (called without the cache lock held)"""
+    if unsubscribe is None:
+        return
+    try:
+        unsubscribe()
+    except Exception as e:
+        log.warning("⚠️ Failed to detach story cache listener for %s: %s", story_id, e)
+
+
+# Process-wide story document cache
+story_cache = StoryCache()
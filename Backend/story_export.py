@@ -0,0 +1,447 @@
+"""
+Server-side manuscript export (Markdown, plain text, EPUB).
+
+Exports are generated one chapter at a time: each chapter's HTML is run
+through a streaming HTML converter and emitted as soon as it is rendered, so
+the output is never assembled in memory. Output is deterministic for a given
+story version, which makes HTTP Range requests (resume) possible: a planning
+pass renders each part once to learn its size and the strong ETag, then a
+ranged response re-renders only the parts that overlap the requested range.
+
+EPUB files are written with a minimal ZIP writer (mimetype stored, chapters
+deflated) whose central directory is built from per-entry records kept during
+planning.
+"""
+
+import hashlib
+import re
+import struct
+import zlib
+from datetime import datetime
+from html import escape
+from html.parser import HTMLParser
+from typing import Optional, Dict, Any, List, Tuple, Iterator, Callable
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    'md': ('text/markdown; charset=utf-8', 'md'),
+    'txt': ('text/plain; charset=utf-8', 'txt'),
+    'epub': ('application/epub+zip', 'epub'),
+}
+
+DEFAULT_AUTHOR = 'Storynexis Writer'
+
+_BLOCK_TAGS = {'p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'ul', 'ol', 'pre'}
+# Tags kept (well-formed) in EPUB chapters
+_XHTML_TAGS = {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'strong', 'b', 'em', 'i', 'u', 's',
+               'blockquote', 'ul', 'ol', 'li', 'code', 'pre', 'sup', 'sub'}
+_XHTML_VOID_TAGS = {'br', 'hr'}
+_MARKDOWN_INLINE = {'strong': '**', 'b': '**', 'em': '*', 'i': '*', 's': '~~', 'code': '`'}
+_WHITESPACE = re.compile(r'\s+')
+_BLANK_LINES = re.compile(r'\n{3,}')
+_UNSAFE_FILENAME = re.compile(r'[^a-z0-9]', re.IGNORECASE)
+
+_EPUB_CSS = """body { font-family: 'Times New Roman', serif; margin: 5%; line-height: 1.5; text-align: justify; }
+h1, h2, h3 { text-align: center; margin-bottom: 1em; page-break-after: avoid; }
+p { margin-bottom: 1em; text-indent: 1.5em; }
+p:first-of-type { text-indent: 0; }
+"""
+
+
+class HtmlConverter(HTMLParser):
+    """
+    Converts editor HTML to Markdown, plain text or well-formed XHTML.
+
+    Args:
+        mode: 'md', 'txt' or 'xhtml'
+    """
+
+    def __init__(self, mode: str):
+        super().__init__(convert_charrefs=True)
+        self.mode = mode
+        self._out: List[str] = []
+        self._open: List[str] = []  # XHTML tags left open
+        self._lists: List[List[int]] = []  # Per open list: [is_ordered, next number]
+        self._quote_depth = 0
+
+    def convert(self, html: str) -> str:
+        self.feed(html or '')
+        self.close()
+        while self._open:
+            self._out.append(f"</{self._open.pop()}>")
+        text = ''.join(self._out)
+        self._out = []
+        if self.mode == 'xhtml':
+            return text
+        return _BLANK_LINES.sub('\n\n', text).strip() + '\n'
+
+    def _block_break(self) -> None:
+        if self._out and not ''.join(self._out[-2:]).endswith('\n\n'):
+            self._out.append('\n\n')
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if self.mode == 'xhtml':
+            if tag in _XHTML_VOID_TAGS:
+                self._out.append(f"<{tag}/>")
+            elif tag in _XHTML_TAGS:
+                self._out.append(f"<{tag}>")
+                self._open.append(tag)
+            return
+
+        if tag in ('ul', 'ol'):
+            self._lists.append([tag == 'ol', 1])
+        elif tag == 'blockquote':
+            self._quote_depth += 1
+        if tag in _BLOCK_TAGS and not (self._lists and tag == 'p'):
+            self._block_break()
+        if tag == 'br':
+            self._out.append('\n')
+        elif tag == 'hr':
+            self._block_break()
+            self._out.append('---' if self.mode == 'md' else '* * *')
+            self._block_break()
+        elif tag == 'li':
+            if self._out and not self._out[-1].endswith('\n'):
+                self._out.append('\n')
+            marker = '-'
+            if self._lists and self._lists[-1][0]:
+                marker = f"{self._lists[-1][1]}."
+                self._lists[-1][1] += 1
+            self._out.append(f"{'  ' * max(len(self._lists) - 1, 0)}{marker} ")
+        elif self.mode == 'md':
+            if tag.startswith('h') and tag[1:].isdigit():
+                self._out.append('#' * int(tag[1:]) + ' ')
+            elif tag in _MARKDOWN_INLINE:
+                self._out.append(_MARKDOWN_INLINE[tag])
+        if self.mode == 'md' and self._quote_depth and tag in ('p', 'div'):
+            self._out.append('> ' * self._quote_depth)
+
+    def handle_endtag(self, tag: str) -> None:
+        if self.mode == 'xhtml':
+            if tag in self._open:
+                # Close anything left open inside this element
+                while self._open:
+                    open_tag = self._open.pop()
+                    self._out.append(f"</{open_tag}>")
+                    if open_tag == tag:
+                        break
+            return
+
+        if tag in ('ul', 'ol') and self._lists:
+            self._lists.pop()
+        elif tag == 'blockquote' and self._quote_depth:
+            self._quote_depth -= 1
+        if self.mode == 'md' and tag in _MARKDOWN_INLINE:
+            self._out.append(_MARKDOWN_INLINE[tag])
+        if tag in _BLOCK_TAGS and not (self._lists and tag == 'p'):
+            self._block_break()
+
+    def handle_data(self, data: str) -> None:
+        if self.mode == 'xhtml':
+            self._out.append(escape(data, quote=False))
+        else:
+            text = _WHITESPACE.sub(' ', data)
+            if not self._out or self._out[-1].endswith('\n'):
+                text = text.lstrip()
+            if text:
+                self._out.append(text)
+
+
+def export_filename(title: str, fmt: str) -> str:
+    """Download filename, e.g. 'my_story.epub' (same scheme as the browser export)"""
+    safe_title = _UNSAFE_FILENAME.sub('_', title or '').lower() or 'story'
+    return f"{safe_title}.{EXPORT_FORMATS[fmt][1]}"
+
+
+def _dos_datetime(timestamp: Optional[str]) -> Tuple[int, int]:
+    """ZIP (MS-DOS) time and date for an ISO timestamp"""
+    try:
+        moment = datetime.fromisoformat(timestamp) if timestamp else datetime(1980, 1, 1)
+    except ValueError:
+        moment = datetime(1980, 1, 1)
+    moment = max(moment.replace(tzinfo=None), datetime(1980, 1, 1))
+    dos_time = (moment.hour << 11) | (moment.minute << 5) | (moment.second // 2)
+    dos_date = ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day
+    return dos_time, dos_date
+
+
+class StoryExport:
+    """
+    A story rendered in one export format, produced part by part.
+
+    Args:
+        story_id: Story document ID (used as the EPUB identifier)
+        story: Story document
+        fmt: 'md', 'txt' or 'epub'
+        author: Author name for title pages and EPUB metadata
+    """
+
+    def __init__(self, story_id: str, story: Dict[str, Any], fmt: str, author: Optional[str] = None):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format '{fmt}'")
+        self.story_id = story_id
+        self.fmt = fmt
+        self.title = story.get('title') or 'Untitled Story'
+        self.genre = story.get('genre') or ''
+        self.author = author or DEFAULT_AUTHOR
+        self.modified = (story.get('metadata') or {}).get('updatedAt') or ''
+
+        chapters = sorted(story.get('chapters') or [], key=lambda ch: ch.get('order', 0))
+        if chapters:
+            self.sections = [
+                (chapter.get('title') or f"Chapter {index + 1}", chapter.get('content') or '')
+                for index, chapter in enumerate(chapters)
+            ]
+        else:
+            self.sections = [(self.title, story.get('content') or '')]
+
+        self.media_type = EXPORT_FORMATS[fmt][0]
+        self.filename = export_filename(self.title, fmt)
+        self.size: Optional[int] = None
+        self.etag: Optional[str] = None
+        self._part_sizes: List[int] = []
+        self._zip_entries: Dict[int, Tuple[bytes, int, int, int, int, int]] = {}
+
+    # Planning and streaming
+
+    def plan(self) -> None:
+        """Render every part once to learn part sizes, total size and ETag"""
+        digest = hashlib.blake2b(digest_size=16)
+        sizes = []
+        for render in self._parts():
+            part = render()
+            digest.update(part)
+            sizes.append(len(part))
+        self._part_sizes = sizes
+        self.size = sum(sizes)
+        self.etag = f'"{digest.hexdigest()}"'
+
+    def iter_bytes(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Yield the bytes in [start, end] (inclusive), rendering only the parts
+        that overlap the range. Requires plan() for ranges other than the whole file.
+        """
+        offset = 0
+        for index, render in enumerate(self._parts()):
+            part_size = self._part_sizes[index] if index < len(self._part_sizes) else None
+            if part_size is not None and offset + part_size <= start:
+                offset += part_size
+                continue
+            if end is not None and offset > end:
+                return
+            part = render()
+            lo = max(start - offset, 0)
+            hi = len(part) if end is None else min(end - offset + 1, len(part))
+            if hi > lo:
+                yield part[lo:hi]
+            offset += len(part)
+
+    def _parts(self) -> Iterator[Callable[[], bytes]]:
+        if self.fmt == 'epub':
+            return self._epub_parts()
+        return self._text_parts()
+
+    # Markdown / plain text
+
+    def _text_parts(self) -> Iterator[Callable[[], bytes]]:
+        markdown = self.fmt == 'md'
+
+        def front_matter() -> bytes:
+            if markdown:
+                lines = [f"# {self.title}", '', f"*By {self.author}*"]
+                if self.genre:
+                    lines += ['', f"*{self.genre}*"]
+            else:
+                lines = [self.title, '=' * len(self.title), '', f"By {self.author}"]
+                if self.genre:
+                    lines += [self.genre]
+            return ('\n'.join(lines) + '\n').encode('utf-8')
+
+        yield front_matter
+
+        for chapter_title, html in self.sections:
+            def render(chapter_title=chapter_title, html=html) -> bytes:
+                body = HtmlConverter(self.fmt).convert(html)
+                heading = f"## {chapter_title}" if markdown else f"{chapter_title}\n{'-' * len(chapter_title)}"
+                return f"\n\n{heading}\n\n{body}".encode('utf-8')
+            yield render
+
+    # EPUB
+
+    def _epub_parts(self) -> Iterator[Callable[[], bytes]]:
+        files: List[Tuple[str, Callable[[], bytes], bool]] = [
+            ('mimetype', lambda: b'application/epub+zip', False),
+            ('META-INF/container.xml', self._container_xml, True),
+            ('OEBPS/styles.css', lambda: _EPUB_CSS.encode('utf-8'), True),
+            ('OEBPS/content.opf', self._content_opf, True),
+            ('OEBPS/toc.ncx', self._toc_ncx, True),
+            ('OEBPS/nav.xhtml', self._nav_xhtml, True),
+        ]
+        for number, (chapter_title, html) in enumerate(self.sections, start=1):
+            files.append((
+                f"OEBPS/chapter{number}.xhtml",
+                lambda chapter_title=chapter_title, html=html: self._chapter_xhtml(chapter_title, html),
+                True
+            ))
+
+        # Entries are recorded when rendered; parts skipped by a ranged read
+        # were recorded by plan(), so offsets are always known here
+        offset = 0
+        for index, (name, render, compress) in enumerate(files):
+            yield lambda index=index, name=name, render=render, compress=compress, offset=offset: \
+                self._zip_entry(index, name, render(), compress, offset)
+            offset += self._local_entry_size(index)
+        yield lambda count=len(files): self._zip_central_directory(count)
+
+    def _local_entry_size(self, index: int) -> int:
+        name, _, _, compressed_size, _, _ = self._zip_entries[index]
+        return 30 + len(name) + compressed_size
+
+    def _zip_entry(self, index: int, name: str, data: bytes, compress: bool, offset: int) -> bytes:
+        """Local file header + data; the entry is recorded for the central directory"""
+        crc = zlib.crc32(data)
+        if compress:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            payload = compressor.compress(data) + compressor.flush()
+            method = 8
+        else:
+            payload = data
+            method = 0
+        encoded_name = name.encode('utf-8')
+        dos_time, dos_date = _dos_datetime(self.modified)
+        header = struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, 20, 0, method, dos_time, dos_date,
+            crc, len(payload), len(data), len(encoded_name), 0
+        )
+        self._zip_entries[index] = (encoded_name, method, crc, len(payload), len(data), offset)
+        return header + encoded_name + payload
+
+    def _zip_central_directory(self, count: int) -> bytes:
+        dos_time, dos_date = _dos_datetime(self.modified)
+        records = []
+        directory_offset = 0
+        for index in range(count):
+            name, method, crc, compressed_size, size, offset = self._zip_entries[index]
+            records.append(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014b50, 20, 20, 0, method, dos_time, dos_date,
+                crc, compressed_size, size, len(name), 0, 0, 0, 0, 0, offset
+            ) + name)
+            directory_offset = offset + 30 + len(name) + compressed_size
+        directory = b''.join(records)
+        end_record = struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0, count, count, len(directory), directory_offset, 0
+        )
+        return directory + end_record
+
+    def _container_xml(self) -> bytes:
+        return b"""<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>"""
+
+    def _content_opf(self) -> bytes:
+        numbers = range(1, len(self.sections) + 1)
+        manifest = '\n    '.join(
+            f'<item id="ch{n}" href="chapter{n}.xhtml" media-type="application/xhtml+xml"/>' for n in numbers
+        )
+        spine = '\n    '.join(f'<itemref idref="ch{n}"/>' for n in numbers)
+        modified = (self.modified or '1980-01-01T00:00:00').split('.')[0] + 'Z'
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" unique-identifier="BookID" version="3.0">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">
+    <dc:title>{escape(self.title)}</dc:title>
+    <dc:creator>{escape(self.author)}</dc:creator>
+    <dc:language>en</dc:language>
+    <dc:identifier id="BookID">urn:storynexis:{escape(self.story_id)}</dc:identifier>
+    <meta property="dcterms:modified">{modified}</meta>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+    {manifest}
+    <item id="css" href="styles.css" media-type="text/css"/>
+    <item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>
+  </manifest>
+  <spine toc="ncx">
+    {spine}
+  </spine>
+</package>""".encode('utf-8')
+
+    def _toc_ncx(self) -> bytes:
+        nav_points = '\n    '.join(
+            f'<navPoint id="navPoint-{n}" playOrder="{n}"><navLabel><text>{escape(chapter_title)}</text></navLabel>'
+            f'<content src="chapter{n}.xhtml"/></navPoint>'
+            for n, (chapter_title, _) in enumerate(self.sections, start=1)
+        )
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">
+  <head>
+    <meta name="dtb:uid" content="urn:storynexis:{escape(self.story_id)}"/>
+    <meta name="dtb:depth" content="1"/>
+    <meta name="dtb:totalPageCount" content="0"/>
+    <meta name="dtb:maxPageNumber" content="0"/>
+  </head>
+  <docTitle><text>{escape(self.title)}</text></docTitle>
+  <navMap>
+    {nav_points}
+  </navMap>
+</ncx>""".encode('utf-8')
+
+    def _nav_xhtml(self) -> bytes:
+        items = '\n      '.join(
+            f'<li><a href="chapter{n}.xhtml">{escape(chapter_title)}</a></li>'
+            for n, (chapter_title, _) in enumerate(self.sections, start=1)
+        )
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" xml:lang="en" lang="en">
+<head><title>{escape(self.title)}</title></head>
+<body>
+  <nav epub:type="toc">
+    <ol>
+      {items}
+    </ol>
+  </nav>
+</body>
+</html>""".encode('utf-8')
+
+    def _chapter_xhtml(self, chapter_title: str, html: str) -> bytes:
+        body = HtmlConverter('xhtml').convert(html)
+        return f"""<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" xml:lang="en" lang="en">
+<head>
+  <title>{escape(chapter_title)}</title>
+  <link rel="stylesheet" type="text/css" href="styles.css"/>
+</head>
+<body>
+  <h2>{escape(chapter_title)}</h2>
+  {body}
+</body>
+</html>""".encode('utf-8')
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range 'bytes=' header into an inclusive (start, end).
+
+    Returns None when the header is absent or not a single byte range (the
+    full body is sent). Raises ValueError for unsatisfiable ranges.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start_text, _, end_text = header[len('bytes='):].strip().partition('-')
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return start, min(end, size - 1)
@@ -0,0 +1,467 @@
+"""
+Revision history for stories and chapters.
+
+Every save can record a revision of the story's text (title, legacy content,
+chapter list and chapter contents). Revisions are stored as periodic full
+snapshots plus compact deltas against the previous revision:
+- Only changed fields are stored; changed text is diffed at sentence/tag
+  granularity and kept as copy/skip/insert operations.
+- Payloads are zlib-compressed JSON.
+- Every REVISION_SNAPSHOT_INTERVAL-th revision in a chain is a full snapshot,
+  so reconstructing any revision applies at most that many deltas.
+
+Saves closer together than REVISION_MIN_INTERVAL_SECONDS are folded into the
+latest revision in memory instead of adding a new one; the folded revision is
+written once when its window closes (or before anything reads or extends the
+history, or on shutdown), so a burst of saves costs one revision write. A
+hard crash loses at most the folds of one window. Compaction thins old
+revisions (keeping labelled checkpoints and one revision per day) and caps
+the count per story, re-encoding survivors so chains stay valid.
+"""
+
+import difflib
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+
+from storage_backend import get_storage, RevisionExists
+
+log = logging.getLogger(__name__)
+
+# Maximum deltas between two full snapshots (bounds reconstruction cost)
+REVISION_SNAPSHOT_INTERVAL = int(os.getenv('REVISION_SNAPSHOT_INTERVAL', '20'))
+# Saves within this window of the latest revision update it in place
+REVISION_MIN_INTERVAL_SECONDS = float(os.getenv('REVISION_MIN_INTERVAL_SECONDS', '60'))
+# Newest revisions always kept by compaction
+REVISION_KEEP_RECENT = int(os.getenv('REVISION_KEEP_RECENT', '50'))
+# Hard cap on revisions per story
+REVISION_MAX_PER_STORY = int(os.getenv('REVISION_MAX_PER_STORY', '200'))
+# Run compaction every N new revisions of a story
+REVISION_COMPACT_EVERY = int(os.getenv('REVISION_COMPACT_EVERY', '25'))
+# Stories whose latest revision is kept in memory for delta encoding
+REVISION_TIP_CACHE_STORIES = int(os.getenv('REVISION_TIP_CACHE_STORIES', '128'))
+
+# Revision fields returned by listings (everything except the payload)
+REVISION_FIELDS = ('number', 'kind', 'base', 'depth', 'createdAt', 'updatedAt',
+                   'label', 'wordCount', 'size', 'changedChapters')
+
+# Sentence / tag sized segments used as the diff unit
+_SEGMENT = re.compile(r'[^>.!?\n]*[>.!?\n]+|[^>.!?\n]+')
+
+CHAPTER_PREFIX = 'chapter/'
+
+State = Dict[str, str]
+
+
+# State encoding
+
+def story_state(story: Dict[str, Any]) -> State:
+    """Flatten the versioned parts of a story into named text fields"""
+    state = {'title': story.get('title') or ''}
+    chapters = story.get('chapters') or []
+    if chapters:
+        outline = [
+            {key: chapter.get(key) for key in ('id', 'title', 'order', 'status')}
+            for chapter in chapters
+        ]
+        state['chapters'] = json.dumps(outline, separators=(',', ':'))
+        for chapter in chapters:
+            state[f"{CHAPTER_PREFIX}{chapter.get('id')}"] = chapter.get('content') or ''
+    else:
+        state['content'] = story.get('content') or ''
+    return state
+
+
+def state_to_story(state: State) -> Dict[str, Any]:
+    """Inverse of story_state: title plus either chapters or legacy content"""
+    story: Dict[str, Any] = {'title': state.get('title', '')}
+    if 'chapters' in state:
+        chapters = []
+        for chapter in json.loads(state['chapters']):
+            chapter['content'] = state.get(f"{CHAPTER_PREFIX}{chapter.get('id')}", '')
+            chapters.append(chapter)
+        story['chapters'] = chapters
+        story['content'] = chapters[0]['content'] if chapters else ''
+    else:
+        story['content'] = state.get('content', '')
+    return story
+
+
+def diff_text(old: str, new: str):
+    """
+    Encode new text relative to old text.
+
+    Returns either the new text itself, or a list of operations over old's
+    segments: positive int = copy that many, negative int = skip that many,
+    str = insert. Whichever is smaller is returned.
+    """
+    old_segments = _SEGMENT.findall(old)
+    new_segments = _SEGMENT.findall(new)
+    matcher = difflib.SequenceMatcher(None, old_segments, new_segments, autojunk=False)
+    ops: List[Any] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(''.join(new_segments[j1:j2]))
+    encoded_size = sum(len(op) if isinstance(op, str) else 4 for op in ops)
+    return ops if encoded_size < len(new) else new
+
+
+def patch_text(old: str, ops) -> str:
+    """Apply diff_text output to old text"""
+    if isinstance(ops, str):
+        return ops
+    segments = _SEGMENT.findall(old)
+    out = []
+    cursor = 0
+    for op in ops:
+        if isinstance(op, str):
+            out.append(op)
+        elif op > 0:
+            out.extend(segments[cursor:cursor + op])
+            cursor += op
+        else:
+            cursor -= op
+    return ''.join(out)
+
+
+def diff_states(old: State, new: State) -> Dict[str, Any]:
+    """Delta between two states: changed fields and removed field names"""
+    changed = {}
+    for key, text in new.items():
+        previous = old.get(key)
+        if previous == text:
+            continue
+        changed[key] = text if previous is None else diff_text(previous, text)
+    removed = [key for key in old if key not in new]
+    return {'set': changed, 'del': removed}
+
+
+def patch_state(old: State, delta: Dict[str, Any]) -> State:
+    state = {key: text for key, text in old.items() if key not in delta.get('del', ())}
+    for key, ops in delta.get('set', {}).items():
+        state[key] = patch_text(old.get(key, ''), ops)
+    return state
+
+
+def _pack(payload: Any) -> bytes:
+    return zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def _unpack(payload: bytes) -> Any:
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+
+def _changed_chapters(old: State, new: State) -> List[str]:
+    keys = {key for key in new if old.get(key) != new[key]} | {key for key in old if key not in new}
+    return sorted(key[len(CHAPTER_PREFIX):] for key in keys if key.startswith(CHAPTER_PREFIX))
+
+
+class _Tip:
+    """Latest revision of a story, with the state of its base for in-place updates"""
+    __slots__ = ('meta', 'state', 'base_state', 'dirty')
+
+    def __init__(self, meta: Dict[str, Any], state: State, base_state: Optional[State], dirty: bool = False):
+        self.meta = meta
+        self.state = state
+        self.base_state = base_state
+        self.dirty = dirty  # Folded saves not yet written to storage
+
+
+class RevisionHistory:
+    """
+    Records and reconstructs story revisions through the storage backend.
+
+    Args:
+        snapshot_interval: Maximum delta chain length
+        min_interval_seconds: Saves closer than this update the latest revision
+    """
+
+    def __init__(
+        self,
+        snapshot_interval: int = REVISION_SNAPSHOT_INTERVAL,
+        min_interval_seconds: float = REVISION_MIN_INTERVAL_SECONDS
+    ):
+        self.snapshot_interval = max(1, snapshot_interval)
+        self.min_interval = timedelta(seconds=min_interval_seconds)
+        self._tips: "OrderedDict[str, _Tip]" = OrderedDict()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._timers: Dict[str, threading.Timer] = {}
+
+    def _lock(self, story_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(story_id, threading.Lock())
+
+    # Recording
+
+    def record(
+        self,
+        story_id: str,
+        story: Dict[str, Any],
+        label: Optional[str] = None,
+        force: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Record the story's current text as a revision.
+
+        Args:
+            story_id: Story document ID
+            story: Story document after the save
+            label: Optional checkpoint name (labelled revisions survive thinning)
+            force: Always add a new revision (explicit checkpoints)
+
+        Returns:
+            Metadata of the revision written or updated, None if unchanged
+        """
+        state = story_state(story)
+        word_count = (story.get('metadata') or {}).get('wordCount', 0)
+        with self._lock(story_id):
+            for attempt in range(2):
+                try:
+                    return self._record(story_id, state, word_count, label, force)
+                except RevisionExists:
+                    # Another server instance appended first; reload the tip
+                    self._tips.pop(story_id, None)
+                    if attempt:
+                        raise
+
+    def _record(self, story_id: str, state: State, word_count: int,
+                label: Optional[str], force: bool) -> Optional[Dict[str, Any]]:
+        storage = get_storage()
+        tip = self._load_tip(story_id)
+        now = datetime.utcnow()
+
+        if tip is not None and not force:
+            if tip.state == state:
+                return None
+            opened_at = datetime.fromisoformat(tip.meta['createdAt'])
+            if not tip.meta.get('label') and now - opened_at < self.min_interval:
+                return self._fold_into_tip(story_id, tip, state, word_count, now, opened_at)
+
+        # The new revision is encoded against the tip, so the tip must be stored first
+        if tip is not None:
+            self._persist_tip(story_id, tip)
+
+        if tip is None or tip.meta['depth'] + 1 >= self.snapshot_interval:
+            kind, depth, payload = 'snapshot', 0, state
+        else:
+            kind, depth, payload = 'delta', tip.meta['depth'] + 1, diff_states(tip.state, state)
+        packed = _pack(payload)
+        meta = {
+            'number': tip.meta['number'] + 1 if tip else 1,
+            'kind': kind,
+            'base': tip.meta['number'] if tip else None,
+            'depth': depth,
+            'createdAt': now.isoformat(),
+            'updatedAt': now.isoformat(),
+            'label': label,
+            'wordCount': word_count,
+            'size': len(packed),
+            'changedChapters': _changed_chapters(tip.state if tip else {}, state),
+        }
+        storage.create_revision(story_id, {**meta, 'payload': packed})
+        self._remember(story_id, _Tip(meta, state, tip.state if tip else None))
+
+        if meta['number'] % REVISION_COMPACT_EVERY == 0:
+            self._compact(story_id)
+        return meta
+
+    def _fold_into_tip(self, story_id: str, tip: _Tip, state: State, word_count: int,
+                       now: datetime, opened_at: datetime) -> Dict[str, Any]:
+        """Make the latest revision hold the new state (written when its window closes)"""
+        meta = {
+            **tip.meta,
+            'updatedAt': now.isoformat(),
+            'wordCount': word_count,
+            'changedChapters': _changed_chapters(tip.base_state or {}, state),
+        }
+        self._remember(story_id, _Tip(meta, state, tip.base_state, dirty=True))
+        if story_id not in self._timers:
+            delay = max((opened_at + self.min_interval - now).total_seconds(), 0.0)
+            timer = threading.Timer(delay, self._flush_after_window, args=(story_id,))
+            timer.daemon = True
+            self._timers[story_id] = timer
+            timer.start()
+        return meta
+
+    def _persist_tip(self, story_id: str, tip: _Tip) -> None:
+        """Re-encode and write the latest revision if saves were folded into it. Caller holds the story lock."""
+        timer = self._timers.pop(story_id, None)
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+        if not tip.dirty:
+            return
+        if tip.meta['kind'] == 'snapshot' or tip.base_state is None:
+            payload = tip.state
+        else:
+            payload = diff_states(tip.base_state, tip.state)
+        packed = _pack(payload)
+        tip.meta = {**tip.meta, 'size': len(packed)}
+        get_storage().write_revisions(story_id, [{**tip.meta, 'payload': packed}], [])
+        tip.dirty = False
+
+    def _flush_after_window(self, story_id: str) -> None:
+        try:
+            self.flush(story_id)
+        except Exception as e:
+            log.warning("⚠️ Failed to write folded revision of story %s: %s", story_id, e)
+
+    def flush(self, story_id: str) -> None:
+        """Write the story's folded saves now, if any"""
+        with self._lock(story_id):
+            tip = self._tips.get(story_id)
+            if tip is not None:
+                self._persist_tip(story_id, tip)
+
+    def flush_all(self) -> int:
+        """Write every story's folded saves (used on graceful shutdown). Returns stories written."""
+        story_ids = [story_id for story_id, tip in list(self._tips.items()) if tip.dirty]
+        for story_id in story_ids:
+            try:
+                self.flush(story_id)
+            except Exception as e:
+                log.error("❌ Failed to write folded revision of story %s during shutdown: %s", story_id, e)
+        return len(story_ids)
+
+    def _remember(self, story_id: str, tip: _Tip) -> None:
+        self._tips[story_id] = tip
+        self._tips.move_to_end(story_id)
+        # Tips with unwritten folds stay until their window's flush
+        evictable = (key for key, cached in list(self._tips.items()) if not cached.dirty)
+        while len(self._tips) > REVISION_TIP_CACHE_STORIES:
+            key = next(evictable, None)
+            if key is None:
+                break
+            del self._tips[key]
+
+    def _load_tip(self, story_id: str) -> Optional[_Tip]:
+        tip = self._tips.get(story_id)
+        if tip is not None:
+            self._tips.move_to_end(story_id)
+            return tip
+        metas = get_storage().list_revisions(story_id)
+        if not metas:
+            return None
+        latest = metas[-1].data
+        states = self._reconstruct_chain({m.data['number']: m.data for m in metas}, story_id, latest['number'])
+        tip = _Tip(latest, states[-1], states[-2] if len(states) > 1 else None)
+        self._remember(story_id, tip)
+        return tip
+
+    # Reading
+
+    def list_revisions(self, story_id: str, chapter_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Revision metadata, newest first, optionally only those touching a chapter"""
+        self.flush(story_id)
+        metas = [doc.data for doc in get_storage().list_revisions(story_id)]
+        if chapter_id is not None:
+            metas = [m for m in metas if chapter_id in (m.get('changedChapters') or [])]
+        return list(reversed(metas))
+
+    def reconstruct(self, story_id: str, number: int) -> Optional[Tuple[Dict[str, Any], State]]:
+        """Metadata and full state of a revision, or None if it does not exist"""
+        self.flush(story_id)
+        metas = {doc.data['number']: doc.data for doc in get_storage().list_revisions(story_id)}
+        if number not in metas:
+            return None
+        return metas[number], self._reconstruct_chain(metas, story_id, number)[-1]
+
+    def _reconstruct_chain(self, metas: Dict[int, Dict[str, Any]], story_id: str, number: int) -> List[State]:
+        """States from the nearest snapshot up to `number` (at most snapshot_interval deltas)"""
+        chain = [number]
+        while metas[chain[-1]]['kind'] != 'snapshot':
+            chain.append(metas[chain[-1]]['base'])
+        chain.reverse()
+
+        docs = {doc.data['number']: doc.data for doc in get_storage().get_revisions(story_id, chain)}
+        states: List[State] = []
+        for revision_number in chain:
+            payload = _unpack(docs[revision_number]['payload'])
+            states.append(payload if not states else patch_state(states[-1], payload))
+        return states
+
+    # Retention
+
+    def _select_retained(self, metas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Newest REVISION_KEEP_RECENT, labelled checkpoints and the last revision of each day"""
+        recent = metas[-REVISION_KEEP_RECENT:] if REVISION_KEEP_RECENT > 0 else []
+        older = metas[:len(metas) - len(recent)]
+        last_of_day: Dict[str, int] = {}
+        for meta in older:
+            last_of_day[meta['updatedAt'][:10]] = meta['number']
+        keep_numbers = set(last_of_day.values()) | {m['number'] for m in older if m.get('label')}
+        kept = [m for m in older if m['number'] in keep_numbers] + recent
+        return kept[-REVISION_MAX_PER_STORY:]
+
+    def compact(self, story_id: str) -> Dict[str, int]:
+        """Apply the retention policy to one story. Returns counts."""
+        with self._lock(story_id):
+            return self._compact(story_id)
+
+    def _compact(self, story_id: str) -> Dict[str, int]:
+        storage = get_storage()
+        tip = self._tips.get(story_id)
+        if tip is not None:
+            self._persist_tip(story_id, tip)
+        metas = [doc.data for doc in storage.list_revisions(story_id)]
+        kept = self._select_retained(metas)
+        kept_numbers = {m['number'] for m in kept}
+        dropped = [m['number'] for m in metas if m['number'] not in kept_numbers]
+        if not dropped:
+            return {'kept': len(kept), 'dropped': 0, 'rewritten': 0}
+
+        # Replay every revision in order; survivors whose base was dropped are
+        # re-encoded against the previous survivor (or become snapshots)
+        docs = storage.get_revisions(story_id, [m['number'] for m in metas])
+        rewrites = []
+        state: State = {}
+        previous_kept: Optional[Tuple[Dict[str, Any], State]] = None
+        for doc in docs:
+            revision = doc.data
+            payload = _unpack(revision['payload'])
+            state = payload if revision['kind'] == 'snapshot' else patch_state(state, payload)
+            if revision['number'] not in kept_numbers:
+                continue
+
+            meta = {k: revision.get(k) for k in REVISION_FIELDS}
+            base_kept = previous_kept is not None and previous_kept[0]['number'] == revision['base']
+            if revision['kind'] == 'delta' and not base_kept:
+                if previous_kept is None or previous_kept[0]['depth'] + 1 >= self.snapshot_interval:
+                    meta.update(kind='snapshot', base=None, depth=0)
+                    new_payload: Any = state
+                else:
+                    meta.update(base=previous_kept[0]['number'], depth=previous_kept[0]['depth'] + 1)
+                    new_payload = diff_states(previous_kept[1], state)
+                    meta['changedChapters'] = _changed_chapters(previous_kept[1], state)
+                packed = _pack(new_payload)
+                meta['size'] = len(packed)
+                rewrites.append({**meta, 'payload': packed})
+            previous_kept = (meta, state)
+
+        storage.write_revisions(story_id, rewrites, dropped)
+        self._tips.pop(story_id, None)
+        log.info("🗜️ Compacted history of story %s: dropped %s, re-encoded %s", story_id, len(dropped), len(rewrites))
+        return {'kept': len(kept), 'dropped': len(dropped), 'rewritten': len(rewrites)}
+
+    def forget(self, story_id: str) -> None:
+        """Drop in-memory state for a deleted story (storage is reaped separately)"""
+        with self._lock(story_id):
+            timer = self._timers.pop(story_id, None)
+            if timer is not None:
+                timer.cancel()
+            self._tips.pop(story_id, None)
+
+
+# Process-wide revision history
+revision_history = RevisionHistory()
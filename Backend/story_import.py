@@ -0,0 +1,219 @@
+"""
+Streaming manuscript import (.txt, .md, .docx).
+
+Uploaded files are read incrementally (line by line for text, paragraph by
+paragraph from word/document.xml for .docx) and split into chapters on
+headings in a single pass. Each section is yielded as (title, html) as soon
+as the next heading is seen, so only the chapter being built is in memory.
+
+Headings are detected from:
+- Markdown '#' / '##' headings
+- Word 'Title' / 'Heading 1' / 'Heading 2' paragraph styles
+- Lines like 'Chapter 12', 'CHAPTER TWELVE: The Storm', 'Prologue', 'Part II'
+- The editor's '--- Chapter N: Title ---' markers
+"""
+
+import io
+import os
+import re
+import zipfile
+from html import escape
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+from xml.etree.ElementTree import iterparse, ParseError
+
+IMPORT_EXTENSIONS = ('.txt', '.md', '.markdown', '.docx')
+
+# Largest accepted upload on backends without a document size limit (SQLite)
+IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', str(20 * 1024 * 1024)))
+# Share of a size-limited story document (Firestore: 1 MiB) a manuscript may
+# fill; the rest is left for chapter metadata and field names
+IMPORT_DOCUMENT_FILL = 0.9
+# Chapters are written to storage whenever this much content is pending
+IMPORT_BATCH_BYTES = int(os.getenv('IMPORT_BATCH_BYTES', str(256 * 1024)))
+
+_MARKDOWN_HEADING = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+_NUMBER_WORD = (
+    r'(?:one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|thirteen|fourteen|'
+    r'fifteen|sixteen|seventeen|eighteen|nineteen|twenty|thirty|forty|fifty|sixty|seventy|'
+    r'eighty|ninety|hundred)'
+)
+# 'Chapter 12', 'CHAPTER TWENTY-ONE: The Storm', 'Part IV - Home', 'Prologue'
+_CHAPTER_LINE = re.compile(
+    r'^(?:(?:chapter|part|book)\s+(?:\d+|[ivxlcdm]+|' + _NUMBER_WORD + r'(?:[\s-]' + _NUMBER_WORD + r')*)'
+    r'|prologue|epilogue|interlude)\.?(?:\s*[:.\-–—]\s*.{1,80})?$',
+    re.IGNORECASE
+)
+_EDITOR_MARKER = re.compile(r'^\s*---\s*Chapter\s+\d+:\s*(.*?)\s*---\s*$')
+_BOLD = re.compile(r'\*\*(.+?)\*\*|__(.+?)__')
+_ITALIC = re.compile(r'(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?!\w)|(?<![\w_])_(?!\s)(.+?)(?<!\s)_(?!\w)')
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_CHAPTER_STYLES = {'title', 'heading1', 'heading2'}
+
+Section = Tuple[str, str]
+
+
+def _inline_markdown(text: str) -> str:
+    html = escape(text, quote=False)
+    html = _BOLD.sub(lambda m: f"<strong>{m.group(1) or m.group(2)}</strong>", html)
+    return _ITALIC.sub(lambda m: f"<em>{m.group(1) or m.group(2)}</em>", html)
+
+
+def _chapter_heading(line: str, markdown: bool) -> Optional[str]:
+    """Chapter title if the line starts a new chapter"""
+    marker = _EDITOR_MARKER.match(line)
+    if marker:
+        return marker.group(1) or 'Untitled Chapter'
+    if markdown:
+        heading = _MARKDOWN_HEADING.match(line)
+        if heading and len(heading.group(1)) <= 2:
+            return heading.group(2)
+    if _CHAPTER_LINE.match(line):
+        return line.strip()
+    return None
+
+
+class _SectionBuilder:
+    """Collects paragraphs of the current chapter and emits finished sections"""
+
+    def __init__(self, default_title: str):
+        self.default_title = default_title
+        self.title: Optional[str] = None
+        self.blocks: List[str] = []
+
+    def start(self, title: str) -> Optional[Section]:
+        finished = self.finish()
+        self.title = title
+        return finished
+
+    def add(self, html_block: str) -> None:
+        self.blocks.append(html_block)
+
+    def finish(self) -> Optional[Section]:
+        if not self.blocks:
+            # Headings with no text (e.g. a title page) merge into the next chapter
+            return None
+        section = (self.title or self.default_title, ''.join(self.blocks))
+        self.title = None
+        self.blocks = []
+        return section
+
+
+def iter_text_sections(lines: Iterator[str], markdown: bool = False,
+                       default_title: str = 'Chapter 1') -> Iterator[Section]:
+    """
+    Split plain text / Markdown into chapters.
+
+    Paragraphs are separated by blank lines; hard-wrapped lines within a
+    paragraph are joined. Text before the first heading becomes its own
+    section titled default_title.
+    """
+    builder = _SectionBuilder(default_title)
+    paragraph: List[str] = []
+
+    def end_paragraph() -> None:
+        if paragraph:
+            text = ' '.join(paragraph)
+            builder.add(f"<p>{_inline_markdown(text) if markdown else escape(text, quote=False)}</p>")
+            paragraph.clear()
+
+    for raw_line in lines:
+        line = raw_line.rstrip('\r\n')
+        stripped = line.strip()
+        if not stripped:
+            end_paragraph()
+            continue
+
+        title = _chapter_heading(stripped, markdown)
+        if title is not None:
+            end_paragraph()
+            finished = builder.start(title)
+            if finished:
+                yield finished
+            continue
+
+        if markdown:
+            heading = _MARKDOWN_HEADING.match(stripped)
+            if heading:
+                end_paragraph()
+                level = len(heading.group(1))
+                builder.add(f"<h{level}>{_inline_markdown(heading.group(2))}</h{level}>")
+                continue
+            if stripped in ('---', '***', '* * *'):
+                end_paragraph()
+                builder.add('<hr>')
+                continue
+        paragraph.append(stripped)
+
+    end_paragraph()
+    finished = builder.finish()
+    if finished:
+        yield finished
+
+
+def iter_docx_sections(file: BinaryIO, default_title: str = 'Chapter 1') -> Iterator[Section]:
+    """
+    Split a .docx manuscript into chapters.
+
+    word/document.xml is parsed incrementally; each paragraph element is
+    cleared after it is converted. Bold and italic runs are kept.
+    """
+    try:
+        yield from _iter_docx_sections(file, _SectionBuilder(default_title))
+    except (zipfile.BadZipFile, KeyError, ParseError) as e:
+        raise ValueError(f"Not a valid .docx file: {e}")
+
+
+def _iter_docx_sections(file: BinaryIO, builder: _SectionBuilder) -> Iterator[Section]:
+    with zipfile.ZipFile(file) as archive, archive.open('word/document.xml') as document:
+        for _, element in iterparse(document, events=('end',)):
+            if element.tag != f"{_W}p":
+                continue
+
+            style = element.find(f"{_W}pPr/{_W}pStyle")
+            style_name = (style.get(f"{_W}val", '') if style is not None else '').replace(' ', '').lower()
+
+            plain_parts = []
+            html_parts = []
+            for run in element.iter(f"{_W}r"):
+                text = ''.join(
+                    node.text or '' if node.tag == f"{_W}t" else '\n'
+                    for node in run if node.tag in (f"{_W}t", f"{_W}br")
+                )
+                if not text:
+                    continue
+                plain_parts.append(text)
+                html = escape(text, quote=False).replace('\n', '<br>')
+                properties = run.find(f"{_W}rPr")
+                if properties is not None:
+                    if properties.find(f"{_W}b") is not None:
+                        html = f"<strong>{html}</strong>"
+                    if properties.find(f"{_W}i") is not None:
+                        html = f"<em>{html}</em>"
+                html_parts.append(html)
+            element.clear()
+
+            plain = ''.join(plain_parts).strip()
+            if not plain:
+                continue
+            if style_name in _CHAPTER_STYLES or _chapter_heading(plain, markdown=False) is not None:
+                finished = builder.start(_chapter_heading(plain, markdown=False) or plain)
+                if finished:
+                    yield finished
+            else:
+                builder.add(f"<p>{''.join(html_parts)}</p>")
+
+    finished = builder.finish()
+    if finished:
+        yield finished
+
+
+def iter_manuscript_sections(filename: str, file: BinaryIO) -> Iterator[Section]:
+    """Pick the parser for an uploaded file by extension"""
+    name = (filename or '').lower()
+    if name.endswith('.docx'):
+        return iter_docx_sections(file)
+    if name.endswith(('.txt', '.md', '.markdown')):
+        lines = io.TextIOWrapper(file, encoding='utf-8-sig', errors='replace')
+        return iter_text_sections(lines, markdown=not name.endswith('.txt'))
+    raise ValueError(f"Unsupported file type (expected one of {', '.join(IMPORT_EXTENSIONS)})")
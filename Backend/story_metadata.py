@@ -0,0 +1,260 @@
+"""
+Story and chapter metadata calculation.
+
+Word and character counts are derived from chapter content. Each chapter's
+metadata stores a content hash, so saves only recount chapters whose content
+actually changed and story totals are adjusted by the resulting deltas.
+"""
+
+import hashlib
+import re
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+_HTML_TAG = re.compile(r'<[^>]+>')
+_WORD = re.compile(r'\b\w+\b')
+
+
+def content_hash(text: str) -> str:
+    """Stable fingerprint of chapter/story content"""
+    return hashlib.blake2b((text or '').encode('utf-8'), digest_size=16).hexdigest()
+
+
+def calculate_word_count(text: str) -> int:
+    """Calculate word count from text (strips HTML tags first)"""
+    if not text:
+        return 0
+    # Strip HTML tags before counting
+    clean = _HTML_TAG.sub(' ', text)
+    words = _WORD.findall(clean)
+    return len(words)
+
+
+def create_story_metadata(content: str) -> Dict[str, Any]:
+    """Create metadata for a story"""
+    now = datetime.utcnow().isoformat()
+    return {
+        'wordCount': calculate_word_count(content),
+        'characterCount': len(content) if content else 0,
+        'contentHash': content_hash(content),
+        'createdAt': now,
+        'updatedAt': now,
+        'lastEditedAt': now
+    }
+
+
+def update_story_metadata(existing_metadata: Dict[str, Any], content: str) -> Dict[str, Any]:
+    """Update metadata for an existing story (counts are reused if content is unchanged)"""
+    now = datetime.utcnow().isoformat()
+    digest = content_hash(content)
+    if existing_metadata.get('contentHash') == digest and 'wordCount' in existing_metadata:
+        word_count = existing_metadata['wordCount']
+    else:
+        word_count = calculate_word_count(content)
+    return {
+        **existing_metadata,
+        'wordCount': word_count,
+        'characterCount': len(content) if content else 0,
+        'contentHash': digest,
+        'updatedAt': now,
+        'lastEditedAt': now
+    }
+
+
+def calculate_chapter_metadata(content: str) -> Dict[str, Any]:
+    """Calculate metadata for a single chapter"""
+    now = datetime.utcnow().isoformat()
+    return {
+        'wordCount': calculate_word_count(content),
+        'characterCount': len(content) if content else 0,
+        'contentHash': content_hash(content),
+        'createdAt': now,
+        'updatedAt': now
+    }
+
+
+def aggregate_story_metadata_from_chapters(chapters: List[Dict[str, Any]], existing_metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Aggregate metadata from all chapters"""
+    if not chapters:
+        return existing_metadata or create_story_metadata("")
+    
+    total_words = sum(ch.get('metadata', {}).get('wordCount', 0) for ch in chapters)
+    total_chars = sum(ch.get('metadata', {}).get('characterCount', 0) for ch in chapters)
+    
+    # Get earliest createdAt and latest updatedAt
+    created_dates = [ch.get('metadata', {}).get('createdAt', '') for ch in chapters if ch.get('metadata', {}).get('createdAt')]
+    updated_dates = [ch.get('metadata', {}).get('updatedAt', '') for ch in chapters if ch.get('metadata', {}).get('updatedAt')]
+    
+    now = datetime.utcnow().isoformat()
+    created_at = min(created_dates) if created_dates else (existing_metadata or {}).get('createdAt', now)
+    updated_at = max(updated_dates) if updated_dates else now
+    
+    return {
+        'wordCount': total_words,
+        'characterCount': total_chars,
+        'chapterCount': len(chapters),
+        'createdAt': created_at,
+        'updatedAt': updated_at,
+        'lastEditedAt': now
+    }
+
+
+def process_chapter_updates(
+    chapters: List[Any],
+    previous_chapters: Optional[List[Dict[str, Any]]],
+    existing_metadata: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Refresh chapter metadata for a save and update story totals by deltas
+    
+    A chapter whose content hash matches the stored chapter with the same id
+    keeps its stored counts and updatedAt; only new or edited chapters are
+    recounted. Story word/character totals are adjusted by the difference,
+    falling back to a full aggregation when the stored totals were not built
+    from the stored chapters (e.g. a legacy content-only story).
+    
+    Args:
+        chapters: Incoming chapters (dicts or Pydantic models)
+        previous_chapters: Chapters currently stored for the story
+        existing_metadata: Current story metadata
+    
+    Returns:
+        (processed chapters, story metadata)
+    """
+    existing_metadata = existing_metadata or {}
+    previous_chapters = previous_chapters or []
+    previous_by_id = {
+        str(ch.get('id')): ch.get('metadata') or {}
+        for ch in previous_chapters if isinstance(ch, dict)
+    }
+    now = datetime.utcnow().isoformat()
+    
+    processed_chapters = []
+    seen_ids = set()
+    word_delta = 0
+    char_delta = 0
+    for ch in chapters:
+        if isinstance(ch, dict):
+            chapter_dict = ch
+        else:
+            chapter_dict = ch.dict() if hasattr(ch, 'dict') else dict(ch)
+        
+        chapter_id = str(chapter_dict.get('id'))
+        content = chapter_dict.get('content', '') or ''
+        digest = content_hash(content)
+        previous = previous_by_id.get(chapter_id) if chapter_id not in seen_ids else None
+        seen_ids.add(chapter_id)
+        incoming = chapter_dict.get('metadata') or {}
+        
+        if previous is not None and previous.get('contentHash') == digest and 'wordCount' in previous:
+            # Unchanged chapter: keep the stored counts and timestamps
+            chapter_dict['metadata'] = {**incoming, **previous}
+        else:
+            word_count = calculate_word_count(content)
+            chapter_dict['metadata'] = {
+                **incoming,
+                'wordCount': word_count,
+                'characterCount': len(content),
+                'contentHash': digest,
+                'createdAt': (previous or {}).get('createdAt') or incoming.get('createdAt') or now,
+                'updatedAt': now
+            }
+            word_delta += word_count - (previous or {}).get('wordCount', 0)
+            char_delta += len(content) - (previous or {}).get('characterCount', 0)
+        
+        processed_chapters.append(chapter_dict)
+    
+    # Chapters removed in this save
+    for chapter_id, previous in previous_by_id.items():
+        if chapter_id not in seen_ids:
+            word_delta -= previous.get('wordCount', 0)
+            char_delta -= previous.get('characterCount', 0)
+    
+    totals_match_chapters = (
+        previous_chapters
+        and existing_metadata.get('chapterCount') == len(previous_chapters)
+        and len(previous_by_id) == len(previous_chapters)
+        and 'wordCount' in existing_metadata
+        and 'createdAt' in existing_metadata
+    )
+    if not processed_chapters or not totals_match_chapters:
+        return processed_chapters, aggregate_story_metadata_from_chapters(processed_chapters, existing_metadata)
+    
+    metadata = {
+        **existing_metadata,
+        'wordCount': existing_metadata['wordCount'] + word_delta,
+        'characterCount': existing_metadata.get('characterCount', 0) + char_delta,
+        'chapterCount': len(processed_chapters),
+        'updatedAt': now,
+        'lastEditedAt': now
+    }
+    # Story-level hash only describes legacy single-content stories
+    metadata.pop('contentHash', None)
+    return processed_chapters, metadata
+
+
+def backfill_story_metadata(story: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fields to write so a stored story has complete, consistent metadata
+    
+    Fills in missing or stale chapter counts and content hashes and
+    recomputes story totals, keeping existing timestamps. Used by maintenance
+    jobs (admin_cli.py backfill-metadata).
+    
+    Args:
+        story: Stored story document
+    
+    Returns:
+        Top-level fields to update ('chapters' and/or 'metadata'); empty if
+        the story is already consistent
+    """
+    metadata = dict(story.get('metadata') or {})
+    fallback_time = metadata.get('updatedAt') or metadata.get('createdAt') or datetime.utcnow().isoformat()
+    update: Dict[str, Any] = {}
+    
+    chapters = story.get('chapters') or []
+    if chapters:
+        refreshed = []
+        chapters_changed = False
+        for chapter in chapters:
+            content = chapter.get('content') or ''
+            chapter_metadata = dict(chapter.get('metadata') or {})
+            digest = content_hash(content)
+            if chapter_metadata.get('contentHash') != digest or 'wordCount' not in chapter_metadata:
+                chapter_metadata.update(
+                    wordCount=calculate_word_count(content),
+                    characterCount=len(content),
+                    contentHash=digest
+                )
+                chapters_changed = True
+            for field in ('createdAt', 'updatedAt'):
+                if not chapter_metadata.get(field):
+                    chapter_metadata[field] = fallback_time
+                    chapters_changed = True
+            refreshed.append({**chapter, 'metadata': chapter_metadata})
+        if chapters_changed:
+            update['chapters'] = refreshed
+        expected = {
+            'wordCount': sum(ch['metadata']['wordCount'] for ch in refreshed),
+            'characterCount': sum(ch['metadata']['characterCount'] for ch in refreshed),
+            'chapterCount': len(refreshed),
+        }
+    else:
+        content = story.get('content') or ''
+        digest = content_hash(content)
+        if metadata.get('contentHash') == digest and 'wordCount' in metadata:
+            expected = {}
+        else:
+            expected = {
+                'wordCount': calculate_word_count(content),
+                'characterCount': len(content),
+                'contentHash': digest,
+            }
+    
+    for field in ('createdAt', 'updatedAt', 'lastEditedAt'):
+        if not metadata.get(field):
+            expected[field] = fallback_time
+    
+    if any(metadata.get(field) != value for field, value in expected.items()):
+        update['metadata'] = {**metadata, **expected}
+    return update
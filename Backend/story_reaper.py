@@ -0,0 +1,185 @@
+"""
+Background reaper for deleted stories.
+
+delete_story only marks a story as deleted so the API returns in constant
+time. This module removes the story document and every subcollection under
+it (e.g. bible_items) in the background, in batched and rate-limited chunks,
+with retries and progress tracking.
+
+Stories marked deleted but not yet reaped (e.g. after a restart or a failed
+cascade) are picked up again by sweep_pending(), on startup and then every
+REAPER_SWEEP_INTERVAL_SECONDS from the reaper thread. Progress is tracked
+only while a story is queued, running or failed; finished stories are only
+counted in totals.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+from storage_backend import get_storage
+
+log = logging.getLogger(__name__)
+
+# Documents deleted per batch commit (Firestore caps this at 500)
+REAPER_BATCH_SIZE = int(os.getenv('REAPER_BATCH_SIZE', '200'))
+# Maximum batch commits per second across all stories being reaped
+REAPER_BATCHES_PER_SECOND = float(os.getenv('REAPER_BATCHES_PER_SECOND', '5'))
+# Attempts per batch before a story is left for the next sweep
+REAPER_MAX_RETRIES = int(os.getenv('REAPER_MAX_RETRIES', '5'))
+# Seconds between sweeps for stories left marked deleted (0 disables periodic sweeps)
+REAPER_SWEEP_INTERVAL_SECONDS = float(os.getenv('REAPER_SWEEP_INTERVAL_SECONDS', '600'))
+
+
+class StoryReaper:
+    """Deletes marked stories and their subcollections on a daemon thread"""
+
+    def __init__(
+        self,
+        batch_size: int = REAPER_BATCH_SIZE,
+        batches_per_second: float = REAPER_BATCHES_PER_SECOND,
+        max_retries: int = REAPER_MAX_RETRIES,
+        sweep_interval_seconds: float = REAPER_SWEEP_INTERVAL_SECONDS
+    ):
+        self.batch_size = batch_size
+        self.min_interval = 1.0 / batches_per_second if batches_per_second > 0 else 0.0
+        self.max_retries = max_retries
+        self.sweep_interval = sweep_interval_seconds
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._last_commit = 0.0
+        self._progress: Dict[str, Dict[str, Any]] = {}
+        self._progress_lock = threading.Lock()
+        # Stories reaped and their documents deleted, since startup
+        self._reaped = 0
+        self._documents_deleted = 0
+
+    def start(self) -> None:
+        """Start the reaper thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="story-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Ask the reaper thread to finish its current batch and exit"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def enqueue(self, story_id: str) -> None:
+        """Schedule a story (already marked deleted) for cascade deletion"""
+        with self._progress_lock:
+            if story_id in self._progress and self._progress[story_id]['status'] in ('queued', 'running'):
+                return
+            self._progress[story_id] = {
+                'status': 'queued',
+                'documentsDeleted': 0,
+                'attempts': 0,
+                'queuedAt': datetime.utcnow().isoformat(),
+            }
+        self._queue.put(story_id)
+
+    def sweep_pending(self) -> int:
+        """Re-queue stories that were marked deleted but never reaped. Returns count queued."""
+        try:
+            count = 0
+            for story_id in get_storage().list_deleted_story_ids():
+                self.enqueue(story_id)
+                count += 1
+            if count:
+                log.info("🧹 Reaper resumed %s pending story deletion(s)", count)
+            return count
+        except Exception as e:
+            log.error("❌ Reaper sweep failed: %s", e)
+            return 0
+
+    def progress(self, story_id: Optional[str] = None) -> Dict[str, Any]:
+        """Progress for one story, or a summary of all tracked deletions"""
+        with self._progress_lock:
+            if story_id is not None:
+                return dict(self._progress.get(story_id, {}))
+            by_status: Dict[str, int] = {'done': self._reaped} if self._reaped else {}
+            for entry in self._progress.values():
+                by_status[entry['status']] = by_status.get(entry['status'], 0) + 1
+            return {
+                'queued': self._queue.qsize(),
+                'byStatus': by_status,
+                'documentsDeleted': self._documents_deleted + sum(
+                    e['documentsDeleted'] for e in self._progress.values()
+                ),
+            }
+
+    def _run(self) -> None:
+        next_sweep = time.monotonic() + self.sweep_interval
+        while True:
+            timeout = max(next_sweep - time.monotonic(), 0.0) if self.sweep_interval > 0 else None
+            try:
+                story_id = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                # Retry stories whose cascade failed (or were marked by another instance)
+                self.sweep_pending()
+                next_sweep = time.monotonic() + self.sweep_interval
+                continue
+            if story_id is None:
+                return
+            self._reap(story_id)
+
+    def _reap(self, story_id: str) -> None:
+        self._update_progress(story_id, status='running')
+        storage = get_storage()
+        try:
+            while True:
+                deleted = self._with_retries(
+                    story_id,
+                    lambda: storage.delete_story_children(story_id, self.batch_size)
+                )
+                if not deleted:
+                    break
+                with self._progress_lock:
+                    self._progress[story_id]['documentsDeleted'] += deleted
+            self._with_retries(story_id, lambda: storage.delete_story_document(story_id))
+            with self._progress_lock:
+                deleted = self._progress.pop(story_id)['documentsDeleted']
+                self._reaped += 1
+                self._documents_deleted += deleted
+            log.info("🧹 Reaped story %s (%s subcollection document(s))", story_id, deleted)
+        except Exception as e:
+            # Story stays marked deleted, so the next sweep retries it
+            self._update_progress(story_id, status='failed', error=str(e))
+            log.error("❌ Reaper gave up on story %s: %s", story_id, e)
+
+    def _with_retries(self, story_id: str, operation):
+        """Run a write operation with rate limiting and exponential backoff"""
+        for attempt in range(self.max_retries):
+            self._throttle()
+            try:
+                return operation()
+            except Exception as e:
+                with self._progress_lock:
+                    self._progress[story_id]['attempts'] += 1
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = min(2 ** attempt, 30)
+                log.warning("⚠️ Reaper batch for story %s failed (%s); retrying in %ss", story_id, e, delay)
+                time.sleep(delay)
+
+    def _throttle(self) -> None:
+        wait = self._last_commit + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_commit = time.monotonic()
+
+    def _update_progress(self, story_id: str, **fields) -> None:
+        with self._progress_lock:
+            self._progress.setdefault(story_id, {'documentsDeleted': 0, 'attempts': 0}).update(fields)
+
+
+# Process-wide reaper used by delete_story
+story_reaper = StoryReaper()
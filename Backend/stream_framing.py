@@ -0,0 +1,238 @@
+"""
+Frame coalescing for streamed generations.
+
+TextIteratorStreamer yields detokenized fragments of one or two characters;
+sending each as its own Server-Sent Event costs a JSON encode, a socket
+write and a proxy flush per token. StreamFramer collects fragments and
+emits one frame when the first fragment of the frame is STREAM_FRAME_WINDOW_MS
+old or STREAM_FRAME_MAX_BYTES have been collected, whichever comes first.
+30 ms is below what a reader perceives as stutter, and at typical decoding
+speeds (20-60 tokens/s on GPU) it merges fragments only when they arrive
+faster than the eye follows them.
+
+When nothing has been sent for STREAM_HEARTBEAT_SECONDS (e.g. during prompt
+prefill) a heartbeat is emitted so proxies and mobile networks keep the
+connection open; in SSE it is a comment line, which EventSource and the
+frontend's parser ignore.
+
+Events are pre-serialized: a chunk event is a constant prefix, the
+JSON-escaped text and a constant suffix, so only the text is encoded.
+
+`python benchmark_streaming.py` compares events and CPU time per token with
+and without coalescing.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+
+from fast_response import dumps
+from tracing import bind
+
+# Coalescing window per frame, and the size that flushes a frame early (0 ms sends every fragment)
+STREAM_FRAME_WINDOW_MS = float(os.getenv('STREAM_FRAME_WINDOW_MS', '30'))
+STREAM_FRAME_MAX_BYTES = int(os.getenv('STREAM_FRAME_MAX_BYTES', '256'))
+# Idle time after which a keep-alive is sent (0 disables heartbeats)
+STREAM_HEARTBEAT_SECONDS = float(os.getenv('STREAM_HEARTBEAT_SECONDS', '15'))
+
+SSE_HEARTBEAT = b': ping\n\n'
+_CHUNK_PREFIX = b'data: {"type":"chunk","text":'
+_CHUNK_SUFFIX = b'}\n\n'
+
+# Yielded by StreamFramer.frames() in place of a frame when a heartbeat is due
+HEARTBEAT = None
+
+def sse_event(data: Dict[str, Any]) -> bytes:
+    """One Server-Sent Event carrying a JSON object"""
+    return b'data: ' + dumps(data) + b'\n\n'
+
+
+def sse_chunk(text: str, event_id: Optional[int] = None) -> bytes:
+    """
+    A 'chunk' event, equivalent to sse_event({'type': 'chunk', 'text': text})
+
+    Args:
+        event_id: SSE event id (the stream offset, for Last-Event-ID resumes)
+    """
+    event = _CHUNK_PREFIX + dumps(text) + _CHUNK_SUFFIX
+    return event if event_id is None else b'id: %d\n' % event_id + event
+
+
+SSE_START = sse_event({'type': 'start'})
+
+
+class FrameStats:
+    """Counters for one stream"""
+
+    __slots__ = ('fragments', 'frames', 'bytes', 'heartbeats', 'started_at')
+
+    def __init__(self):
+        self.fragments = 0
+        self.frames = 0
+        self.bytes = 0
+        self.heartbeats = 0
+        self.started_at = time.monotonic()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'fragments': self.fragments,
+            'frames': self.frames,
+            'bytes': self.bytes,
+            'heartbeats': self.heartbeats,
+            'fragmentsPerFrame': round(self.fragments / self.frames, 2) if self.frames else 0.0,
+            'durationMs': round((time.monotonic() - self.started_at) * 1000),
+        }
+
+
+# Process-wide totals across finished streams (read by /health)
+_totals = {'streams': 0, 'fragments': 0, 'frames': 0, 'bytes': 0, 'heartbeats': 0}
+
+
+def framing_stats() -> Dict[str, Any]:
+    frames = _totals['frames']
+    return {
+        **_totals,
+        'fragmentsPerFrame': round(_totals['fragments'] / frames, 2) if frames else 0.0,
+        'windowMs': STREAM_FRAME_WINDOW_MS,
+        'maxBytes': STREAM_FRAME_MAX_BYTES,
+    }
+
+
+class StreamFramer:
+    """
+    Coalesces streamed text fragments into frames over a time/byte window.
+
+    Args:
+        window_ms: A frame is sent this long after its first fragment arrived
+        max_bytes: ...or as soon as it holds this many UTF-8 bytes
+        heartbeat_seconds: Emit HEARTBEAT after this long without output (0 = never)
+    """
+
+    def __init__(
+        self,
+        window_ms: float = STREAM_FRAME_WINDOW_MS,
+        max_bytes: int = STREAM_FRAME_MAX_BYTES,
+        heartbeat_seconds: float = STREAM_HEARTBEAT_SECONDS
+    ):
+        self.window = max(window_ms, 0) / 1000
+        self.max_bytes = max_bytes
+        self.heartbeat = heartbeat_seconds
+        self.stats = FrameStats()
+
+    async def frames(self, fragments: Iterable[str]) -> AsyncIterator[Optional[str]]:
+        """
+        Coalesced text frames from a blocking iterator of fragments
+
+        The iterator (e.g. a TextIteratorStreamer) is consumed on a thread
+        that only buffers fragments. The event loop collects the buffer once
+        per window while the stream is active, so a steady stream costs one
+        timer per frame; the thread wakes the loop only for the first
+        fragment after an idle window, when a frame reaches max_bytes, and
+        at the end.
+
+        Yields:
+            Frame text, or HEARTBEAT (None) when the stream has been idle
+        """
+        loop = asyncio.get_running_loop()
+        lock = threading.Lock()
+        wake = asyncio.Event()
+        state = {'pending': [], 'bytes': 0, 'ticking': False, 'finished': False, 'error': None, 'stopped': False}
+        timers = {}
+        last_output = loop.time()
+
+        def signal(callback, *args) -> None:
+            try:
+                loop.call_soon_threadsafe(callback, *args)
+            except RuntimeError:
+                # Event loop closed - nobody is listening any more
+                state['stopped'] = True
+
+        def start_ticking() -> None:
+            if 'tick' not in timers:
+                timers['tick'] = loop.call_later(self.window, tick)
+
+        def tick() -> None:
+            timers.pop('tick', None)
+            wake.set()
+
+        def check_idle() -> None:
+            if loop.time() - last_output >= self.heartbeat:
+                state['heartbeat'] = True
+                wake.set()
+            timers['idle'] = loop.call_later(self.heartbeat / 2, check_idle)
+
+        def pump() -> None:
+            try:
+                for fragment in fragments:
+                    if state['stopped']:
+                        return
+                    self.stats.fragments += 1
+                    if not fragment:
+                        continue
+                    size = len(fragment.encode('utf-8'))
+                    with lock:
+                        state['pending'].append(fragment)
+                        state['bytes'] += size
+                        full = state['bytes'] >= self.max_bytes
+                        start = not state['ticking']
+                        state['ticking'] = True
+                    if full:
+                        signal(wake.set)
+                    elif start:
+                        signal(start_ticking)
+            except BaseException as e:
+                state['error'] = e
+            finally:
+                state['finished'] = True
+                signal(wake.set)
+
+        if self.heartbeat > 0:
+            timers['idle'] = loop.call_later(self.heartbeat / 2, check_idle)
+        # Keeps the trace context, so model.generate started from fragments() joins the request's trace
+        threading.Thread(target=bind(pump), name="stream-framer", daemon=True).start()
+        try:
+            while True:
+                await wake.wait()
+                wake.clear()
+                finished = state['finished']
+                with lock:
+                    pending, size = state['pending'], state['bytes']
+                    state['pending'], state['bytes'] = [], 0
+                    # Keep collecting once per window while fragments keep coming
+                    state['ticking'] = bool(pending) and not finished
+                heartbeat = state.pop('heartbeat', False)
+                if pending:
+                    if state['ticking']:
+                        start_ticking()
+                    yield self._frame(pending, size)
+                    last_output = loop.time()
+                elif heartbeat and not finished:
+                    self.stats.heartbeats += 1
+                    yield HEARTBEAT
+                    last_output = loop.time()
+                if finished:
+                    break
+            if state['error'] is not None:
+                raise state['error']
+        finally:
+            state['stopped'] = True
+            for timer in timers.values():
+                timer.cancel()
+            self._record()
+
+    async def sse(self, fragments: Iterable[str]) -> AsyncIterator[bytes]:
+        """frames() as Server-Sent Events: 'chunk' events and comment heartbeats"""
+        async for frame in self.frames(fragments):
+            yield SSE_HEARTBEAT if frame is HEARTBEAT else sse_chunk(frame)
+
+    def _frame(self, pending: list, size: int) -> str:
+        self.stats.frames += 1
+        self.stats.bytes += size
+        return pending[0] if len(pending) == 1 else ''.join(pending)
+
+    def _record(self) -> None:
+        _totals['streams'] += 1
+        for key in ('fragments', 'frames', 'bytes', 'heartbeats'):
+            _totals[key] += getattr(self.stats, key)
@@ -0,0 +1,98 @@
+"""
+Text processing shared by generation post-processing and quality scoring.
+
+Sentence detection lives here once, with every pattern compiled at import:
+
+- sentence_boundaries() scans a text in one regex pass and returns the
+  offset just after each sentence end: a run of . ! ? plus an optional
+  closing quote, followed by whitespace or the end of the text.
+- clean_and_complete_text() trims generated text back to its last boundary.
+- truncate_context() keeps the most recent words of a story and starts them
+  after their first boundary.
+- sentence_lengths() gives quality_control's variety metric its per-sentence
+  word counts. It splits at every run of . ! ? (also inside "3.14"), as the
+  score always has, so scores are unchanged.
+
+benchmark_text.py checks these against the previous implementations.
+"""
+
+import re
+from typing import List
+
+from tracing import traced
+
+SENTENCE_PUNCTUATION = re.compile(r'[.!?]+')
+_BOUNDARY = re.compile(r'[.!?]+["\']?(?=\s|\Z)')
+
+# Meta-commentary or instructions that leak into generations, removed in order.
+# Each only applies when its marker is in the text, which skips the regex for most outputs.
+_LEAKED = [
+    (None, re.compile(r'^(Here\'s|Here is|I\'ll|Let me|Continuing|The story continues).*?:\s*', re.IGNORECASE | re.DOTALL)),
+    ('[', re.compile(r'\n\s*\[.*?\]\s*$', re.IGNORECASE | re.DOTALL)),
+    ('(', re.compile(r'\n\s*\(.*?\)\s*$', re.IGNORECASE | re.DOTALL)),
+    ('---', re.compile(r'---+.*$', re.IGNORECASE | re.DOTALL)),
+]
+
+
+def sentence_boundaries(text: str) -> List[int]:
+    """Offsets just after each sentence end (closing quote included), in order"""
+    return [match.end() for match in _BOUNDARY.finditer(text)]
+
+
+def sentence_lengths(text: str) -> List[int]:
+    """Words per non-empty sentence, splitting at every run of . ! ?"""
+    return list(filter(None, map(len, map(str.split, SENTENCE_PUNCTUATION.split(text)))))
+
+
+@traced('text.clean')
+def clean_and_complete_text(text):
+    """Clean generated text and ensure it ends with complete sentences."""
+    if not text:
+        return text
+
+    for marker, pattern in _LEAKED:
+        if marker is None or marker in text:
+            text = pattern.sub('', text)
+
+    text = text.strip()
+
+    # Check if text ends with proper punctuation
+    if text and text[-1] in '.!?"\'':
+        return text
+
+    # Keep everything up to the last complete sentence
+    boundaries = sentence_boundaries(text)
+    if boundaries:
+        text = text[:boundaries[-1]].strip()
+    elif len(text) > 20 and text[-1] not in '.!?,"\'':
+        # No sentence ending found - end at a natural break point in the latter half, or add a period
+        break_point = max(text.rfind(','), text.rfind(' and '), text.rfind(' but '))
+        if break_point > len(text) * 0.5:
+            text = text[:break_point].rstrip(',').strip() + '.'
+        else:
+            text = text + '.'
+
+    return text
+
+
+def truncate_context(content: str, max_tokens: int = 1000) -> str:
+    """
+    Truncate content to fit context window while preserving story coherence
+    Keeps the most recent context
+    """
+    # Simple word-based truncation (approximate)
+    # Qwen tokenizer roughly: 1 token ≈ 0.75 words
+    max_words = int(max_tokens * 0.75)
+
+    # Split off only the last max_words words instead of the whole story
+    words = content.rsplit(None, max_words)
+    if len(words) <= max_words:
+        return content
+    truncated_text = ' '.join(words[1:])
+
+    # Start after the first sentence end, skipping the partial sentence the cut made
+    boundary = _BOUNDARY.search(truncated_text)
+    if boundary and boundary.end() < len(truncated_text):
+        return truncated_text[boundary.end() + 1:]
+
+    return truncated_text
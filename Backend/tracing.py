@@ -0,0 +1,451 @@
+"""
+Request tracing.
+
+Metrics say how slow /generate is on average; a trace says where the time
+of one request went. A sampled request gets a root span (TracingMiddleware)
+and every stage it passes through opens a child span:
+
+    with span('tokenize') as current:
+        inputs = tokenizer(text, return_tensors="pt")
+        current.set(promptTokens=inputs.input_ids.shape[-1])
+
+    @traced('text.clean')
+    def clean_and_complete_text(text): ...
+
+Spans follow the request through `contextvars`, so they nest across awaits
+and tasks without being passed around. Threads do not inherit context: start
+thread targets through bind() (model.generate, the stream framer's pump).
+Stages timed elsewhere - prefill and decode, measured by GenerationProbe
+from inside model.generate - are added afterwards with record_span().
+
+Sampling is decided once per request: TRACE_SAMPLE_RATE of requests are
+traced, plus those whose W3C `traceparent` header has the sampled flag (when
+TRACE_TRUST_TRACEPARENT is on). In an unsampled request span() returns a
+shared no-op span, so instrumentation costs a context variable lookup.
+Sampled requests get an X-Trace-Id response header.
+
+Finished spans are queued (at most TRACE_QUEUE_SIZE, then dropped and
+counted) and exported in batches by a background thread. TRACE_EXPORTER
+selects the exporter: 'jsonl' (JsonLinesExporter, one JSON object per span
+in TRACE_FILE, rotated at TRACE_FILE_MAX_BYTES), 'none', or
+'package.module:factory' for any SpanExporter.
+"""
+
+import asyncio
+import contextvars
+import functools
+import importlib
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fast_response import dumps
+
+log = logging.getLogger(__name__)
+
+# Fraction of requests traced
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+# Also trace requests whose traceparent header says the caller sampled them
+TRACE_TRUST_TRACEPARENT = os.getenv('TRACE_TRUST_TRACEPARENT', 'true').lower() == 'true'
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'jsonl')
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+TRACE_FILE_MAX_BYTES = int(os.getenv('TRACE_FILE_MAX_BYTES', str(100 * 1024 * 1024)))
+# Finished spans waiting for the exporter before new ones are dropped
+TRACE_QUEUE_SIZE = int(os.getenv('TRACE_QUEUE_SIZE', '10000'))
+# Paths never traced (probes and scrapers)
+TRACE_EXCLUDE_PATHS = {
+    path.strip() for path in os.getenv('TRACE_EXCLUDE_PATHS', '/health,/metrics').split(',') if path.strip()
+}
+
+TRACE_BATCH_SIZE = 512
+TRACE_FLUSH_SECONDS = 1.0
+MAX_ATTRIBUTE_CHARS = 300
+
+# Spans are timed with perf_counter; this maps it to the wall clock for export
+_WALL_OFFSET = time.time() - time.perf_counter()
+
+_current: ContextVar[Optional["Span"]] = ContextVar('trace_span', default=None)
+
+
+class Span:
+    """
+    One timed stage of a traced request; a context manager that makes itself
+    the current span (the parent of spans opened inside it)
+
+    Args:
+        name: Stage name ('tokenize', 'storage.get_story', ...)
+        trace_id: 128-bit id shared by the request's spans
+        parent_id: Enclosing span's id (None for a root without remote parent)
+        attributes: Small values describing the stage (sizes, counts, labels - no text)
+        start: perf_counter() start time (defaults to now)
+    """
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start', 'end_time', 'status', '_token')
+
+    sampled = True
+
+    def __init__(self, name: str, trace_id: int, parent_id: Optional[int],
+                 attributes: Dict[str, Any], start: Optional[float] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64) or 1
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.perf_counter() if start is None else start
+        self.end_time: Optional[float] = None
+        self.status = 'ok'
+        self._token = None
+
+    @property
+    def trace_id_hex(self) -> str:
+        return f'{self.trace_id:032x}'
+
+    def set(self, **attributes: Any) -> "Span":
+        self.attributes.update(attributes)
+        return self
+
+    def error(self, error: BaseException) -> None:
+        self.status = 'error'
+        self.attributes['error'] = f"{type(error).__name__}: {error}"[:MAX_ATTRIBUTE_CHARS]
+
+    def end(self, end: Optional[float] = None) -> None:
+        """Finish the span (once) and queue it for export"""
+        if self.end_time is None:
+            self.end_time = time.perf_counter() if end is None else end
+            _processor.submit(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.error(exc)
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Exited in another context (e.g. a generator finished elsewhere)
+            pass
+        self.end()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'traceId': self.trace_id_hex,
+            'spanId': f'{self.span_id:016x}',
+            'parentId': f'{self.parent_id:016x}' if self.parent_id else None,
+            'name': self.name,
+            'start': round(_WALL_OFFSET + self.start, 6),
+            'durationMs': round((self.end_time - self.start) * 1000, 3),
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Stands in for spans of unsampled requests; every method does nothing"""
+
+    sampled = False
+    trace_id_hex = ''
+
+    def set(self, **attributes: Any) -> "_NoopSpan":
+        return self
+
+    def error(self, error: BaseException) -> None:
+        pass
+
+    def end(self, end: Optional[float] = None) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def current_span():
+    """The innermost open span, or NOOP_SPAN outside a sampled request"""
+    return _current.get() or NOOP_SPAN
+
+
+def span(name: str, **attributes: Any):
+    """A child of the current span (NOOP_SPAN when the request is not sampled)"""
+    parent = _current.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+def record_span(name: str, parent, start: float, end: float, **attributes: Any):
+    """
+    Add a finished child span timed elsewhere
+
+    Args:
+        parent: Span to attach to (NOOP_SPAN records nothing)
+        start: perf_counter() start time
+        end: perf_counter() end time
+    """
+    if not parent.sampled:
+        return NOOP_SPAN
+    child = Span(name, parent.trace_id, parent.span_id, attributes, start)
+    child.end(end)
+    return child
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[int, int, bool]]:
+    """(trace id, parent span id, sampled flag) from a W3C traceparent header"""
+    if not header:
+        return None
+    parts = header.strip().split('-')
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        trace_id, parent_id, flags = int(parts[1], 16), int(parts[2], 16), int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if not trace_id or not parent_id:
+        return None
+    return trace_id, parent_id, bool(flags & 1)
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, **attributes: Any):
+    """
+    Root span of a request, or NOOP_SPAN if it is not sampled (or tracing is off)
+
+    Args:
+        traceparent: Incoming W3C header; continues the caller's trace
+    """
+    if not _processor.running:
+        return NOOP_SPAN
+    remote = parse_traceparent(traceparent)
+    sampled = random.random() < TRACE_SAMPLE_RATE
+    if remote is not None and remote[2] and TRACE_TRUST_TRACEPARENT:
+        sampled = True
+    if not sampled:
+        return NOOP_SPAN
+    if remote is not None:
+        return Span(name, remote[0], remote[1], attributes)
+    return Span(name, random.getrandbits(128) or 1, None, attributes)
+
+
+def bind(fn: Callable) -> Callable:
+    """`fn` run in a copy of the current context (pass as a Thread target to keep the trace)"""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Decorator running each call of a function (sync or async) in a span"""
+    def decorate(fn: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Export
+
+class SpanExporter:
+    """Receives finished spans in batches on the export thread"""
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+
+class JsonLinesExporter(SpanExporter):
+    """
+    Appends one JSON object per span to a file, for offline analysis
+    (e.g. `jq 'select(.traceId == "...")' traces.jsonl`)
+
+    Args:
+        path: Output file
+        max_bytes: Size at which the file is rotated to `<path>.1` (0 disables rotation)
+    """
+
+    def __init__(self, path: str = TRACE_FILE, max_bytes: int = TRACE_FILE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        data = b''.join(dumps(item) + b'\n' for item in spans)
+        if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+            os.replace(self.path, f'{self.path}.1')
+        with open(self.path, 'ab') as output:
+            output.write(data)
+
+
+class SpanProcessor:
+    """Queue of finished spans drained by a background export thread (module singleton below)"""
+
+    def __init__(self, max_size: int = TRACE_QUEUE_SIZE):
+        self.max_size = max_size
+        self.exporter: Optional[SpanExporter] = None
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def submit(self, finished: Span) -> None:
+        if self._queue.qsize() >= self.max_size:
+            self.dropped += 1
+        else:
+            self._queue.put_nowait(finished)
+
+    def start(self, exporter: SpanExporter) -> None:
+        self.exporter = exporter
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Export queued spans and stop the thread"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+        self._thread = None
+        self.exporter.shutdown()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + TRACE_FLUSH_SECONDS
+            while len(batch) < TRACE_BATCH_SIZE:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.001))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self._export(batch)
+
+    def _export(self, batch: Iterable[Span]) -> None:
+        spans = [item.as_dict() for item in batch]
+        try:
+            self.exporter.export(spans)
+            self.exported += len(spans)
+        except Exception as e:
+            self.failed += len(spans)
+            log.warning("⚠️ Exporting %s spans failed: %s", len(spans), e)
+
+
+_processor = SpanProcessor()
+
+
+def load_exporter(spec: str = TRACE_EXPORTER) -> Optional[SpanExporter]:
+    """The exporter named by TRACE_EXPORTER ('jsonl', 'none' or 'module:factory')"""
+    if spec in ('', 'none'):
+        return None
+    if spec == 'jsonl':
+        return JsonLinesExporter()
+    module_name, _, factory = spec.partition(':')
+    return getattr(importlib.import_module(module_name), factory)()
+
+
+def configure_tracing(exporter: Optional[SpanExporter] = None) -> None:
+    """
+    Start exporting spans (idempotent); tracing stays off while unconfigured
+
+    Args:
+        exporter: Overrides TRACE_EXPORTER
+    """
+    if _processor.running:
+        return
+    exporter = exporter or load_exporter()
+    if exporter is None or (TRACE_SAMPLE_RATE <= 0 and not TRACE_TRUST_TRACEPARENT):
+        log.info("🔍 Tracing disabled")
+        return
+    _processor.start(exporter)
+    log.info("🔍 Tracing %s of requests to %s", f"{TRACE_SAMPLE_RATE:.1%}", type(exporter).__name__)
+
+
+def shutdown_tracing() -> None:
+    """Export queued spans and stop the export thread"""
+    _processor.stop()
+
+
+def tracing_stats() -> Dict[str, Any]:
+    """Export counters (reported by /health)"""
+    return {
+        'enabled': _processor.running,
+        'sampleRate': TRACE_SAMPLE_RATE,
+        'exporter': type(_processor.exporter).__name__ if _processor.exporter else None,
+        'queued': _processor._queue.qsize(),
+        'exported': _processor.exported,
+        'dropped': _processor.dropped,
+        'failed': _processor.failed,
+    }
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening the root span of each sampled HTTP request
+
+    The span covers the whole response, including streamed bodies, and is
+    named after the matched route template ("GET /stories/{story_id}").
+    """
+
+    def __init__(self, app, exclude_paths: Iterable[str] = TRACE_EXCLUDE_PATHS):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or scope['path'] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for key, value in scope.get('headers') or ():
+            if key == b'traceparent':
+                traceparent = value.decode('latin-1')
+                break
+        root = start_trace(f"{scope['method']} {scope['path']}", traceparent, method=scope['method'])
+        if not root.sampled:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_traced(message) -> None:
+            if message['type'] == 'http.response.start':
+                root.set(statusCode=message['status'])
+                if message['status'] >= 500:
+                    root.status = 'error'
+                message['headers'] = list(message.get('headers') or []) + [
+                    (b'x-trace-id', root.trace_id_hex.encode('ascii'))
+                ]
+            await send(message)
+
+        with root:
+            try:
+                await self.app(scope, receive, send_traced)
+            finally:
+                # Set by the router once it has matched the request
+                route = scope.get('route')
+                if route is not None and getattr(route, 'path', None):
+                    root.name = f"{scope['method']} {route.path}"
@@ -0,0 +1,137 @@
+"""
+Per-user library statistics.
+
+Each user has one stats document (story count, total words, characters and
+chapters, and story counts per status and genre) so dashboard summaries are
+a single read regardless of library size.
+
+create_story / update_story / delete_story compute the change a write makes
+to its owner's totals (stats_delta) and storage applies it as increments in
+the same atomic write as the story itself (see StatsDelta in
+storage_backend.py).
+
+A stats document is trusted only once it has been rebuilt from scratch
+(it carries 'rebuiltAt'); documents created by increments alone, e.g. for
+users whose stories predate stats tracking, are rebuilt on first read.
+Rebuilding lists the user's stories, so an increment landing while a rebuild
+runs can be lost; `python admin_cli.py repair-stats` recomputes every user.
+"""
+
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterable
+
+# Top-level counters
+STAT_FIELDS = ('storyCount', 'wordCount', 'characterCount', 'chapterCount')
+# Per-value story counts: stats field -> story field
+STAT_BREAKDOWNS = {'byStatus': 'status', 'byGenre': 'genre'}
+
+
+def story_contribution(story: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    What one story adds to its owner's totals
+
+    Args:
+        story: Story document (metadata, status and genre are used), or
+            None for a story that does not exist
+
+    Returns:
+        Flat counters; breakdown keys are dotted, e.g. 'byStatus.draft'
+    """
+    if not story or story.get('deleted'):
+        return {}
+    metadata = story.get('metadata') or {}
+    contribution = {
+        'storyCount': 1,
+        'wordCount': int(metadata.get('wordCount') or 0),
+        'characterCount': int(metadata.get('characterCount') or 0),
+        'chapterCount': int(metadata.get('chapterCount') or 0),
+    }
+    for stats_field, story_field in STAT_BREAKDOWNS.items():
+        contribution[f"{stats_field}.{_breakdown_key(story.get(story_field))}"] = 1
+    return contribution
+
+
+def stats_delta(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Increments that turn a user's totals with `before` into totals with `after`
+
+    Args:
+        before: Story before the write (None when creating)
+        after: Story after the write (None or deleted when deleting)
+
+    Returns:
+        Non-zero flat counters
+    """
+    old = story_contribution(before)
+    new = story_contribution(after)
+    delta = {key: new.get(key, 0) - old.get(key, 0) for key in old.keys() | new.keys()}
+    return {key: value for key, value in delta.items() if value}
+
+
+def apply_delta(stats: Dict[str, Any], delta: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Apply flat increments to a stats document (for backends without native increments)
+
+    Returns:
+        New stats document
+    """
+    updated = {**stats, **{field: dict(stats.get(field) or {}) for field in STAT_BREAKDOWNS}}
+    for key, value in delta.items():
+        if '.' in key:
+            field, sub_key = key.split('.', 1)
+            updated[field][sub_key] = updated[field].get(sub_key, 0) + value
+        else:
+            updated[key] = updated.get(key, 0) + value
+    updated['updatedAt'] = datetime.utcnow().isoformat()
+    return updated
+
+
+def nest_delta(delta: Dict[str, int], wrap=lambda value: value) -> Dict[str, Any]:
+    """Expand dotted keys into nested maps, wrapping each leaf (e.g. in an increment transform)"""
+    nested: Dict[str, Any] = {}
+    for key, value in delta.items():
+        if '.' in key:
+            field, sub_key = key.split('.', 1)
+            nested.setdefault(field, {})[sub_key] = wrap(value)
+        else:
+            nested[key] = wrap(value)
+    return nested
+
+
+def compute_user_stats(stories: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Totals for a library, computed from scratch
+
+    Args:
+        stories: The user's story documents (STORY_LIST_FIELDS are enough)
+
+    Returns:
+        Stats document marked as rebuilt
+    """
+    totals: Dict[str, int] = {}
+    for story in stories:
+        for key, value in story_contribution(story).items():
+            totals[key] = totals.get(key, 0) + value
+    now = datetime.utcnow().isoformat()
+    stats = apply_delta(empty_stats(), totals)
+    stats['rebuiltAt'] = now
+    stats['updatedAt'] = now
+    return stats
+
+
+def empty_stats() -> Dict[str, Any]:
+    return {**{field: 0 for field in STAT_FIELDS}, **{field: {} for field in STAT_BREAKDOWNS}}
+
+
+def stats_response(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Public shape of a stats document, dropping zeroed breakdown entries"""
+    response: Dict[str, Any] = {field: max(int(stats.get(field) or 0), 0) for field in STAT_FIELDS}
+    for field in STAT_BREAKDOWNS:
+        response[field] = {key: count for key, count in (stats.get(field) or {}).items() if count > 0}
+    response['updatedAt'] = stats.get('updatedAt')
+    return response
+
+
+def _breakdown_key(value: Any) -> str:
+    # Map keys can't contain '.' (it is the field path separator)
+    return str(value or 'unknown').replace('.', '_')
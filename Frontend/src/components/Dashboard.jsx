@@ -1,8 +1,8 @@
 import { useAuth } from '../contexts/AuthContext';
 import { updateDisplayName } from '../firebase/auth';
 import { useNavigate } from 'react-router-dom';
-import { useState, useEffect, useMemo } from 'react';
-import { getStories, deleteStory } from '../utils/api';
+import { useState, useEffect, useMemo, useRef } from 'react';
+import { getStories, getUserStats, deleteStory, importManuscript } from '../utils/api';
 import './Dashboard.css';
 
 const Dashboard = () => {
@@ -10,6 +10,7 @@ const Dashboard = () => {
   const navigate = useNavigate();
   const [copied, setCopied] = useState(false);
   const [stories, setStories] = useState([]);
+  const [libraryStats, setLibraryStats] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [selectedStory, setSelectedStory] = useState(null);
@@ -20,6 +21,8 @@ const Dashboard = () => {
   const [newDisplayName, setNewDisplayName] = useState('');
   const [savingName, setSavingName] = useState(false);
   const [exportingStories, setExportingStories] = useState(false);
+  const [importing, setImporting] = useState(false);
+  const importInputRef = useRef(null);
 
   const handleLogout = async () => {
     try {
@@ -54,7 +57,12 @@ const Dashboard = () => {
     try {
       setLoading(true);
       setError('');
-      const fetchedStories = await getStories();
+      // Totals come from the server so they cover the whole library, not just the listed page
+      const [fetchedStories, fetchedStats] = await Promise.all([
+        getStories(),
+        getUserStats().catch(() => null)
+      ]);
+      setLibraryStats(fetchedStats);
 
       // Convert metadata timestamps to timestamp for compatibility
       const normalized = fetchedStories.map(story => ({
@@ -80,16 +88,18 @@ const Dashboard = () => {
       const genre = s.genre || 'Other';
       genreCounts[genre] = (genreCounts[genre] || 0) + 1;
     });
-    const topGenre = Object.entries(genreCounts).sort((a, b) => b[1] - a[1])[0];
+    const topGenre = Object.entries(libraryStats?.byGenre || genreCounts).sort((a, b) => b[1] - a[1])[0];
+    const totalStories = libraryStats ? libraryStats.storyCount : stories.length;
+    const libraryWords = libraryStats ? libraryStats.wordCount : totalWords;
 
     return {
-      totalStories: stories.length,
-      totalWords,
-      avgWords: stories.length ? Math.round(totalWords / stories.length) : 0,
+      totalStories,
+      totalWords: libraryWords,
+      avgWords: totalStories ? Math.round(libraryWords / totalStories) : 0,
       topGenre: topGenre ? topGenre[0] : 'None yet',
       lastActive: stories[0]?.timestamp || null
     };
-  }, [stories]);
+  }, [stories, libraryStats]);
 
   // Filtered and sorted stories
   const filteredStories = useMemo(() => {
@@ -120,6 +130,25 @@ const Dashboard = () => {
     return result;
   }, [stories, searchQuery, sortBy]);
 
+  const handleImportFile = async (event) => {
+    const file = event.target.files?.[0];
+    event.target.value = '';
+    if (!file) return;
+
+    try {
+      setImporting(true);
+      setError('');
+      const imported = await importManuscript(file);
+      // Summary has no content, so the editor fetches the full story
+      navigate('/edit', { state: { loadedStory: imported } });
+    } catch (error) {
+      console.error('Error importing manuscript:', error);
+      setError(error.message || 'Failed to import manuscript. Please try again.');
+    } finally {
+      setImporting(false);
+    }
+  };
+
   const handleViewStory = (story) => {
     setSelectedStory(story);
   };
@@ -132,6 +161,7 @@ const Dashboard = () => {
       // Update local state
       const updatedStories = stories.filter(s => s.id !== storyId);
       setStories(updatedStories);
+      getUserStats().then(setLibraryStats).catch(() => setLibraryStats(null));
       if (selectedStory?.id === storyId) {
         setSelectedStory(null);
       }
@@ -527,6 +557,20 @@ const Dashboard = () => {
               <button className="btn-new-story" onClick={handleStartWriting}>
                 + New Story
               </button>
+              <button
+                className="btn-new-story"
+                onClick={() => importInputRef.current?.click()}
+                disabled={importing}
+              >
+                {importing ? 'Importing...' : 'Import Manuscript'}
+              </button>
+              <input
+                ref={importInputRef}
+                type="file"
+                accept=".txt,.md,.markdown,.docx"
+                style={{ display: 'none' }}
+                onChange={handleImportFile}
+              />
             </div>
 
             {filteredStories.length === 0 ? (
@@ -9,7 +9,8 @@ import AmbientPlayer from './AmbientPlayer';
 import { stripHtml } from '../utils/textUtils';
 import { useTTS } from '../hooks/useTTS';
 import { exportToPdf, exportToEpub } from '../utils/exportUtils';
-import { generateContinuationStream, getBibleItems, getStoryById, generateBibleItems } from '../utils/api';
+import { generateContinuationStream, getBibleItems, getStoryById, generateBibleItems, exportStory } from '../utils/api';
+import { saveAs } from 'file-saver';
 import { tonePalette } from '../constants/landingPageData';
 
 
@@ -293,7 +294,7 @@ const Editor = () => {
   }, [title, genre, content, chapters]);
 
   // Save to cloud (Firestore via backend API)
-  const saveToCloud = useCallback(async () => {
+  const saveToCloud = useCallback(async ({ autosave = false } = {}) => {
     if (!user) return null;
     if (!title.trim()) return null;
     if (isSavingRef.current) return null; // Prevent concurrent saves
@@ -311,7 +312,7 @@ const Editor = () => {
         status: 'draft'
       };
 
-      const response = await saveStory(storyData, storyId); // Pass storyId for updates
+      const response = await saveStory(storyData, storyId, { autosave }); // Pass storyId for updates
 
       // If this is a new story, set the ID
       if (!storyId && response.id) {
@@ -417,13 +418,20 @@ const Editor = () => {
   const handleEpubExport = async () => {
     try {
       setSuccessMessage('Generating ePub...');
-      await exportToEpub({
-        title,
-        content,
-        storyId,
-        chapters,
-        author: user?.displayName || 'Storynexis Writer'
-      });
+      if (storyId) {
+        // Saved stories are exported by the server, chapter by chapter
+        await saveToCloud();
+        const { blob, filename } = await exportStory(storyId, 'epub');
+        saveAs(blob, filename);
+      } else {
+        await exportToEpub({
+          title,
+          content,
+          storyId,
+          chapters,
+          author: user?.displayName || 'Storynexis Writer'
+        });
+      }
       setSuccessMessage('ePub exported successfully!');
       setTimeout(() => setSuccessMessage(''), 3000);
     } catch (error) {
@@ -432,6 +440,24 @@ const Editor = () => {
     }
   };
 
+  const handleMarkdownExport = async () => {
+    if (!storyId) {
+      setError('Save the story before exporting Markdown.');
+      setTimeout(() => setError(''), 3000);
+      return;
+    }
+    try {
+      await saveToCloud();
+      const { blob, filename } = await exportStory(storyId, 'md');
+      saveAs(blob, filename);
+      setSuccessMessage('Markdown exported successfully!');
+      setTimeout(() => setSuccessMessage(''), 3000);
+    } catch (error) {
+      setError('Failed to export Markdown.');
+      setTimeout(() => setError(''), 3000);
+    }
+  };
+
   const handleSyncBible = useCallback(async () => {
     if (!storyId) return;
     try {
@@ -649,7 +675,7 @@ const Editor = () => {
     if (autoSaveTimer) clearTimeout(autoSaveTimer);
 
     const timer = setTimeout(() => {
-      saveToCloud();
+      saveToCloud({ autosave: true });
     }, 3000); // 3 second debounce for cloud saves
 
     setAutoSaveTimer(timer);
@@ -775,6 +801,9 @@ const Editor = () => {
                     <button onClick={handleEpubExport} className="action-btn">
                       <span className="action-text">Download ePub</span>
                     </button>
+                    <button onClick={handleMarkdownExport} className="action-btn">
+                      <span className="action-text">Download Markdown</span>
+                    </button>
 
                     <button onClick={handleNewStory} className="action-btn danger">
                       <span className="action-text">New Story</span>
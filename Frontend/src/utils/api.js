@@ -1,8 +1,15 @@
 import { auth } from '../firebase/auth';
+import { generationSocket } from './generationSocket';
 
 // Get API URL from environment variable, fallback to localhost
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
+// 'ws' multiplexes generation streams over one WebSocket (falls back to SSE); 'sse' always uses SSE
+const GENERATION_TRANSPORT = import.meta.env.VITE_GENERATION_TRANSPORT || 'ws';
+
+// Reconnects after a dropped generation stream (the server keeps decoding for a grace period)
+const STREAM_RESUME_ATTEMPTS = 5;
+
 console.log('🌐 API URL:', API_URL);
 
 // Custom API Error class for better error handling
@@ -118,6 +125,11 @@ export const authenticatedFetch = async (
         ...options.headers,
       };
 
+      // Let the browser set the multipart boundary for uploads
+      if (options.body instanceof FormData) {
+        delete headers['Content-Type'];
+      }
+
       // Add authorization header only if we have a token
       if (token) {
         headers['Authorization'] = `Bearer ${token}`;
@@ -288,10 +300,104 @@ export const generateContinuationStream = async (
   onError,
   signal = null
 ) => {
+  if (GENERATION_TRANSPORT === 'ws' && typeof WebSocket !== 'undefined') {
+    try {
+      await generationSocket.connect();
+    } catch (error) {
+      console.warn('Generation socket unavailable, falling back to SSE:', error);
+    }
+
+    if (generationSocket.socket) {
+      // Resolves when the stream ends, like the SSE path below
+      return new Promise((resolve) => {
+        generationSocket.stream('continue', params, {
+          onChunk: (text) => onChunk(text),
+          onDone: (message) => {
+            console.log('✅ Streaming complete');
+            onComplete(message.fullText);
+            resolve();
+          },
+          onError: (error) => {
+            console.error('Streaming error:', error);
+            onError(error);
+            resolve();
+          },
+          onCancel: () => {
+            console.log('⏹️ Generation cancelled by user');
+            resolve();
+          },
+        }, { signal }).catch((error) => {
+          onError(error);
+          resolve();
+        });
+      });
+    }
+  }
+
+  // Resumable stream state: the server's generation id and the offset (last SSE event id) received
+  let generationId = null;
+  let lastEventId = null;
+  let finished = false;
+
+  const cancelOnServer = () => {
+    if (generationId && !finished) {
+      fetch(`${API_URL}/generate/stream/${generationId}`, { method: 'DELETE' }).catch(() => {});
+    }
+  };
+  signal?.addEventListener('abort', cancelOnServer, { once: true });
+
+  const readEvents = async (response) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+
+      if (done) break;
+
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop() || '';
+
+      for (const event of events) {
+        let payload = null;
+        for (const line of event.split('\n')) {
+          if (line.startsWith('id: ')) {
+            lastEventId = line.slice(4);
+          } else if (line.startsWith('data: ')) {
+            payload = line.slice(6);
+          }
+        }
+        if (!payload) continue;
+
+        try {
+          const data = JSON.parse(payload);
+
+          if (data.type === 'start') {
+            generationId = data.generationId || generationId;
+            console.log(data.offset ? `🔁 Streaming resumed at ${data.offset}` : '🌊 Streaming started');
+          } else if (data.type === 'chunk') {
+            onChunk(data.text);
+          } else if (data.type === 'done') {
+            finished = true;
+            console.log('✅ Streaming complete');
+            onComplete(data.fullText);
+          } else if (data.type === 'error') {
+            finished = true;
+            onError(new Error(data.message));
+          }
+        } catch (parseError) {
+          console.error('Error parsing SSE data:', parseError);
+        }
+      }
+    }
+  };
+
   try {
     const token = await getAuthToken();
 
-    const response = await fetch(`${API_URL}/generate/stream`, {
+    let response = await fetch(`${API_URL}/generate/stream`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -309,39 +415,49 @@ export const generateContinuationStream = async (
       );
     }
 
-    const reader = response.body.getReader();
-    const decoder = new TextDecoder();
-    let buffer = '';
+    generationId = response.headers.get('X-Generation-Id');
 
+    let attempt = 0;
+    let streamError = null;
     while (true) {
-      const { done, value } = await reader.read();
-
-      if (done) break;
-
-      buffer += decoder.decode(value, { stream: true });
-      const lines = buffer.split('\n\n');
-      buffer = lines.pop() || '';
-
-      for (const line of lines) {
-        if (line.startsWith('data: ')) {
-          try {
-            const data = JSON.parse(line.slice(6));
-
-            if (data.type === 'start') {
-              console.log('🌊 Streaming started');
-            } else if (data.type === 'chunk') {
-              onChunk(data.text);
-            } else if (data.type === 'done') {
-              console.log('✅ Streaming complete');
-              onComplete(data.fullText);
-            } else if (data.type === 'error') {
-              onError(new Error(data.message));
-            }
-          } catch (parseError) {
-            console.error('Error parsing SSE data:', parseError);
-          }
+      if (response?.status === 404 || response?.status === 410) {
+        // Expired, or more was missed than the server buffers
+        streamError = new ApiError('The generation could not be resumed, please try again', response.status);
+        break;
+      } else if (response && !response.ok) {
+        streamError = new ApiError('Failed to resume streaming', response.status);
+      } else if (response) {
+        try {
+          await readEvents(response);
+          streamError = null;
+        } catch (error) {
+          if (error.name === 'AbortError') throw error;
+          streamError = error;
         }
       }
+      if (finished || !generationId || attempt >= STREAM_RESUME_ATTEMPTS) break;
+
+      // The connection dropped mid-generation: the server keeps decoding, so pick up where we left off
+      attempt += 1;
+      const delay = Math.min(500 * 2 ** (attempt - 1), 4000);
+      console.warn(`📶 Stream interrupted, resuming in ${delay}ms (attempt ${attempt})`);
+      await new Promise((resolve) => setTimeout(resolve, delay));
+      if (signal?.aborted) throw new DOMException('Aborted', 'AbortError');
+
+      try {
+        response = await fetch(`${API_URL}/generate/stream/${generationId}`, {
+          headers: lastEventId ? { 'Last-Event-ID': lastEventId } : {},
+          signal
+        });
+      } catch (error) {
+        if (error.name === 'AbortError') throw error;
+        streamError = error;
+        response = null;
+      }
+    }
+
+    if (!finished) {
+      throw streamError || new Error('Stream ended before the generation finished');
     }
   } catch (error) {
     if (error.name === 'AbortError') {
@@ -350,6 +466,8 @@ export const generateContinuationStream = async (
       console.error('Streaming error:', error);
       onError(error);
     }
+  } finally {
+    signal?.removeEventListener('abort', cancelOnServer);
   }
 };
 
@@ -366,13 +484,30 @@ export const getUserInfo = async () => {
   return response.json();
 };
 
+/**
+ * Get library totals (story/word counts, stories per status and genre)
+ */
+export const getUserStats = async () => {
+  const response = await authenticatedFetch('/user/me/stats');
+
+  if (!response.ok) {
+    throw new ApiError('Failed to fetch library stats', response.status);
+  }
+
+  return response.json();
+};
+
 /**
  * Save story to backend
  * @param {Object} storyData - Story data to save
  * @param {string} storyId - Optional story ID for updating existing story
+ * @param {Object} options - { autosave } marks background saves the server may coalesce
  */
-export const saveStory = async (storyData, storyId = null) => {
-  const endpoint = storyId ? `/stories?story_id=${storyId}` : '/stories';
+export const saveStory = async (storyData, storyId = null, { autosave = false } = {}) => {
+  let endpoint = storyId ? `/stories?story_id=${storyId}` : '/stories';
+  if (storyId && autosave) {
+    endpoint += '&autosave=true';
+  }
 
   const response = await authenticatedFetch(endpoint, {
     method: 'POST',
@@ -417,6 +552,53 @@ export const getStoryById = async (storyId) => {
   return response.json();
 };
 
+/**
+ * Import a manuscript (.txt, .md or .docx) as a new story
+ * @param {File} file - Manuscript file
+ * @param {Object} options - Optional title and genre
+ * @returns {Promise<Object>} Story summary (id, title, metadata)
+ */
+export const importManuscript = async (file, { title = null, genre = 'General' } = {}) => {
+  const formData = new FormData();
+  formData.append('file', file);
+  formData.append('genre', genre);
+  if (title) {
+    formData.append('title', title);
+  }
+
+  const response = await authenticatedFetch('/stories/import', {
+    method: 'POST',
+    body: formData,
+  }, { maxRetries: 0, timeout: 600000 });
+
+  if (!response.ok) {
+    throw new ApiError('Failed to import manuscript', response.status);
+  }
+
+  return response.json();
+};
+
+/**
+ * Export a saved story from the server
+ * @param {string} storyId - Story ID to export
+ * @param {string} format - 'epub', 'md' or 'txt'
+ * @returns {Promise<{blob: Blob, filename: string}>}
+ */
+export const exportStory = async (storyId, format = 'epub') => {
+  const response = await authenticatedFetch(`/stories/${storyId}/export?format=${format}`, {}, { timeout: 600000 });
+
+  if (!response.ok) {
+    throw new ApiError('Failed to export story', response.status);
+  }
+
+  const disposition = response.headers.get('Content-Disposition') || '';
+  const match = disposition.match(/filename="([^"]+)"/);
+  return {
+    blob: await response.blob(),
+    filename: match ? match[1] : `story.${format}`,
+  };
+};
+
 /**
  * Delete a story
  * @param {string} storyId - Story ID to delete
@@ -0,0 +1,155 @@
+import { auth } from '../firebase/auth';
+
+const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+const WS_URL = `${API_URL.replace(/^http/, 'ws')}/generate/ws`;
+
+// Re-authenticate the socket when the ID token has less than this left (ms)
+const TOKEN_REFRESH_MARGIN = 60 * 1000;
+
+const getToken = async (forceRefresh = false) => {
+  const user = auth.currentUser;
+  if (!user) return null;
+  try {
+    return await user.getIdToken(forceRefresh);
+  } catch (error) {
+    console.warn('Failed to get auth token:', error);
+    return null;
+  }
+};
+
+/**
+ * One WebSocket multiplexing every generation stream of the session
+ * (see Backend/generation_channel.py for the protocol)
+ */
+class GenerationSocket {
+  constructor() {
+    this.socket = null;
+    this.ready = null;
+    this.expiresAt = null;
+    this.streams = new Map();
+    this.nextId = 1;
+  }
+
+  /**
+   * Open and authenticate the socket (once; later calls share the connection)
+   */
+  connect() {
+    if (!this.ready) {
+      this.ready = this._open().catch((error) => {
+        this.ready = null;
+        throw error;
+      });
+    }
+    return this.ready;
+  }
+
+  async _open() {
+    const token = await getToken();
+
+    return new Promise((resolve, reject) => {
+      const socket = new WebSocket(WS_URL);
+
+      socket.onopen = () => socket.send(JSON.stringify({ type: 'auth', token }));
+
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'ready') {
+          this.socket = socket;
+          this.expiresAt = message.expiresAt ? message.expiresAt * 1000 : null;
+          resolve(socket);
+        } else if (message.type === 'error' && message.id == null && !this.socket) {
+          reject(new Error(message.message));
+        } else {
+          this._route(message);
+        }
+      };
+
+      socket.onerror = () => reject(new Error('Generation socket failed'));
+
+      socket.onclose = () => {
+        this.socket = null;
+        this.ready = null;
+        reject(new Error('Generation socket closed'));
+        for (const handlers of this.streams.values()) {
+          handlers.onError(new Error('Connection to the generation server was lost'));
+        }
+        this.streams.clear();
+      };
+    });
+  }
+
+  async _refreshAuth(socket) {
+    if (this.expiresAt && this.expiresAt - Date.now() < TOKEN_REFRESH_MARGIN) {
+      const token = await getToken(true);
+      socket.send(JSON.stringify({ type: 'auth', token }));
+      this.expiresAt = null;
+    }
+  }
+
+  /**
+   * Start a generation stream
+   * @param {string} kind - 'continue', 'variations' or 'rewrite'
+   * @param {Object} params - Same body as the matching HTTP endpoint
+   * @param {Object} handlers - { onChunk(text, variant), onDone(message), onError(error), onCancel() }
+   * @param {Object} options - { signal: AbortSignal, priority: number }
+   * @returns {Promise<number>} Stream id
+   */
+  async stream(kind, params, handlers, { signal = null, priority = 0 } = {}) {
+    const socket = await this.connect();
+    await this._refreshAuth(socket);
+
+    const id = this.nextId++;
+    this.streams.set(id, handlers);
+    socket.send(JSON.stringify({ type: 'start', id, kind, params, priority }));
+
+    if (signal) {
+      if (signal.aborted) this.cancel(id);
+      else signal.addEventListener('abort', () => this.cancel(id), { once: true });
+    }
+    return id;
+  }
+
+  cancel(id) {
+    if (this.socket && this.streams.has(id)) {
+      this.socket.send(JSON.stringify({ type: 'cancel', id }));
+    }
+  }
+
+  setPriority(id, priority) {
+    if (this.socket && this.streams.has(id)) {
+      this.socket.send(JSON.stringify({ type: 'priority', id, priority }));
+    }
+  }
+
+  _route(message) {
+    const handlers = this.streams.get(message.id);
+    if (!handlers) {
+      if (message.type === 'error') console.error('Generation socket error:', message.message);
+      return;
+    }
+
+    switch (message.type) {
+      case 'chunk':
+        handlers.onChunk(message.text, message.variant);
+        break;
+      case 'done':
+        this.streams.delete(message.id);
+        handlers.onDone(message);
+        break;
+      case 'cancelled':
+        this.streams.delete(message.id);
+        handlers.onCancel?.();
+        break;
+      case 'error':
+        this.streams.delete(message.id);
+        handlers.onError(new Error(message.message));
+        break;
+      default:
+        break;
+    }
+  }
+}
+
+export const generationSocket = new GenerationSocket();
+
+export default generationSocket;